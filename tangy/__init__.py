@@ -1,7 +1,8 @@
 from ._tangy import tangy_config_location, buffer_list_update
 from ._tangy import buffer_list_append, buffer_list_show, buffer_list_delete_all
 from ._tangy import Records
-from ._tangy import TangyBuffer, TangyBufferType
+from ._tangy import TangyBuffer, TangyBufferType, TangyView, TangyReader, TangyCounter, TangyMerge
+from ._tangy import CoincidenceEngine, SparseJointHistogram
 from ._tangy import PTUFile, QuToolsFile
 
 from sys import platform
@@ -62,7 +62,7 @@ cdef extern from "./src/uqd_bindings.h":
 
     void CTimeTag_stopTimetags(CTimeTag_ptr timetag)
 
-    int CTimeTag_readTags(CTimeTag_ptr timetag, c_ChannelType** channel_ret, c_TimeType** time_ret)
+    int CTimeTag_readTags(CTimeTag_ptr timetag, c_ChannelType** channel_ret, c_TimeType** time_ret) nogil
 
     void CTimeTag_saveDcCalibration(CTimeTag_ptr timetag, char* filename)
 
@@ -395,11 +395,17 @@ class UQDLogic16:
 
     @cython.ccall
     def read_tags(self) -> Tuple[int, ndarray, ndarray]:
-        count: int = _ctimetag.CTimeTag_readTags(
-            self._c_timetag,
-            cython.address(self._channel_ptr),
-            cython.address(self._timetag_ptr),
+        timetag: _ctimetag.CTimeTag_ptr = self._c_timetag
+        channel_ret: cython.pointer(cython.pointer(_ctimetag.c_ChannelType)) = (
+            cython.address(self._channel_ptr)
         )
+        time_ret: cython.pointer(cython.pointer(_ctimetag.c_TimeType)) = (
+            cython.address(self._timetag_ptr)
+        )
+        count: cython.int = 0
+        # waiting on the device leaves other threads free to analyse the buffer
+        with cython.nogil:
+            count = _ctimetag.CTimeTag_readTags(timetag, channel_ret, time_ret)
 
         if count == 0:
             return (count, array([]), array([]))
@@ -568,11 +574,17 @@ class UQDLogic16:
         """
         Write tags directly into buffer
         """
-        count: int = _ctimetag.CTimeTag_readTags(
-            self._c_timetag,
-            cython.address(self._channel_ptr),
-            cython.address(self._timetag_ptr),
+        timetag: _ctimetag.CTimeTag_ptr = self._c_timetag
+        channel_ret: cython.pointer(cython.pointer(_ctimetag.c_ChannelType)) = (
+            cython.address(self._channel_ptr)
+        )
+        time_ret: cython.pointer(cython.pointer(_ctimetag.c_TimeType)) = (
+            cython.address(self._timetag_ptr)
         )
+        count: cython.int = 0
+        # waiting on the device leaves other threads free to analyse the buffer
+        with cython.nogil:
+            count = _ctimetag.CTimeTag_readTags(timetag, channel_ret, time_ret)
 
         if count == 0:
             return count
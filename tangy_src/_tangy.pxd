@@ -63,12 +63,20 @@ cdef extern from "./src/shared_memory.c":
         SM_UNMAP,
         SM_FD_CLOSE,
         SM_UNLINK,
+        SM_HEADER,
 
     ctypedef struct shmem_result:
         bint Ok
         shmem_error Error
         int Std_Error
 
+    ctypedef enum shmem_flags:
+        SM_DEFAULT,
+        SM_HUGE_PAGES,
+        SM_PREFAULT,
+        SM_LOCKED,
+        SM_FILE,
+
     shmem_result shmem_exists(char *const map_name, u8 *exists)
 
 cdef extern from './src/picoquant_reader.h':
@@ -121,6 +129,44 @@ cdef extern from './src/picoquant_reader.h':
                              u64 count_tags)
 
 
+cdef extern from "./src/notify.h":
+    void tb_fifo_drain(int fd)
+
+cdef extern from "./src/buffer_registry.h":
+    enum: REGISTRY_ENTRIES
+    enum: REGISTRY_NAME_LENGTH
+    ctypedef struct registry_entry:
+        u64 format
+        u64 capacity
+        u64 owner
+        char name[REGISTRY_NAME_LENGTH]
+
+cdef extern from "./src/thread_pool.h":
+    u64 tb_hardware_threads() nogil
+
+cdef extern from "./src/coincidence_stream.h":
+    enum: STREAM_CHANNELS_MAX
+    ctypedef struct coincidence_stream:
+        u64 n_channels
+        u64 position
+        u64 last_time
+        u64 coincidences
+        u64 lost
+
+    void stream_deinit(coincidence_stream* stream)
+    void stream_reset(coincidence_stream* stream, u64 position)
+
+cdef extern from "./src/sparse_histogram.h":
+    ctypedef struct sparse_histogram:
+        u64 length
+        u64 capacity
+
+    void sparse_histogram_init(sparse_histogram* histogram, u64 capacity)
+    void sparse_histogram_deinit(sparse_histogram* histogram)
+    void sparse_histogram_export(const sparse_histogram* histogram,
+                                 u64* bins,
+                                 u64* counts)
+
 cdef extern from "./src/shared_ring_buffer_context.h":
 
     ctypedef struct shared_ring_buffer:
@@ -139,6 +185,7 @@ cdef extern from "./src/shared_ring_buffer_context.h":
         u64 count
         u64 reference_count
         u64 channel_count
+        u64 sequence
 
     u64 srb_context_size()
     u64 srb_conversion_factor(f64 resolution, f64 clock_period)
@@ -170,6 +217,52 @@ cdef extern from "./src/shared_ring_buffer_context.h":
     u64 srb_get_channel_count(shared_ring_buffer* buffer)
     void srb_set_channel_count(shared_ring_buffer* buffer, u64 channel_count)
 
+    u64 srb_get_memory_flags(shared_ring_buffer* buffer)
+
+    ctypedef enum srb_layout_flags:
+        SRB_LAYOUT_DEFAULT,
+        SRB_LAYOUT_ARRIVAL,
+        SRB_LAYOUT_PACKED,
+
+    u64 srb_get_layout(shared_ring_buffer* buffer)
+    u64 srb_get_channel_index(shared_ring_buffer* buffer)
+    u64 srb_get_block_size(shared_ring_buffer* buffer)
+
+    u64 srb_get_resized(shared_ring_buffer* buffer)
+
+    u64 srb_get_sequence(shared_ring_buffer* buffer)
+    void srb_set_sequence(shared_ring_buffer* buffer, u64 sequence)
+
+    u64 srb_write_begin(shared_ring_buffer* buffer, u64 n)
+    void srb_write_end(shared_ring_buffer* buffer, u64 count)
+    u64 srb_valid_from(shared_ring_buffer* buffer)
+    bint srb_range_intact(shared_ring_buffer* buffer, u64 start)
+
+    u64 srb_wait_for(shared_ring_buffer* buffer, u64 target, f64 timeout) nogil
+    int srb_subscribe(shared_ring_buffer* buffer, u32* slot)
+    void srb_unsubscribe(shared_ring_buffer* buffer, u32 slot, int fd)
+    void srb_acknowledge(shared_ring_buffer* buffer, u32 slot, int fd)
+
+    enum: SRB_MAX_ATTACHMENTS
+    u64* srb_attachment_pid(shared_ring_buffer* buffer, u64 index)
+    u64* srb_attachment_count(shared_ring_buffer* buffer, u64 index)
+    u64 srb_reap(shared_ring_buffer* buffer)
+    void srb_attach(shared_ring_buffer* buffer)
+    u64 srb_detach(shared_ring_buffer* buffer)
+    shmem_result srb_reap_segment(char* name, u64* remaining)
+
+    enum: SRB_MAX_READERS
+    char* srb_reader_name(shared_ring_buffer* buffer, u64 index)
+    u64 srb_reader_position(shared_ring_buffer* buffer, u64 index)
+    u64 srb_reader_lost(shared_ring_buffer* buffer, u64 index)
+    bint srb_reader_active(shared_ring_buffer* buffer, u64 index)
+    i64 srb_reader_find(shared_ring_buffer* buffer, const char* name)
+    i64 srb_reader_register(shared_ring_buffer* buffer, const char* name, u64 position)
+    void srb_reader_unregister(shared_ring_buffer* buffer, u64 index)
+    u64 srb_reader_next(shared_ring_buffer* buffer, u64 index, u64 max_n, u64* start)
+    bint srb_reader_commit(shared_ring_buffer* buffer, u64 index, u64 start, u64 stop)
+    i64 srb_reader_slowest(shared_ring_buffer* buffer)
+
     shmem_result srb_init(const u64 length_bytes,
                      char* name,
                      f64 resolution,
@@ -177,8 +270,8 @@ cdef extern from "./src/shared_ring_buffer_context.h":
                      u64 conversion_factor,
                      u64 capacity,
                      u64 count,
-                     u64 reference_count,
                      u64 channel_count,
+                     u64 memory_flags,
                      shared_ring_buffer* buffer)
 
     shmem_result srb_deinit(shared_ring_buffer* buffer)
@@ -233,8 +326,14 @@ cdef extern from "./src/analysis_impl_clocked.h":
 
     ctypedef struct clk_slice:
         usize length
+        u64 conversion_factor
         u8* channel
-        clk_timetag* timestamp
+        u64* clock
+        u64* delta
+        u64* arrival
+        u64* packed
+        u64 delta_bits
+        u64 delta_mask
 
     ctypedef struct clk_field_ptrs:
         usize length
@@ -258,6 +357,10 @@ cdef extern from "./src/tangy.h":
         STANDARD,
         CLOCKED
 
+    ctypedef enum coincidence_engine:
+        ENGINE_PATTERN,
+        ENGINE_WINDOW
+
     ctypedef union tangy_slice:
         std_slice standard
         clk_slice clocked
@@ -283,12 +386,36 @@ cdef extern from "./src/tangy.h":
                       f64 resolution,
                       f64 clock_period,
                       u64 channel_count,
+                      u64 memory_flags,
+                      u64 layout,
+                      u64 channel_index,
+                      u64 block_size,
                       tangy_buffer* t_buffer)
 
     shmem_result tangy_buffer_deinit(tangy_buffer* t_buf)
 
     shmem_result tangy_buffer_connect(char* name, tangy_buffer* t_buf)
 
+    bint tangy_registry_read(u64 index, registry_entry* entry)
+
+    void tangy_registry_remove(char* name)
+
+    void tangy_buffer_register(char* name, tangy_buffer* t_buf)
+
+    shmem_result tangy_buffer_resize(char* name, const u64 capacity, tangy_buffer* t_buf)
+
+    shmem_result tangy_buffer_refresh(char* name, tangy_buffer* t_buf)
+
+    shmem_result tangy_buffer_open_file(char* path, tangy_buffer* t_buf)
+
+    u64 tangy_buffer_recover(tangy_buffer* t_buf)
+
+    shmem_result tangy_buffer_snapshot(tangy_buffer* t_buf,
+                      char* name,
+                      u64 start,
+                      u64 stop,
+                      tangy_buffer* snapshot)
+
     u64 tangy_bins_from_time(tangy_buffer* t_buf, f64 time)
 
     void tangy_clear_buffer(tangy_buffer* t_buf)
@@ -296,12 +423,27 @@ cdef extern from "./src/tangy.h":
     u64 tangy_buffer_slice(tangy_buffer* t_buf,
                            tangy_field_ptrs* ptrs,
                            u64 start,
-                           u64 stop)
+                           u64 stop) nogil
 
     u64 tangy_buffer_push(tangy_buffer* t_buf,
                           tangy_field_ptrs* ptrs,
                           u64 start,
-                          u64 stop)
+                          u64 stop) nogil
+
+    const u64 MERGE_NOT_WAITING
+
+    u64 tangy_merge(tangy_buffer* t_buf,
+                    const u64 n_sources,
+                    tangy_buffer** sources,
+                    u64* positions,
+                    const u64* stops,
+                    u64* waiting_since,
+                    const u8* channel_offsets,
+                    const u64 latency_bins,
+                    const u64 max_n,
+                    u64* late) nogil
+
+    u64 tangy_valid_from(tangy_buffer* t_buf)
 
     u64 tangy_oldest_index(tangy_buffer* t_buf)
 
@@ -311,16 +453,22 @@ cdef extern from "./src/tangy.h":
 
     f64 tangy_time_in_buffer(tangy_buffer* t_buf)
 
-    u64 tangy_lower_bound(tangy_buffer* t_buf, u64 key)
+    u64 tangy_lower_bound(tangy_buffer* t_buf, u64 key) nogil
 
-    u64 tangy_singles(tangy_buffer* t_buf, u64 start, u64 stop, u64* counters)
+    u64 tangy_singles(tangy_buffer* t_buf,
+                      u64 start,
+                      u64 stop,
+                      u64* counters,
+                      u64 n_threads) nogil
 
     u64 tangy_coincidence_count(tangy_buffer* t_buf,
                                 u64 channel_count,
                                 u8* channels,
                                 f64* delays,
                                 f64 time_coincidence_radius,
-                                f64 time_read)
+                                f64 time_read,
+                                coincidence_engine engine,
+                                u64 n_threads) nogil
 
     u64 tangy_coincidence_collect(tangy_buffer* t_buf,
                                   u64 channel_count,
@@ -328,20 +476,42 @@ cdef extern from "./src/tangy.h":
                                   f64* delays,
                                   f64 time_coincidence_radius,
                                   f64 time_read,
-                                  tangy_record_vec* records)
+                                  tangy_record_vec* records,
+                                  coincidence_engine engine) nogil
+
+    enum: COINCIDENCE_SUBSETS_MAX
+
+    u64 tangy_coincidence_counts(tangy_buffer* t_buf,
+                                 u64 channel_count,
+                                 u8* channels,
+                                 f64* delays,
+                                 f64 time_coincidence_radius,
+                                 f64 time_read,
+                                 u64 n_patterns,
+                                 u64* patterns,
+                                 u64* counts) nogil
+
+    void tangy_coincidence_stream_init(tangy_buffer* t_buf,
+                                       coincidence_stream* stream,
+                                       u64 channel_count,
+                                       u8* channels,
+                                       f64* delays,
+                                       f64 time_coincidence_radius,
+                                       u64 position)
+
+    u64 tangy_coincidence_stream_update(tangy_buffer* t_buf,
+                                        coincidence_stream* stream,
+                                        u64* counters) nogil
+
+    void tangy_records_init(buffer_format format,
+                            tangy_record_vec* records)
+
+    void tangy_records_deinit(buffer_format format,
+                              tangy_record_vec* records)
 
     void tangy_records_copy(buffer_format format,
                             tangy_record_vec* records,
-                            tangy_field_ptrs* slice)
-
-    u64 tangy_timetrace(tangy_buffer* t_buf,
-                        const u64 start,
-                        const u64 stop,
-                        const u64 bin_width,
-                        const u8* channels,
-                        const u64 n_channels,
-                        const u64 length,
-                        u64* intensities)
+                            tangy_field_ptrs* slice) nogil
 
     void tangy_relative_delay(tangy_buffer* t_buf,
                               const u64 start,
@@ -351,7 +521,42 @@ cdef extern from "./src/tangy.h":
                               const u8 channels_a,
                               const u8 channels_b,
                               const u64 length,
-                              u64* intensities)
+                              u64* intensities,
+                              const u64 n_threads) nogil
+
+    void tangy_cross_correlation(tangy_buffer* t_buf,
+                                 const u64 start,
+                                 const u64 stop,
+                                 const u64 correlation_window,
+                                 const u64 resolution,
+                                 const i64 delay,
+                                 const u8 channel_a,
+                                 const u8 channel_b,
+                                 const u64 length,
+                                 u64* intensities,
+                                 const u64 n_threads) nogil
+
+    void tangy_delay_histograms(tangy_buffer* t_buf,
+                                const u64 start,
+                                const u64 stop,
+                                const u64 correlation_window,
+                                const u64 resolution,
+                                const u64 n_channels,
+                                const u8* channels,
+                                const u64 length,
+                                u64* intensities,
+                                const u64 n_threads) nogil
+
+    u64 tangy_channel_traces(tangy_buffer* t_buf,
+                             const u64 start,
+                             const u64 stop,
+                             const u64 origin,
+                             const u64 bin_width,
+                             const u64 n_channels,
+                             const u8* channels,
+                             const u64 length,
+                             u64* intensities,
+                             const u64 n_threads) nogil
 
     u64 tangy_joint_delay_histogram(tangy_buffer* t_buf,
                                     const u8 clock,
@@ -362,7 +567,10 @@ cdef extern from "./src/tangy.h":
                                     const f64* delays,
                                     const f64 radius,
                                     const f64 read_time,
-                                    u64* intensities)
+                                    const u64 bin_width,
+                                    u64* intensities,
+                                    sparse_histogram* sparse,
+                                    const u64 n_threads) nogil
 
     void tangy_second_order_coherence(tangy_buffer* t_buf,
                                       const u64 start,
@@ -372,7 +580,7 @@ cdef extern from "./src/tangy.h":
                                       const u8 signal,
                                       const u8 idler,
                                       const u64 length,
-                                      u64* intensities)
+                                      u64* intensities) nogil
 
 
     void tangy_second_order_coherence_delays(tangy_buffer* t_buf,
@@ -383,7 +591,7 @@ cdef extern from "./src/tangy.h":
                                              const u8 idler,
                                              const f64* delays,
                                              const u64 length,
-                                             u64* intensities)
+                                             u64* intensities) nogil
 
     cdef extern from "./src/qutools_reader.h":
 
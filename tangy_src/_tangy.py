@@ -3,26 +3,33 @@ from cython.cimports import _tangy as _tangy
 import warnings
 
 import mmap
-from os import dup, listdir, remove, makedirs
-from os.path import getsize, join, exists
-import json
+from os import dup, getpid, makedirs
+from os.path import getsize, exists
 from scipy.optimize import curve_fit
-from numpy import mean, where, exp, roll
+from numpy import mean, median, where, exp, roll, isfinite
 from numpy import round as npround
 from numpy import abs as nabs
 from numpy import arange, array, ndarray, asarray, zeros, frombuffer, reshape
+from numpy import concatenate, ceil, triu_indices, add, full
+from numpy.fft import rfft, irfft
+from numpy.lib.stride_tricks import sliding_window_view
 from numpy import uint8 as u8n
 from numpy import uint64 as u64n
 from numpy import int64 as i64n
 from numpy import float64 as f64n
 
 from cython.cimports.libc.stdio import FILE, fdopen, fclose
+from cython.cimports.libc.stdlib import malloc, free
+from cython.cimports.cpython.memoryview import PyMemoryView_FromMemory
+from cython.cimports.cpython.buffer import PyBUF_READ
 from cython.cimports.libc.stdint import uint8_t as u8
 
-# from cython.cimports.libc.stdint import uint32_t as u32
+from cython.cimports.libc.stdint import uint32_t as u32
 from cython.cimports.libc.stdint import uint64_t as u64
 from cython.cimports.libc.stdint import int64_t as i64
 import struct
+from select import select
+from time import sleep, monotonic
 from typing import List, Tuple, Optional, Union
 from numpy.typing import NDArray
 from enum import Enum
@@ -33,11 +40,16 @@ __all__ = [
     "tangy_config_location",
     "Records",
     "JointHistogram",
+    "SparseJointHistogram",
     "centre_histogram",
-    "bin_histogram",
     "delay_result",
     "TangyBufferType",
+    "CoincidenceEngine",
     "TangyBuffer",
+    "TangyView",
+    "TangyReader",
+    "TangyCounter",
+    "TangyMerge",
     "PTUFile",
     "buffer_list_update",
     "buffer_list_append",
@@ -106,6 +118,53 @@ class JointHistogram:
     # TODO: add rebin function "def rebin(self, x, y) -> JointHistogram"
 
 
+@cython.dataclasses.dataclass(frozen=True)
+class SparseJointHistogram:
+    """JSI result holding only the occupied bins
+
+    The bins are in coordinate form sorted by row then column, bin
+        ``(rows[k], columns[k])`` holding ``counts[k]``. Rows are the signal
+        and columns the idler, as for ``JointHistogram.data``.
+    """
+
+    central_bin: int = cython.dataclasses.field()
+    temporal_window: float = cython.dataclasses.field()
+    bin_size: Tuple[int, int] = cython.dataclasses.field()
+    rows: ndarray(u64n) = cython.dataclasses.field()
+    columns: ndarray(u64n) = cython.dataclasses.field()
+    counts: ndarray(u64n) = cython.dataclasses.field()
+    marginal_idler: ndarray(u64n) = cython.dataclasses.field()
+    marginal_signal: ndarray(u64n) = cython.dataclasses.field()
+    axis_idler: ndarray(f64n) = cython.dataclasses.field()
+    axis_signal: ndarray(f64n) = cython.dataclasses.field()
+
+    def dense(self) -> JointHistogram:
+        """Expand into a ``JointHistogram``
+
+        Returns:
+            (JointHistogram): Same histogram with every bin held
+        """
+        n = int(self.temporal_window)
+        data = zeros((n, n), dtype=u64n)
+        data[self.rows, self.columns] = self.counts
+        return JointHistogram(
+            self.central_bin,
+            self.temporal_window,
+            self.bin_size,
+            data,
+            self.marginal_idler,
+            self.marginal_signal,
+            self.axis_idler,
+            self.axis_signal,
+        )
+
+
+def _centre_offset(central_bin: int, temporal_window: int, marginal: ndarray) -> int:
+    """Shift that moves the bins above 10% of the peak of a marginal to the centre"""
+    bins = arange(temporal_window) - central_bin
+    return -int(npround(mean(bins[marginal > (0.1 * marginal.max())])))
+
+
 @cython.wraparound(False)
 @cython.boundscheck(False)
 @cython.ccall
@@ -135,16 +194,8 @@ def centre_histogram(
         marginal, signal marginal and joint histogram
     """
 
-    bins = arange(temporal_window) - central_bin
-    offset_idler: int = int(
-        npround(mean(bins[marginal_idler > (0.1 * marginal_idler.max())]))
-    )
-    offset_signal: int = int(
-        npround(mean(bins[marginal_signal > (0.1 * marginal_signal.max())]))
-    )
-
-    offset_idler *= -1
-    offset_signal *= -1
+    offset_idler: int = _centre_offset(central_bin, temporal_window, marginal_idler)
+    offset_signal: int = _centre_offset(central_bin, temporal_window, marginal_signal)
 
     return (
         roll(marginal_idler, offset_idler),
@@ -153,58 +204,45 @@ def centre_histogram(
     )
 
 
-@cython.wraparound(False)
-@cython.boundscheck(False)
-@cython.cfunc
-def bin_histogram(
-    histogram: ndarray(u64n), x_width: i64, y_width: i64
-) -> Tuple[Tuple[u64n, u64n], ndarray(u64n), ndarray(u64n), ndarray(u64n)]:
-    (n_rows, n_cols) = histogram.shape
-
-    histogram_view: u64[:, ::1] = histogram
-
-    n_cols_new: i64 = n_cols // y_width
-    n_rows_new: i64 = n_rows // x_width
-
-    result = zeros([n_rows_new, n_cols_new], dtype=u64n)
-    result_view: u64[:, ::1] = result
-
-    marginal_signal = zeros(n_rows_new, dtype=u64n)
-    marginal_idler = zeros(n_cols_new, dtype=u64n)
+# TODO: def extract_marginals
 
-    marginal_signal_view: u64[::1] = marginal_signal
-    marginal_idler_view: u64[::1] = marginal_idler
 
-    i: i64
-    i_start: i64
-    i_stop: i64
-    j: i64
-    j_start: i64
-    j_stop: i64
+def _thread_count(threads: int) -> int:
+    """Number of native threads to run an analysis on, 0 for every core"""
+    assert threads >= 0, "threads must be at least 0"
+    if threads == 0:
+        return _tangy.tb_hardware_threads()
+    return threads
 
-    x: i64
-    y: i64
 
-    value: u64 = 0
+def _correlate_lags(trace_a: ndarray, trace_b: ndarray, max_lag: int) -> ndarray:
+    """Cross-correlation of two traces for lags of b after a in [-max_lag, max_lag]
 
-    for i in range(n_rows_new):
-        i_start = i * y_width
-        i_stop = i_start + y_width
-        for j in range(n_cols_new):
-            j_start = j * x_width
-            j_stop = j_start + x_width
-            value = 0
-            for y in range(i_start, i_stop):
-                for x in range(j_start, j_stop):
-                    value += histogram_view[y][x]
-            result_view[i][j] = value
-            marginal_idler_view[i] += value
-            marginal_signal_view[j] += value
+    Sums the cross-spectra of short segments of the traces rather than
+        transforming them whole, each segment of a against the segment of b
+        extended by max_lag either side, so no lag is lost at the segment
+        boundaries and the transforms stay small.
+    """
+    segment = 1 << max(12, int(4 * max_lag).bit_length())
+    n_fft = 1 << int(segment + 2 * max_lag - 1).bit_length()
+    n_segments = -(-len(trace_a) // segment)
+    rows = 256
 
-    return ((n_rows_new, n_cols_new), marginal_signal, marginal_idler, result)
+    padded_a = zeros(n_segments * segment, dtype=f64n)
+    padded_a[:len(trace_a)] = trace_a
+    padded_a = padded_a.reshape(n_segments, segment)
+    padded_b = zeros(n_segments * segment + 2 * max_lag, dtype=f64n)
+    padded_b[max_lag:max_lag + len(trace_b)] = trace_b
+    windows_b = sliding_window_view(padded_b, segment + 2 * max_lag)[::segment]
 
+    spectrum = zeros(n_fft // 2 + 1, dtype=complex)
+    for row in range(0, n_segments, rows):
+        spectrum_a = rfft(padded_a[row:row + rows], n_fft, axis=1)
+        spectrum_b = rfft(windows_b[row:row + rows], n_fft, axis=1)
+        spectrum += (spectrum_a.conjugate() * spectrum_b).sum(axis=0)
 
-# TODO: def extract_marginals
+    # lag k of b after a is at k + max_lag within a window of b
+    return irfft(spectrum, n_fft)[:2 * max_lag + 1]
 
 
 def double_decay(time, tau1, tau2, t0, max_intensity):
@@ -270,6 +308,10 @@ def raise_shmem_error(result: _tangy.shmem_result):
     if result.Error == _tangy.shmem_error.SM_UNLINK:
         if result.Std_Error != 0:
             raise OSError(result.Std_Error)
+        raise RuntimeError("Failed to remove map name")
+
+    if result.Error == _tangy.shmem_error.SM_HEADER:
+        raise ValueError("File does not contain a valid buffer")
 
 
 class TangyBufferType(Enum):
@@ -279,6 +321,22 @@ class TangyBufferType(Enum):
     Clocked = 1
 
 
+class CoincidenceEngine(Enum):
+    """Kernel used to find coincidences, both give the same result
+
+    ``Pattern`` steps through the timetags of each channel in turn and with a
+        channel index only reads the selected channels, ``Window`` reads every
+        timetag once in a single pass. ``Window`` is faster unless the selected
+        channels hold a small fraction of the timetags and the buffer has a
+        channel index, measure with ``tests/bench-coincidence-engine.py``. The
+        results differ only for timetags on different channels with identical
+        timestamps.
+    """
+
+    Pattern = 0
+    Window = 1
+
+
 @cython.cclass
 class TangyBuffer:
     """Interface to underlying ring buffer
@@ -301,6 +359,51 @@ class TangyBuffer:
             timetags in the buffer, default is the ```standard``` format with a
             single value for the channel and single value for timing information.
             Unused if connecting.
+        huge_pages (bool = False, optional): Request transparent huge pages for
+            the buffer, reduces TLB pressure when scanning large buffers. Only
+            takes effect on Linux when huge pages are enabled for shared memory,
+            see ``memory``. Unused if connecting.
+        prefault (bool = False, optional): Fault in every page of the buffer
+            on creation rather than on first write. Unused if connecting.
+        lock_memory (bool = False, optional): Lock the buffer in physical
+            memory so it can not be swapped out, subject to ``ulimit -l``.
+            Unused if connecting.
+        arrival (bool = False, optional): Store the arrival time of each
+            ``Clocked`` timetag next to its clock and delta, analysis then reads
+            a single column instead of converting every timetag, at the cost of
+            8 bytes per timetag. ``resolution`` and ``clock_period`` can then
+            not be changed later. Ignored for the ``Standard`` format. Unused
+            if connecting.
+        packed (bool = False, optional): Store the clock and delta of each
+            ``Clocked`` timetag in a single 8 byte word, 9 rather than 17 bytes
+            per timetag. The delta takes as many bits as needed to hold one
+            clock period in units of the resolution, the clock the remaining
+            bits, so ``resolution`` and ``clock_period`` can not be changed
+            later. Ignored for the ``Standard`` format. Unused if connecting.
+        channel_index (int = 0, optional): Number of positions to remember for
+            each channel. The writer then records where each channel's
+            timetags are, and ``coincidence_count``, ``coincidence_collect``,
+            ``joint_delay_histogram`` and ``second_order_coherence`` with
+            delays step through the selected channels only, a large speed up
+            when those channels hold a small fraction of the timetags. Costs
+            ``8 * channel_count * channel_index`` bytes. A channel that has
+            had more than ``channel_index`` timetags since the start of an
+            analysis is scanned as before. Unused if connecting.
+        block_size (int = 4096, optional): Number of timetags summarised
+            together, rounded up to a power of two. For every block the writer
+            keeps the first and last arrival time and the number of timetags
+            on each channel. ``singles`` then counts complete blocks from their
+            summaries, ``lower_bound`` searches the summaries before the
+            timetags and scans for a channel skip blocks without it. Set to 0
+            to keep no summaries. Unused if connecting.
+        backing (str = "shared", optional): Memory holding the buffer,
+            ``"shared"`` for shared memory that is removed once the last
+            process closes the buffer, or ``"file"`` to map the file at
+            ``path``. A buffer file is kept when closed, can be larger than
+            physical memory and is reopened by passing the same ``path``, in
+            which case the other arguments are ignored.
+        path (Optional[str] = None, optional): Path of the buffer file, must
+            be given if ``backing`` is ``"file"``.
 
     Attributes:
         name (str): Name of buffer
@@ -325,6 +428,27 @@ class TangyBuffer:
         supplied. The correct values will be made available from the buffer
         connected to.
 
+        A buffer file that is reopened when no other process has it open is
+        first recovered: timetags of a write that never completed are dropped
+        and, if the buffer keeps block summaries (``block_size``), the count
+        is restored from the most recent block whose summary matches its
+        timetags. The channel index and block summaries are then rebuilt,
+        which reads every timetag in the buffer once. A warning reports any
+        change to ``count``.
+
+        Threads: ``singles``, ``coincidence_count``, ``coincidence_collect``,
+        ``coincidence_counts``, ``timetrace``, ``timetraces``,
+        ``relative_delay``, ``find_delay``, ``delay_matrix``,
+        ``joint_delay_histogram``, ``second_order_coherence`` and ``push``
+        release the GIL while the timetags are read or written. Any number of threads can run the
+        analyses on the same buffer object at once, alongside a single thread
+        or process calling ``push``. A resize made by another process is
+        followed safely, analyses already running finish on the old segment.
+        ``push`` from several threads at once, and ``close``, ``clear`` or
+        ``resize`` while any other method runs on the same object, are not
+        safe. A ``TangyCounter``, ``TangyReader`` or ``TangyMerge`` must only
+        be used from one thread at a time.
+
     Examples:
         Creation of a TangyBuffer object for both the ``Standard`` and \
         ``Clocked`` timetag formats that can hold 1,000,000 timetags for a \
@@ -361,6 +485,17 @@ class TangyBuffer:
             # the correct name
             clocked_buffer_connection = tangy.TangyBuffer("clocked")
             ```
+
+        === "Buffer backed by a file"
+            ```python
+            # Keeps hours of timetags on disk, the buffer survives the
+            # process and is reopened (and recovered) from the same path
+            archive = tangy.TangyBuffer("archive", 1e-12,
+                                        channel_count=16,
+                                        capacity=int(5e9),
+                                        backing="file",
+                                        path="/data/archive.tangy")
+            ```
     """
 
     _name = cython.declare(bytes)
@@ -369,6 +504,10 @@ class TangyBuffer:
     _ptr_rb: cython.pointer(_tangy.shared_ring_buffer)
     _format: TangyBufferType
     _ptr_rec_vec: cython.pointer(_tangy.tangy_record_vec)
+    _notify_fd: cython.int
+    _notify_slot: u32
+    _closed: cython.bint
+    _file: cython.bint
 
     def __init__(
         self,
@@ -378,11 +517,22 @@ class TangyBuffer:
         channel_count: int = 4,
         capacity: int = 10_000_000,
         format: TangyBufferType = TangyBufferType.Standard,
+        huge_pages: bool = False,
+        prefault: bool = False,
+        lock_memory: bool = False,
+        arrival: bool = False,
+        packed: bool = False,
+        channel_index: int = 0,
+        block_size: int = 4096,
+        backing: str = "shared",
+        path: Optional[str] = None,
     ):
-        buffer_list_update()
-
-        # TODO: connect to buffers without need to specify format
-        # See buffer_list_delete_all for for details
+        self._notify_fd = -1
+        self._closed = False
+        assert backing in ("shared", "file"), "backing must be 'shared' or 'file'"
+        self._file = backing == "file"
+        if self._file:
+            assert path is not None, "Must supply a path for a file backed buffer"
 
         self._format = format
 
@@ -391,15 +541,43 @@ class TangyBuffer:
 
         self._ptr_buf = cython.address(self._buf)
 
-        result: _tangy.shmem_result = _tangy.tangy_buffer_connect(c_name, self._ptr_buf)
-        if result.Ok is True:
-            self._ptr_rb = cython.address(self._buf.buffer)
+        if self._file and exists(path):
+            self._open_file(path)
             return
 
+        result: _tangy.shmem_result
+        if not self._file:
+            result = _tangy.tangy_buffer_connect(c_name, self._ptr_buf)
+            if result.Ok is True:
+                self._ptr_rb = cython.address(self._buf.buffer)
+                if self._buf.format == _tangy.buffer_format.CLOCKED:
+                    self._format = TangyBufferType.Clocked
+                else:
+                    self._format = TangyBufferType.Standard
+                return
+
         buffer_format: _tangy.buffer_format = _tangy.buffer_format.STANDARD
         if format == TangyBufferType.Clocked:
             buffer_format = _tangy.buffer_format.CLOCKED
 
+        memory_flags: u64 = _tangy.shmem_flags.SM_DEFAULT
+        if huge_pages:
+            memory_flags |= _tangy.shmem_flags.SM_HUGE_PAGES
+        if prefault:
+            memory_flags |= _tangy.shmem_flags.SM_PREFAULT
+        if lock_memory:
+            memory_flags |= _tangy.shmem_flags.SM_LOCKED
+        if self._file:
+            memory_flags |= _tangy.shmem_flags.SM_FILE
+            path_encoded = path.encode("utf-8")
+            c_name = path_encoded
+
+        layout: u64 = _tangy.srb_layout_flags.SRB_LAYOUT_DEFAULT
+        if arrival:
+            layout |= _tangy.srb_layout_flags.SRB_LAYOUT_ARRIVAL
+        if packed:
+            layout |= _tangy.srb_layout_flags.SRB_LAYOUT_PACKED
+
         result: _tangy.shmem_result = _tangy.tangy_buffer_init(
             buffer_format,
             c_name,
@@ -407,6 +585,10 @@ class TangyBuffer:
             resolution,
             clock_period,
             channel_count,
+            memory_flags,
+            layout,
+            channel_index,
+            block_size,
             self._ptr_buf,
         )
 
@@ -414,29 +596,105 @@ class TangyBuffer:
             raise_shmem_error(result)
 
         self._ptr_rb = cython.address(self._buf.buffer)
-        buffer_list_append(self)
 
         return
 
-    def __del__(self):
-        c_name: cython.p_char = self._name
-        flag: u8 = 0
-        result: _tangy.shmem_result = _tangy.shmem_exists(
-            c_name,
-            cython.address(flag),
+    @cython.cfunc
+    def _open_file(self, path: str):
+        path_encoded = path.encode("utf-8")
+        c_path: cython.p_char = path_encoded
+        result: _tangy.shmem_result = _tangy.tangy_buffer_open_file(
+            c_path, self._ptr_buf
         )
-        if exists == 0:
-            buffer_list_update()
+        if result.Ok is False:
+            raise_shmem_error(result)
+        self._ptr_rb = cython.address(self._buf.buffer)
+        if self._buf.format == _tangy.buffer_format.CLOCKED:
+            self._format = TangyBufferType.Clocked
+        else:
+            self._format = TangyBufferType.Standard
+
+        # only this process has the file open, the last writer may have
+        # stopped part way through a write
+        if _tangy.srb_get_reference_count(self._ptr_rb) == 1:
+            count: u64 = _tangy.srb_get_count(self._ptr_rb)
+            recovered: u64 = _tangy.tangy_buffer_recover(self._ptr_buf)
+            if recovered != count:
+                warn(f"Recovered buffer file {path} with {recovered} timetags, "
+                     f"{count} were recorded")
+
+    def __del__(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._ptr_rb == cython.NULL:
+            # the buffer was never created or connected to
             return
 
-        result = _tangy.tangy_buffer_deinit(self._ptr_buf)
+        if self._notify_fd >= 0:
+            _tangy.srb_unsubscribe(self._ptr_rb, self._notify_slot, self._notify_fd)
+            self._notify_fd = -1
+
+        result: _tangy.shmem_result = _tangy.tangy_buffer_deinit(self._ptr_buf)
         if result.Ok is False:
             raise_shmem_error(result)
-        buffer_list_update()
 
     def close(self):
         self.__del__()
 
+    @cython.cfunc
+    def _refresh(self) -> cython.bint:
+        # follow a resize made by another process, see resize
+        if _tangy.srb_get_resized(self._ptr_rb) == 0:
+            return False
+        c_name: cython.p_char = self._name
+        result: _tangy.shmem_result = _tangy.tangy_buffer_refresh(c_name, self._ptr_buf)
+        if result.Ok is False:
+            # the new segment is not named yet, try again on the next call
+            return False
+        return True
+
+    def resize(self, capacity: int):
+        """Change the number of timetags the buffer can hold
+
+        A new buffer with the same name and configuration is created, the
+            most recent timetags that fit are copied into it, along with the
+            channel index, block summaries and registered readers. Other
+            processes connected to the buffer move to the new buffer the next
+            time they use it, ``wait_for`` returns early so waiting processes
+            can move across.
+
+        Call from the process writing to the buffer between two calls to
+            ``push``, timetags written to the old buffer after the copy are
+            not seen by anyone. Processes connecting while the buffer is
+            resized may fail to find it. Arrays from ``view`` and
+            ``TangyReader.next_batch`` remain readable and hold the timetags
+            of the old buffer, which is released when the buffer is closed.
+            Not supported on Windows or for file backed buffers.
+
+        The cost grows with the number of timetags held, about 8 ms per
+            million ``Standard`` timetags and 13 ms per million ``Clocked``
+            timetags when doubling a full buffer, under twice the time taken
+            to ``pull`` them as most of it is spent faulting in the new buffer.
+            Measure on the target machine with ``tests/bench-resize.py``.
+
+        Args:
+            capacity (int): Number of timetags the resized buffer can hold
+
+        Examples:
+            Keep a longer history once a measurement turns out to be long
+            >>> buffer.resize(100_000_000)
+        """
+        assert capacity > 0, "Capacity must be greater than zero"
+        assert not self._file, "File backed buffers can not be resized"
+        self._refresh()
+        c_name: cython.p_char = self._name
+        result: _tangy.shmem_result = _tangy.tangy_buffer_resize(
+            c_name, capacity, self._ptr_buf
+        )
+        if result.Ok is False:
+            raise_shmem_error(result)
+
     def __len__(self):
         """Length of buffer
 
@@ -537,6 +795,7 @@ class TangyBuffer:
 
     @cython.cfunc
     def _call(self, time: float) -> int:
+        self._refresh()
         time_at_start: f64n = 0
         time_at_stop: f64n = 0
         (time_at_start, time_at_stop) = self.time_range()
@@ -581,6 +840,17 @@ class TangyBuffer:
         """
         return self._name.decode("utf-8")
 
+    @cython.cfunc
+    def _check_timing_settable(self):
+        # arrival times and packed records are written with the conversion
+        # factor the buffer was created with
+        layout: u64 = _tangy.srb_get_layout(self._ptr_rb)
+        if layout != _tangy.srb_layout_flags.SRB_LAYOUT_DEFAULT:
+            raise ValueError(
+                "The resolution and clock period of arrival and packed buffers "
+                "are fixed"
+            )
+
     @property
     def resolution(self) -> float:
         """Resolution of timetags in buffer
@@ -592,6 +862,7 @@ class TangyBuffer:
 
     @resolution.setter
     def resolution(self, res: float):
+        self._check_timing_settable()
         _tangy.srb_set_resolution(self._ptr_rb, res)
         cf: u64n = _tangy.srb_conversion_factor(res, self.clock_period)
         _tangy.srb_set_conversion_factor(self._ptr_rb, cf)
@@ -611,6 +882,7 @@ class TangyBuffer:
 
     @clock_period.setter
     def clock_period(self, period: float):
+        self._check_timing_settable()
         _tangy.srb_set_clock_period(self._ptr_rb, period)
         cf: u64n = _tangy.srb_conversion_factor(self.resolution, period)
         _tangy.srb_set_conversion_factor(self._ptr_rb, cf)
@@ -645,11 +917,105 @@ class TangyBuffer:
         Returns:
             (int): maximum number of timetags
         """
+        self._refresh()
         return _tangy.srb_get_capacity(self._ptr_rb)
 
     @property
     def count(self) -> int:
         """Number of timetags written to the buffer"""
+        self._refresh()
+        return _tangy.srb_get_count(self._ptr_rb)
+
+    def wait_for(
+        self, count: Optional[int] = None, timeout: object = None
+    ) -> int:
+        """Block until the buffer holds at least ``count`` timetags
+
+        The calling process sleeps until a writer publishes new timetags, no
+            polling of ``count`` is required. The GIL is released while waiting
+            so other Python threads keep running.
+
+        Args:
+            count (Optional[int] = None): Number of timetags to wait for,
+                defaults to waiting for any new timetag
+            timeout (Optional[float] = None): Maximum time to wait in seconds,
+                waits indefinitely if None
+
+        Returns:
+            (int): Number of timetags written to the buffer, will be less than
+                ``count`` if the timeout expired
+
+        Examples:
+            Process timetags as soon as they arrive
+            >>> while True:
+            >>>     count = buffer.wait_for(timeout=1.0)
+            >>>     print(buffer.singles(start=buffer.begin, stop=count - 1))
+        """
+        self._refresh()
+        target: u64 = 0
+        if count is None:
+            target = _tangy.srb_get_count(self._ptr_rb) + 1
+        else:
+            target = count
+
+        deadline: cython.double = -1.0
+        if timeout is not None:
+            deadline = monotonic() + float(timeout)
+
+        seconds: cython.double = -1.0
+        current: u64 = 0
+        while True:
+            if timeout is not None:
+                seconds = max(deadline - monotonic(), 0.0)
+            with cython.nogil:
+                current = _tangy.srb_wait_for(self._ptr_rb, target, seconds)
+            # waiting stops when the buffer is resized, continue on the new one
+            if (current >= target) or (not self._refresh()):
+                return current
+
+    def fileno(self) -> int:
+        """File descriptor that becomes readable when timetags are published
+
+        Allows a buffer to be added to ``select``/``poll`` based event loops,
+            such as ``asyncio`` or Tk's ``createfilehandler``, without a thread.
+            Call ``acknowledge`` from the callback to clear the descriptor.
+            Each reader holds one of a limited number of subscriber slots for
+            the lifetime of the object.
+
+        Returns:
+            (int): Readable file descriptor
+
+        Raises:
+            OSError: No subscriber slots are available or the platform does
+                not support named FIFOs (Windows)
+
+        Examples:
+            >>> loop = asyncio.get_event_loop()
+            >>> loop.add_reader(buffer.fileno(), on_new_timetags)
+        """
+        self._refresh()
+        if self._notify_fd < 0:
+            slot: u32 = 0
+            fd: cython.int = _tangy.srb_subscribe(
+                self._ptr_rb, cython.address(slot)
+            )
+            if fd < 0:
+                raise OSError("Unable to subscribe to buffer notifications")
+            self._notify_fd = fd
+            self._notify_slot = slot
+        return self._notify_fd
+
+    def acknowledge(self) -> int:
+        """Clear pending notifications on the descriptor returned by ``fileno``
+
+        Returns:
+            (int): Number of timetags written to the buffer
+        """
+        self._refresh()
+        if self._notify_fd >= 0:
+            _tangy.srb_acknowledge(
+                self._ptr_rb, self._notify_slot, self._notify_fd
+            )
         return _tangy.srb_get_count(self._ptr_rb)
 
     @property
@@ -668,6 +1034,154 @@ class TangyBuffer:
     def reference_count(self, rc: int):
         _tangy.srb_set_reference_count(self._ptr_rb, rc)
 
+    @property
+    def attachments(self) -> dict:
+        """Processes attached to the buffer
+
+        Each process that connects to the buffer is recorded in the buffer
+            along with the number of connections it holds. Connections held by
+            processes that have exited are removed when the next process
+            connects or when ``reap`` or ``buffer_list_update`` are called.
+
+        Returns:
+            (dict): Mapping of process id to number of connections
+        """
+        table = {}
+        i: u64
+        for i in range(_tangy.SRB_MAX_ATTACHMENTS):
+            pid: u64 = _tangy.srb_attachment_pid(self._ptr_rb, i)[0]
+            if pid != 0:
+                table[pid] = _tangy.srb_attachment_count(self._ptr_rb, i)[0]
+        return table
+
+    def register_reader(self, name: str, from_start: bool = False):
+        """Register a named reader that consumes timetags at least once
+
+        Readers are stored in the buffer, registering a name that already
+            exists resumes from that reader's last committed position, so a
+            consumer that is restarted continues where it stopped and is given
+            again the batch it had not committed. Timetags the writer
+            overwrites before the reader reads them are never delivered and
+            are counted in ``TangyReader.lost`` instead.
+
+        Args:
+            name (str): Name of reader, at most 23 characters
+            from_start (bool = False): New readers start at the oldest timetag
+                in the buffer rather than the next timetag written
+
+        Returns:
+            (TangyReader): Reader cursor
+
+        Raises:
+            OSError: All reader slots are in use
+
+        Examples:
+            >>> reader = buffer.register_reader("archiver")
+            >>> while True:
+            >>>     buffer.wait_for(reader.position + 1)
+            >>>     (channels, timetags) = reader.next_batch(100_000)
+            >>>     archive.write(channels, timetags)
+        """
+        self._refresh()
+        return TangyReader(self, name, from_start)
+
+    def coincidence_counter(
+        self,
+        channels: List[int],
+        window: float,
+        delays: Optional[List[float]] = None,
+        history: float = 1.0,
+    ):
+        """Counter of singles and coincidences that only reads new timetags
+
+        Counts from the next timetag written, see ``TangyCounter``.
+
+        Args:
+            channels (List[int]): channels to find coincidences between
+            window (float): maximum distance between timetags allowed
+            delays (Optional[List[float]] = None): delays for each channel
+            history (float = 1.0): time in seconds summed by
+                ``TangyCounter.rolling``
+
+        Returns:
+            (TangyCounter): Counter
+
+        Examples:
+            >>> counter = buffer.coincidence_counter([0, 1], 1e-9)
+            >>> while True:
+            >>>     sleep(0.1)
+            >>>     (singles, coincidences) = counter.update()
+        """
+        self._refresh()
+        return TangyCounter(self, channels, window, delays, history)
+
+    def unregister_reader(self, name: str):
+        """Remove a named reader from the buffer
+
+        Args:
+            name (str): Name of reader
+        """
+        name_encoded = name.encode("utf-8")
+        c_name: cython.p_char = name_encoded
+        index: i64 = _tangy.srb_reader_find(self._ptr_rb, c_name)
+        if index >= 0:
+            _tangy.srb_reader_unregister(self._ptr_rb, index)
+
+    def readers(self) -> List[dict]:
+        """Readers registered with the buffer
+
+        Returns:
+            (List[dict]): ``name``, ``position``, ``lag`` and ``lost`` for each
+                reader
+        """
+        self._refresh()
+        count: u64 = _tangy.srb_get_count(self._ptr_rb)
+        readers = []
+        i: u64
+        for i in range(_tangy.SRB_MAX_READERS):
+            if not _tangy.srb_reader_active(self._ptr_rb, i):
+                continue
+            position: u64 = _tangy.srb_reader_position(self._ptr_rb, i)
+            readers.append({
+                "name": _tangy.srb_reader_name(self._ptr_rb, i).decode("utf-8"),
+                "position": position,
+                "lag": count - position if count > position else 0,
+                "lost": _tangy.srb_reader_lost(self._ptr_rb, i),
+            })
+        return readers
+
+    def slowest_reader(self) -> Optional[dict]:
+        """Reader that has consumed the fewest timetags
+
+        Writers can use this to apply backpressure or raise an alarm before a
+            reader starts losing timetags, i.e. when ``lag`` approaches
+            ``capacity``.
+
+        Returns:
+            (Optional[dict]): ``name``, ``position``, ``lag`` and ``lost`` of the
+                slowest reader or None if no readers are registered
+        """
+        self._refresh()
+        index: i64 = _tangy.srb_reader_slowest(self._ptr_rb)
+        if index < 0:
+            return None
+        count: u64 = _tangy.srb_get_count(self._ptr_rb)
+        position: u64 = _tangy.srb_reader_position(self._ptr_rb, index)
+        return {
+            "name": _tangy.srb_reader_name(self._ptr_rb, index).decode("utf-8"),
+            "position": position,
+            "lag": count - position if count > position else 0,
+            "lost": _tangy.srb_reader_lost(self._ptr_rb, index),
+        }
+
+    def reap(self) -> int:
+        """Remove connections held by processes that have exited
+
+        Returns:
+            (int): Number of connections removed
+        """
+        return _tangy.srb_reap(self._ptr_rb)
+
     @property
     def channel_count(self) -> int:
         """Maximum number of channels in the buffer
@@ -684,7 +1198,60 @@ class TangyBuffer:
     def channel_count(self, n_ch: int):
         _tangy.srb_set_channel_count(self._ptr_rb, n_ch)
 
+    @property
+    def memory(self) -> dict:
+        """Options applied to the memory backing the buffer
+
+        Options requested on creation that could not be applied are reported
+            as ``False``. On Linux ``huge_page_bytes`` gives the amount of the
+            buffer currently mapped with huge pages in this process, which can
+            be zero even if huge pages were requested if they are disabled for
+            shared memory (see ``/sys/kernel/mm/transparent_hugepage/`` and
+            the ``huge=`` mount option of ``/dev/shm``).
+
+        Returns:
+            (dict): ``huge_pages``, ``prefault``, ``locked`` and
+                ``huge_page_bytes``
+        """
+        flags: u64 = _tangy.srb_get_memory_flags(self._ptr_rb)
+        return {
+            "huge_pages": (flags & _tangy.shmem_flags.SM_HUGE_PAGES) != 0,
+            "prefault": (flags & _tangy.shmem_flags.SM_PREFAULT) != 0,
+            "locked": (flags & _tangy.shmem_flags.SM_LOCKED) != 0,
+            "huge_page_bytes": self._huge_page_bytes(),
+        }
+
+    def _huge_page_bytes(self) -> int:
+        address: cython.size_t = cython.cast(cython.size_t, self._buf.buffer.map_ptr)
+        try:
+            with open("/proc/self/smaps", "r") as smaps:
+                in_mapping = False
+                for line in smaps:
+                    fields = line.split()
+                    if "-" in fields[0] and not fields[0].endswith(":"):
+                        in_mapping = int(fields[0].split("-")[0], 16) == address
+                    elif in_mapping and fields[0] in (
+                        "ShmemPmdMapped:",
+                        "FilePmdMapped:",
+                    ):
+                        return int(fields[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
     def configuration(self) -> dict:
+        self._refresh()
+        memory = self.memory
+        memory_mode = [
+            label
+            for (key, label) in (
+                ("huge_pages", "huge pages"),
+                ("prefault", "prefaulted"),
+                ("locked", "locked"),
+            )
+            if memory[key]
+        ]
+
         config = {
             "name": self._buf.buffer.name.decode("utf-8"),
             "format": self._format.name,
@@ -694,7 +1261,15 @@ class TangyBuffer:
             "clock period": self.clock_period,
             "#-channels": self.channel_count,
             "reference_count": self.reference_count,
+            "memory": ", ".join(memory_mode) if memory_mode else "default",
+            "channel index": _tangy.srb_get_channel_index(self._ptr_rb),
+            "block size": _tangy.srb_get_block_size(self._ptr_rb),
+            "backing": "file" if self._file else "shared",
         }
+        if self._buf.format == _tangy.buffer_format.CLOCKED:
+            layout: u64 = _tangy.srb_get_layout(self._ptr_rb)
+            config["arrival"] = (layout & _tangy.srb_layout_flags.SRB_LAYOUT_ARRIVAL) != 0
+            config["packed"] = (layout & _tangy.srb_layout_flags.SRB_LAYOUT_PACKED) != 0
 
         return config
 
@@ -722,6 +1297,7 @@ class TangyBuffer:
 
     @cython.ccall
     def oldest_time(self) -> float:
+        self._refresh()
         return _tangy.tangy_oldest_time(self._ptr_buf)
 
     @cython.ccall
@@ -730,6 +1306,7 @@ class TangyBuffer:
         Returns:
             (float): Most recent timetag as time
         """
+        self._refresh()
         return _tangy.tangy_current_time(self._ptr_buf)
 
     @cython.ccall
@@ -738,6 +1315,7 @@ class TangyBuffer:
         Returns:
             (float): Time between oldest and newest timetags
         """
+        self._refresh()
         return _tangy.tangy_time_in_buffer(self._ptr_buf)
 
     @cython.ccall
@@ -753,15 +1331,8 @@ class TangyBuffer:
         Returns:
             (int): Index of first record in buffer
         """
-        count: u64n = self.count
-        capacity: u64n = self.capacity
-
-        start: u64n = 0
-
-        if count > capacity:
-            start = count - capacity
-
-        return start
+        self._refresh()
+        return _tangy.tangy_oldest_index(self._ptr_buf)
 
     @property
     def end(self) -> int:
@@ -805,6 +1376,159 @@ class TangyBuffer:
 
     @cython.ccall
     def pull(self, start: u64n, stop: u64n):
+        """Copy records in the range [start, stop) out of the buffer
+
+        If the writer has overwritten the start of the range, either before
+        or during the copy, the range is truncated to the records that are
+        still intact and a warning is issued.
+
+        Args:
+            start (int): Index of first record to copy
+            stop (int): Index one past the last record to copy
+
+        Returns:
+            (Tuple[NDArray[u8], NDArray[u64]] |\
+                Tuple[NDArray[u8], Tuple[NDArray[u64], NDArray[u64]]]):\
+                channels and timetags of the records
+
+        Raises:
+            IndexError: if the whole range has been overwritten
+        """
+        self._refresh()
+        valid_from: u64n = _tangy.tangy_valid_from(self._ptr_buf)
+        while True:
+            if valid_from >= stop:
+                raise IndexError(
+                    f"Records [{start}, {stop}) have been overwritten")
+            if start < valid_from:
+                warn(f"Records [{start}, {valid_from}) have been overwritten, "
+                     f"returning [{valid_from}, {stop})")
+                start = valid_from
+            records = self._pull(start, stop)
+            valid_from = _tangy.tangy_valid_from(self._ptr_buf)
+            if start >= valid_from:
+                return records
+
+    def view(self, start: Optional[int] = None, stop: Optional[int] = None):
+        """Read-only view of the records in the range [start, stop)
+
+        Unlike ``pull`` no records are copied, see ``TangyView``.
+
+        Args:
+            start (Optional[int]): Index of first record, defaults to the oldest
+                record in the buffer
+            stop (Optional[int]): Index one past the last record, defaults to
+                the number of records written
+
+        Returns:
+            (TangyView): View of the records
+
+        Raises:
+            IndexError: if the range has been overwritten or not yet written
+        """
+        self._refresh()
+        if start is None:
+            start = self.begin
+        if stop is None:
+            stop = self.count
+        if stop < start:
+            raise IndexError(f"Invalid range [{start}, {stop})")
+        if stop > self.count:
+            raise IndexError(
+                f"Records [{self.count}, {stop}) have not been written")
+        if start < _tangy.tangy_valid_from(self._ptr_buf):
+            raise IndexError(f"Records from {start} have been overwritten")
+        return TangyView(self, start, stop)
+
+    def snapshot(
+        self,
+        read_time: Optional[float] = None,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+    ):
+        """Private copy of a range of the buffer that the writer can not change
+
+        The records are copied into a new buffer with the configuration of
+            this one, including its channel index and block summaries, at the
+            same positions. Every method of ``TangyBuffer`` then works on the
+            snapshot, so several analyses see exactly the same timetags however
+            long they take, while the writer carries on. The copy runs at
+            memory bandwidth, about the cost of ``pull``, and other processes
+            can not connect to the snapshot.
+
+        Args:
+            read_time (Optional[float] = None): Length of time before the most
+                recent timetag to copy, as for ``singles``. Analyses with
+                delays read up to the largest delay further back, include it
+                in ``read_time``
+            start (Optional[int] = None): Index of first record to copy, used
+                when ``read_time`` is not given. Defaults to the oldest record
+            stop (Optional[int] = None): Index one past the last record to
+                copy, defaults to the number of records written
+
+        Returns:
+            (TangyBuffer): Buffer holding the records [start, stop)
+
+        Raises:
+            IndexError: if the range has not been written or has been
+                overwritten
+
+        Examples:
+            Measure the singles and coincidences of the same second of data
+            >>> snapshot = buffer.snapshot(1.0)
+            >>> total, singles = snapshot.singles(1.0)
+            >>> count = snapshot.coincidence_count(1.0, 1e-9, [0, 1])
+        """
+        self._refresh()
+        if stop is None:
+            stop = self.count
+        if stop > self.count:
+            raise IndexError(
+                f"Records [{self.count}, {stop}) have not been written")
+
+        if read_time:
+            if read_time >= self.time_in_buffer():
+                start = self.begin
+            else:
+                start = self.lower_bound(self.current_time() - read_time)
+        elif start is None:
+            start = self.begin
+        if stop < start:
+            raise IndexError(f"Invalid range [{start}, {stop})")
+
+        valid_from: u64n = _tangy.tangy_valid_from(self._ptr_buf)
+        if valid_from >= stop and stop > start:
+            raise IndexError(f"Records [{start}, {stop}) have been overwritten")
+        if start < valid_from:
+            warn(f"Records [{start}, {valid_from}) have been overwritten, "
+                 f"copying [{valid_from}, {stop})")
+            start = valid_from
+
+        snapshot: TangyBuffer = TangyBuffer.__new__(TangyBuffer)
+        snapshot._notify_fd = -1
+        snapshot._closed = True
+        snapshot._file = False
+        snapshot._format = self._format
+        snapshot._name = f"{self.name}.snapshot.{getpid()}.{id(snapshot)}".encode(
+            "utf-8")
+        snapshot._ptr_buf = cython.address(snapshot._buf)
+
+        c_name: cython.p_char = snapshot._name
+        result: _tangy.shmem_result = _tangy.tangy_buffer_snapshot(
+            self._ptr_buf, c_name, start, stop, snapshot._ptr_buf
+        )
+        if result.Ok is False:
+            raise_shmem_error(result)
+        snapshot._ptr_rb = cython.address(snapshot._buf.buffer)
+        snapshot._closed = False
+
+        if snapshot.begin > start:
+            warn(f"Records [{start}, {snapshot.begin}) were overwritten while "
+                 f"they were copied, the snapshot holds [{snapshot.begin}, {stop})")
+        return snapshot
+
+    @cython.cfunc
+    def _pull(self, start: u64n, stop: u64n):
         total: u64n = stop - start
 
         slice: _tangy.tangy_field_ptrs
@@ -843,35 +1567,49 @@ class TangyBuffer:
         channels: ndarray(u8n),
         timetags: Union[ndarray(u64n), Tuple[ndarray(u64n), ndarray(u64n)]],
     ):
+        self._refresh()
         total: u64n = len(channels)
 
         start: u64n = self.count
         stop: u64n = start + total
 
-        count_pushed: u64n = 0
+        t_buf: _tangy.tangy_buffer = self._buf
+        _start: u64 = start
+        _stop: u64 = stop
+        count_pushed: u64 = 0
         slice: _tangy.tangy_field_ptrs
         if self._buf.format == _tangy.buffer_format.STANDARD:
             slice = self.slice_from_pointers(
                 total, channels, timestamps=timetags, clocks=None, deltas=None
             )
             assert slice.standard.length > 0, "No timetags to push"
-            count_pushed = _tangy.tangy_buffer_push(
-                self._ptr_buf, cython.address(slice), start, stop
-            )
+            with cython.nogil:
+                count_pushed = _tangy.tangy_buffer_push(
+                    cython.address(t_buf), cython.address(slice), _start, _stop
+                )
 
         if self._buf.format == _tangy.buffer_format.CLOCKED:
+            packed: cython.pointer(u64) = self._buf.slice.clocked.packed
+            if packed != cython.NULL and total > 0:
+                delta_bits: u64 = self._buf.slice.clocked.delta_bits
+                assert timetags[1].max() <= self._buf.slice.clocked.delta_mask, \
+                    "Delta does not fit in a packed timetag"
+                assert (timetags[0].max() >> (64 - delta_bits)) == 0, \
+                    "Clock does not fit in a packed timetag"
             slice = self.slice_from_pointers(
                 total, channels, timestamps=None, clocks=timetags[0], deltas=timetags[1]
             )
             assert slice.clocked.length > 0, "No timetags to push"
-            count_pushed = _tangy.tangy_buffer_push(
-                self._ptr_buf, cython.address(slice), start, stop
-            )
+            with cython.nogil:
+                count_pushed = _tangy.tangy_buffer_push(
+                    cython.address(t_buf), cython.address(slice), _start, _stop
+                )
 
         return count_pushed
 
     @cython.ccall
     def clear(self):
+        self._refresh()
         _tangy.tangy_clear_buffer(self._ptr_buf)
 
     @cython.ccall
@@ -890,6 +1628,7 @@ class TangyBuffer:
             than or equal to ``buffer.time_in_buffer() - time``
 
         """
+        self._refresh()
         bins: u64n = self.bins_from_time(time)
         index: u64n = _tangy.tangy_lower_bound(self._ptr_buf, bins)
         return index
@@ -949,20 +1688,30 @@ class TangyBuffer:
         if type(channels) is int:
             channels = [channels]
 
+        # select from a view of the buffer rather than a copy of the range,
+        # falling back to a copy if the writer overwrites the view
+        segments = [(ch, tt) for (ch, tt) in self.view(start, stop)]
+        if not _tangy.srb_range_intact(self._ptr_rb, start):
+            segments = [self[start:stop]]
+
         tag_arrays = []
         if self._buf.format == _tangy.buffer_format.STANDARD:
-            (ch, tt) = self[start:stop]
             for c in channels:
-                channel_mask = ch == c
-                if channel_mask.sum() != 0:
-                    tag_arrays.append((c, tt[channel_mask]))
+                selected = [tt[ch == c] for (ch, tt) in segments]
+                tt_c = concatenate(selected)
+                if len(tt_c) != 0:
+                    tag_arrays.append((c, tt_c))
 
         if self._buf.format == _tangy.buffer_format.CLOCKED:
-            (ch, (cl, dt)) = self[start:stop]
             for c in channels:
-                channel_mask = ch == c
-                if channel_mask != 0:
-                    tag_arrays.append((c, (cl[channel_mask], dt[channel_mask])))
+                masks = [ch == c for (ch, _) in segments]
+                cl_c = concatenate([cl[m] for ((_, (cl, _)), m) in zip(segments, masks)])
+                dt_c = concatenate([dt[m] for ((_, (_, dt)), m) in zip(segments, masks)])
+                if len(cl_c) != 0:
+                    tag_arrays.append((c, (cl_c, dt_c)))
+
+        if not _tangy.srb_range_intact(self._ptr_rb, start):
+            warn(f"Records from {start} were overwritten while selecting timetags")
 
         return tag_arrays
 
@@ -972,6 +1721,7 @@ class TangyBuffer:
         read_time: Optional[float] = None,
         start: Optional[int] = None,
         stop: Optional[int] = None,
+        threads: int = 1,
     ) -> Tuple[int, List[int]]:
         """Count the occurrences of each channel over a region of the buffer
 
@@ -981,6 +1731,7 @@ class TangyBuffer:
             read_time (Optional[float] = None): Length of time to integrate over
             start (Optional[int] = None): Buffer position to start counting from
             stop (Optional[int] = None): Buffer position to sotp counting to
+            threads (int = 1): Native threads to count on, 0 for every core
 
         Returns:
             (int, List[int]): Total counts and list of total counts on each channel
@@ -995,6 +1746,7 @@ class TangyBuffer:
             Count the singles in the last 1000 tags
             >>> tangy.singles(buffer, buffer.count - 1000, buffer.count)
         """
+        self._refresh()
 
         counters: u64n[:] = zeros(self.channel_count, dtype=u64n)
         counters_view: u64[::1] = counters
@@ -1013,10 +1765,18 @@ class TangyBuffer:
             # stop: u64n = self.count - 1
             stop: u64n = self.end
 
-        total: u64n = 0
-        total = _tangy.tangy_singles(
-            self._ptr_buf, start, stop, cython.address(counters_view[0])
-        )
+        # kernels run on a copy of the buffer so a refresh from another thread
+        # can not swap the segment out from under them
+        t_buf: _tangy.tangy_buffer = self._buf
+        _start: u64 = start
+        _stop: u64 = stop
+        _counters: cython.pointer(u64) = cython.address(counters_view[0])
+        _n_threads: u64 = _thread_count(threads)
+        total: u64 = 0
+        with cython.nogil:
+            total = _tangy.tangy_singles(
+                cython.address(t_buf), _start, _stop, _counters, _n_threads
+            )
         return (total, counters)
 
     @cython.boundscheck(False)
@@ -1028,6 +1788,8 @@ class TangyBuffer:
         window: float,
         channels: List[int],
         delays: Optional[List[float]] = None,
+        engine: CoincidenceEngine = CoincidenceEngine.Pattern,
+        threads: int = 1,
     ) -> int:
         """Count coincidences
 
@@ -1043,11 +1805,17 @@ class TangyBuffer:
             window (float): maximum distance between timetags allowed
             channels (List[int]): channels to find coincidences between
             delays (Optional[List[float]] = None,): delays for each channel
+            engine (CoincidenceEngine = CoincidenceEngine.Pattern): kernel
+                used to find the coincidences, see ``CoincidenceEngine``
+            threads (int = 1): Native threads to count on, 0 for every core.
+                With more than one the ``Window`` engine is used whatever
+                ``engine`` is, both count the same coincidences
 
         Returns:
             (int): Number of coincidences found
 
         """
+        self._refresh()
 
         _n_channels = len(channels)
 
@@ -1067,15 +1835,29 @@ class TangyBuffer:
 
         _delays_view: cython.double[::1] = array(delays, dtype=f64n)
 
-        count = 0
-        count = _tangy.tangy_coincidence_count(
-            self._ptr_buf,
-            _n_channels,
-            cython.address(_channels_view[0]),
-            cython.address(_delays_view[0]),
-            window,
-            read_time,
-        )
+        _engine: _tangy.coincidence_engine = _tangy.coincidence_engine.ENGINE_PATTERN
+        if engine == CoincidenceEngine.Window:
+            _engine = _tangy.coincidence_engine.ENGINE_WINDOW
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _n: u64 = _n_channels
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _delays_ptr: cython.pointer(cython.double) = cython.address(_delays_view[0])
+        _window: cython.double = window
+        _read_time: cython.double = read_time
+        _n_threads: u64 = _thread_count(threads)
+        count: u64 = 0
+        with cython.nogil:
+            count = _tangy.tangy_coincidence_count(
+                cython.address(t_buf),
+                _n,
+                _channels_ptr,
+                _delays_ptr,
+                _window,
+                _read_time,
+                _engine,
+                _n_threads,
+            )
 
         return count
 
@@ -1088,6 +1870,7 @@ class TangyBuffer:
         window: float,
         channels: List[int],
         delays: Optional[List[float]] = None,
+        engine: CoincidenceEngine = CoincidenceEngine.Pattern,
     ) -> Optional[Records]:
         """Collect coincident timetags
 
@@ -1103,11 +1886,14 @@ class TangyBuffer:
             window (float): maximum distance between timetags allowed
             channels (List[int]): channels to find coincidences between
             delays (Optional[List[float]] = None,): delays for each channel
+            engine (CoincidenceEngine = CoincidenceEngine.Pattern): kernel
+                used to find the coincidences, see ``CoincidenceEngine``
 
         Returns:
             (Records): Records found in coincidence
 
         """
+        self._refresh()
 
         _n_channels = len(channels)
 
@@ -1127,18 +1913,33 @@ class TangyBuffer:
 
         _delays_view: cython.double[::1] = array(delays, dtype=f64n)
 
-        count = 0
-        count = _tangy.tangy_coincidence_collect(
-            self._ptr_buf,
-            _n_channels,
-            cython.address(_channels_view[0]),
-            cython.address(_delays_view[0]),
-            window,
-            read_time,
-            cython.address(self._buf.records),
-        )
+        _engine: _tangy.coincidence_engine = _tangy.coincidence_engine.ENGINE_PATTERN
+        if engine == CoincidenceEngine.Window:
+            _engine = _tangy.coincidence_engine.ENGINE_WINDOW
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _n: u64 = _n_channels
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _delays_ptr: cython.pointer(cython.double) = cython.address(_delays_view[0])
+        _window: cython.double = window
+        _read_time: cython.double = read_time
+        records: _tangy.tangy_record_vec
+        _tangy.tangy_records_init(self._buf.format, cython.address(records))
+        count: u64 = 0
+        with cython.nogil:
+            count = _tangy.tangy_coincidence_collect(
+                cython.address(t_buf),
+                _n,
+                _channels_ptr,
+                _delays_ptr,
+                _window,
+                _read_time,
+                cython.address(records),
+                _engine,
+            )
 
         if count == 0:
+            _tangy.tangy_records_deinit(self._buf.format, cython.address(records))
             warnings.warn("No coincidences found")
             return None
 
@@ -1159,8 +1960,9 @@ class TangyBuffer:
             )
 
         _tangy.tangy_records_copy(
-            self._buf.format, cython.address(self._buf.records), cython.address(slice)
+            self._buf.format, cython.address(records), cython.address(slice)
         )
+        _tangy.tangy_records_deinit(self._buf.format, cython.address(records))
 
         if self._buf.format == _tangy.buffer_format.STANDARD:
             # return count, (channels, timetags)
@@ -1177,69 +1979,241 @@ class TangyBuffer:
                 count, self.resolution, self.clock_period, _channels, (clocks, deltas)
             )
 
-    @cython.ccall
-    def timetrace(
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def coincidence_counts(
         self,
-        channels: Union[int, List[int]],
         read_time: float,
-        resolution: float = 10.0,
-    ):
-        """Time trace of buffer for chosen channels and read time
-
-        Produces an array of count rates accumulated for the chosen channels
-            over the read time specified. The read time is taken as time from
-            the most recent timetag in the buffer, e.g. a read time of 1s in a
-            buffer containing 100s will give a result from the 99th second to the
-            100th.
+        window: float,
+        patterns: Optional[List[List[int]]] = None,
+        delays: Optional[List[float]] = None,
+        channels: Optional[List[int]] = None,
+    ) -> Union[ndarray, dict]:
+        """Count the coincidences of many patterns at once
+
+        Counts every pattern, or every subset of ``channels``, in a single pass
+            over the timetags, each as ``coincidence_count`` with the
+            ``Window`` engine would count it. Much faster than calling
+            ``coincidence_count`` once per pattern since the scan is limited by
+            memory bandwidth rather than by the number of patterns. With
+            unequal delays every channel is read over the span that
+            ``coincidence_count`` uses for a pattern containing the channel
+            with the largest delay, so patterns without that channel can
+            differ close to the start of ``read_time``.
 
         Args:
-            channels (List[int]): Channels to count timetags of
-            read_time (float): Amount of time to measure over, In seconds
-            resolution (float = 10.0): Size of bins in seconds
+            read_time (float): time to integrate over
+            window (float): maximum distance between timetags allowed
+            patterns (Optional[List[List[int]]] = None): channels of each
+                pattern to count
+            delays (Optional[List[float]] = None): delay of each channel of
+                the buffer, indexed by channel
+            channels (Optional[List[int]] = None): count every subset of these
+                channels instead of ``patterns``, at most 16 channels
 
         Returns:
-            (ndarray): intensities
+            (NDArray[u64] | dict): Number of coincidences of each pattern, or a
+                dictionary from each subset of ``channels`` as a tuple to its
+                number of coincidences. Subsets of a single channel give the
+                singles over the read time
 
+        Examples:
+            Count the coincidences between detectors for tomography
+            >>> counts = buffer.coincidence_counts(1.0, 1e-9,
+            ...                                    [[0, 2], [0, 3], [1, 2], [1, 3]])
+
+            Count every combination of four detectors
+            >>> counts = buffer.coincidence_counts(1.0, 1e-9, channels=[0, 1, 2, 3])
+            >>> counts[(0, 1, 3)]
         """
-        n_channels: u64n = 1
+        self._refresh()
 
-        channels_arr: u8n[:]
+        assert (patterns is None) != (channels is None), (
+            "Supply either patterns or channels"
+        )
 
-        if isinstance(channels, (list)):
-            n_channels = len(channels)
-            channels_arr = zeros(n_channels, dtype=u8n)
-            channels_arr = asarray(channels, dtype=u8n)
-        elif isinstance(channels, (int)):
-            channels_arr = zeros(n_channels, dtype=u8n)
-            channels_arr[0] = channels
+        if channels is not None:
+            assert len(set(channels)) == len(channels), "Channels must be distinct"
+            assert len(channels) <= _tangy.COINCIDENCE_SUBSETS_MAX, (
+                f"At most {_tangy.COINCIDENCE_SUBSETS_MAX} channels"
+            )
+            used = list(channels)
+        else:
+            used = sorted(set(c for pattern in patterns for c in pattern))
+            assert len(used) <= 64, "At most 64 channels across all patterns"
 
-        # print(n_channels, channels_arr)
+        assert max(used) < self.channel_count, (
+            f"Requested channel {max(used)} when maximum channel available in {self.channel_count}"
+        )
 
-        # channels_view: cython.uchar[::1] = asarray(channels, dtype=u8n)
-        channels_view: cython.uchar[::1] = channels_arr
+        _n_channels = len(used)
+        _channels: ndarray(u8n) = array(used, dtype=u8n)
+        _channels_view: cython.uchar[::1] = _channels
 
-        bin_width: u64n = round(resolution / self.resolution)
-        start: u64 = self.lower_bound(self.current_time() - read_time)
-        stop: u64 = self.count
-        length: u64 = round(read_time / resolution)
+        if delays is None:
+            delays: List[float] = [0 for i in range(self.channel_count)]
+        _delays_view: cython.double[::1] = array(
+            [delays[c] for c in used], dtype=f64n
+        )
 
-        intensities: u64n[:] = zeros(length - 1, dtype=u64n)
-        intensities_view: u64[:] = intensities
+        _n_patterns: u64 = 0
+        n_counts = 1 << _n_channels
+        if patterns is not None:
+            _n_patterns = len(patterns)
+            n_counts = _n_patterns
+        _patterns: ndarray(u64n) = zeros(max(_n_patterns, 1), dtype=u64n)
+        for k in range(_n_patterns):
+            for c in patterns[k]:
+                _patterns[k] |= 1 << used.index(c)
+        _patterns_view: u64[::1] = _patterns
+
+        counts: ndarray(u64n) = zeros(n_counts, dtype=u64n)
+        _counts_view: u64[::1] = counts
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _n: u64 = _n_channels
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _delays_ptr: cython.pointer(cython.double) = cython.address(_delays_view[0])
+        _patterns_ptr: cython.pointer(u64) = cython.address(_patterns_view[0])
+        _counts_ptr: cython.pointer(u64) = cython.address(_counts_view[0])
+        _window: cython.double = window
+        _read_time: cython.double = read_time
+        with cython.nogil:
+            _tangy.tangy_coincidence_counts(
+                cython.address(t_buf),
+                _n,
+                _channels_ptr,
+                _delays_ptr,
+                _window,
+                _read_time,
+                _n_patterns,
+                _patterns_ptr,
+                _counts_ptr,
+            )
 
-        count: u64 = _tangy.tangy_timetrace(
-            self._ptr_buf,
-            start,
-            stop,
-            bin_width,
-            cython.address(channels_view[0]),
-            n_channels,
-            length,
-            cython.address(intensities_view[0]),
+        if patterns is not None:
+            return counts
+
+        subsets = {}
+        for mask in range(1, n_counts):
+            subset = tuple(used[j] for j in range(_n_channels) if mask & (1 << j))
+            subsets[subset] = int(counts[mask])
+        return subsets
+
+    @cython.ccall
+    def timetrace(
+        self,
+        channels: Union[int, List[int]],
+        read_time: float,
+        resolution: float = 10.0,
+        threads: int = 1,
+    ):
+        """Time trace of buffer for chosen channels and read time
+
+        Produces an array of count rates accumulated for the chosen channels
+            over the read time specified. The read time is taken as time from
+            the most recent timetag in the buffer, e.g. a read time of 1s in a
+            buffer containing 100s will give a result from the 99th second to the
+            100th. The bins end at the most recent timetag and there are enough
+            of them to cover the whole read time, see ``timetraces``.
+
+        Args:
+            channels (List[int]): Channels to count timetags of
+            read_time (float): Amount of time to measure over, In seconds
+            resolution (float = 10.0): Size of bins in seconds
+            threads (int = 1): Native threads to count on, 0 for every core
+
+        Returns:
+            (ndarray): intensities
+
+        """
+        if isinstance(channels, (int)):
+            channels = [channels]
+
+        traces: ndarray(u64n) = self.timetraces(
+            sorted(set(channels)), read_time, resolution, threads
         )
+        intensities: ndarray(u64n) = traces.sum(axis=0, dtype=u64n)
 
-        assert count > 0, "No data found"
+        assert intensities.sum() > 0, "No data found"
         return intensities
 
+    @cython.ccall
+    def timetraces(
+        self,
+        channels: List[int],
+        read_time: float,
+        bin_width: float,
+        threads: int = 1,
+    ):
+        """Time trace of each of several channels in a single pass
+
+        Counts the timetags of every channel in bins of ``bin_width``. The
+            bins end at the most recent timetag and there are enough of them
+            to cover the read time, the oldest bin starting up to one bin
+            width before the read time. Bins spanning many blocks of the
+            block summaries (see ``block_size``) are counted from the
+            summaries after finding the edges of the bin with a binary
+            search, narrower bins by reading every timetag once.
+
+        Args:
+            channels (List[int]): Channels to trace
+            read_time (float): Amount of time to trace, in seconds
+            bin_width (float): Width of bins in seconds
+            threads (int = 1): Native threads to count on, 0 for every core
+
+        Returns:
+            (NDArray[u64]): Counts of shape ``(len(channels), bins)``,
+                ``traces[i]`` the trace of ``channels[i]`` from the oldest bin
+
+        Examples:
+            Count rates of 8 detectors over the last 10 s in 10 ms bins
+            >>> traces = buffer.timetraces(list(range(8)), 10.0, 10e-3)
+            >>> rates = traces / 10e-3
+        """
+        self._refresh()
+
+        _n_channels = len(channels)
+        assert _n_channels >= 1, "At least one channel is required"
+        assert len(set(channels)) == _n_channels, "Channels must be distinct"
+        assert max(channels) < self.channel_count, (
+            f"Requested channel {max(channels)} when maximum channel available in {self.channel_count}"
+        )
+
+        width: u64 = max(round(bin_width / self.resolution), 1)
+        length: u64 = max(int(ceil(read_time / self.resolution / width)), 1)
+        newest: u64 = round(self.current_time() / self.resolution)
+        origin: u64 = 0
+        if newest + 1 > length * width:
+            origin = newest + 1 - length * width
+
+        _channels_view: cython.uchar[::1] = array(channels, dtype=u8n)
+        traces: ndarray(u64n) = zeros((_n_channels, length), dtype=u64n)
+        _traces_view: u64[:, ::1] = traces
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _n: u64 = _n_channels
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _traces_ptr: cython.pointer(u64) = cython.address(_traces_view[0, 0])
+        _n_threads: u64 = _thread_count(threads)
+        start: u64 = 0
+        stop: u64 = self.count
+        with cython.nogil:
+            start = _tangy.tangy_lower_bound(cython.address(t_buf), origin)
+            _tangy.tangy_channel_traces(
+                cython.address(t_buf),
+                start,
+                stop,
+                origin,
+                width,
+                _n,
+                _channels_ptr,
+                length,
+                _traces_ptr,
+                _n_threads,
+            )
+        return traces
+
     @cython.ccall
     def relative_delay(
         self,
@@ -1248,19 +2222,32 @@ class TangyBuffer:
         read_time: float,
         resolution: float = 1e-9,
         window: Optional[float] = None,
+        all_pairs: bool = False,
+        threads: int = 1,
     ) -> delay_result:
         """Relative delay between two channels
 
+        By default each timetag is only paired with the most recent timetag on
+            the other channel, which biases the histogram towards short delays
+            at high count rates. With ``all_pairs`` every pair of timetags
+            within the window is counted (multi-start, multi-stop), giving an
+            unbiased cross-correlation on a flat background of accidentals that
+            is subtracted before fitting.
+
         Args:
             channel_a (int): First channel
             channel_b (int): Second channel
             read_time (float,): Time to integrate over
             resolution (float = 1e-9,): Resolution of bins
             window (Optional[float] = None): Correlation window
+            all_pairs (bool = False): Count every pair within the window
+            threads (int = 1): Native threads to histogram on, 0 for every
+                core
 
         Returns:
             (delay_result): Dataclass containing histogram data and fitting results
         """
+        self._refresh()
 
         # PERF: replace time trace with singles()
         # NOTE: decay (tau) is ≈ 1 / singles(channelX), so we have:
@@ -1297,29 +2284,66 @@ class TangyBuffer:
         start: u64 = self.lower_bound(self.current_time() - read_time)
         stop: u64 = self.count
 
-        _tangy.tangy_relative_delay(
-            self._ptr_buf,
-            start,
-            stop,
-            u64n(correlation_window),
-            resolution_measurment,
-            channel_a,
-            channel_b,
-            length,
-            cython.address(intensity_view[0]),
-        )
+        t_buf: _tangy.tangy_buffer = self._buf
+        _window: u64 = u64n(correlation_window)
+        _resolution: u64 = resolution_measurment
+        _a: u8 = channel_a
+        _b: u8 = channel_b
+        _length: u64 = length
+        _intensities_ptr: cython.pointer(u64) = cython.address(intensity_view[0])
+        _n_threads: u64 = _thread_count(threads)
+        _all_pairs: cython.bint = all_pairs
+        with cython.nogil:
+            if _all_pairs:
+                _tangy.tangy_cross_correlation(
+                    cython.address(t_buf),
+                    start,
+                    stop,
+                    _window,
+                    _resolution,
+                    0,
+                    _a,
+                    _b,
+                    _length,
+                    _intensities_ptr,
+                    _n_threads,
+                )
+            else:
+                _tangy.tangy_relative_delay(
+                    cython.address(t_buf),
+                    start,
+                    stop,
+                    _window,
+                    _resolution,
+                    _a,
+                    _b,
+                    _length,
+                    _intensities_ptr,
+                    _n_threads,
+                )
+
+        background = 0.0
+        if all_pairs:
+            background = median(intensity_array)
+        peak = intensity_array - background
 
         times = (arange(length) - (length // 2)) * resolution
-        max_idx = intensity_array.argmax()
+        max_idx = peak.argmax()
         t0 = times[max_idx]
 
         tau = 2 / intensity_average
-        max_intensity = intensity_array.max()
+        max_intensity = peak.max()
 
         guess = [tau, tau, t0, max_intensity]
-
-        [opt, cov] = curve_fit(double_decay, times, intensity_array, p0=guess)
-        hist_fit = double_decay(times, *opt)
+        try:
+            [opt, cov] = curve_fit(double_decay, times, peak, p0=guess)
+        except RuntimeError:
+            warn("Fit of the delay histogram did not converge, using the peak bin")
+            opt = guess
+        if (not isfinite(opt).all()) or not (times[0] <= opt[2] <= times[-1]):
+            warn("Fit of the delay histogram is outside the window, using the peak bin")
+            opt = guess
+        hist_fit = double_decay(times, *opt) + background
 
         # central_delay = t0
 
@@ -1336,6 +2360,290 @@ class TangyBuffer:
 
         return result
 
+    def find_delay(
+        self,
+        channel_a: int,
+        channel_b: int,
+        read_time: float,
+        max_delay: float = 1e-5,
+        resolution: float = 1e-10,
+        coarse_bins: int = 1 << 22,
+        threads: int = 1,
+    ) -> delay_result:
+        """Find a large unknown delay between two channels
+
+        Bins both channels into coarse time traces of at most ``coarse_bins``
+            bins, cross-correlates the traces with an FFT to locate the delay
+            to within a coarse bin, then histograms every pair of timetags
+            within a coarse bin of that delay at ``resolution``, as
+            ``relative_delay`` does with ``all_pairs``. The cost of searching
+            a delay range no longer grows with ``max_delay / resolution``.
+
+        Args:
+            channel_a (int): First channel
+            channel_b (int): Second channel
+            read_time (float): Time to integrate over
+            max_delay (float = 1e-5): Largest delay, of either sign, to search
+            resolution (float = 1e-10): Resolution of the fine histogram
+            coarse_bins (int = 1 << 22): Largest number of bins in the coarse
+                time traces
+            threads (int = 1): Native threads to bin and histogram on, 0 for
+                every core
+
+        Returns:
+            (delay_result): Dataclass containing the fine histogram, with
+                times of channel b after channel a, and fitting results
+
+        Examples:
+            Find the delay of a detector after a fibre was replaced
+            >>> result = buffer.find_delay(0, 1, 10.0, max_delay=20e-6)
+            >>> result.central_delay
+        """
+        self._refresh()
+
+        start: u64 = self.lower_bound(self.current_time() - read_time)
+        stop: u64 = self.count
+        origin: u64 = u64n(max(self.current_time() - read_time, 0) / self.resolution)
+
+        fine_bins: u64 = max(round(resolution / self.resolution), 1)
+        coarse_width: u64 = max(
+            int(ceil(read_time / self.resolution / coarse_bins)), fine_bins
+        )
+        length: u64 = int(ceil(read_time / self.resolution / coarse_width)) + 1
+
+        _channels_view: cython.uchar[::1] = array([channel_a, channel_b], dtype=u8n)
+        traces: ndarray(u64n) = zeros(2 * length, dtype=u64n)
+        _traces_view: u64[::1] = traces
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _traces_ptr: cython.pointer(u64) = cython.address(_traces_view[0])
+        _n_threads: u64 = _thread_count(threads)
+        counted: u64 = 0
+        with cython.nogil:
+            counted = _tangy.tangy_channel_traces(
+                cython.address(t_buf),
+                start,
+                stop,
+                origin,
+                coarse_width,
+                2,
+                _channels_ptr,
+                length,
+                _traces_ptr,
+                _n_threads,
+            )
+        assert counted > 0, "No data found"
+
+        trace_a = traces[:length] - traces[:length].mean()
+        trace_b = traces[length:] - traces[length:].mean()
+        max_lag = min(int(ceil(max_delay / self.resolution / coarse_width)), length - 1)
+        correlation = _correlate_lags(trace_a, trace_b, max_lag)
+
+        # a delay between lags k and k + 1 splits its pairs between them in
+        # proportion to how close it is to each
+        k = int(correlation.argmax())
+        fraction = 0.0
+        if (0 < k < 2 * max_lag) and (correlation[k] > 0):
+            before = max(correlation[k - 1], 0)
+            after = max(correlation[k + 1], 0)
+            if after > before:
+                fraction = after / (correlation[k] + after)
+            else:
+                fraction = -before / (correlation[k] + before)
+        coarse_delay: i64 = round((k - max_lag + fraction) * coarse_width)
+
+        half: u64 = int(ceil(coarse_width / fine_bins))
+        length_fine: u64 = 2 * half
+        intensity_array: ndarray(u64n) = zeros(length_fine, dtype=u64n)
+        _intensity_view: u64[::1] = intensity_array
+
+        _a: u8 = channel_a
+        _b: u8 = channel_b
+        _intensities_ptr: cython.pointer(u64) = cython.address(_intensity_view[0])
+        with cython.nogil:
+            _tangy.tangy_cross_correlation(
+                cython.address(t_buf),
+                start,
+                stop,
+                half * fine_bins,
+                fine_bins,
+                coarse_delay,
+                _a,
+                _b,
+                length_fine,
+                _intensities_ptr,
+                _n_threads,
+            )
+
+        times = (coarse_delay + (arange(length_fine) - half) * fine_bins) * self.resolution
+
+        background = median(intensity_array)
+        peak = intensity_array - background
+        max_idx = peak.argmax()
+        t0 = times[max_idx]
+        max_intensity = peak.max()
+        tau = max((peak > max_intensity / 2).sum(), 1) * fine_bins * self.resolution / 2
+
+        # only the bins around the peak constrain the fit, made at bin centres
+        bin_width = fine_bins * self.resolution
+        centres = times + 0.5 * bin_width
+        t0 = t0 + 0.5 * bin_width
+        near = nabs(centres - t0) < max(20 * tau, 20 * bin_width)
+
+        guess = [tau, tau, t0, max_intensity]
+        opt = guess
+        if near.sum() < len(guess):
+            warn("Too few bins around the peak to fit the delay histogram, "
+                 "using the peak bin")
+        else:
+            try:
+                [opt, cov] = curve_fit(
+                    double_decay, centres[near], peak[near], p0=guess
+                )
+            except (RuntimeError, TypeError, ValueError):
+                warn("Fit of the delay histogram did not converge, using the peak bin")
+                opt = guess
+        if (not isfinite(opt).all()) or \
+                not (times[0] <= opt[2] <= times[-1] + bin_width):
+            warn("Fit of the delay histogram is outside the window, using the peak bin")
+            opt = guess
+        hist_fit = double_decay(centres, *opt) + background
+
+        return delay_result(
+            times=times,
+            intensities=intensity_array,
+            fit=hist_fit,
+            tau1=opt[0],
+            tau2=opt[1],
+            t0=opt[2],
+            central_delay=opt[2],
+            max_intensity=opt[3],
+        )
+
+    def delay_matrix(
+        self,
+        channels: List[int],
+        read_time: float,
+        resolution: float = 1e-9,
+        window: float = 1e-7,
+        histograms: bool = False,
+        fit: bool = False,
+        threads: int = 1,
+    ) -> Union[ndarray, Tuple[ndarray, ndarray, ndarray]]:
+        """Relative delay between every pair of channels
+
+        Histograms every pair of timetags within the window, as
+            ``relative_delay`` with ``all_pairs``, for every pair of channels
+            in a single pass over the read time. The delay of each pair is the
+            centroid of its peak bin and the bins either side, above the
+            median of the histogram as background, found for all pairs at
+            once.
+
+        Args:
+            channels (List[int]): Channels to find delays between
+            read_time (float): Time to integrate over
+            resolution (float = 1e-9): Resolution of bins
+            window (float = 1e-7): Largest delay, of either sign, histogrammed
+            histograms (bool = False): Also return the histograms
+            fit (bool = False): Fit ``double_decay`` to each histogram and
+                use the centre of the fit as the delay, one fit per pair
+            threads (int = 1): Native threads to histogram on, 0 for every
+                core
+
+        Returns:
+            (NDArray[f64] | Tuple[NDArray[f64], NDArray[f64], NDArray[u64]]):
+                Matrix of delays in seconds, ``delays[i, j]`` the delay of
+                ``channels[j]`` after ``channels[i]``. With ``histograms``
+                also the start time of each bin and the histograms,
+                ``histograms[i, j]`` of ``channels[j]`` after ``channels[i]``
+                filled for i < j only
+
+        Examples:
+            Align a 16 channel detector array to its first channel
+            >>> delays = buffer.delay_matrix(list(range(16)), 1.0)
+            >>> offsets = delays[0]
+        """
+        self._refresh()
+
+        _n_channels = len(channels)
+        assert _n_channels >= 2, "At least two channels are required"
+        assert len(set(channels)) == _n_channels, "Channels must be distinct"
+        assert max(channels) < self.channel_count, (
+            f"Requested channel {max(channels)} when maximum channel available in {self.channel_count}"
+        )
+
+        _channels_view: cython.uchar[::1] = array(channels, dtype=u8n)
+
+        fine_bins: u64 = max(round(resolution / self.resolution), 1)
+        half: u64 = max(int(ceil(window / self.resolution / fine_bins)), 1)
+        length: u64 = 2 * half
+        n_pairs = _n_channels * (_n_channels - 1) // 2
+
+        intensities: ndarray(u64n) = zeros((n_pairs, length), dtype=u64n)
+        _intensities_view: u64[:, ::1] = intensities
+
+        start: u64 = self.lower_bound(self.current_time() - read_time)
+        stop: u64 = self.count
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _n: u64 = _n_channels
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _intensities_ptr: cython.pointer(u64) = cython.address(_intensities_view[0, 0])
+        _n_threads: u64 = _thread_count(threads)
+        with cython.nogil:
+            _tangy.tangy_delay_histograms(
+                cython.address(t_buf),
+                start,
+                stop,
+                half * fine_bins,
+                fine_bins,
+                _n,
+                _channels_ptr,
+                length,
+                _intensities_ptr,
+                _n_threads,
+            )
+
+        bin_width = fine_bins * self.resolution
+        times = (arange(length) - half) * bin_width
+
+        # centroid of the peak bin and its neighbours above the background
+        peaks = intensities - median(intensities, axis=1, keepdims=True)
+        rows = arange(n_pairs)
+        k = peaks.argmax(axis=1)
+        centre = peaks[rows, k].clip(min=0)
+        before = where(k > 0, peaks[rows, (k - 1).clip(min=0)], 0).clip(min=0)
+        after = where(k < length - 1, peaks[rows, (k + 1).clip(max=length - 1)], 0).clip(min=0)
+        total = before + centre + after
+        shift = where(total > 0, (after - before) / where(total > 0, total, 1), 0)
+        pair_delays = times[k] + (0.5 + shift) * bin_width
+
+        if fit:
+            centres = times + 0.5 * bin_width
+            for p in range(n_pairs):
+                near = nabs(centres - centres[k[p]]) < 20 * bin_width
+                guess = [bin_width, bin_width, pair_delays[p], max(centre[p], 1)]
+                try:
+                    [opt, cov] = curve_fit(
+                        double_decay, centres[near], peaks[p, near], p0=guess
+                    )
+                    pair_delays[p] = opt[2]
+                except RuntimeError:
+                    warn(f"Fit of pair {p} did not converge, using its peak")
+
+        delays: ndarray(f64n) = zeros((_n_channels, _n_channels), dtype=f64n)
+        upper = triu_indices(_n_channels, 1)
+        delays[upper] = pair_delays
+        delays[(upper[1], upper[0])] = -pair_delays
+
+        if not histograms:
+            return delays
+
+        matrix: ndarray(u64n) = zeros((_n_channels, _n_channels, length), dtype=u64n)
+        matrix[upper] = intensities
+        return delays, times, matrix
+
     @cython.ccall
     def joint_delay_histogram(
         self,
@@ -1348,7 +2656,9 @@ class TangyBuffer:
         clock: Optional[int] = None,
         bin_width: int = 1,
         centre: bool = True,
-    ) -> JointHistogram:
+        sparse: bool = False,
+        threads: int = 1,
+    ):
         """2-D histogram of delays between channels
 
         Histograms relative delays of channsl found to be in coincdience for
@@ -1369,13 +2679,30 @@ class TangyBuffer:
             radius (float,): maximum distance between timetags allowed
             delays (Optional[List[float]] = None,): delays for each channel
             clock (Optional[int] = None,): Optional clock channel
-            bin_width (int = 1,): Width of bins in histogram
+            bin_width (int = 1,): Width of bins in histogram, in units of the
+                resolution. Delays are binned as they are found so the
+                histogram holds ``(2 * radius / bin_width)^2`` bins
             centre (bool = True): Whether or not to centre the histogram
+            sparse (bool = False): Only keep the occupied bins, memory then
+                scales with the bins counted into rather than with the square
+                of the window. Use for wide windows at fine resolution
+            threads (int = 1): Native threads to histogram on, 0 for every
+                core. Each thread fills a sparse histogram that is added into
+                the result
 
         Returns:
-            (JointHistogram): Joint delay histogram and marginal distributions
+            (JointHistogram | SparseJointHistogram): Joint delay histogram and
+                marginal distributions, ``SparseJointHistogram.dense`` expands
+                a sparse histogram
 
+        Examples:
+            Joint histogram over a 5 ns radius at 1 ps resolution, without
+            allocating the 10^8 bins
+            >>> jsi = buffer.joint_delay_histogram(0, 1, [0, 1, 2], 1.0, 5e-9,
+            ...                                    clock=2, sparse=True)
+            >>> data = jsi.dense().data
         """
+        self._refresh()
 
         _n_channels = len(channels)
 
@@ -1400,48 +2727,112 @@ class TangyBuffer:
         else:
             clock = 0
 
-        radius_bins: u64n = round(radius / self.resolution)
-        temporal_window: u64n = radius_bins + radius_bins
-        n_bins: u64n = temporal_window * temporal_window
-        histogram: u64n[:] = zeros(u64n(n_bins), dtype=u64n)
-        histogram_view: u64[:] = histogram
-
-        count: u64n = 0
-        count = _tangy.tangy_joint_delay_histogram(
-            self._ptr_buf,
-            clock,
-            signal,
-            idler,
-            _n_channels,
-            cython.address(_channels_view[0]),
-            cython.address(_delays_view[0]),
-            radius,
-            read_time,
-            cython.address(histogram_view[0]),
-        )
+        assert bin_width >= 1, "bin_width must be at least 1"
+        radius_bins: u64n = self.bins_from_time(radius)
+        temporal_window: u64n = (radius_bins + radius_bins) // bin_width
+
+        t_buf: _tangy.tangy_buffer = self._buf
+        _clock: u8 = clock
+        _signal: u8 = signal
+        _idler: u8 = idler
+        _n: u64 = _n_channels
+        _channels_ptr: cython.pointer(u8) = cython.address(_channels_view[0])
+        _delays_ptr: cython.pointer(cython.double) = cython.address(_delays_view[0])
+        _radius: cython.double = radius
+        _read_time: cython.double = read_time
+        _bin_width: u64 = bin_width
+        _n_threads: u64 = _thread_count(threads)
+
+        histogram: ndarray(u64n) = zeros(0 if sparse else max(temporal_window, 1) ** 2, dtype=u64n)
+        histogram_view: u64[::1] = histogram
+        _histogram_ptr: cython.pointer(u64) = cython.NULL
+        _sparse: _tangy.sparse_histogram
+        _sparse_ptr: cython.pointer(_tangy.sparse_histogram) = cython.NULL
+        if sparse:
+            _tangy.sparse_histogram_init(cython.address(_sparse), 0)
+            _sparse_ptr = cython.address(_sparse)
+        else:
+            _histogram_ptr = cython.address(histogram_view[0])
+
+        count: u64 = 0
+        with cython.nogil:
+            count = _tangy.tangy_joint_delay_histogram(
+                cython.address(t_buf),
+                _clock,
+                _signal,
+                _idler,
+                _n,
+                _channels_ptr,
+                _delays_ptr,
+                _radius,
+                _read_time,
+                _bin_width,
+                _histogram_ptr,
+                _sparse_ptr,
+                _n_threads,
+            )
 
         if count == 0:
             warn("No counts found, results will be empty")
 
-        histogram = reshape(histogram, [temporal_window, temporal_window])
-
-        temporal_window = temporal_window // bin_width
+        n: u64n = temporal_window
         central_bin = temporal_window // 2
-
-        # TODO: this needs to go behind an if-guard
-        # TODO: will need other marginal calculation, see "def extract_marginals"
-        ((nr, nc), ms, mi, histogram) = bin_histogram(histogram, bin_width, bin_width)
-        if centre:
-            (ms, mi, histogram) = centre_histogram(
-                central_bin, temporal_window, mi, ms, histogram
+        axis = (arange(temporal_window) * bin_width - radius_bins) * self.resolution
+
+        if not sparse:
+            histogram = reshape(histogram[: n * n], [n, n])
+            # signal -> rows, idler -> columns
+            ms = histogram.sum(axis=1, dtype=u64n)
+            mi = histogram.sum(axis=0, dtype=u64n)
+            if centre and (count > 0):
+                (ms, mi, histogram) = centre_histogram(
+                    central_bin, temporal_window, ms, mi, histogram
+                )
+            return JointHistogram(
+                radius_bins,
+                temporal_window,
+                (bin_width, bin_width),
+                histogram,
+                mi,
+                ms,
+                axis,
+                axis,
             )
 
-        axis = (arange(temporal_window) - radius_bins) * self.resolution
-        return JointHistogram(
+        bins: ndarray(u64n) = zeros(_sparse.length, dtype=u64n)
+        counts: ndarray(u64n) = zeros(_sparse.length, dtype=u64n)
+        if _sparse.length > 0:
+            _bins_view: u64[::1] = bins
+            _counts_view: u64[::1] = counts
+            _tangy.sparse_histogram_export(
+                cython.address(_sparse),
+                cython.address(_bins_view[0]),
+                cython.address(_counts_view[0]),
+            )
+        _tangy.sparse_histogram_deinit(cython.address(_sparse))
+
+        rows = bins // n
+        columns = bins % n
+        ms = zeros(n, dtype=u64n)
+        mi = zeros(n, dtype=u64n)
+        add.at(ms, rows, counts)
+        add.at(mi, columns, counts)
+        if centre and (count > 0):
+            offset_signal = _centre_offset(central_bin, temporal_window, ms)
+            offset_idler = _centre_offset(central_bin, temporal_window, mi)
+            rows = (rows.astype(i64n) + offset_signal) % n
+            columns = (columns.astype(i64n) + offset_idler) % n
+            ms = roll(ms, offset_signal)
+            mi = roll(mi, offset_idler)
+
+        order = (rows * n + columns).argsort()
+        return SparseJointHistogram(
             radius_bins,
             temporal_window,
             (bin_width, bin_width),
-            histogram,
+            rows[order].astype(u64n),
+            columns[order].astype(u64n),
+            counts[order],
             mi,
             ms,
             axis,
@@ -1458,6 +2849,7 @@ class TangyBuffer:
         resolution: float,
         delays: Optional[List[float]] = None,
     ):
+        self._refresh()
         length: u64n = u64n(radius / resolution)
         correlation_window: f64n = radius / self.resolution
 
@@ -1470,36 +2862,646 @@ class TangyBuffer:
 
         times = (arange(length) - (length // 2)) * resolution
 
+        t_buf: _tangy.tangy_buffer = self._buf
+        _window: cython.double = correlation_window
+        _resolution: cython.double = resolution_hist
+        _signal: u8 = signal
+        _idler: u8 = idler
+        _length: u64 = length
+        _intensities_ptr: cython.pointer(u64) = cython.address(intensities_view[0])
+
         if delays is None:
             start: u64 = self.lower_bound(self.current_time() - read_time)
             stop: u64 = self.count
 
-            _tangy.tangy_second_order_coherence(
-                self._ptr_buf,
-                start,
-                stop,
-                correlation_window,
-                resolution_hist,
-                signal,
-                idler,
-                length,
-                cython.address(intensities_view[0]),
-            )
+            with cython.nogil:
+                _tangy.tangy_second_order_coherence(
+                    cython.address(t_buf),
+                    start,
+                    stop,
+                    _window,
+                    _resolution,
+                    _signal,
+                    _idler,
+                    _length,
+                    _intensities_ptr,
+                )
             return (times, intensities)
 
         _delays_view: cython.double[::1] = array(delays, dtype=f64n)
-        _tangy.tangy_second_order_coherence_delays(
-            self._ptr_buf,
-            read_time,
-            correlation_window,
-            resolution_hist,
-            signal,
-            idler,
+        _delays_ptr: cython.pointer(cython.double) = cython.address(_delays_view[0])
+        _read_time: cython.double = read_time
+        with cython.nogil:
+            _tangy.tangy_second_order_coherence_delays(
+                cython.address(t_buf),
+                _read_time,
+                _window,
+                _resolution,
+                _signal,
+                _idler,
+                _delays_ptr,
+                _length,
+                _intensities_ptr,
+            )
+        return (times, intensities)
+
+
+@cython.cfunc
+def _memory_view(ptr: cython.p_char, n_bytes: u64, dtype):
+    return frombuffer(PyMemoryView_FromMemory(ptr, n_bytes, PyBUF_READ), dtype=dtype)
+
+
+@cython.cfunc
+def _records_view(buffer: TangyBuffer, offset: u64, n: u64):
+    """Read-only arrays aliasing n records of buffer from ring index offset
+
+    Records of packed clocked buffers are decoded into new arrays.
+    """
+    if buffer._buf.format == _tangy.buffer_format.STANDARD:
+        data: _tangy.std_slice = buffer._buf.slice.standard
+        channels = _memory_view(
+            cython.cast(cython.p_char, data.channel + offset), n, u8n
+        )
+        timestamps = _memory_view(
+            cython.cast(cython.p_char, data.timestamp + offset), n * 8, u64n
+        )
+        return (channels, timestamps)
+
+    data_clk: _tangy.clk_slice = buffer._buf.slice.clocked
+    channels = _memory_view(
+        cython.cast(cython.p_char, data_clk.channel + offset), n, u8n
+    )
+    if data_clk.packed != cython.NULL:
+        words = _memory_view(
+            cython.cast(cython.p_char, data_clk.packed + offset), n * 8, u64n
+        )
+        clocks = words >> u64n(data_clk.delta_bits)
+        deltas = words & u64n(data_clk.delta_mask)
+        return (channels, (clocks, deltas))
+    clocks = _memory_view(
+        cython.cast(cython.p_char, data_clk.clock + offset), n * 8, u64n
+    )
+    deltas = _memory_view(
+        cython.cast(cython.p_char, data_clk.delta + offset), n * 8, u64n
+    )
+    return (channels, (clocks, deltas))
+
+
+@cython.cclass
+class TangyView:
+    """Read-only view of a range of records held in a TangyBuffer
+
+    Created with ``TangyBuffer.view``. The records are not copied, the arrays
+        alias the shared memory of the buffer. As the range may wrap around
+        the end of the ring it is split into at most two segments, each a
+        ``(channels, timetags)`` tuple in the same form ``pull`` returns.
+        ``Clocked`` buffers created with ``packed=True`` are decoded and so
+        copied.
+
+    The writer keeps overwriting the oldest records, the arrays always show
+        what is currently in the buffer. Check ``valid`` after using the
+        arrays to be sure the records have not been replaced in the meantime.
+        Arrays must not be used once the buffer has been closed.
+
+    Attributes:
+        start (int): Index of first record
+        stop (int): Index one past the last record
+        segments (List[Tuple]): ``(channels, timetags)`` of each contiguous
+            part of the range
+        expires (int): Number of records the writer must have claimed
+            (``sequence``) before the first record is overwritten
+        valid (bool): No record of the view has been overwritten
+
+    Examples:
+        Archive the whole buffer without copying it
+        >>> view = buffer.view()
+        >>> for (channels, timestamps) in view:
+        >>>     archive.write(channels, timestamps)
+        >>> assert view.valid, "Records were overwritten while archiving"
+    """
+
+    _buffer: TangyBuffer
+    _start: u64
+    _stop: u64
+    _segments: list
+
+    def __init__(self, buffer: TangyBuffer, start: int, stop: int):
+        self._buffer = buffer
+        self._start = start
+        self._stop = stop
+        self._segments = []
+
+        capacity: u64 = _tangy.srb_get_capacity(buffer._ptr_rb)
+        offset: u64 = self._start % capacity
+        n: u64 = self._stop - self._start
+        first: u64 = min(n, capacity - offset)
+        if first > 0:
+            self._segments.append(_records_view(buffer, offset, first))
+        if n > first:
+            self._segments.append(_records_view(buffer, 0, n - first))
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def stop(self) -> int:
+        return self._stop
+
+    @property
+    def segments(self) -> list:
+        return self._segments
+
+    @property
+    def expires(self) -> int:
+        return self._start + _tangy.srb_get_capacity(self._buffer._ptr_rb)
+
+    @property
+    def valid(self) -> bool:
+        return _tangy.srb_range_intact(self._buffer._ptr_rb, self._start)
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __iter__(self):
+        return iter(self._segments)
+
+    def copy(self):
+        """Copy the records of the view into contiguous arrays
+
+        Returns:
+            (Tuple[NDArray[u8], NDArray[u64]] |\
+                Tuple[NDArray[u8], Tuple[NDArray[u64], NDArray[u64]]]):\
+                channels and timetags of the records, as ``pull``
+
+        Raises:
+            IndexError: if records of the view were overwritten
+        """
+        channels = concatenate([c for (c, _) in self._segments])
+        if self._buffer._buf.format == _tangy.buffer_format.STANDARD:
+            records = (channels, concatenate([t for (_, t) in self._segments]))
+        else:
+            records = (
+                channels,
+                (
+                    concatenate([t[0] for (_, t) in self._segments]),
+                    concatenate([t[1] for (_, t) in self._segments]),
+                ),
+            )
+        if not self.valid:
+            raise IndexError(
+                f"Records of view [{self._start}, {self._stop}) were overwritten")
+        return records
+
+
+@cython.cclass
+class TangyReader:
+    """Named cursor consuming timetags from a TangyBuffer
+
+    Created with ``TangyBuffer.register_reader``. Each call to ``next_batch``
+        marks the previous batch as consumed and returns the next contiguous
+        batch of timetags. Batches are read-only views of the buffer itself, no
+        copy is made, and are only valid until the next call to ``next_batch``
+        or until the writer overwrites them, see ``intact``. If the reader
+        process exits before calling ``next_batch`` again the batch is
+        delivered again to the next reader registered with the same name.
+
+    Attributes:
+        name (str): Name of reader
+        position (int): Index of next timetag to be consumed
+        lag (int): Number of timetags written but not yet consumed
+        lost (int): Number of timetags overwritten before being consumed
+        intact (bool): The current batch has not been overwritten
+    """
+
+    _buffer: TangyBuffer
+    _name: str
+    _index: i64
+    _start: u64
+    _stop: u64
+
+    def __init__(self, buffer: TangyBuffer, name: str, from_start: bool = False):
+        self._buffer = buffer
+        self._name = name
+
+        position: u64 = _tangy.srb_get_count(buffer._ptr_rb)
+        if from_start:
+            position = _tangy.tangy_oldest_index(buffer._ptr_buf)
+
+        name_encoded = name.encode("utf-8")
+        c_name: cython.p_char = name_encoded
+        self._index = _tangy.srb_reader_register(buffer._ptr_rb, c_name, position)
+        if self._index < 0:
+            raise OSError("No free reader slots in buffer")
+
+        self._start = _tangy.srb_reader_position(buffer._ptr_rb, self._index)
+        self._stop = self._start
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def position(self) -> int:
+        self._buffer._refresh()
+        return _tangy.srb_reader_position(self._buffer._ptr_rb, self._index)
+
+    @property
+    def lag(self) -> int:
+        self._buffer._refresh()
+        count: u64 = _tangy.srb_get_count(self._buffer._ptr_rb)
+        position: u64 = _tangy.srb_reader_position(self._buffer._ptr_rb, self._index)
+        return count - position if count > position else 0
+
+    @property
+    def lost(self) -> int:
+        self._buffer._refresh()
+        return _tangy.srb_reader_lost(self._buffer._ptr_rb, self._index)
+
+    @property
+    def intact(self) -> bool:
+        return _tangy.srb_range_intact(self._buffer._ptr_rb, self._start)
+
+    def commit(self) -> bool:
+        """Mark the current batch as consumed
+
+        Called automatically by ``next_batch``.
+
+        Returns:
+            (bool): True if the batch was intact, otherwise the overwritten
+                timetags are added to ``lost``
+        """
+        self._buffer._refresh()
+        intact: cython.bint = True
+        if self._stop > self._start:
+            intact = _tangy.srb_reader_commit(
+                self._buffer._ptr_rb, self._index, self._start, self._stop
+            )
+        self._start = self._stop
+        return intact
+
+    def next_batch(self, max_n: int = 1_000_000):
+        """Consume the next batch of timetags
+
+        Args:
+            max_n (int = 1_000_000): Maximum number of timetags to return
+
+        Returns:
+            (Tuple[NDArray[u8], NDArray[u64]] |\
+                Tuple[NDArray[u8], Tuple[NDArray[u64], NDArray[u64]]]):\
+                channels and timetags of the batch, empty if there are no new
+                timetags
+        """
+        self.commit()
+
+        start: u64 = 0
+        n: u64 = _tangy.srb_reader_next(
+            self._buffer._ptr_rb, self._index, max_n, cython.address(start)
+        )
+        self._start = start
+        self._stop = start + n
+
+        capacity: u64 = _tangy.srb_get_capacity(self._buffer._ptr_rb)
+        return _records_view(self._buffer, start % capacity, n)
+
+    def close(self):
+        """Commit the current batch and stop using the reader
+
+        The reader remains registered with the buffer, see
+            ``TangyBuffer.unregister_reader``.
+        """
+        self.commit()
+
+
+@cython.cclass
+class TangyCounter:
+    """Singles and coincidence counter that only reads new timetags
+
+    Created with ``TangyBuffer.coincidence_counter``. Each call to ``update``
+        reads the timetags written since the previous call, so a live display
+        costs time proportional to the count rate rather than to the read time
+        of ``coincidence_count``. Coincidences are found as with the ``Window``
+        engine, a timetag that opens a coincidence waiting across calls until
+        every other channel of the pattern has had its next timetag.
+
+    If the writer overwrites timetags before the counter reads them they are
+        skipped and counted in ``lost``, the counts then restart from the
+        oldest timetag still in the buffer.
+
+    Attributes:
+        channels (List[int]): Channels of the pattern
+        position (int): Index of next timetag to be counted
+        lost (int): Number of timetags overwritten before being counted
+        history (float): Time in seconds over which ``rolling`` sums updates
+    """
+
+    _buffer: TangyBuffer
+    _channels: list
+    _stream: _tangy.coincidence_stream
+    _singles: ndarray
+    _intervals: list
+    history: float
+
+    def __init__(
+        self,
+        buffer: TangyBuffer,
+        channels: List[int],
+        window: float,
+        delays: Optional[List[float]] = None,
+        history: float = 1.0,
+    ):
+        _n_channels = len(channels)
+        assert len(set(channels)) == _n_channels, "Channels must be distinct"
+        assert _n_channels <= _tangy.STREAM_CHANNELS_MAX, (
+            f"At most {_tangy.STREAM_CHANNELS_MAX} channels"
+        )
+        assert max(channels) < buffer.channel_count, (
+            f"Requested channel {max(channels)} when maximum channel available in {buffer.channel_count}"
+        )
+
+        self._buffer = buffer
+        self._channels = list(channels)
+        self._singles = zeros(buffer.channel_count, dtype=u64n)
+        self._intervals = []
+        self.history = history
+
+        _channels_view: cython.uchar[::1] = array(channels, dtype=u8n)
+        if delays is None:
+            delays: List[float] = [0 for i in range(_n_channels)]
+        _delays_view: cython.double[::1] = array(delays, dtype=f64n)
+
+        _tangy.tangy_coincidence_stream_init(
+            buffer._ptr_buf,
+            cython.address(self._stream),
+            _n_channels,
+            cython.address(_channels_view[0]),
             cython.address(_delays_view[0]),
-            length,
-            cython.address(intensities_view[0]),
+            window,
+            _tangy.srb_get_count(buffer._ptr_rb),
         )
-        return (times, intensities)
+
+    def __dealloc__(self):
+        _tangy.stream_deinit(cython.address(self._stream))
+
+    @property
+    def channels(self) -> List[int]:
+        return self._channels
+
+    @property
+    def position(self) -> int:
+        return self._stream.position
+
+    @property
+    def lost(self) -> int:
+        return self._stream.lost
+
+    def update(self) -> Tuple[NDArray[u64n], int]:
+        """Count the timetags written since the previous update
+
+        Returns:
+            (Tuple[NDArray[u64], int]): singles of every channel of the buffer
+                and number of coincidences, over the new timetags
+        """
+        self._buffer._refresh()
+        _singles_view: u64[::1] = self._singles
+        t_buf: _tangy.tangy_buffer = self._buffer._buf
+        _stream: cython.pointer(_tangy.coincidence_stream) = cython.address(self._stream)
+        _singles_ptr: cython.pointer(u64) = cython.address(_singles_view[0])
+        with cython.nogil:
+            _tangy.tangy_coincidence_stream_update(
+                cython.address(t_buf), _stream, _singles_ptr
+            )
+
+        singles = self._singles.copy()
+        coincidences: int = self._stream.coincidences
+
+        end = self._stream.last_time * self._buffer.resolution
+        self._intervals.append((end, singles, coincidences))
+        while (len(self._intervals) > 1) and (self._intervals[0][0] <= end - self.history):
+            self._intervals.pop(0)
+        return singles, coincidences
+
+    def rolling(self) -> Tuple[NDArray[u64n], int]:
+        """Sum of the updates within ``history`` of the most recent timetag
+
+        Returns:
+            (Tuple[NDArray[u64], int]): singles of every channel of the buffer
+                and number of coincidences
+        """
+        singles = zeros(self._buffer.channel_count, dtype=u64n)
+        coincidences = 0
+        for (end, interval_singles, interval_coincidences) in self._intervals:
+            singles += interval_singles
+            coincidences += interval_coincidences
+        return singles, coincidences
+
+    def reset(self):
+        """Discard the history and continue from the next timetag written"""
+        self._buffer._refresh()
+        self._intervals = []
+        _tangy.stream_reset(
+            cython.address(self._stream), _tangy.srb_get_count(self._buffer._ptr_rb)
+        )
+
+
+@cython.cclass
+class TangyMerge:
+    """Merge timetags from several producer buffers into one buffer
+
+    Each producer (device, file reader, ...) writes into its own buffer as
+        usual, a single merge stage then interleaves the timetags from every
+        producer into the target buffer in order of arrival time. Analysis on
+        the target buffer, such as ``coincidence_count`` or
+        ``joint_delay_histogram``, then works across devices. All buffers must
+        have the same format, resolution and clock period.
+
+    A timetag is only merged once every producer has reported a timetag at
+        least as recent, or once a producer has fallen more than ``latency``
+        behind the most recent producer, at which point it is no longer waited
+        for. Timetags a late producer provides that are older than timetags
+        already merged are dropped and counted in ``late``, as are timetags
+        whose offset channel is not a channel of the target. A producer that
+        has not written any timetags yet holds back the merge until the other
+        producers have moved on by more than ``latency`` from when the merge
+        first found it empty.
+
+    Args:
+        target (TangyBuffer): Buffer to merge into
+        producers (List[TangyBuffer]): Buffers to merge from
+        channel_offsets (Optional[List[int]] = None): Added to the channel of
+            each producer's timetags, defaults to placing producers one after
+            another using their channel_count
+        latency (float = 1e-3): Maximum time in seconds to wait for a producer
+            that has fallen behind
+        name (str = "merge"): Name of the reader registered with each producer,
+            see ``TangyBuffer.register_reader``
+
+    Examples:
+        Merge two UQDLogic16 devices and a file into one buffer
+        >>> merged = tangy.TangyBuffer("merged", 1e-12, channel_count=48)
+        >>> merge = tangy.TangyMerge(merged, [uqd_a.buffer(), uqd_b.buffer(),
+        >>>                                   ptu.buffer()])
+        >>> merge.run()
+    """
+
+    _target: TangyBuffer
+    _producers: list
+    _readers: list
+    _sources: cython.pointer(cython.pointer(_tangy.tangy_buffer))
+    _n_sources: u64
+    _offsets: ndarray
+    _positions: ndarray
+    _stops: ndarray
+    _waiting_since: ndarray
+    _latency_bins: u64
+    _late: u64
+
+    def __init__(
+        self,
+        target: TangyBuffer,
+        producers: List[TangyBuffer],
+        channel_offsets: Optional[List[int]] = None,
+        latency: float = 1e-3,
+        name: str = "merge",
+    ):
+        assert len(producers) > 0, "Must supply at least one producer"
+
+        if channel_offsets is None:
+            channel_offsets = []
+            offset = 0
+            for producer in producers:
+                channel_offsets.append(offset)
+                offset += producer.channel_count
+        assert len(channel_offsets) == len(producers), \
+            "Must supply a channel offset for each producer"
+        for offset, producer in zip(channel_offsets, producers):
+            assert 0 <= offset <= 255, "Channel offsets must be within 0-255"
+            assert offset + producer.channel_count <= target.channel_count, \
+                "Offset channels of every producer must fit in the target"
+
+        for producer in producers:
+            assert producer.configuration()["format"] == \
+                target.configuration()["format"], \
+                "Producers must have the same format as the target"
+            assert (producer.resolution == target.resolution) and \
+                (producer.clock_period == target.clock_period), \
+                "Producers must have the same resolution and clock period"
+
+        self._target = target
+        self._producers = list(producers)
+        self._readers = [p.register_reader(name) for p in producers]
+        self._n_sources = len(producers)
+        self._offsets = array(channel_offsets, dtype=u8n)
+        self._positions = zeros(self._n_sources, dtype=u64n)
+        self._stops = zeros(self._n_sources, dtype=u64n)
+        self._waiting_since = full(
+            self._n_sources, _tangy.MERGE_NOT_WAITING, dtype=u64n)
+        self._latency_bins = target.bins_from_time(latency)
+        self._late = 0
+
+        self._sources = cython.cast(
+            cython.pointer(cython.pointer(_tangy.tangy_buffer)),
+            malloc(self._n_sources * cython.sizeof(cython.pointer(_tangy.tangy_buffer))),
+        )
+        k: u64
+        source: TangyBuffer
+        for k in range(self._n_sources):
+            source = self._producers[k]
+            self._sources[k] = source._ptr_buf
+
+    def __dealloc__(self):
+        free(self._sources)
+
+    @property
+    def late(self) -> int:
+        """Number of timetags dropped, arrived too late or out of channel range"""
+        return self._late
+
+    @property
+    def lost(self) -> int:
+        """Number of timetags overwritten in a producer before being merged"""
+        return sum(reader.lost for reader in self._readers)
+
+    def step(self, max_n: int = 1_000_000) -> int:
+        """Merge the timetags currently available from the producers
+
+        Args:
+            max_n (int = 1_000_000): Maximum number of timetags to merge
+
+        Returns:
+            (int): Number of timetags merged
+        """
+        positions: u64[::1] = self._positions
+        stops: u64[::1] = self._stops
+        waiting_since: u64[::1] = self._waiting_since
+        offsets: u8[::1] = self._offsets
+        starts = []
+
+        self._target._refresh()
+        producer: TangyBuffer
+        for producer in self._producers:
+            producer._refresh()
+
+        k: u64
+        reader: TangyReader
+        start: u64 = 0
+        for k in range(self._n_sources):
+            reader = self._readers[k]
+            # skips, and counts, any timetags the producer already overwrote
+            _tangy.srb_reader_next(
+                reader._buffer._ptr_rb, reader._index, 0, cython.address(start)
+            )
+            positions[k] = start
+            stops[k] = _tangy.srb_get_count(reader._buffer._ptr_rb)
+            starts.append(start)
+
+        late: u64 = 0
+        merged: u64 = _tangy.tangy_merge(
+            self._target._ptr_buf,
+            self._n_sources,
+            self._sources,
+            cython.address(positions[0]),
+            cython.address(stops[0]),
+            cython.address(waiting_since[0]),
+            cython.address(offsets[0]),
+            self._latency_bins,
+            max_n,
+            cython.address(late),
+        )
+        self._late += late
+
+        for k in range(self._n_sources):
+            reader = self._readers[k]
+            _tangy.srb_reader_commit(
+                reader._buffer._ptr_rb, reader._index, starts[k], positions[k]
+            )
+        return merged
+
+    def run(self, stop=None, interval: float = 1e-2):
+        """Merge timetags until stopped
+
+        Waits for any producer to publish timetags (or for ``interval`` to
+            pass) and then merges them.
+
+        Args:
+            stop (Optional[threading.Event] = None): Merging stops once set,
+                runs indefinitely if None
+            interval (float = 1e-2): Maximum time in seconds between merges
+        """
+        descriptors = []
+        try:
+            descriptors = [p.fileno() for p in self._producers]
+        except OSError:
+            pass
+
+        while (stop is None) or (not stop.is_set()):
+            if descriptors:
+                select(descriptors, [], [], interval)
+                for producer in self._producers:
+                    producer.acknowledge()
+            else:
+                sleep(interval)
+            self.step()
 
 
 ChannelConfig = Tuple[TangyBuffer, List[int], Optional[List[float]]]
@@ -1961,68 +3963,59 @@ def buffer_list_update() -> dict:
     """
     Up-to-date list of available buffers
 
-    Gets the list of available buffers from the Tangy configuration directory,
-        for example, ```~/.config/Tangy/buffers``` on linux and
-        ```C:\\Users\\user_name\\AppData\\Local\\PeterBarrow\\Tangy\\buffers```
-        on Windows. For each buffer configuration file the existence of the
-        associated buffer is checked, buffers that no longer exists have their
-        corresponding configuration file removed. Upon completion this returns
-        a dictionary containing the buffer name, buffer format and path to the
-        configuration file.
+    Reads the registry of buffers, a small shared memory segment that every
+        buffer created in shared memory is entered in. For each entry the
+        existence of the buffer is checked and entries of buffers that no
+        longer exist are removed. Connections to each buffer held by processes
+        that have exited are removed and buffers left without any connections
+        are deleted. Upon completion this returns a dictionary containing the
+        buffer name, buffer format, capacity and the process that created it.
+        Buffer files and buffers with names of 64 characters or more are not
+        registered.
 
     Returns:
         (dict): Dictionary of
-            ```{"name": {"format": fmt, "path": "/path/to/config"}```
+            ```{"name": {"format": fmt, "capacity": n, "owner": pid}}```
 
     """
-    buffer_list_path = join(tangy_config_location(), "buffers")
-    if not exists(buffer_list_path):
-        makedirs(buffer_list_path)
-    buffer_list = {}
-
-    for file in listdir(buffer_list_path):
-        if file.endswith(".json") or file.endswith(".JSON"):
-            file_name = join(buffer_list_path, file)
-            with open(file_name, "r") as f:
-                config = {k.lower(): v for k, v in json.load(f).items()}
-                keys = config.keys()
-                if "name" not in keys:
-                    continue
-                if "format" not in keys:
-                    continue
-                buffer_list[config["name"]] = {
-                    "format": config["format"],
-                    "path": file_name,
-                }
-
     buffer_list_available = {}
+    entry: _tangy.registry_entry
     result: _tangy.shmem_result
     flag: u8 = 0
-    for name, details in buffer_list.items():
-        name_encoded = name.encode("utf-8")
-        c_name: cython.p_char = name_encoded
-        result = _tangy.shmem_exists(c_name, cython.address(flag))
-        if result.Ok is False:
-            remove(details["path"])
+    remaining: u64 = 0
+    i: u64
+    for i in range(_tangy.REGISTRY_ENTRIES):
+        if not _tangy.tangy_registry_read(i, cython.address(entry)):
             continue
-        if flag == 0:
-            # buffer doesn't exist anymore so delete its json file
-            remove(details["path"])
 
-        # if we got here then the buffer exists, but we don't know about its
-        # reference count, the reference count can also be higher than it should
-        # if the last connection to that buffer crashed (no decrement)
-
-        # name_stub_free = ""
-        # if details["format"].lower() == "standard":
-        #     name_stub_free = name.replace("std_", "")
+        name_stub_free = entry.name.decode("utf-8")
+        format = "Standard"
+        prefix = "std_"
+        if entry.format == _tangy.buffer_format.CLOCKED:
+            format = "Clocked"
+            prefix = "clk_"
+        name_encoded = (prefix + name_stub_free).encode("utf-8")
+        c_name: cython.p_char = name_encoded
 
-        # if details["format"].lower() == "clocked":
-        #     name_stub_free = name.replace("clk_", "")
+        flag = 0
+        result = _tangy.shmem_exists(c_name, cython.address(flag))
+        if (result.Ok is False) or (flag == 0):
+            # buffer doesn't exist anymore so remove its entry
+            _tangy.tangy_registry_remove(entry.name)
+            continue
 
-        name_stub_free = "_".join(name.split("_")[1::])
+        # connections from processes that crashed are removed, if none are
+        # left the buffer is orphaned and gets deleted
+        result = _tangy.srb_reap_segment(c_name, cython.address(remaining))
+        if (result.Ok is True) and (remaining == 0):
+            _tangy.tangy_registry_remove(entry.name)
+            continue
 
-        buffer_list_available[name_stub_free] = details
+        buffer_list_available[name_stub_free] = {
+            "format": format,
+            "capacity": entry.capacity,
+            "owner": entry.owner,
+        }
 
     return buffer_list_available
 
@@ -2030,17 +4023,16 @@ def buffer_list_update() -> dict:
 @cython.ccall
 def buffer_list_append(buffer: TangyBuffer):
     """
-    Adds the configuration of a buffer to the Tangy configuration directory
+    Adds a buffer to the registry of buffers
+
+    Buffers are registered when they are created, this is only needed to
+        register a buffer again after its entry was removed.
 
     Args:
-        buffer (TangyBuffer): buffer with configuration to save
+        buffer (TangyBuffer): buffer to register
     """
-
-    config = buffer.configuration()
-    buffer_list_path = join(tangy_config_location(), "buffers")
-    file_name = join(buffer_list_path, config["name"] + ".json")
-    with open(file_name, "w") as file:
-        json.dump(config, file, indent=4)
+    c_name: cython.p_char = buffer._name
+    _tangy.tangy_buffer_register(c_name, buffer._ptr_buf)
 
 
 @cython.ccall
@@ -2061,14 +4053,13 @@ def buffer_list_delete_all():
 @cython.ccall
 def buffer_list_show():
     tangy_config_path = tangy_config_location()
-    buffer_list_path = join(tangy_config_path, "buffers")
     buffer_list = buffer_list_update()
     out = f"Tangy configuration: {tangy_config_path}\n"
-    out += f"Buffer configurations: {buffer_list_path}\n"
     out += "Available Tangy buffers\n"
     for name, details in buffer_list.items():
         f = details["format"]
-        p = details["path"]
-        out += f"{name} : \n\tFormat : {f}\n\tPath: {p}\n"
+        c = details["capacity"]
+        o = details["owner"]
+        out += f"{name} : \n\tFormat : {f}\n\tCapacity : {c}\n\tOwner : {o}\n"
 
     print(out)
@@ -67,7 +67,8 @@ static inline u64
 JOIN(stub, buffer_map_size)(u64 num_elements) {
     u64 size_context = srb_context_size();
     u64 size_elems = JOIN(stub, size_of)();
-    return size_context + (size_elems * num_elements);
+    // room to align the columns following the channel array
+    return size_context + (size_elems * num_elements) + sizeof(u64);
 }
 
 void JOIN(stub, clear_buffer)(shared_ring_buffer* buffer, slice* data);
@@ -78,14 +79,30 @@ slice JOIN(stub, init_base_ptrs)(shared_ring_buffer* buf);
 record JOIN(stub, record_at)(const slice* data, u64 absolute_index);
 timestamp JOIN(stub, timestamp_at)(const slice* data, u64 absolute_index);
 u8 JOIN(stub, channel_at)(const slice* data, u64 absolute_index);
+void JOIN(stub, record_set)(slice* data,
+                            u64 absolute_index,
+                            u8 channel,
+                            timestamp value);
 u64 JOIN(stub, arrival_time_at)(const slice* data,
                                 u64 conversion_factor,
                                 u64 absolute_index);
+static inline void JOIN(stub, copy_records)(const slice* const from,
+                                            u64 from_index,
+                                            const slice* const to,
+                                            u64 to_index,
+                                            u64 n);
+
+// most channels coincidence_counts counts every subset of
+#define COINCIDENCE_SUBSETS_MAX 16
+
+// waiting_since of a merge source that has not been waited for
+#define MERGE_NOT_WAITING UINT64_MAX
 
 #define absIdx(buf, idx) idx % srb_get_capacity(buf)
 #define recordAt(s, idx) JOIN(stub, record_at)(s, idx)
 #define timestampAt(s, idx) JOIN(stub, timestamp_at)(s, idx)
 #define channelAt(s, idx) JOIN(stub, channel_at)(s, idx)
+#define recordSet(s, idx, ch, ts) JOIN(stub, record_set)(s, idx, ch, ts)
 #define arrivalTimeAt(s, cf, idx) JOIN(stub, arrival_time_at)(s, cf, idx)
 
 // conversion methods
@@ -123,13 +140,234 @@ u64 JOIN(stub, buffer_push)(shared_ring_buffer* const buf,
                             u64 start,
                             u64 stop);
 
+///
+/// @brief set up the channel index and block summaries found at ptr
+///
+/// Called by init_base_ptrs with the first aligned address after the records.
+///
+static inline void
+JOIN(stub, init_indexes)(shared_ring_buffer* buf, slice* data, char* ptr) {
+    u64 channel_count = srb_get_channel_count(buf);
+    u64 channel_index = srb_get_channel_index(buf);
+    data->by_channel = channel_index_init(ptr, channel_count, channel_index);
+    ptr += channel_index_map_size(channel_count, channel_index);
+    data->blocks = block_summary_init(
+      ptr, channel_count, srb_get_capacity(buf), srb_get_block_size(buf));
+}
+
+///
+/// @brief add the records in [start, stop) to the channel index and block
+/// summaries
+///
+/// Called by writers after writing records and before publishing them.
+///
+static inline void
+JOIN(stub, index_records)(shared_ring_buffer* const buf,
+                          const slice* const data,
+                          u64 start,
+                          u64 stop) {
+    u64 capacity = srb_get_capacity(buf);
+    if (data->by_channel.capacity != 0) {
+        for (u64 position = start; position < stop; position++) {
+            channel_index_append(
+              &data->by_channel, channelAt(data, position % capacity), position);
+        }
+    }
+    if (data->blocks.block_size != 0) {
+        u64 conversion_factor = srb_get_conversion_factor(buf);
+        for (u64 position = start; position < stop; position++) {
+            u64 index = position % capacity;
+            block_summary_add(&data->blocks,
+                              position,
+                              channelAt(data, index),
+                              arrivalTimeAt(data, conversion_factor, index));
+        }
+    }
+}
+#define indexRecords(buf, data, start, stop)                                   \
+    JOIN(stub, index_records)(buf, data, start, stop)
+
+///
+/// @brief copy the records [start, stop) of a buffer into another buffer
+///
+/// Records keep their absolute positions and are copied together with their
+/// channel index entries and block summaries, the other buffer then holds
+/// exactly [start, stop). The other buffer must have the same layout and room
+/// for stop - start records.
+///
+/// @return first position that was still intact once the copy finished, the
+/// copy of any record before it may be corrupt if the writer overwrote it
+///
+static inline u64
+JOIN(stub, copy_range)(shared_ring_buffer* const from_buf,
+                       const slice* const from,
+                       shared_ring_buffer* const to_buf,
+                       const slice* const to,
+                       u64 start,
+                       u64 stop) {
+    u64 from_capacity = srb_get_capacity(from_buf);
+    u64 to_capacity = srb_get_capacity(to_buf);
+
+    // runs end where either ring wraps
+    u64 position = start;
+    while (position < stop) {
+        u64 from_index = position % from_capacity;
+        u64 to_index = position % to_capacity;
+        u64 run = stop - position;
+        run = run < from_capacity - from_index ? run : from_capacity - from_index;
+        run = run < to_capacity - to_index ? run : to_capacity - to_index;
+        JOIN(stub, copy_records)(from, from_index, to, to_index, run);
+        position += run;
+    }
+
+    channel_index_copy(&from->by_channel, &to->by_channel);
+    block_summary_copy(&from->blocks, &to->blocks, start, stop);
+    srb_set_origin(to_buf, start);
+    srb_set_sequence(to_buf, stop);
+    srb_set_count(to_buf, stop);
+
+    u64 intact = srb_valid_from(from_buf);
+    return intact > start ? intact : start;
+}
+
+///
+/// @brief copy the records held by a buffer into its resized replacement
+///
+/// The most recent records that fit are copied, then the replacement takes
+/// over the count of the original. The original must not be written to
+/// during the copy.
+///
+static inline void
+JOIN(stub, copy_window)(shared_ring_buffer* const from_buf,
+                        const slice* const from,
+                        shared_ring_buffer* const to_buf,
+                        const slice* const to) {
+    u64 count = srb_get_count(from_buf);
+    u64 start = srb_valid_from(from_buf);
+    if (count - start > srb_get_capacity(to_buf)) {
+        start = count - srb_get_capacity(to_buf);
+    }
+    JOIN(stub, copy_range)(from_buf, from, to_buf, to, start, count);
+}
+
+///
+/// @brief check the summary of a block against the first n of its records
+///
+static inline bool
+JOIN(stub, block_consistent)(shared_ring_buffer* const buf,
+                             const slice* const data,
+                             u64 block,
+                             u64 n) {
+    const block_summary* blocks = &data->blocks;
+    const u64* slot = block_summary_slot(blocks, block);
+    u64 capacity = srb_get_capacity(buf);
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+
+    u64 mask[BLOCK_SUMMARY_MASK_WORDS] = { 0 };
+    u64* counts = (u64*)calloc(blocks->channel_count + 1, sizeof(u64));
+    u64 first = block << blocks->shift;
+    u64 first_time = arrivalTimeAt(data, conversion_factor, first % capacity);
+    u64 last_time = first_time;
+    for (u64 position = first; position < first + n; position++) {
+        u64 index = position % capacity;
+        u8 channel = channelAt(data, index);
+        if (channel < blocks->channel_count) {
+            counts[channel] += 1;
+        }
+        mask[channel >> 6] |= 1ULL << (channel & 63);
+        last_time = arrivalTimeAt(data, conversion_factor, index);
+    }
+
+    bool consistent = (block_summary_first(slot) == first_time) &&
+                      (block_summary_last(slot) == last_time) &&
+                      (0 == memcmp(&slot[4], mask, sizeof(mask))) &&
+                      (0 == memcmp(block_summary_counts(slot),
+                                   counts,
+                                   blocks->channel_count * sizeof(u64)));
+    free(counts);
+    return consistent;
+}
+
+///
+/// @brief restore a consistent buffer after its writer stopped unexpectedly
+///
+/// Records claimed by a write that was never published are dropped along with
+/// the older records the write may have overwritten. If the buffer keeps block
+/// summaries the count is then taken from the most recent block whose summary
+/// agrees with its records, which recovers records written after the count was
+/// last stored and drops records that never reached a buffer file. The channel
+/// index and block summaries are rebuilt from the remaining records.
+///
+/// @return number of records in the buffer after recovery
+///
+static inline u64
+JOIN(stub, recover)(shared_ring_buffer* const buf, const slice* const data) {
+    u64 capacity = srb_get_capacity(buf);
+    u64 count = srb_get_count(buf);
+    u64 origin = srb_valid_from(buf);
+    if (origin > count) {
+        origin = count;
+    }
+
+    const block_summary* blocks = &data->blocks;
+    if (blocks->block_size != 0) {
+        // newest block started within one lap of the stored count, the
+        // count may be older than the records it describes
+        u64 sequence = srb_get_sequence(buf);
+        u64 limit = (sequence > count ? sequence : count) + capacity;
+        u64 newest = 0;
+        bool summarised = false;
+        for (u64 s = 0; s < blocks->slots; s++) {
+            u64 id = block_summary_slot(blocks, s)[0];
+            if ((id != 0) && (((id - 1) << blocks->shift) < limit) &&
+                (id - 1 >= newest)) {
+                newest = id - 1;
+                summarised = true;
+            }
+        }
+
+        u64 recovered = origin;
+        for (u64 step = 0; summarised && (step <= newest) && (step < blocks->slots);
+             step++) {
+            u64 block = newest - step;
+            u64 first = block << blocks->shift;
+            if (first < origin) {
+                break;
+            }
+            const u64* slot = block_summary_slot(blocks, block);
+            u64 n = slot[1];
+            if ((slot[0] != block + 1) || (n == 0) ||
+                (n > blocks->block_size) || (n > capacity)) {
+                continue;
+            }
+            if (JOIN(stub, block_consistent)(buf, data, block, n)) {
+                recovered = first + n;
+                break;
+            }
+        }
+        count = recovered;
+        if (count - origin > capacity) {
+            origin = count - capacity;
+        }
+    }
+
+    srb_set_origin(buf, origin);
+    srb_set_sequence(buf, count);
+    srb_set_count(buf, count);
+
+    channel_index_clear(&data->by_channel);
+    block_summary_clear(blocks);
+    JOIN(stub, index_records)(buf, data, origin, count);
+    return count;
+}
+
 // analysis
 
 static inline u64
 JOIN(stub, oldest_index)(shared_ring_buffer* buf) {
-    u64 count = srb_get_count(buf);
-    u64 capacity = srb_get_capacity(buf);
-    return count > capacity ? count - capacity : 0;
+    // records between (count - capacity) and (sequence - capacity) may be
+    // getting overwritten by a writer that has claimed but not yet published
+    return srb_valid_from(buf);
 }
 
 static inline f64
@@ -156,11 +394,47 @@ JOIN(stub, lower_bound)(shared_ring_buffer* buf, const slice* data, u64 key) {
     u64 count = srb_get_count(buf) - 1;
     u64 conversion_factor = srb_get_conversion_factor(buf);
 
-    u64 left = count > capacity ? count - capacity : 0;
+    u64 left = srb_valid_from(buf);
     u64 right = count;
     u64 mid = 0;
     u64 arrival_time = 0;
 
+    // narrow the search to one block using the first arrival time of each
+    // block, the summaries are far smaller than the records
+    const block_summary* blocks = &data->blocks;
+    if ((blocks->block_size != 0) && (left < right)) {
+        u64 block_left = (left + blocks->block_size - 1) >> blocks->shift;
+        u64 block_last = right >> blocks->shift;
+        u64 block_right = block_last;
+        bool summarised = true;
+        while (block_left < block_right) {
+            u64 block = block_left + (block_right - block_left) / 2;
+            const u64* summary = block_summary_started(blocks, block);
+            if (summary == NULL) {
+                summarised = false;
+                break;
+            }
+            if (block_summary_first(summary) < key) {
+                block_left = block + 1;
+            } else {
+                block_right = block;
+            }
+        }
+        if (summarised) {
+            // the answer lies between the first record of the last block
+            // starting before key and the first record of block_left, the
+            // last block is never searched so it bounds nothing on the right
+            if ((block_left > 0) &&
+                (((block_left - 1) << blocks->shift) > left)) {
+                left = (block_left - 1) << blocks->shift;
+            }
+            if ((block_left < block_last) &&
+                ((block_left << blocks->shift) < right)) {
+                right = block_left << blocks->shift;
+            }
+        }
+    }
+
     while (left < right) {
         mid = left + (right - left) / 2;
         arrival_time = arrivalTimeAt(data, conversion_factor, mid % capacity);
@@ -171,7 +445,10 @@ JOIN(stub, lower_bound)(shared_ring_buffer* buf, const slice* data, u64 key) {
         }
     }
 
-    return left;
+    // the writer may have lapped the lower half of the search, in which case
+    // the oldest intact record is the best answer we can give
+    u64 valid_from = srb_valid_from(buf);
+    return left < valid_from ? valid_from : left;
 }
 #define lowerBound(buf, data, key) JOIN(stub, lower_bound)(buf, data, key)
 
@@ -183,11 +460,8 @@ JOIN(stub, time_in_buffer)(shared_ring_buffer* buf, slice* data) {
     u64 conversion_factor = srb_get_conversion_factor(buf);
 
     u64 newest_index = count;
-    u64 oldest_index = 0;
+    u64 oldest_index = JOIN(stub, oldest_index)(buf);
 
-    if (count > capacity) {
-        oldest_index = count - capacity;
-    }
     newest_index = (newest_index - 1) % capacity;
     oldest_index = oldest_index % capacity;
 
@@ -247,11 +521,11 @@ JOIN(stub, arg_min)(shared_ring_buffer* const buf,
 #define argMin(buf, ch_max, cur, n) JOIN(stub, arg_min)(buf, ch_max, cur, n)
 
 static inline u64
-JOIN(stub, singles)(shared_ring_buffer* const buf,
-                    const slice* data,
-                    const u64 start,
-                    const u64 stop,
-                    u64* counters) {
+JOIN(stub, singles_scan)(shared_ring_buffer* const buf,
+                         const slice* data,
+                         const u64 start,
+                         const u64 stop,
+                         u64* counters) {
 
     u64 count = srb_get_count(buf);
     u64 capacity = srb_get_capacity(buf);
@@ -283,15 +557,78 @@ JOIN(stub, singles)(shared_ring_buffer* const buf,
     return count_current;
 }
 
+///
+/// @brief count the records of each channel in [start, stop)
+///
+/// Complete blocks inside the range are counted from their summaries, only
+/// the partial blocks at either end are scanned.
+///
+static inline u64
+JOIN(stub, singles)(shared_ring_buffer* const buf,
+                    const slice* data,
+                    const u64 start,
+                    const u64 stop,
+                    u64* counters) {
+
+    const block_summary* blocks = &data->blocks;
+    if ((blocks->block_size == 0) || (stop <= start) ||
+        ((stop - start) < 2 * blocks->block_size)) {
+        return JOIN(stub, singles_scan)(buf, data, start, stop, counters);
+    }
+
+    u64 channel_count = srb_get_channel_count(buf);
+    if (channel_count > blocks->channel_count) {
+        channel_count = blocks->channel_count;
+    }
+
+    u64 total = 0;
+    u64 position = start;
+    u64 block = (start + blocks->block_size - 1) >> blocks->shift;
+    u64 block_stop = stop >> blocks->shift;
+
+    for (; block < block_stop; block++) {
+        const u64* summary = block_summary_complete(blocks, block);
+        if (summary == NULL) {
+            continue;
+        }
+        u64 block_start = block << blocks->shift;
+        if (position < block_start) {
+            total += JOIN(stub, singles_scan)(
+              buf, data, position, block_start, counters);
+        }
+        const u64* counts = block_summary_counts(summary);
+        for (u64 c = 0; c < channel_count; c++) {
+            counters[c] += counts[c];
+        }
+        total += blocks->block_size;
+        position = block_start + blocks->block_size;
+    }
+
+    if (position < stop) {
+        total += JOIN(stub, singles_scan)(buf, data, position, stop, counters);
+    }
+    return total;
+}
+
 // TODO: replace read_time with a length, this way the user can choose to
 // convert a read time to bins or alternatively just pick some number of bins
+///
+/// @brief pattern iterator over the records before count
+///
+/// Each channel starts at its first record within read_time of the most
+/// recent record, or at its first record arriving at or after from_bins if
+/// that is later. Iterators of one analysis split into chunks share count so
+/// they all see the same records.
+///
 static inline pattern_iterator
-JOIN(stub, pattern_init)(shared_ring_buffer* const buf,
-                         const slice* data,
-                         const u32 n,
-                         const u8* const channels,
-                         const f64* const time_delays,
-                         const f64 read_time) {
+JOIN(stub, pattern_init_range)(shared_ring_buffer* const buf,
+                               const slice* data,
+                               const u32 n,
+                               const u8* const channels,
+                               const f64* const time_delays,
+                               const f64 read_time,
+                               const u64 count,
+                               const u64 from_bins) {
 
     u64* delays = (u64*)malloc(sizeof(u64) * n);
     binsFromTimeDelays(buf, n, time_delays, delays);
@@ -306,13 +643,14 @@ JOIN(stub, pattern_init)(shared_ring_buffer* const buf,
     // }
     // printf("\n");
 
-    u64 count = srb_get_count(buf);
     u64 capacity = srb_get_capacity(buf);
     f64 res = srb_get_resolution(buf);
     u64 read_bins = binsFromTime(res, read_time);
 
     u64* channel_max = (u64*)malloc(sizeof(u64) * n);
     u64* index = (u64*)malloc(sizeof(u64) * n);
+    u64* entry = (u64*)malloc(sizeof(u64) * n);
+    u64* entry_stop = (u64*)malloc(sizeof(u64) * n);
     circular_iterator* iters =
       (circular_iterator*)malloc(sizeof(circular_iterator) * n);
 
@@ -336,11 +674,34 @@ JOIN(stub, pattern_init)(shared_ring_buffer* const buf,
         if (!(channel_max[i] <= read_bins)) {
             channel_min = channel_max[i] - read_bins;
         }
+        if (channel_min < from_bins) {
+            channel_min = from_bins;
+        }
 
         index[i] = lowerBound(buf, data, channel_min);
 
-        while (channelAt(data, index[i] % capacity) != channels[i]) {
-            index[i] += 1;
+        // with a channel index the first record of the channel is found
+        // directly, otherwise by walking forward from the lower bound
+        entry[i] = channel_index_lower_bound(
+          &data->by_channel, channels[i], index[i]);
+        if (entry[i] != CHANNEL_INDEX_MISS) {
+            entry_stop[i] = channel_index_count(&data->by_channel, channels[i]);
+            if ((entry[i] < entry_stop[i]) &&
+                (channel_index_position(&data->by_channel,
+                                        channels[i],
+                                        entry[i]) < count)) {
+                index[i] = channel_index_position(
+                  &data->by_channel, channels[i], entry[i]);
+            } else {
+                entry[i] = CHANNEL_INDEX_MISS;
+            }
+        }
+
+        if (entry[i] == CHANNEL_INDEX_MISS) {
+            while ((index[i] < count) &&
+                   (channelAt(data, index[i] % capacity) != channels[i])) {
+                index[i] += 1;
+            }
         }
 
         iterator_init(&iters[i], capacity, index[i], count);
@@ -356,18 +717,82 @@ JOIN(stub, pattern_init)(shared_ring_buffer* const buf,
     pattern_iter.index = index;
     pattern_iter.limit = channel_max;
     pattern_iter.iters = iters;
+    pattern_iter.entry = entry;
+    pattern_iter.entry_stop = entry_stop;
+    pattern_iter.stop = count;
 
     return pattern_iter;
 }
+#define patternIteratorInitRange(buf, s, n, ch, delays, rt, c, from)           \
+    JOIN(stub, pattern_init_range)(buf, s, n, ch, delays, rt, c, from)
+
+static inline pattern_iterator
+JOIN(stub, pattern_init)(shared_ring_buffer* const buf,
+                         const slice* data,
+                         const u32 n,
+                         const u8* const channels,
+                         const f64* const time_delays,
+                         const f64 read_time) {
+    return JOIN(stub, pattern_init_range)(
+      buf, data, n, channels, time_delays, read_time, srb_get_count(buf), 0);
+}
 #define patternIteratorInit(buf, s, n, ch, delays, rt)                         \
     JOIN(stub, pattern_init)(buf, s, n, ch, delays, rt)
 
+///
+/// @brief oldest absolute index a pattern iterator with these settings reads
+///
+/// Mirrors the search performed in pattern_init without allocating the
+/// iterators, callers use the result to check whether the region scanned by
+/// an analysis was overwritten by the writer while the analysis was running.
+///
+static inline u64
+JOIN(stub, pattern_first_index)(shared_ring_buffer* const buf,
+                                const slice* data,
+                                const u32 n,
+                                const f64* const time_delays,
+                                const f64 read_time) {
+
+    u64 count = srb_get_count(buf);
+    if (count == 0) {
+        return 0;
+    }
+
+    u64* delays = (u64*)malloc(sizeof(u64) * n);
+    binsFromTimeDelays(buf, n, time_delays, delays);
+
+    u64 delay_max = 0;
+    for (u32 i = 0; i < n; i++) {
+        if (delays[i] > delay_max) {
+            delay_max = delays[i];
+        }
+    }
+    free(delays);
+
+    u64 capacity = srb_get_capacity(buf);
+    f64 res = srb_get_resolution(buf);
+    u64 read_bins = binsFromTime(res, read_time);
+    u64 most_recent = asBins(timestampAt(data, (count - 1) % capacity),
+                             srb_get_conversion_factor(buf));
+
+    u64 channel_min = 0;
+    if (most_recent > (delay_max + read_bins)) {
+        channel_min = most_recent - delay_max - read_bins;
+    }
+
+    return lowerBound(buf, data, channel_min);
+}
+#define patternFirstIndex(buf, s, n, delays, rt)                               \
+    JOIN(stub, pattern_first_index)(buf, s, n, delays, rt)
+
 static inline void
 JOIN(stub, pattern_deinit)(pattern_iterator* pattern) {
     // free(pattern->channels);
     free(pattern->index);
     free(pattern->limit);
     free(pattern->iters);
+    free(pattern->entry);
+    free(pattern->entry_stop);
 }
 #define patternIteratorDeinit(PTTRN) JOIN(stub, pattern_deinit)(PTTRN)
 
@@ -392,6 +817,91 @@ JOIN(stub, next_for_channel)(const slice* data,
 #define nextForChannel(s, iter, ch, idx)                                       \
     JOIN(stub, next_for_channel)(s, iter, ch, idx)
 
+///
+/// @brief advance channel i of a pattern to its next record
+///
+/// Uses the channel index where pattern_init could, otherwise walks the
+/// records with next_for_channel. The channel's circular iterator follows the
+/// index so a channel whose index entries the writer replaces mid scan carries
+/// on walking the records from where the index left off.
+///
+/// @return false once channel i has no records left
+///
+static inline bool
+JOIN(stub, pattern_next)(shared_ring_buffer* const buf,
+                         const slice* data,
+                         pattern_iterator* pattern,
+                         u64 i) {
+
+    if (pattern->entry[i] != CHANNEL_INDEX_MISS) {
+        pattern->entry[i] += 1;
+        if (pattern->entry[i] >= pattern->entry_stop[i]) {
+            return false;
+        }
+
+        const channel_index* by_channel = &data->by_channel;
+        u8 channel = pattern->channels[i];
+        circular_iterator* iter = &pattern->iters[i];
+        u64 position =
+          channel_index_position(by_channel, channel, pattern->entry[i]);
+        u64 current = pattern->stop - iter->count;
+        if ((position > current) && (position < pattern->stop)) {
+            pattern->index[i] = iterator_advance(iter, position - current);
+            return true;
+        }
+
+        // every position appended after initialisation is at or past stop,
+        // unless the writer has since published a full index of entries past
+        // this one and replaced it, then the records are walked instead
+        if (channel_index_count(by_channel, channel) <
+            pattern->entry[i] + by_channel->capacity) {
+            return false;
+        }
+        pattern->entry[i] = CHANNEL_INDEX_MISS;
+    }
+
+    const block_summary* blocks = &data->blocks;
+    if (blocks->block_size == 0) {
+        return nextForChannel(data,
+                              &pattern->iters[i],
+                              pattern->channels[i],
+                              &pattern->index[i]);
+    }
+
+    // as next_for_channel, skipping whole blocks without the channel
+    circular_iterator* iter = &pattern->iters[i];
+    u8 channel = pattern->channels[i];
+    u64 mask = blocks->block_size - 1;
+    while (iter->count != 0) {
+        u64 upcoming = pattern->stop - iter->count + 1;
+        if (((upcoming & mask) == 0) && (iter->count > blocks->block_size)) {
+            const u64* summary =
+              block_summary_complete(blocks, upcoming >> blocks->shift);
+            if ((summary != NULL) &&
+                (false == block_summary_has_channel(summary, channel))) {
+                pattern->index[i] =
+                  iterator_advance(iter, blocks->block_size);
+                continue;
+            }
+        }
+        // walk the records up to the start of the next block
+        u64 run = blocks->block_size - (upcoming & mask);
+        if (run > iter->count) {
+            run = iter->count;
+        }
+        usize index = next(iter);
+        while ((channelAt(data, index) != channel) & (--run != 0)) {
+            index = next(iter);
+        }
+        pattern->index[i] = index;
+        if (channelAt(data, index) == channel) {
+            break;
+        }
+    }
+    return iter->count != 0;
+}
+#define patternNext(buf, s, pttrn, i) JOIN(stub, pattern_next)(buf, s, pttrn, i)
+
 static inline u64
 JOIN(stub, channels_in_coincidence)(const u8 n_channels,
                                     const u64* current_times,
@@ -479,10 +989,7 @@ JOIN(stub, coincidence_count)(shared_ring_buffer* const buf,
                                diameter_bins,
                                pattern.oldest);
 
-        in_range = nextForChannel(data,
-                                  &pattern.iters[pattern.oldest],
-                                  channels[pattern.oldest],
-                                  &pattern.index[pattern.oldest]);
+        in_range = patternNext(buf, data, &pattern, pattern.oldest);
 
         current_times[pattern.oldest] =
           arrivalTimeAt(data, conversion_factor, pattern.index[pattern.oldest]);
@@ -547,10 +1054,7 @@ JOIN(stub, coincidence_collect)(shared_ring_buffer* const buf,
         }
         count += check;
 
-        in_range = nextForChannel(data,
-                                  &pattern.iters[pattern.oldest],
-                                  channels[pattern.oldest],
-                                  &pattern.index[pattern.oldest]);
+        in_range = patternNext(buf, data, &pattern, pattern.oldest);
 
         current_times[pattern.oldest] =
           arrivalTimeAt(data, conversion_factor, pattern.index[pattern.oldest]);
@@ -562,70 +1066,341 @@ JOIN(stub, coincidence_collect)(shared_ring_buffer* const buf,
     return count;
 }
 
-static inline void JOIN(stub, records_copy)(tt_vector* records,
-                                            field_ptrs* data);
+///
+/// @brief first record read on each channel by a single pass engine
+///
+/// Each channel is read from the same record as pattern_init starts it at.
+///
+/// @param[out] first absolute index of the first record read per channel
+/// @return oldest of the first records
+///
+static inline u64
+JOIN(stub, window_first)(shared_ring_buffer* const buf,
+                         const slice* data,
+                         const u64 n_channels,
+                         const u64* delay_bins,
+                         const f64 read_time,
+                         u64* first) {
+    u64 count = srb_get_count(buf);
+    u64 capacity = srb_get_capacity(buf);
+    u64 read_bins = binsFromTime(srb_get_resolution(buf), read_time);
+    u64 most_recent = asBins(timestampAt(data, (count - 1) % capacity),
+                             srb_get_conversion_factor(buf));
+
+    u64 oldest = count;
+    for (u64 i = 0; i < n_channels; i++) {
+        u64 channel_max = most_recent;
+        if (most_recent > delay_bins[i]) {
+            channel_max = most_recent - delay_bins[i];
+        }
+        u64 channel_min = 0;
+        if (channel_max > read_bins) {
+            channel_min = channel_max - read_bins;
+        }
+        first[i] = lowerBound(buf, data, channel_min);
+        oldest = first[i] < oldest ? first[i] : oldest;
+    }
+    return oldest;
+}
 
+///
+/// @brief coincidences found in a single pass over the records
+///
+/// Gives the same result as coincidence_count and coincidence_collect, apart
+/// from records of different channels with identical timestamps, without
+/// stepping an iterator per channel. The records are walked once from the
+/// most recent back to the oldest one read, keeping the delayed arrival time
+/// of the next record on each channel of the pattern. A record is in
+/// coincidence when the next record on every other channel of the pattern
+/// falls within the diameter after it, a bit per channel records which do.
+/// The channels of the pattern must be distinct, at most 64 of them.
+///
+/// @param[out] records receives the timestamps of each coincidence in pattern
+/// order, oldest coincidence first, NULL to only count them
+/// @return number of coincidences
+///
 static inline u64
-JOIN(stub, timetrace)(shared_ring_buffer* buf,
-                      const slice* data,
-                      const u64 start,
-                      const u64 stop,
-                      const u64 bin_width,
-                      const u8* channels,
-                      const u64 n_channels,
-                      const u64 length,
-                      u64* intensities) {
+JOIN(stub, coincidence_window)(shared_ring_buffer* const buf,
+                               const slice* data,
+                               const u64 n_channels,
+                               u8* channels,
+                               const f64* delays,
+                               const f64 radius,
+                               const f64 read_time,
+                               tt_vector* records) {
+
+    if (records != NULL) {
+        tt_vector_reset(records);
+    }
 
     u64 count = srb_get_count(buf);
+    if ((count == 0) || (n_channels == 0) || (n_channels > 64)) {
+        return 0;
+    }
+
     u64 capacity = srb_get_capacity(buf);
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+    u64 radius_bins = binsFromTime(srb_get_resolution(buf), radius);
+    u64 diameter_bins = radius_bins + radius_bins;
 
-    if (start > count) {
-        return 0;
+    u64* delay_bins = (u64*)malloc(sizeof(u64) * n_channels);
+    u64* first = (u64*)malloc(sizeof(u64) * n_channels);
+    // no next record yet, masked out by seen below
+    u64* next_time = (u64*)calloc(n_channels, sizeof(u64));
+    u64* next_index = (u64*)calloc(n_channels, sizeof(u64));
+    binsFromTimeDelays(buf, n_channels, delays, delay_bins);
+    u64 oldest = JOIN(stub, window_first)(
+      buf, data, n_channels, delay_bins, read_time, first);
+
+    // position of each channel in the pattern, n_channels if not in it
+    u8 position_of[256];
+    memset(position_of, (int)n_channels, sizeof(position_of));
+    for (u64 i = 0; i < n_channels; i++) {
+        position_of[channels[i]] = (u8)i;
     }
 
-    if (stop > count) {
-        return 0;
+    u64 pattern_mask = (n_channels == 64) ? UINT64_MAX
+                                          : (((u64)1 << n_channels) - 1);
+    // ring indexes of the records of each coincidence, newest first
+    u64* found = NULL;
+    u64 found_capacity = 0;
+    u64 seen = 0;
+    u64 total = 0;
+    u64 index = (count - 1) % capacity;
+    for (u64 position = count; position-- > oldest;) {
+        u64 i = position_of[channelAt(data, index)];
+        if ((i < n_channels) && (position >= first[i])) {
+            u64 arrival =
+              arrivalTimeAt(data, conversion_factor, index) + delay_bins[i];
+
+            u64 mask = (u64)1 << i;
+            for (u64 j = 0; j < n_channels; j++) {
+                mask |= (u64)((next_time[j] - arrival) < diameter_bins) << j;
+            }
+            mask &= seen | ((u64)1 << i);
+
+            if (mask == pattern_mask) {
+                total += 1;
+                if (records != NULL) {
+                    if (total * n_channels > found_capacity) {
+                        found_capacity = 2 * total * n_channels;
+                        found = (u64*)realloc(found,
+                                              sizeof(u64) * found_capacity);
+                    }
+                    u64* entry = found + (total - 1) * n_channels;
+                    for (u64 j = 0; j < n_channels; j++) {
+                        entry[j] = (j == i) ? index : next_index[j];
+                    }
+                }
+            }
+
+            next_time[i] = arrival;
+            next_index[i] = index;
+            seen |= (u64)1 << i;
+        }
+        index = (index == 0) ? capacity - 1 : index - 1;
     }
 
-    if (start > stop) {
+    for (u64 k = total; (found != NULL) && (k-- > 0);) {
+        for (u64 j = 0; j < n_channels; j++) {
+            tt_vector_push(records,
+                           timestampAt(data, found[k * n_channels + j]));
+        }
+    }
+
+    free(found);
+    free(delay_bins);
+    free(first);
+    free(next_time);
+    free(next_index);
+    return total;
+}
+
+///
+/// @brief count the coincidences of many patterns in a single pass
+///
+/// As coincidence_window, each record on one of the channels gives a bit for
+/// every channel whose next record falls within the diameter after it. Every
+/// pattern containing the channel of the record and covered by those bits has
+/// a coincidence. Every channel is read over the same span for all patterns,
+/// the span coincidence_count reads for a pattern containing the channel with
+/// the largest delay, so with unequal delays a pattern without that channel
+/// can differ from coincidence_count close to the start of read_time.
+///
+/// @param[in] n_channels number of channels read, at most 64
+/// @param[in] channels distinct channels read
+/// @param[in] delays delay of each of the channels
+/// @param[in] n_patterns number of patterns, 0 to count every subset of the
+/// channels, at most COINCIDENCE_SUBSETS_MAX of them
+/// @param[in] patterns bit j set for each pattern containing channels[j]
+/// @param[out] counts coincidences of each pattern, or of every subset indexed
+/// by its bits if n_patterns is 0 (2^n_channels entries), zeroed first
+/// @return number of records read
+///
+static inline u64
+JOIN(stub, coincidence_counts)(shared_ring_buffer* const buf,
+                               const slice* data,
+                               const u64 n_channels,
+                               const u8* channels,
+                               const f64* delays,
+                               const f64 radius,
+                               const f64 read_time,
+                               const u64 n_patterns,
+                               const u64* patterns,
+                               u64* counts) {
+
+    if ((n_patterns == 0) && (n_channels > COINCIDENCE_SUBSETS_MAX)) {
         return 0;
     }
+    u64 n_counts = (n_patterns == 0) ? ((u64)1 << n_channels) : n_patterns;
+    memset(counts, 0, sizeof(u64) * n_counts);
 
-    circular_iterator iter = { 0 };
-    iterator_init(&iter, capacity, start, stop);
+    u64 count = srb_get_count(buf);
+    if ((count == 0) || (n_channels == 0) || (n_channels > 64)) {
+        return 0;
+    }
 
-    u64 index = iter.lower.index;
+    u64 capacity = srb_get_capacity(buf);
     u64 conversion_factor = srb_get_conversion_factor(buf);
-    u64 end_of_bin = arrivalTimeAt(data, conversion_factor, index) + bin_width;
+    u64 radius_bins = binsFromTime(srb_get_resolution(buf), radius);
+    u64 diameter_bins = radius_bins + radius_bins;
 
-    u64 i = 0;
-    u64 offset = 1;
-    u8 current_channel = 0;
-    u64 intensity = 0;
+    u64* delay_bins = (u64*)malloc(sizeof(u64) * n_channels);
+    u64* first = (u64*)malloc(sizeof(u64) * n_channels);
+    u64* next_time = (u64*)calloc(n_channels, sizeof(u64));
+    binsFromTimeDelays(buf, n_channels, delays, delay_bins);
+    u64 oldest = JOIN(stub, window_first)(
+      buf, data, n_channels, delay_bins, read_time, first);
 
-    while (iter.count != 0) {
-        current_channel = channelAt(data, index);
-        for (u64 c = 0; c < n_channels; c++) {
-            if (current_channel == channels[c]) {
-                intensity += 1;
-                break;
+    u8 position_of[256];
+    memset(position_of, (int)n_channels, sizeof(position_of));
+    for (u64 i = 0; i < n_channels; i++) {
+        position_of[channels[i]] = (u8)i;
+    }
+
+    // patterns containing each channel, members[member_start[i]...]
+    u64* member_start = (u64*)calloc(n_channels + 1, sizeof(u64));
+    u64* members = (u64*)malloc(sizeof(u64) * (n_patterns * n_channels + 1));
+    for (u64 i = 0; i < n_channels; i++) {
+        member_start[i + 1] = member_start[i];
+        for (u64 k = 0; k < n_patterns; k++) {
+            if (patterns[k] & ((u64)1 << i)) {
+                members[member_start[i + 1]++] = k;
             }
         }
+    }
+
+    u64 seen = 0;
+    u64 index = (count - 1) % capacity;
+    for (u64 position = count; position-- > oldest;) {
+        u64 i = position_of[channelAt(data, index)];
+        if ((i < n_channels) && (position >= first[i])) {
+            u64 arrival =
+              arrivalTimeAt(data, conversion_factor, index) + delay_bins[i];
+            u64 bit = (u64)1 << i;
+
+            u64 mask = 0;
+            for (u64 j = 0; j < n_channels; j++) {
+                mask |= (u64)((next_time[j] - arrival) < diameter_bins) << j;
+            }
+            mask &= seen & ~bit;
+
+            if (n_patterns == 0) {
+                // every subset of the channels in the window with this one
+                u64 subset = mask;
+                while (true) {
+                    counts[subset | bit] += 1;
+                    if (subset == 0) {
+                        break;
+                    }
+                    subset = (subset - 1) & mask;
+                }
+            } else {
+                mask |= bit;
+                for (u64 m = member_start[i]; m < member_start[i + 1]; m++) {
+                    counts[members[m]] += (patterns[members[m]] & ~mask) == 0;
+                }
+            }
 
-        if (arrivalTimeAt(data, conversion_factor, index) > end_of_bin) {
-            intensities[i] = intensity;
-            intensity = 0;
-            i += 1;
-            end_of_bin += bin_width;
+            next_time[i] = arrival;
+            seen |= bit;
         }
+        index = (index == 0) ? capacity - 1 : index - 1;
+    }
+
+    free(member_start);
+    free(members);
+    free(delay_bins);
+    free(first);
+    free(next_time);
+    return count - oldest;
+}
+
+///
+/// @brief start a coincidence stream for a pattern at a record
+///
+static inline void
+JOIN(stub, coincidence_stream_init)(shared_ring_buffer* const buf,
+                                    coincidence_stream* stream,
+                                    const u64 n_channels,
+                                    const u8* channels,
+                                    const f64* delays,
+                                    const f64 radius,
+                                    const u64 position) {
+    u64* delay_bins = (u64*)malloc(sizeof(u64) * n_channels);
+    binsFromTimeDelays(buf, n_channels, delays, delay_bins);
+    u64 radius_bins = binsFromTime(srb_get_resolution(buf), radius);
+    stream_init(stream,
+                n_channels,
+                channels,
+                delay_bins,
+                radius_bins + radius_bins,
+                position);
+    free(delay_bins);
+}
+
+///
+/// @brief consume the records [stream->position, stop)
+///
+/// Coincidences completed by these records are added to
+/// stream->coincidences, the records of each channel to counters.
+///
+/// @return number of records consumed
+///
+static inline u64
+JOIN(stub, coincidence_stream_update)(shared_ring_buffer* const buf,
+                                      const slice* data,
+                                      coincidence_stream* stream,
+                                      const u64 stop,
+                                      u64* counters) {
+    u64 start = stream->position;
+    if (stop <= start) {
+        return 0;
+    }
 
-        offset = next(&iter);
-        index = offset;
+    u64 capacity = srb_get_capacity(buf);
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+    u64 index = start % capacity;
+    for (u64 position = start; position < stop; position++) {
+        u8 channel = channelAt(data, index);
+        counters[channel] += 1;
+        u64 i = stream->position_of[channel];
+        if (i < stream->n_channels) {
+            stream_record(
+              stream, i, arrivalTimeAt(data, conversion_factor, index));
+        }
+        index = (index + 1 == capacity) ? 0 : index + 1;
     }
 
-    return i;
+    index = (stop - 1) % capacity;
+    stream->last_time = arrivalTimeAt(data, conversion_factor, index);
+    stream->position = stop;
+    return stop - start;
 }
 
+static inline void JOIN(stub, records_copy)(tt_vector* records,
+                                            field_ptrs* data);
+
 static inline void
 JOIN(stub, relative_delay)(shared_ring_buffer* buf,
                            const slice* data,
@@ -691,60 +1466,1034 @@ JOIN(stub, relative_delay)(shared_ring_buffer* buf,
     }
 }
 
-histogram2D_coords JOIN(stub,
-                        joint_histogram_position)(const slice* data,
-                                                  const u8 ch_idx_idler,
-                                                  const u8 ch_idx_signal,
-                                                  const u8 ch_idx_clock,
-                                                  const timestamp* timetags);
+///
+/// @brief move the pointers of a lookback of arrival times on to the record
+/// arriving at time_of_arrival
+///
+/// The times in [tail, middle) are those before time_of_arrival by more than
+/// lower and by less than upper. Both pointers only move forward, the
+/// lookback is compacted once most of it is behind the tail.
+///
+static inline void
+JOIN(stub, lookback_advance)(vec_u64* lookback,
+                             u64* tail,
+                             u64* middle,
+                             const u64 time_of_arrival,
+                             const i64 lower,
+                             const i64 upper) {
+    u64 length = (u64)lookback->length;
+    while ((*tail < length) &&
+           ((i64)(time_of_arrival - lookback->data[*tail]) >= upper)) {
+        *tail += 1;
+    }
+    if (*middle < *tail) {
+        *middle = *tail;
+    }
+    while ((*middle < length) &&
+           ((i64)(time_of_arrival - lookback->data[*middle]) > lower)) {
+        *middle += 1;
+    }
 
-#define jointHistogramPosition(s, i_i, i_s, i_c, ts)                           \
-    JOIN(stub, joint_histogram_position)(s, i_i, i_s, i_c, ts)
+    if (*tail == length) {
+        lookback->length = 0;
+        *tail = 0;
+        *middle = 0;
+    } else if (*tail > (u64)(lookback->capacity / 2)) {
+        lookback->length -= (size)*tail;
+        memmove(lookback->data,
+                lookback->data + *tail,
+                lookback->length * sizeof(u64));
+        *middle -= *tail;
+        *tail = 0;
+    }
+}
 
-static inline u64
-JOIN(stub, joint_delay_histogram)(shared_ring_buffer* const buf,
-                                  const slice* data,
-                                  const u8 clock,
-                                  const u8 signal,
-                                  const u8 idler,
-                                  const u64 n_channels,
-                                  const u8* channels,
-                                  const f64* delays,
-                                  const f64 radius,
-                                  const f64 read_time,
-                                  u64* intensities) {
+///
+/// @brief histogram of the delays between every pair of records on two
+/// channels within the correlation window of delay
+///
+/// Unlike relative_delay, which only pairs a record with the most recent
+/// record on the other channel, every pair within the window is counted
+/// (multi-start, multi-stop). A pair is counted when its later record is
+/// read, from a lookback of the arrival times on the other channel within
+/// reach, so the records are swept once and there is no limit on the records
+/// per window. Bin i holds the pairs with t_b - t_a - delay in
+/// [(i - length / 2) * resolution, (i - length / 2 + 1) * resolution).
+///
+static inline void
+JOIN(stub, cross_correlation)(shared_ring_buffer* buf,
+                              const slice* data,
+                              const u64 start,
+                              const u64 stop,
+                              const u64 correlation_window,
+                              const u64 resolution,
+                              const i64 delay,
+                              const u8 channel_a,
+                              const u8 channel_b,
+                              const u64 length,
+                              u64* intensities) {
 
-    bool has_signal = false;
-    bool has_idler = false;
+    u64 count = srb_get_count(buf);
+    u64 capacity = srb_get_capacity(buf);
 
-    u8 idx_signal = 0;
-    u8 idx_idler = 0;
-    u8 idx_clock = 0;
+    if ((start > count) || (stop > count) || (start > stop)) {
+        return;
+    }
 
-    for (u64 i = 0; i < n_channels; i++) {
-        if (channels[i] == signal) {
-            has_signal = true;
-            idx_signal = i;
+    circular_iterator iter = { 0 };
+    iterator_init(&iter, capacity, start, stop);
+    u64 index = iter.lower.index;
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+
+    // t_b - t_a must lie in (delay - window, delay + window), read from a b
+    // record that is t_b - t_a and from an a record that is t_a - t_b
+    i64 window = (i64)correlation_window;
+    i64 lower_b = delay - window;
+    i64 upper_b = delay + window;
+    i64 lower_a = -delay - window;
+    i64 upper_a = -delay + window;
+
+    vec_u64* lookback_a = vector_u64_init(256);
+    vec_u64* lookback_b = vector_u64_init(256);
+    u64 tail_a = 0;
+    u64 middle_a = 0;
+    u64 tail_b = 0;
+    u64 middle_b = 0;
+
+    // shifts t_b - t_a - delay so the central bin holds [0, resolution), a
+    // pair shifted below zero wraps past length and is not counted
+    i64 shift = (i64)((length / 2) * resolution);
+    u64 bin;
+
+    while (iter.count != 0) {
+        u8 current_channel = channelAt(data, index);
+
+        if (current_channel == channel_a) {
+            u64 time_of_arrival = arrivalTimeAt(data, conversion_factor, index);
+            if (upper_a > 0) {
+                JOIN(stub, lookback_advance)(lookback_b,
+                                             &tail_b,
+                                             &middle_b,
+                                             time_of_arrival,
+                                             lower_a,
+                                             upper_a);
+                for (u64 i = tail_b; i < middle_b; i++) {
+                    i64 delta = (i64)(lookback_b->data[i] - time_of_arrival);
+                    bin = (u64)(delta - delay + shift) / resolution;
+                    if (bin < length) {
+                        intensities[bin] += 1;
+                    }
+                }
+            }
+            if (upper_b > 0) {
+                vector_u64_push(lookback_a, time_of_arrival);
+            }
+
+        } else if (current_channel == channel_b) {
+            u64 time_of_arrival = arrivalTimeAt(data, conversion_factor, index);
+            if (upper_b > 0) {
+                JOIN(stub, lookback_advance)(lookback_a,
+                                             &tail_a,
+                                             &middle_a,
+                                             time_of_arrival,
+                                             lower_b,
+                                             upper_b);
+                for (u64 i = tail_a; i < middle_a; i++) {
+                    i64 delta = (i64)(time_of_arrival - lookback_a->data[i]);
+                    bin = (u64)(delta - delay + shift) / resolution;
+                    if (bin < length) {
+                        intensities[bin] += 1;
+                    }
+                }
+            }
+            if (upper_a > 0) {
+                vector_u64_push(lookback_b, time_of_arrival);
+            }
         }
-        if (channels[i] == idler) {
-            has_idler = true;
-            idx_idler = i;
+
+        index = next(&iter);
+    }
+
+    vector_u64_deinit(lookback_a);
+    vector_u64_deinit(lookback_b);
+}
+
+///
+/// @brief all pairs histograms between every two of the channels in one pass
+///
+/// As cross_correlation without a delay, for every pair of channels at once.
+/// The histogram of channels i < j holds t_j - t_i and is at row
+/// i * n_channels - i * (i + 1) / 2 + (j - i - 1) of intensities, each row
+/// length bins long. A record is paired with the lookback of every other
+/// channel, so the cost grows with the number of channels, not of pairs.
+///
+static inline void
+JOIN(stub, delay_histograms)(shared_ring_buffer* buf,
+                             const slice* data,
+                             const u64 start,
+                             const u64 stop,
+                             const u64 correlation_window,
+                             const u64 resolution,
+                             const u64 n_channels,
+                             const u8* channels,
+                             const u64 length,
+                             u64* intensities) {
+
+    u64 count = srb_get_count(buf);
+    u64 capacity = srb_get_capacity(buf);
+
+    if ((start > count) || (stop > count) || (start > stop)) {
+        return;
+    }
+
+    // position of each channel, n_channels for those not histogrammed
+    u16 position_of[256];
+    for (u64 c = 0; c < 256; c++) {
+        position_of[c] = (u16)n_channels;
+    }
+    for (u64 c = 0; c < n_channels; c++) {
+        position_of[channels[c]] = (u16)c;
+    }
+
+    vec_u64** lookbacks = (vec_u64**)malloc(n_channels * sizeof(vec_u64*));
+    u64* tails = (u64*)calloc(n_channels, sizeof(u64));
+    u64* middles = (u64*)calloc(n_channels, sizeof(u64));
+    for (u64 c = 0; c < n_channels; c++) {
+        lookbacks[c] = vector_u64_init(256);
+    }
+
+    circular_iterator iter = { 0 };
+    iterator_init(&iter, capacity, start, stop);
+    u64 index = iter.lower.index;
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+
+    i64 window = (i64)correlation_window;
+    i64 shift = (i64)((length / 2) * resolution);
+
+    while (iter.count != 0) {
+        u64 x = position_of[channelAt(data, index)];
+        if (x < n_channels) {
+            u64 time_of_arrival = arrivalTimeAt(data, conversion_factor, index);
+
+            for (u64 y = 0; y < n_channels; y++) {
+                if (y == x) {
+                    continue;
+                }
+                vec_u64* lookback = lookbacks[y];
+                JOIN(stub, lookback_advance)(lookback,
+                                             &tails[y],
+                                             &middles[y],
+                                             time_of_arrival,
+                                             -window,
+                                             window);
+                if (tails[y] == middles[y]) {
+                    continue;
+                }
+
+                // the later record of the pair is on x, t_x - t_y >= 0
+                u64 first = x < y ? x : y;
+                u64 second = x < y ? y : x;
+                u64 row = first * n_channels - first * (first + 1) / 2 +
+                          (second - first - 1);
+                u64* histogram = intensities + row * length;
+                i64 sign = x > y ? 1 : -1;
+
+                for (u64 i = tails[y]; i < middles[y]; i++) {
+                    i64 delta = (i64)(time_of_arrival - lookback->data[i]);
+                    u64 bin = (u64)(sign * delta + shift) / resolution;
+                    if (bin < length) {
+                        histogram[bin] += 1;
+                    }
+                }
+            }
+            vector_u64_push(lookbacks[x], time_of_arrival);
         }
-        if (channels[i] == clock) {
-            idx_clock = i;
+        index = next(&iter);
+    }
+
+    for (u64 c = 0; c < n_channels; c++) {
+        vector_u64_deinit(lookbacks[c]);
+    }
+    free(lookbacks);
+    free(tails);
+    free(middles);
+}
+
+///
+/// @brief first record at or after key, stop if there is none
+///
+static inline u64
+JOIN(stub, position_at_time)(shared_ring_buffer* const buf,
+                             const slice* data,
+                             const u64 key,
+                             const u64 stop) {
+    u64 count = srb_get_count(buf);
+    u64 position = lowerBound(buf, data, key);
+    if ((position == count - 1) &&
+        (arrivalTimeAt(data,
+                       srb_get_conversion_factor(buf),
+                       position % srb_get_capacity(buf)) < key)) {
+        position = count;
+    }
+    return position < stop ? position : stop;
+}
+
+///
+/// @brief channel_traces by testing the channel of every record
+///
+static inline u64
+JOIN(stub, channel_traces_scan)(shared_ring_buffer* buf,
+                                const slice* data,
+                                const u64 start,
+                                const u64 stop,
+                                const u64 origin,
+                                const u64 bin_width,
+                                const u64 n_channels,
+                                const u8* channels,
+                                const u64 length,
+                                u64* intensities) {
+
+    u64 count = srb_get_count(buf);
+    u64 capacity = srb_get_capacity(buf);
+
+    if ((start > count) || (stop > count) || (start > stop)) {
+        return 0;
+    }
+
+    // trace of each channel, n_channels for those not traced
+    u16 trace_of[256];
+    for (u64 c = 0; c < 256; c++) {
+        trace_of[c] = (u16)n_channels;
+    }
+    for (u64 c = 0; c < n_channels; c++) {
+        trace_of[channels[c]] = (u16)c;
+    }
+
+    circular_iterator iter = { 0 };
+    iterator_init(&iter, capacity, start, stop);
+    u64 index = iter.lower.index;
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+
+    u64 counted = 0;
+    while (iter.count != 0) {
+        u16 trace = trace_of[channelAt(data, index)];
+        if (trace < n_channels) {
+            u64 time_of_arrival = arrivalTimeAt(data, conversion_factor, index);
+            if (time_of_arrival >= origin) {
+                u64 bin = (time_of_arrival - origin) / bin_width;
+                if (bin >= length) {
+                    break;
+                }
+                intensities[trace * length + bin] += 1;
+                counted += 1;
+            }
         }
+        index = next(&iter);
     }
 
-    if (!(has_signal == true && has_idler == true)) {
+    return counted;
+}
+
+///
+/// @brief channel_traces by finding the edges of each bin with lowerBound
+///
+/// The records of a bin are then counted with singles, complete blocks from
+/// their summaries, so a bin costs two searches and its partial blocks
+/// rather than a test of each record.
+///
+static inline u64
+JOIN(stub, channel_traces_blocked)(shared_ring_buffer* buf,
+                                   const slice* data,
+                                   const u64 start,
+                                   const u64 stop,
+                                   const u64 origin,
+                                   const u64 bin_width,
+                                   const u64 n_channels,
+                                   const u8* channels,
+                                   const u64 length,
+                                   u64* intensities) {
+
+    u64 counters[256];
+    u64 counted = 0;
+    u64 edge = JOIN(stub, position_at_time)(buf, data, origin, stop);
+    edge = edge > start ? edge : start;
+
+    for (u64 bin = 0; (bin < length) && (edge < stop); bin++) {
+        u64 next_edge = JOIN(stub, position_at_time)(
+          buf, data, origin + (bin + 1) * bin_width, stop);
+        if (next_edge <= edge) {
+            continue;
+        }
+        memset(counters, 0, sizeof(counters));
+        JOIN(stub, singles)(buf, data, edge, next_edge, counters);
+        for (u64 c = 0; c < n_channels; c++) {
+            intensities[c * length + bin] += counters[channels[c]];
+            counted += counters[channels[c]];
+        }
+        edge = next_edge;
+    }
+
+    return counted;
+}
+
+///
+/// @brief count the records of each channel in bins of bin_width from origin
+///
+/// intensities holds a trace of length bins for each channel, one after the
+/// other. Records before origin or beyond the last bin are not counted. Bins
+/// spanning many blocks of the block summaries are counted from them, see
+/// channel_traces_blocked, otherwise every record is read once.
+///
+/// @return number of records counted
+///
+static inline u64
+JOIN(stub, channel_traces)(shared_ring_buffer* buf,
+                           const slice* data,
+                           const u64 start,
+                           const u64 stop,
+                           const u64 origin,
+                           const u64 bin_width,
+                           const u64 n_channels,
+                           const u8* channels,
+                           const u64 length,
+                           u64* intensities) {
+
+    if ((start > srb_get_count(buf)) || (stop > srb_get_count(buf)) ||
+        (start > stop)) {
         return 0;
     }
 
-    //     if (idx_signal == idx_idler) {
-    //         return 0;
-    //     }
+    u64 block_size = data->blocks.block_size;
+    if ((block_size != 0) && (length > 0) &&
+        ((stop - start) / length >= 4 * block_size)) {
+        return JOIN(stub, channel_traces_blocked)(buf,
+                                                  data,
+                                                  start,
+                                                  stop,
+                                                  origin,
+                                                  bin_width,
+                                                  n_channels,
+                                                  channels,
+                                                  length,
+                                                  intensities);
+    }
+    return JOIN(stub, channel_traces_scan)(buf,
+                                           data,
+                                           start,
+                                           stop,
+                                           origin,
+                                           bin_width,
+                                           n_channels,
+                                           channels,
+                                           length,
+                                           intensities);
+}
 
-    pattern_iterator pattern =
-      patternIteratorInit(buf, data, n_channels, channels, delays, read_time);
+// ---------------------------------------------------------------------------
+// Parallel execution
+//
+// A range of records is split into chunks run on the threads of
+// thread_pool.h, each chunk into its own counters or histograms which are
+// summed once every chunk is done. Analyses that pair a record with records
+// up to a window before it read a halo of records before their chunk, the
+// histogram of [halo, chunk start) is subtracted from that of
+// [halo, chunk stop) so only pairs ending inside the chunk remain. The
+// coincidence window engine looks ahead instead and reads a halo after its
+// chunk, counting only coincidences starting inside it. Either way the
+// result is the same as a single pass.
+// ---------------------------------------------------------------------------
+
+///
+/// @brief first record of [start, position] within halo bins before position
+///
+static inline u64
+JOIN(stub, halo_before)(shared_ring_buffer* const buf,
+                        const slice* data,
+                        const u64 start,
+                        const u64 position,
+                        const u64 halo) {
+    if (position <= start) {
+        return start;
+    }
+    u64 arrival = arrivalTimeAt(
+      data, srb_get_conversion_factor(buf), position % srb_get_capacity(buf));
+    if (arrival <= halo) {
+        return start;
+    }
+    u64 first = JOIN(stub, position_at_time)(buf, data, arrival - halo, position);
+    return first > start ? first : start;
+}
+
+typedef struct JOIN(stub, singles_task) JOIN(stub, singles_task);
+struct JOIN(stub, singles_task) {
+    shared_ring_buffer* buf;
+    const slice* data;
+    u64 start;
+    u64 stop;
+    u64 n_chunks;
+    u64 channel_count;
+    u64* counters; /**< channel_count counters per chunk */
+    u64* totals;   /**< records counted per chunk */
+};
+
+static inline void
+JOIN(stub, singles_chunk)(void* context, u64 k) {
+    JOIN(stub, singles_task)* task = (JOIN(stub, singles_task)*)context;
+    u64 chunk_start, chunk_stop;
+    tb_chunk_bounds(
+      task->start, task->stop, task->n_chunks, k, &chunk_start, &chunk_stop);
+    task->totals[k] = JOIN(stub, singles)(task->buf,
+                                          task->data,
+                                          chunk_start,
+                                          chunk_stop,
+                                          task->counters +
+                                            k * task->channel_count);
+}
+
+///
+/// @brief singles over [start, stop) on n_threads
+///
+static inline u64
+JOIN(stub, singles_parallel)(shared_ring_buffer* const buf,
+                             const slice* data,
+                             const u64 start,
+                             const u64 stop,
+                             u64* counters,
+                             const u64 n_threads) {
+    u64 n_chunks = tb_chunk_count(n_threads, stop > start ? stop - start : 0);
+    if (n_chunks == 1) {
+        return JOIN(stub, singles)(buf, data, start, stop, counters);
+    }
+
+    u64 channel_count = srb_get_channel_count(buf);
+    JOIN(stub, singles_task) task = { buf, data, start, stop, n_chunks,
+                                      channel_count };
+    task.counters = (u64*)calloc(n_chunks * channel_count, sizeof(u64));
+    task.totals = (u64*)calloc(n_chunks, sizeof(u64));
+
+    tb_parallel_for(n_chunks, n_threads, JOIN(stub, singles_chunk), &task);
+
+    u64 total = 0;
+    for (u64 k = 0; k < n_chunks; k++) {
+        total += task.totals[k];
+        for (u64 c = 0; c < channel_count; c++) {
+            counters[c] += task.counters[k * channel_count + c];
+        }
+    }
+    free(task.counters);
+    free(task.totals);
+    return total;
+}
+
+#ifndef __HISTOGRAM_KIND__
+#define __HISTOGRAM_KIND__
+typedef enum {
+    HISTOGRAM_RELATIVE_DELAY = 0,
+    HISTOGRAM_CROSS_CORRELATION = 1,
+    HISTOGRAM_DELAY_MATRIX = 2,
+} histogram_kind;
+#endif
+
+typedef struct JOIN(stub, histogram_task) JOIN(stub, histogram_task);
+struct JOIN(stub, histogram_task) {
+    shared_ring_buffer* buf;
+    const slice* data;
+    u64 start;
+    u64 stop;
+    u64 n_chunks;
+    histogram_kind kind;
+    u64 halo;
+    u64 correlation_window;
+    u64 resolution;
+    i64 delay;
+    u8 channel_a;
+    u8 channel_b;
+    u64 n_channels;
+    const u8* channels;
+    u64 length;
+    u64 size;         /**< bins of the histograms of a chunk */
+    u64* intensities; /**< size bins per chunk */
+};
+
+static inline void
+JOIN(stub, histogram_range)(JOIN(stub, histogram_task)* task,
+                            u64 start,
+                            u64 stop,
+                            u64* intensities) {
+    switch (task->kind) {
+        case HISTOGRAM_RELATIVE_DELAY:
+            JOIN(stub, relative_delay)(task->buf,
+                                       task->data,
+                                       start,
+                                       stop,
+                                       task->correlation_window,
+                                       task->resolution,
+                                       task->channel_a,
+                                       task->channel_b,
+                                       task->length,
+                                       intensities);
+            break;
+        case HISTOGRAM_CROSS_CORRELATION:
+            JOIN(stub, cross_correlation)(task->buf,
+                                          task->data,
+                                          start,
+                                          stop,
+                                          task->correlation_window,
+                                          task->resolution,
+                                          task->delay,
+                                          task->channel_a,
+                                          task->channel_b,
+                                          task->length,
+                                          intensities);
+            break;
+        case HISTOGRAM_DELAY_MATRIX:
+            JOIN(stub, delay_histograms)(task->buf,
+                                         task->data,
+                                         start,
+                                         stop,
+                                         task->correlation_window,
+                                         task->resolution,
+                                         task->n_channels,
+                                         task->channels,
+                                         task->length,
+                                         intensities);
+            break;
+    }
+}
+
+static inline void
+JOIN(stub, histogram_chunk)(void* context, u64 k) {
+    JOIN(stub, histogram_task)* task = (JOIN(stub, histogram_task)*)context;
+    u64 chunk_start, chunk_stop;
+    tb_chunk_bounds(
+      task->start, task->stop, task->n_chunks, k, &chunk_start, &chunk_stop);
+    if (chunk_stop <= chunk_start) {
+        return;
+    }
+
+    u64* intensities = task->intensities + k * task->size;
+    u64 halo = JOIN(stub, halo_before)(
+      task->buf, task->data, task->start, chunk_start, task->halo);
+    if (halo < chunk_start) {
+        // histogram of the halo alone, negated so the histogram of the halo
+        // and the chunk leaves only the pairs ending in the chunk
+        JOIN(stub, histogram_range)(task, halo, chunk_start, intensities);
+        for (u64 i = 0; i < task->size; i++) {
+            intensities[i] = (u64)0 - intensities[i];
+        }
+    }
+    JOIN(stub, histogram_range)(task, halo, chunk_stop, intensities);
+}
+
+///
+/// @brief relative_delay, cross_correlation or delay_histograms of
+/// [start, stop) on n_threads, as set in task
+///
+static inline void
+JOIN(stub, histogram_parallel)(JOIN(stub, histogram_task)* task,
+                               u64* intensities,
+                               const u64 n_threads) {
+    task->n_chunks = tb_chunk_count(
+      n_threads, task->stop > task->start ? task->stop - task->start : 0);
+    if (task->n_chunks == 1) {
+        JOIN(stub, histogram_range)(task, task->start, task->stop, intensities);
+        return;
+    }
+
+    task->intensities = (u64*)calloc(task->n_chunks * task->size, sizeof(u64));
+    tb_parallel_for(
+      task->n_chunks, n_threads, JOIN(stub, histogram_chunk), task);
+
+    for (u64 k = 0; k < task->n_chunks; k++) {
+        const u64* chunk = task->intensities + k * task->size;
+        for (u64 i = 0; i < task->size; i++) {
+            intensities[i] += chunk[i];
+        }
+    }
+    free(task->intensities);
+}
+
+static inline void
+JOIN(stub, relative_delay_parallel)(shared_ring_buffer* buf,
+                                    const slice* data,
+                                    const u64 start,
+                                    const u64 stop,
+                                    const u64 correlation_window,
+                                    const u64 resolution,
+                                    const u8 channel_a,
+                                    const u8 channel_b,
+                                    const u64 length,
+                                    u64* intensities,
+                                    const u64 n_threads) {
+    JOIN(stub, histogram_task) task = { 0 };
+    task.buf = buf;
+    task.data = data;
+    task.start = start;
+    task.stop = stop;
+    task.kind = HISTOGRAM_RELATIVE_DELAY;
+    task.halo = correlation_window;
+    task.correlation_window = correlation_window;
+    task.resolution = resolution;
+    task.channel_a = channel_a;
+    task.channel_b = channel_b;
+    task.length = length;
+    task.size = length;
+    JOIN(stub, histogram_parallel)(&task, intensities, n_threads);
+}
+
+static inline void
+JOIN(stub, cross_correlation_parallel)(shared_ring_buffer* buf,
+                                       const slice* data,
+                                       const u64 start,
+                                       const u64 stop,
+                                       const u64 correlation_window,
+                                       const u64 resolution,
+                                       const i64 delay,
+                                       const u8 channel_a,
+                                       const u8 channel_b,
+                                       const u64 length,
+                                       u64* intensities,
+                                       const u64 n_threads) {
+    JOIN(stub, histogram_task) task = { 0 };
+    task.buf = buf;
+    task.data = data;
+    task.start = start;
+    task.stop = stop;
+    task.kind = HISTOGRAM_CROSS_CORRELATION;
+    task.halo = correlation_window + (u64)(delay < 0 ? -delay : delay);
+    task.correlation_window = correlation_window;
+    task.resolution = resolution;
+    task.delay = delay;
+    task.channel_a = channel_a;
+    task.channel_b = channel_b;
+    task.length = length;
+    task.size = length;
+    JOIN(stub, histogram_parallel)(&task, intensities, n_threads);
+}
+
+static inline void
+JOIN(stub, delay_histograms_parallel)(shared_ring_buffer* buf,
+                                      const slice* data,
+                                      const u64 start,
+                                      const u64 stop,
+                                      const u64 correlation_window,
+                                      const u64 resolution,
+                                      const u64 n_channels,
+                                      const u8* channels,
+                                      const u64 length,
+                                      u64* intensities,
+                                      const u64 n_threads) {
+    JOIN(stub, histogram_task) task = { 0 };
+    task.buf = buf;
+    task.data = data;
+    task.start = start;
+    task.stop = stop;
+    task.kind = HISTOGRAM_DELAY_MATRIX;
+    task.halo = correlation_window;
+    task.correlation_window = correlation_window;
+    task.resolution = resolution;
+    task.n_channels = n_channels;
+    task.channels = channels;
+    task.length = length;
+    task.size = length * (n_channels * (n_channels - 1) / 2);
+    JOIN(stub, histogram_parallel)(&task, intensities, n_threads);
+}
+
+typedef struct JOIN(stub, traces_task) JOIN(stub, traces_task);
+struct JOIN(stub, traces_task) {
+    shared_ring_buffer* buf;
+    const slice* data;
+    u64 start;
+    u64 stop;
+    u64 n_chunks;
+    u64 origin;
+    u64 bin_width;
+    u64 n_channels;
+    const u8* channels;
+    u64 length;
+    u64* intensities;
+    u64* counted; /**< records counted per chunk */
+};
+
+static inline void
+JOIN(stub, traces_chunk)(void* context, u64 k) {
+    JOIN(stub, traces_task)* task = (JOIN(stub, traces_task)*)context;
+    u64 bin_start, bin_stop;
+    tb_chunk_bounds(0, task->length, task->n_chunks, k, &bin_start, &bin_stop);
+    if (bin_stop <= bin_start) {
+        return;
+    }
+
+    // chunks own whole bins and so whole spans of time, they write to
+    // disjoint parts of the traces
+    u64 length = bin_stop - bin_start;
+    u64 origin = task->origin + bin_start * task->bin_width;
+    u64 chunk_start = JOIN(stub, position_at_time)(
+      task->buf, task->data, origin, task->stop);
+    chunk_start = chunk_start > task->start ? chunk_start : task->start;
+
+    u64* traces = (u64*)calloc(task->n_channels * length, sizeof(u64));
+    task->counted[k] = JOIN(stub, channel_traces)(task->buf,
+                                                  task->data,
+                                                  chunk_start,
+                                                  task->stop,
+                                                  origin,
+                                                  task->bin_width,
+                                                  task->n_channels,
+                                                  task->channels,
+                                                  length,
+                                                  traces);
+    for (u64 c = 0; c < task->n_channels; c++) {
+        memcpy(task->intensities + c * task->length + bin_start,
+               traces + c * length,
+               length * sizeof(u64));
+    }
+    free(traces);
+}
+
+///
+/// @brief channel_traces on n_threads, each thread taking a span of bins
+///
+static inline u64
+JOIN(stub, channel_traces_parallel)(shared_ring_buffer* buf,
+                                    const slice* data,
+                                    const u64 start,
+                                    const u64 stop,
+                                    const u64 origin,
+                                    const u64 bin_width,
+                                    const u64 n_channels,
+                                    const u8* channels,
+                                    const u64 length,
+                                    u64* intensities,
+                                    const u64 n_threads) {
+    u64 n_chunks = tb_chunk_count(n_threads, length);
+    if (n_chunks == 1) {
+        return JOIN(stub, channel_traces)(buf,
+                                          data,
+                                          start,
+                                          stop,
+                                          origin,
+                                          bin_width,
+                                          n_channels,
+                                          channels,
+                                          length,
+                                          intensities);
+    }
+
+    JOIN(stub, traces_task) task = { buf,       data,       start,
+                                     stop,      n_chunks,   origin,
+                                     bin_width, n_channels, channels,
+                                     length,    intensities };
+    task.counted = (u64*)calloc(n_chunks, sizeof(u64));
+    tb_parallel_for(n_chunks, n_threads, JOIN(stub, traces_chunk), &task);
+
+    u64 counted = 0;
+    for (u64 k = 0; k < n_chunks; k++) {
+        counted += task.counted[k];
+    }
+    free(task.counted);
+    return counted;
+}
+
+///
+/// @brief coincidences of the window engine starting in [start, count_stop),
+/// reading on to stop for the records that complete them
+///
+/// first holds the first position of each pattern channel as in
+/// coincidence_window.
+///
+static inline u64
+JOIN(stub, window_count_range)(shared_ring_buffer* const buf,
+                               const slice* data,
+                               const u64 n_channels,
+                               const u8* position_of,
+                               const u64* delay_bins,
+                               const u64 diameter_bins,
+                               const u64* first,
+                               const u64 start,
+                               const u64 count_stop,
+                               const u64 stop) {
+    if (stop <= start) {
+        return 0;
+    }
+
+    u64 capacity = srb_get_capacity(buf);
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+    u64 pattern_mask = (n_channels == 64) ? UINT64_MAX
+                                          : (((u64)1 << n_channels) - 1);
+
+    u64 next_time[64] = { 0 };
+    u64 seen = 0;
+    u64 total = 0;
+    u64 index = (stop - 1) % capacity;
+    for (u64 position = stop; position-- > start;) {
+        u64 i = position_of[channelAt(data, index)];
+        if ((i < n_channels) && (position >= first[i])) {
+            u64 arrival =
+              arrivalTimeAt(data, conversion_factor, index) + delay_bins[i];
+
+            u64 mask = (u64)1 << i;
+            for (u64 j = 0; j < n_channels; j++) {
+                mask |= (u64)((next_time[j] - arrival) < diameter_bins) << j;
+            }
+            mask &= seen | ((u64)1 << i);
+            total += (u64)((mask == pattern_mask) && (position < count_stop));
+
+            next_time[i] = arrival;
+            seen |= (u64)1 << i;
+        }
+        index = (index == 0) ? capacity - 1 : index - 1;
+    }
+    return total;
+}
+
+typedef struct JOIN(stub, window_task) JOIN(stub, window_task);
+struct JOIN(stub, window_task) {
+    shared_ring_buffer* buf;
+    const slice* data;
+    u64 start;
+    u64 stop;
+    u64 n_chunks;
+    u64 n_channels;
+    u8 position_of[256];
+    u64* delay_bins;
+    u64 diameter_bins;
+    u64 horizon;
+    u64* first;
+    u64* totals; /**< coincidences per chunk */
+};
+
+static inline void
+JOIN(stub, window_chunk)(void* context, u64 k) {
+    JOIN(stub, window_task)* task = (JOIN(stub, window_task)*)context;
+    u64 chunk_start, chunk_stop;
+    tb_chunk_bounds(
+      task->start, task->stop, task->n_chunks, k, &chunk_start, &chunk_stop);
+    if (chunk_stop <= chunk_start) {
+        return;
+    }
+
+    // every record that can complete a coincidence starting in the chunk
+    u64 halo_stop = task->stop;
+    if (chunk_stop < task->stop) {
+        u64 last = arrivalTimeAt(task->data,
+                                 srb_get_conversion_factor(task->buf),
+                                 (chunk_stop - 1) % srb_get_capacity(task->buf));
+        halo_stop = JOIN(stub, position_at_time)(
+          task->buf, task->data, last + task->horizon + 1, task->stop);
+        halo_stop = halo_stop > chunk_stop ? halo_stop : chunk_stop;
+    }
+
+    task->totals[k] = JOIN(stub, window_count_range)(task->buf,
+                                                     task->data,
+                                                     task->n_channels,
+                                                     task->position_of,
+                                                     task->delay_bins,
+                                                     task->diameter_bins,
+                                                     task->first,
+                                                     chunk_start,
+                                                     chunk_stop,
+                                                     halo_stop);
+}
+
+///
+/// @brief coincidence_window counting over read_time on n_threads
+///
+static inline u64
+JOIN(stub, coincidence_window_parallel)(shared_ring_buffer* const buf,
+                                        const slice* data,
+                                        const u64 n_channels,
+                                        u8* channels,
+                                        const f64* delays,
+                                        const f64 radius,
+                                        const f64 read_time,
+                                        const u64 n_threads) {
+    u64 count = srb_get_count(buf);
+    if ((count == 0) || (n_channels == 0) || (n_channels > 64)) {
+        return 0;
+    }
+
+    JOIN(stub, window_task) task = { 0 };
+    task.buf = buf;
+    task.data = data;
+    task.n_channels = n_channels;
+    task.diameter_bins =
+      2 * binsFromTime(srb_get_resolution(buf), radius);
+    task.delay_bins = (u64*)malloc(sizeof(u64) * n_channels);
+    task.first = (u64*)malloc(sizeof(u64) * n_channels);
+    binsFromTimeDelays(buf, n_channels, delays, task.delay_bins);
+    task.start = JOIN(stub, window_first)(
+      buf, data, n_channels, task.delay_bins, read_time, task.first);
+    task.stop = count;
+
+    u64 delay_max = 0;
+    memset(task.position_of, (int)n_channels, sizeof(task.position_of));
+    for (u64 i = 0; i < n_channels; i++) {
+        task.position_of[channels[i]] = (u8)i;
+        delay_max =
+          task.delay_bins[i] > delay_max ? task.delay_bins[i] : delay_max;
+    }
+    task.horizon = task.diameter_bins + delay_max;
+
+    task.n_chunks = tb_chunk_count(n_threads, task.stop - task.start);
+    task.totals = (u64*)calloc(task.n_chunks, sizeof(u64));
+    tb_parallel_for(task.n_chunks, n_threads, JOIN(stub, window_chunk), &task);
+
+    u64 total = 0;
+    for (u64 k = 0; k < task.n_chunks; k++) {
+        total += task.totals[k];
+    }
+    free(task.totals);
+    free(task.delay_bins);
+    free(task.first);
+    return total;
+}
+
+histogram2D_coords JOIN(stub,
+                        joint_histogram_position)(const slice* data,
+                                                  const u8 ch_idx_idler,
+                                                  const u8 ch_idx_signal,
+                                                  const u8 ch_idx_clock,
+                                                  const timestamp* timetags);
+
+#define jointHistogramPosition(s, i_i, i_s, i_c, ts)                           \
+    JOIN(stub, joint_histogram_position)(s, i_i, i_s, i_c, ts)
+
+///
+/// @brief joint delay histogram of the coincidences whose oldest record
+/// arrives in [from_bins, until_bins]
+///
+/// The pattern iterator starts at from_bins and stops once its oldest record
+/// arrives after until_bins, it holds the same records when it reaches a
+/// coincidence as an iterator started at the beginning of read_time. A
+/// channel without records there has no coincidences.
+///
+static inline u64
+JOIN(stub, joint_histogram_range)(shared_ring_buffer* const buf,
+                                  const slice* data,
+                                  const u64 n_channels,
+                                  const u8* channels,
+                                  const f64* delays,
+                                  const f64 read_time,
+                                  const u8 idx_signal,
+                                  const u8 idx_idler,
+                                  const u8 idx_clock,
+                                  const u64 diameter_bins,
+                                  const u64 bin_width,
+                                  const u64 stop,
+                                  const u64 from_bins,
+                                  const u64 until_bins,
+                                  u64* intensities,
+                                  sparse_histogram* sparse) {
+
+    pattern_iterator pattern = patternIteratorInitRange(
+      buf, data, n_channels, channels, delays, read_time, stop, from_bins);
+    for (usize i = 0; i < n_channels; i++) {
+        if (pattern.iters[i].count == 0) {
+            patternIteratorDeinit(&pattern);
+            return 0;
+        }
+    }
 
     u64 conversion_factor = srb_get_conversion_factor(buf);
     u64* current_times = (u64*)malloc(n_channels * sizeof(u64));
@@ -753,11 +2502,10 @@ JOIN(stub, joint_delay_histogram)(shared_ring_buffer* const buf,
     for (usize i = 0; i < n_channels; i++) {
         current_times[i] =
           arrivalTimeAt(data, conversion_factor, pattern.index[i]);
+        current_timetags[i] = timestampAt(data, pattern.index[i]);
     }
 
-    f64 res = srb_get_resolution(buf);
-    u64 radius_bins = binsFromTime(res, radius); // TODO: should this be doubled
-    u64 diameter_bins = radius_bins + radius_bins;
+    u64 n_bins = diameter_bins / bin_width;
 
     bool in_range = true;
     u64 check = 0;
@@ -767,6 +2515,9 @@ JOIN(stub, joint_delay_histogram)(shared_ring_buffer* const buf,
     while (in_range == true) {
 
         pattern.oldest = argMin(buf, pattern.limit, current_times, n_channels);
+        if (current_times[pattern.oldest] > until_bins) {
+            break;
+        }
 
         check = inCoincidence(n_channels,
                               current_times,
@@ -780,23 +2531,24 @@ JOIN(stub, joint_delay_histogram)(shared_ring_buffer* const buf,
               data, idx_signal, idx_idler, idx_clock, current_timetags);
             // TODO: can we centre the spectra here? Have a central bin and then
             // calculate the offset from that?
-            if ((point.x < diameter_bins) & (point.y < diameter_bins)) {
+            point.x /= bin_width;
+            point.y /= bin_width;
+            if ((point.x < n_bins) & (point.y < n_bins)) {
                 // histogram_2d[point.y][point.x] += 1;
                 // signal -> rows -> x
                 // idler -> columns -> y
-                offset = (point.x * diameter_bins) + (point.y);
-                // printf("POINT:->{%lu,\t%lu} -> %lu | Limit:%lu\n",
-                // point.x, point.y, offset, diameter_bins * diameter_bins);
-                intensities[offset] += 1;
+                offset = (point.x * n_bins) + (point.y);
+                if (sparse != NULL) {
+                    sparse_histogram_add(sparse, offset);
+                } else {
+                    intensities[offset] += 1;
+                }
             }
         }
 
         count += check;
 
-        in_range = nextForChannel(data,
-                                  &pattern.iters[pattern.oldest],
-                                  channels[pattern.oldest],
-                                  &pattern.index[pattern.oldest]);
+        in_range = patternNext(buf, data, &pattern, pattern.oldest);
 
         current_timetags[pattern.oldest] =
           timestampAt(data, pattern.index[pattern.oldest]);
@@ -812,6 +2564,199 @@ JOIN(stub, joint_delay_histogram)(shared_ring_buffer* const buf,
     return count;
 }
 
+typedef struct JOIN(stub, joint_task) JOIN(stub, joint_task);
+struct JOIN(stub, joint_task) {
+    shared_ring_buffer* buf;
+    const slice* data;
+    u64 n_channels;
+    const u8* channels;
+    const f64* delays;
+    f64 read_time;
+    u8 idx_signal;
+    u8 idx_idler;
+    u8 idx_clock;
+    u64 diameter_bins;
+    u64 bin_width;
+    u64 start;
+    u64 stop;
+    u64 n_chunks;
+    u64* counts;               /**< coincidences per chunk */
+    sparse_histogram* sparses; /**< histogram per chunk */
+};
+
+static inline void
+JOIN(stub, joint_chunk)(void* context, u64 k) {
+    JOIN(stub, joint_task)* task = (JOIN(stub, joint_task)*)context;
+    u64 chunk_start, chunk_stop;
+    tb_chunk_bounds(
+      task->start, task->stop, task->n_chunks, k, &chunk_start, &chunk_stop);
+    if (chunk_stop <= chunk_start) {
+        return;
+    }
+
+    // chunks own the coincidences whose oldest record arrives after the last
+    // record of the chunk before and no later than their own last record, so
+    // records sharing an arrival time across a boundary are counted once
+    u64 conversion_factor = srb_get_conversion_factor(task->buf);
+    u64 capacity = srb_get_capacity(task->buf);
+    u64 from_bins = 0;
+    if (chunk_start > task->start) {
+        u64 before = (chunk_start - 1) % capacity;
+        from_bins = arrivalTimeAt(task->data, conversion_factor, before) + 1;
+    }
+    u64 until_bins = UINT64_MAX;
+    if (chunk_stop < task->stop) {
+        u64 last = (chunk_stop - 1) % capacity;
+        until_bins = arrivalTimeAt(task->data, conversion_factor, last);
+    }
+
+    task->counts[k] = JOIN(stub, joint_histogram_range)(
+      task->buf,
+      task->data,
+      task->n_channels,
+      task->channels,
+      task->delays,
+      task->read_time,
+      task->idx_signal,
+      task->idx_idler,
+      task->idx_clock,
+      task->diameter_bins,
+      task->bin_width,
+      task->stop,
+      from_bins,
+      until_bins,
+      NULL,
+      &task->sparses[k]);
+}
+
+///
+/// @brief histogram the delays of signal and idler in coincidence
+///
+/// Delays are binned bin_width at a time into (diameter / bin_width) bins
+/// along each axis, delays in the remainder of the diameter are dropped. The
+/// bin of signal delay x and idler delay y is x * n_bins + y. Counts go to
+/// sparse if it is not NULL, otherwise to intensities holding n_bins^2 bins.
+///
+/// With more than one thread the records are split into chunks, each
+/// histogrammed into its own sparse histogram, which are added together once
+/// every chunk is done, see joint_histogram_range. Sparse histograms keep the
+/// memory of a chunk to the bins it counts into, even for dense results.
+///
+static inline u64
+JOIN(stub, joint_delay_histogram)(shared_ring_buffer* const buf,
+                                  const slice* data,
+                                  const u8 clock,
+                                  const u8 signal,
+                                  const u8 idler,
+                                  const u64 n_channels,
+                                  const u8* channels,
+                                  const f64* delays,
+                                  const f64 radius,
+                                  const f64 read_time,
+                                  const u64 bin_width,
+                                  u64* intensities,
+                                  sparse_histogram* sparse,
+                                  const u64 n_threads) {
+
+    bool has_signal = false;
+    bool has_idler = false;
+
+    u8 idx_signal = 0;
+    u8 idx_idler = 0;
+    u8 idx_clock = 0;
+
+    for (u64 i = 0; i < n_channels; i++) {
+        if (channels[i] == signal) {
+            has_signal = true;
+            idx_signal = i;
+        }
+        if (channels[i] == idler) {
+            has_idler = true;
+            idx_idler = i;
+        }
+        if (channels[i] == clock) {
+            idx_clock = i;
+        }
+    }
+
+    if (!(has_signal == true && has_idler == true)) {
+        return 0;
+    }
+
+    //     if (idx_signal == idx_idler) {
+    //         return 0;
+    //     }
+
+    u64 stop = srb_get_count(buf);
+    if (stop == 0) {
+        return 0;
+    }
+
+    f64 res = srb_get_resolution(buf);
+    u64 radius_bins = binsFromTime(res, radius); // TODO: should this be doubled
+    u64 diameter_bins = radius_bins + radius_bins;
+
+    JOIN(stub, joint_task) task = { 0 };
+    task.buf = buf;
+    task.data = data;
+    task.n_channels = n_channels;
+    task.channels = channels;
+    task.delays = delays;
+    task.read_time = read_time;
+    task.idx_signal = idx_signal;
+    task.idx_idler = idx_idler;
+    task.idx_clock = idx_clock;
+    task.diameter_bins = diameter_bins;
+    task.bin_width = bin_width;
+    task.start = patternFirstIndex(buf, data, n_channels, delays, read_time);
+    task.stop = stop;
+
+    task.n_chunks = tb_chunk_count(
+      n_threads, task.stop > task.start ? task.stop - task.start : 0);
+    if (task.n_chunks <= 1) {
+        return JOIN(stub, joint_histogram_range)(buf,
+                                                 data,
+                                                 n_channels,
+                                                 channels,
+                                                 delays,
+                                                 read_time,
+                                                 idx_signal,
+                                                 idx_idler,
+                                                 idx_clock,
+                                                 diameter_bins,
+                                                 bin_width,
+                                                 stop,
+                                                 0,
+                                                 UINT64_MAX,
+                                                 intensities,
+                                                 sparse);
+    }
+
+    task.counts = (u64*)calloc(task.n_chunks, sizeof(u64));
+    task.sparses =
+      (sparse_histogram*)malloc(task.n_chunks * sizeof(sparse_histogram));
+    for (u64 k = 0; k < task.n_chunks; k++) {
+        sparse_histogram_init(&task.sparses[k], 0);
+    }
+
+    tb_parallel_for(task.n_chunks, n_threads, JOIN(stub, joint_chunk), &task);
+
+    u64 count = 0;
+    for (u64 k = 0; k < task.n_chunks; k++) {
+        count += task.counts[k];
+        if (sparse != NULL) {
+            sparse_histogram_merge(sparse, &task.sparses[k]);
+        } else {
+            sparse_histogram_add_to(&task.sparses[k], intensities);
+        }
+        sparse_histogram_deinit(&task.sparses[k]);
+    }
+
+    free(task.counts);
+    free(task.sparses);
+    return count;
+}
+
 static inline void
 JOIN(stub, second_order_coherence)(shared_ring_buffer* const buf,
                                    const slice* data,
@@ -988,10 +2933,7 @@ JOIN(stub, second_order_coherence_delays)(shared_ring_buffer* const buf,
             }
         }
 
-        in_range = nextForChannel(data,
-                                  &pattern.iters[pattern.oldest],
-                                  channels[pattern.oldest],
-                                  &pattern.index[pattern.oldest]);
+        in_range = patternNext(buf, data, &pattern, pattern.oldest);
 
         current_times[pattern.oldest] =
           arrivalTimeAt(
@@ -1004,6 +2946,168 @@ JOIN(stub, second_order_coherence_delays)(shared_ring_buffer* const buf,
     ringbuffer_u64_deinit(buffers[1]);
 }
 
+///
+/// @brief merge records from several buffers into buf in arrival time order
+///
+/// Each source is merged from positions[k] up to stops[k], positions is
+/// updated to the first record of each source that was not merged. Only
+/// records that arrived at or before the watermark are merged, the watermark
+/// is the most recent arrival time of the slowest active source, as every
+/// source is sorted no record that arrives later can be older than the
+/// watermark. Sources whose most recent record is more than latency_bins
+/// behind the most recent record of any source are not waited for. Records
+/// they provide later that are older than the last merged record are dropped
+/// and counted in late, as are records whose offset channel is not a channel
+/// of buf.
+///
+/// A source that has not provided any records yet holds back the merge until
+/// the most recent record of the other sources is more than latency_bins past
+/// the arrival time at which the source was first found empty, kept in
+/// waiting_since (MERGE_NOT_WAITING until then).
+///
+/// @param[in] buf buffer to merge into
+/// @param[in] data base pointers of buf
+/// @param[in] n_sources number of source buffers
+/// @param[in] sources source buffers, must use the same conversion factor
+/// @param[in] sources_data base pointers of each source
+/// @param[in/out] positions next record to merge from each source
+/// @param[in] stops record to stop merging at for each source
+/// @param[in/out] waiting_since arrival time each empty source was first
+///                waited for from
+/// @param[in] channel_offsets added to the channel of each source's records
+/// @param[in] latency_bins maximum time to wait for a slow source
+/// @param[in] max_n maximum number of records to merge
+/// @param[in/out] late incremented for every record dropped
+/// @return number of records merged
+///
+static inline u64
+JOIN(stub, merge)(shared_ring_buffer* buf,
+                  slice* data,
+                  const u64 n_sources,
+                  shared_ring_buffer** sources,
+                  const slice* sources_data,
+                  u64* positions,
+                  const u64* stops,
+                  u64* waiting_since,
+                  const u8* channel_offsets,
+                  const u64 latency_bins,
+                  u64 max_n,
+                  u64* late) {
+
+    u64 conversion_factor = srb_get_conversion_factor(buf);
+    u64 capacity = srb_get_capacity(buf);
+    u64 channel_count = srb_get_channel_count(buf);
+
+    u64 newest = 0;
+    for (u64 k = 0; k < n_sources; k++) {
+        if (stops[k] == 0) {
+            continue;
+        }
+        u64 last = arrivalTimeAt(&sources_data[k],
+                                 conversion_factor,
+                                 absIdx(sources[k], stops[k] - 1));
+        newest = last > newest ? last : newest;
+    }
+
+    u64 watermark = newest;
+    for (u64 k = 0; k < n_sources; k++) {
+        if (stops[k] == 0) {
+            continue;
+        }
+        u64 last = arrivalTimeAt(&sources_data[k],
+                                 conversion_factor,
+                                 absIdx(sources[k], stops[k] - 1));
+        if ((last + latency_bins >= newest) && (last < watermark)) {
+            watermark = last;
+        }
+    }
+
+    bool have_newest = false;
+    for (u64 k = 0; k < n_sources; k++) {
+        have_newest = have_newest || (stops[k] > 0);
+    }
+    if (false == have_newest) {
+        return 0;
+    }
+
+    for (u64 k = 0; k < n_sources; k++) {
+        if (stops[k] > 0) {
+            continue;
+        }
+        if (waiting_since[k] == MERGE_NOT_WAITING) {
+            waiting_since[k] = newest;
+        }
+        if (waiting_since[k] + latency_bins >= newest) {
+            // any record the source provides could still be the oldest
+            return 0;
+        }
+    }
+
+    if (max_n > capacity) {
+        max_n = capacity;
+    }
+
+    u64 count = srb_write_begin(buf, max_n);
+    bool have_last = count > 0;
+    u64 last_merged = 0;
+    if (have_last) {
+        last_merged =
+          arrivalTimeAt(data, conversion_factor, absIdx(buf, count - 1));
+    }
+
+    u64 written = 0;
+    while (written < max_n) {
+        i64 best = -1;
+        u64 best_time = 0;
+
+        for (u64 k = 0; k < n_sources; k++) {
+            u64 time = 0;
+            while (positions[k] < stops[k]) {
+                time = arrivalTimeAt(&sources_data[k],
+                                     conversion_factor,
+                                     absIdx(sources[k], positions[k]));
+                if ((false == have_last) || (time >= last_merged)) {
+                    break;
+                }
+                positions[k] += 1;
+                *late += 1;
+            }
+
+            if ((positions[k] >= stops[k]) || (time > watermark)) {
+                continue;
+            }
+
+            if ((best < 0) || (time < best_time)) {
+                best = (i64)k;
+                best_time = time;
+            }
+        }
+
+        if (best < 0) {
+            break;
+        }
+
+        u64 index = absIdx(sources[best], positions[best]);
+        u64 channel =
+          channelAt(&sources_data[best], index) + channel_offsets[best];
+        positions[best] += 1;
+        if (channel >= channel_count) {
+            *late += 1;
+            continue;
+        }
+
+        u64 out = (count + written) % capacity;
+        recordSet(data, out, channel, timestampAt(&sources_data[best], index));
+        written += 1;
+        last_merged = best_time;
+        have_last = true;
+    }
+
+    indexRecords(buf, data, count, count + written);
+    srb_write_end(buf, count + written);
+    return written;
+}
+
 #undef stub
 #undef slice
 #undef field_ptrs
@@ -1027,6 +3131,7 @@ JOIN(stub, second_order_coherence_delays)(shared_ring_buffer* const buf,
 #undef recordAt
 #undef timestampAt
 #undef channelAt
+#undef recordSet
 #undef arrivalTimeAt
 
 #undef binsFromTime
@@ -1039,7 +3144,11 @@ JOIN(stub, second_order_coherence_delays)(shared_ring_buffer* const buf,
 #undef binsFromTimeDelays
 #undef argMin
 #undef patternIteratorInit
+#undef patternIteratorInitRange
+#undef patternFirstIndex
 #undef patternIteratorDeinit
 #undef nextForChannel
+#undef patternNext
+#undef indexRecords
 #undef inCoincidence
 #undef jointHistogramPosition
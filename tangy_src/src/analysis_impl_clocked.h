@@ -2,6 +2,11 @@
 #define __IMPL_CLK__
 
 #include "base.h"
+#include "block_summary.h"
+#include "channel_index.h"
+#include "coincidence_stream.h"
+#include "sparse_histogram.h"
+#include "thread_pool.h"
 #include "vector_impls.h"
 
 typedef struct clk_timetag {
@@ -19,10 +24,32 @@ typedef struct clk_res {
     f64 fine;
 } clk_res;
 
+///
+/// @brief columns of a clocked buffer
+///
+/// Records are stored as a struct of arrays so that kernels touching only one
+/// field stream through a single contiguous array. The arrival time column is
+/// optional (SRB_LAYOUT_ARRIVAL), when present it holds
+/// clock * conversion_factor + delta for every record and arrival is not NULL.
+/// The conversion factor of arrival and packed buffers is therefore fixed once
+/// the buffer is created.
+///
+/// Packed buffers (SRB_LAYOUT_PACKED) replace the clock and delta columns by a
+/// single word per record holding clock << delta_bits | delta, clock and delta
+/// are then NULL and packed is not NULL.
+///
 typedef struct clk_slice {
     usize length;
+    u64 conversion_factor;
     u8* channel;
-    clk_timetag* timestamp;
+    u64* clock;
+    u64* delta;
+    u64* arrival;
+    u64* packed;
+    u64 delta_bits;
+    u64 delta_mask;
+    channel_index by_channel;
+    block_summary blocks;
 } clk_slice;
 
 typedef struct clk_field_ptrs clk_field_ptrs;
@@ -147,15 +174,61 @@ clk_size_of() {
     return elem_size;
 }
 
+///
+/// @brief number of low bits of a packed word holding the delta
+///
+/// Enough bits for any delta up to the conversion factor (one clock period),
+/// the remaining high bits hold the clock. Worked out once when the buffer is
+/// created and kept in the header, as the conversion factor of a buffer may
+/// change afterwards.
+///
+static inline u64
+clk_packed_delta_bits(u64 conversion_factor) {
+    u64 bits = 1;
+    while ((bits < 63) && ((conversion_factor >> bits) != 0)) {
+        bits += 1;
+    }
+    return bits;
+}
+
+///
+/// @brief bytes of shared memory needed for a clocked buffer
+///
+/// @param[in] capacity number of records
+/// @param[in] layout srb_layout_flags selecting the columns
+///
+static inline u64
+clk_layout_map_size(u64 capacity, u64 layout) {
+    u64 columns = 2;
+    if (layout & SRB_LAYOUT_PACKED) {
+        columns = 1;
+    }
+    if (layout & SRB_LAYOUT_ARRIVAL) {
+        columns += 1;
+    }
+    // padding to align the u64 columns following the channels
+    return srb_context_size() + (capacity * sizeof(u8)) + sizeof(u64) +
+           (columns * capacity * sizeof(u64));
+}
+
 inline void
 clk_clear_buffer(shared_ring_buffer* buf, clk_slice* data) {
     u64 capacity = srb_get_capacity(buf);
-    for (u64 i = 0; i < capacity; i++) {
-        data->channel[i] = 0;
-        data->timestamp[i].clock = 0;
-        data->timestamp[i].delta = 0;
+    memset(data->channel, 0, capacity * sizeof(u8));
+    if (data->packed != NULL) {
+        memset(data->packed, 0, capacity * sizeof(u64));
+    } else {
+        memset(data->clock, 0, capacity * sizeof(u64));
+        memset(data->delta, 0, capacity * sizeof(u64));
     }
+    if (data->arrival != NULL) {
+        memset(data->arrival, 0, capacity * sizeof(u64));
+    }
+    channel_index_clear(&data->by_channel);
+    block_summary_clear(&data->blocks);
     srb_set_count(buf, 0);
+    srb_set_sequence(buf, 0);
+    srb_set_origin(buf, 0);
 }
 
 inline clk_slice
@@ -163,25 +236,100 @@ clk_init_base_ptrs(shared_ring_buffer* buf) {
     clk_slice slice = { 0 };
     u64 capacity = srb_get_capacity(buf);
 
-    u64 channel_offset = 9 * sizeof(u64); // astd_size_of();
-    slice.length = srb_get_capacity(buf);
+    u64 channel_offset = srb_context_size();
+    slice.length = capacity;
+    slice.conversion_factor = srb_get_conversion_factor(buf);
+
+    // u64 columns start on the first 8 byte boundary after the channels
+    u64 clock_offset = channel_offset + capacity;
+    clock_offset += (sizeof(u64) - (clock_offset % sizeof(u64))) % sizeof(u64);
+
+    u64 layout = srb_get_layout(buf);
+    u64* columns = (u64*)(&(buf->map_ptr[clock_offset]));
 
     slice.channel = (u8*)buf->map_ptr + channel_offset;
-    slice.timestamp =
-      (clk_timetag*)(&(buf->map_ptr[channel_offset + capacity + 1]));
+    slice.clock = NULL;
+    slice.delta = NULL;
+    slice.packed = NULL;
+    slice.arrival = NULL;
+    if (layout & SRB_LAYOUT_PACKED) {
+        slice.delta_bits = srb_get_delta_bits(buf);
+        slice.delta_mask = (1ULL << slice.delta_bits) - 1;
+        slice.packed = columns;
+        columns += capacity;
+    } else {
+        slice.clock = columns;
+        slice.delta = columns + capacity;
+        columns += 2 * capacity;
+    }
+    if (layout & SRB_LAYOUT_ARRIVAL) {
+        slice.arrival = columns;
+        columns += capacity;
+    }
+    clk_init_indexes(buf, &slice, (char*)columns);
     return slice;
 }
 
+inline clk_timetag
+clk_timestamp_at(const clk_slice* data, u64 absolute_index) {
+    clk_timetag timestamp = { 0 };
+    if (data->packed != NULL) {
+        u64 word = data->packed[absolute_index];
+        timestamp.clock = word >> data->delta_bits;
+        timestamp.delta = word & data->delta_mask;
+    } else {
+        timestamp.clock = data->clock[absolute_index];
+        timestamp.delta = data->delta[absolute_index];
+    }
+    return timestamp;
+}
+
 inline aclocked
 clk_record_at(const clk_slice* data, u64 absolute_index) {
     aclocked record = { .channel = data->channel[absolute_index],
-                        .timestamp = data->timestamp[absolute_index] };
+                        .timestamp = clk_timestamp_at(data, absolute_index) };
     return record;
 }
 
-inline clk_timetag
-clk_timestamp_at(const clk_slice* data, u64 absolute_index) {
-    return data->timestamp[absolute_index];
+///
+/// @brief pack a timestamp into a single word of a packed buffer
+///
+/// Deltas too wide for their bits are carried into the clock, clocks too wide
+/// for the remaining bits saturate to the latest timestamp a word can hold.
+///
+static inline u64
+clk_pack(const clk_slice* data, u64 clock, u64 delta) {
+    if (delta > data->delta_mask) {
+        if (data->conversion_factor > 0) {
+            clock += delta / data->conversion_factor;
+            delta %= data->conversion_factor;
+        } else {
+            delta = data->delta_mask;
+        }
+    }
+    u64 clock_max = UINT64_MAX >> data->delta_bits;
+    if (clock > clock_max) {
+        clock = clock_max;
+        delta = data->delta_mask;
+    }
+    return (clock << data->delta_bits) | delta;
+}
+
+///
+/// @brief write a timestamp to all columns of a record
+///
+static inline void
+clk_timestamp_set(clk_slice* data, u64 absolute_index, u64 clock, u64 delta) {
+    if (data->packed != NULL) {
+        data->packed[absolute_index] = clk_pack(data, clock, delta);
+    } else {
+        data->clock[absolute_index] = clock;
+        data->delta[absolute_index] = delta;
+    }
+    if (data->arrival != NULL) {
+        data->arrival[absolute_index] =
+          (clock * data->conversion_factor) + delta;
+    }
 }
 
 inline u8
@@ -189,12 +337,29 @@ clk_channel_at(const clk_slice* data, u64 absolute_index) {
     return data->channel[absolute_index];
 }
 
+inline void
+clk_record_set(clk_slice* data,
+               u64 absolute_index,
+               u8 channel,
+               clk_timetag value) {
+    data->channel[absolute_index] = channel;
+    clk_timestamp_set(data, absolute_index, value.clock, value.delta);
+}
+
 inline u64
 clk_arrival_time_at(const clk_slice* data,
                     u64 conversion_factor,
                     u64 absolute_index) {
-    clk_timetag timestamp = data->timestamp[absolute_index];
-    return (conversion_factor * timestamp.clock) + timestamp.delta;
+    if (data->arrival != NULL) {
+        return data->arrival[absolute_index];
+    }
+    if (data->packed != NULL) {
+        u64 word = data->packed[absolute_index];
+        return (conversion_factor * (word >> data->delta_bits)) +
+               (word & data->delta_mask);
+    }
+    return (conversion_factor * data->clock[absolute_index]) +
+           data->delta[absolute_index];
 }
 
 inline f64
@@ -207,6 +372,30 @@ clk_as_bins(clk_timetag record, u64 conversion_factor) {
     return (record.clock * conversion_factor) + record.delta;
 }
 
+///
+/// @brief copy n records at index from the columns into ptrs[offset..]
+///
+static inline void
+clk_copy_out(const clk_slice* const data,
+             clk_field_ptrs* ptrs,
+             u64 index,
+             u64 offset,
+             u64 n) {
+    memcpy(ptrs->channels + offset, data->channel + index, n * sizeof(u8));
+    if (data->packed != NULL) {
+        u64 bits = data->delta_bits;
+        u64 mask = data->delta_mask;
+        for (u64 i = 0; i < n; i++) {
+            u64 word = data->packed[index + i];
+            ptrs->clocks[offset + i] = word >> bits;
+            ptrs->deltas[offset + i] = word & mask;
+        }
+        return;
+    }
+    memcpy(ptrs->clocks + offset, data->clock + index, n * sizeof(u64));
+    memcpy(ptrs->deltas + offset, data->delta + index, n * sizeof(u64));
+}
+
 inline u64
 clk_buffer_slice(shared_ring_buffer* const buf,
                  const clk_slice* const data,
@@ -223,23 +412,74 @@ clk_buffer_slice(shared_ring_buffer* const buf,
     }
 
     usize capacity = srb_get_capacity(buf);
-    circular_iterator iter = { 0 };
-    if (iterator_init(&iter, capacity, start, stop) == -1) {
+    if (ptrs->length > capacity) {
         return 0;
     }
 
-    u64 count = 0;
-    u64 i = iter.lower.index;
-    for (u64 j = 0; j < ptrs->length; j++) {
-        clk_timetag timetag = data->timestamp[i];
-        ptrs->channels[j] = data->channel[i];
-        ptrs->clocks[j] = timetag.clock;
-        ptrs->deltas[j] = timetag.delta;
-        i = next(&iter);
-        count += 1;
+    // the range covers at most two contiguous runs of each column
+    u64 start_abs = start % capacity;
+    u64 first = capacity - start_abs;
+    if (first > ptrs->length) {
+        first = ptrs->length;
     }
+    u64 second = ptrs->length - first;
 
-    return count;
+    clk_copy_out(data, ptrs, start_abs, 0, first);
+    if (second > 0) {
+        clk_copy_out(data, ptrs, 0, first, second);
+    }
+
+    return ptrs->length;
+}
+
+///
+/// @brief copy n records from ptrs[offset..] into the columns at index
+///
+static inline void
+clk_copy_in(const clk_slice* const data,
+            const clk_field_ptrs* const ptrs,
+            u64 index,
+            u64 offset,
+            u64 n) {
+    memcpy(data->channel + index, ptrs->channels + offset, n * sizeof(u8));
+    if (data->packed != NULL) {
+        for (u64 i = 0; i < n; i++) {
+            data->packed[index + i] = clk_pack(
+              data, ptrs->clocks[offset + i], ptrs->deltas[offset + i]);
+        }
+    } else {
+        memcpy(data->clock + index, ptrs->clocks + offset, n * sizeof(u64));
+        memcpy(data->delta + index, ptrs->deltas + offset, n * sizeof(u64));
+    }
+    if (data->arrival != NULL) {
+        u64 factor = data->conversion_factor;
+        for (u64 i = 0; i < n; i++) {
+            data->arrival[index + i] =
+              (ptrs->clocks[offset + i] * factor) + ptrs->deltas[offset + i];
+        }
+    }
+}
+
+///
+/// @brief copy n records between two buffers with the same layout
+///
+static inline void
+clk_copy_records(const clk_slice* const from,
+                 u64 from_index,
+                 const clk_slice* const to,
+                 u64 to_index,
+                 u64 n) {
+    memcpy(to->channel + to_index, from->channel + from_index, n * sizeof(u8));
+    if (from->packed != NULL) {
+        memcpy(to->packed + to_index, from->packed + from_index, n * sizeof(u64));
+    } else {
+        memcpy(to->clock + to_index, from->clock + from_index, n * sizeof(u64));
+        memcpy(to->delta + to_index, from->delta + from_index, n * sizeof(u64));
+    }
+    if (from->arrival != NULL) {
+        memcpy(
+          to->arrival + to_index, from->arrival + from_index, n * sizeof(u64));
+    }
 }
 
 inline u64
@@ -264,32 +504,22 @@ clk_buffer_push(shared_ring_buffer* const buf,
     u64 total = stop - start;
     u64 mid_stop = start_abs > stop_abs ? capacity : stop_abs;
 
-    if (srb_get_count(buf) == 0) {
+    u64 count_buffer = srb_write_begin(buf, total);
+
+    if (count_buffer == 0) {
         mid_stop = total > capacity ? capacity : total;
     }
 
-    u64 i = 0;
+    u64 count = mid_stop > start_abs ? mid_stop - start_abs : 0;
+    clk_copy_in(data, ptrs, start_abs, 0, count);
 
-    for (i = 0; (i + start_abs) < mid_stop; i++) {
-        data->channel[start_abs + i] = ptrs->channels[i];
-        clk_timetag timestamp = { .clock = ptrs->clocks[i],
-                                  .delta = ptrs->deltas[i] };
-        data->timestamp[start_abs + i] = timestamp;
-    }
-
-    u64 count = i;
     if (count < total) {
-        i = 0;
-        for (i = 0; i < stop_abs; i++) {
-            data->channel[i] = ptrs->channels[count];
-            clk_timetag timestamp = { .clock = ptrs->clocks[count],
-                                      .delta = ptrs->deltas[count] };
-            data->timestamp[i] = timestamp;
-            count += 1;
-        }
+        clk_copy_in(data, ptrs, 0, count, stop_abs);
+        count += stop_abs;
     }
 
-    srb_set_count(buf, srb_get_count(buf) + count);
+    clk_index_records(buf, data, count_buffer, count_buffer + count);
+    srb_write_end(buf, count_buffer + count);
     return count;
 }
 
@@ -2,6 +2,11 @@
 #define __IMPL_STD__
 
 #include "base.h"
+#include "block_summary.h"
+#include "channel_index.h"
+#include "coincidence_stream.h"
+#include "sparse_histogram.h"
+#include "thread_pool.h"
 
 typedef u64 std_timetag;
 
@@ -16,6 +21,8 @@ typedef struct std_slice {
     usize length;
     u8* channel;
     std_timetag* timestamp;
+    channel_index by_channel;
+    block_summary blocks;
 } std_slice;
 
 #define stub std
@@ -49,7 +56,11 @@ std_clear_buffer(shared_ring_buffer* buf, std_slice* data) {
         data->channel[i] = 0;
         data->timestamp[i] = 0;
     }
+    channel_index_clear(&data->by_channel);
+    block_summary_clear(&data->blocks);
     srb_set_count(buf, 0);
+    srb_set_sequence(buf, 0);
+    srb_set_origin(buf, 0);
 }
 
 inline std_slice
@@ -57,12 +68,16 @@ std_init_base_ptrs(shared_ring_buffer* buf) {
     std_slice slice = { 0 };
     u64 capacity = srb_get_capacity(buf);
 
-    u64 channel_offset = 9 * sizeof(u64); // std_size_of();
+    u64 channel_offset = srb_context_size();
     slice.length = capacity;
 
     slice.channel = (u8*)buf->map_ptr + channel_offset;
     slice.timestamp =
       (std_timetag*)(&(buf->map_ptr[channel_offset + capacity + 1]));
+
+    u64 index_offset = channel_offset + capacity + 1 + (capacity * sizeof(u64));
+    index_offset += (sizeof(u64) - (index_offset % sizeof(u64))) % sizeof(u64);
+    std_init_indexes(buf, &slice, &(buf->map_ptr[index_offset]));
     return slice;
 }
 
@@ -83,6 +98,27 @@ std_channel_at(const std_slice* data, u64 absolute_index) {
     return data->channel[absolute_index];
 }
 
+inline void
+std_record_set(std_slice* data,
+               u64 absolute_index,
+               u8 channel,
+               std_timetag value) {
+    data->channel[absolute_index] = channel;
+    data->timestamp[absolute_index] = value;
+}
+
+static inline void
+std_copy_records(const std_slice* const from,
+                 u64 from_index,
+                 const std_slice* const to,
+                 u64 to_index,
+                 u64 n) {
+    memcpy(to->channel + to_index, from->channel + from_index, n * sizeof(u8));
+    memcpy(to->timestamp + to_index,
+           from->timestamp + from_index,
+           n * sizeof(std_timetag));
+}
+
 inline u64
 std_arrival_time_at(const std_slice* data,
                     u64 conversion_factor,
@@ -155,7 +191,9 @@ std_buffer_push(shared_ring_buffer* const buf,
     u64 total = stop - start;
     u64 mid_stop = start_abs > stop_abs ? capacity : stop_abs;
 
-    if (srb_get_count(buf) == 0) {
+    u64 count_buffer = srb_write_begin(buf, total);
+
+    if (count_buffer == 0) {
         mid_stop = total > capacity ? capacity : total;
     }
 
@@ -176,7 +214,8 @@ std_buffer_push(shared_ring_buffer* const buf,
         }
     }
 
-    srb_set_count(buf, srb_get_count(buf) + count);
+    std_index_records(buf, data, count_buffer, count_buffer + count);
+    srb_write_end(buf, count_buffer + count);
     return count;
 }
 
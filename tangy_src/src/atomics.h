@@ -0,0 +1,180 @@
+#ifndef __ATOMICS__
+#define __ATOMICS__
+
+#include "base.h"
+
+/**
+ * @file atomics.h
+ * @brief Minimal set of atomic operations on words held in shared memory
+ *
+ * The buffer header is shared between processes, so every field that is
+ * written by one process and read by another (count, sequence, ...) must be
+ * accessed with the correct memory ordering. C11 <stdatomic.h> requires the
+ * variables to be declared _Atomic, which is not possible for a raw mapping
+ * and is not available on all of the compilers used to build the wheels, so
+ * the compiler builtins are wrapped here instead.
+ */
+
+#if defined(_MSC_VER) && !defined(__clang__)
+
+#include <intrin.h>
+
+static inline u64
+tb_load_acquire(u64* ptr) {
+    u64 value = *(volatile u64*)ptr;
+    _ReadWriteBarrier();
+    return value;
+}
+
+static inline u64
+tb_load_relaxed(u64* ptr) {
+    return *(volatile u64*)ptr;
+}
+
+static inline void
+tb_store_release(u64* ptr, u64 value) {
+    _ReadWriteBarrier();
+    *(volatile u64*)ptr = value;
+}
+
+static inline void
+tb_store_relaxed(u64* ptr, u64 value) {
+    *(volatile u64*)ptr = value;
+}
+
+static inline u64
+tb_fetch_add(u64* ptr, u64 value) {
+    return (u64)_InterlockedExchangeAdd64((volatile __int64*)ptr,
+                                          (__int64)value);
+}
+
+static inline u64
+tb_fetch_sub(u64* ptr, u64 value) {
+    return (u64)_InterlockedExchangeAdd64((volatile __int64*)ptr,
+                                          -(__int64)value);
+}
+
+static inline bool
+tb_compare_exchange(u64* ptr, u64* expected, u64 desired) {
+    __int64 previous = _InterlockedCompareExchange64(
+      (volatile __int64*)ptr, (__int64)desired, (__int64)*expected);
+    if ((u64)previous == *expected) {
+        return true;
+    }
+    *expected = (u64)previous;
+    return false;
+}
+
+static inline u64
+tb_fetch_or(u64* ptr, u64 value) {
+    return (u64)_InterlockedOr64((volatile __int64*)ptr, (__int64)value);
+}
+
+static inline u64
+tb_fetch_and(u64* ptr, u64 value) {
+    return (u64)_InterlockedAnd64((volatile __int64*)ptr, (__int64)value);
+}
+
+static inline u32
+tb_load_acquire_u32(u32* ptr) {
+    u32 value = *(volatile u32*)ptr;
+    _ReadWriteBarrier();
+    return value;
+}
+
+static inline u32
+tb_fetch_add_u32(u32* ptr, u32 value) {
+    return (u32)_InterlockedExchangeAdd((volatile long*)ptr, (long)value);
+}
+
+static inline void
+tb_fence_acquire() {
+    _ReadWriteBarrier();
+}
+
+static inline void
+tb_fence_release() {
+    _ReadWriteBarrier();
+}
+
+static inline void
+tb_fence_full() {
+    __faststorefence();
+}
+
+#else
+
+static inline u64
+tb_load_acquire(u64* ptr) {
+    return __atomic_load_n(ptr, __ATOMIC_ACQUIRE);
+}
+
+static inline u64
+tb_load_relaxed(u64* ptr) {
+    return __atomic_load_n(ptr, __ATOMIC_RELAXED);
+}
+
+static inline void
+tb_store_release(u64* ptr, u64 value) {
+    __atomic_store_n(ptr, value, __ATOMIC_RELEASE);
+}
+
+static inline void
+tb_store_relaxed(u64* ptr, u64 value) {
+    __atomic_store_n(ptr, value, __ATOMIC_RELAXED);
+}
+
+static inline u64
+tb_fetch_add(u64* ptr, u64 value) {
+    return __atomic_fetch_add(ptr, value, __ATOMIC_ACQ_REL);
+}
+
+static inline u64
+tb_fetch_sub(u64* ptr, u64 value) {
+    return __atomic_fetch_sub(ptr, value, __ATOMIC_ACQ_REL);
+}
+
+static inline bool
+tb_compare_exchange(u64* ptr, u64* expected, u64 desired) {
+    return __atomic_compare_exchange_n(
+      ptr, expected, desired, false, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE);
+}
+
+static inline u64
+tb_fetch_or(u64* ptr, u64 value) {
+    return __atomic_fetch_or(ptr, value, __ATOMIC_ACQ_REL);
+}
+
+static inline u64
+tb_fetch_and(u64* ptr, u64 value) {
+    return __atomic_fetch_and(ptr, value, __ATOMIC_ACQ_REL);
+}
+
+static inline u32
+tb_load_acquire_u32(u32* ptr) {
+    return __atomic_load_n(ptr, __ATOMIC_ACQUIRE);
+}
+
+static inline u32
+tb_fetch_add_u32(u32* ptr, u32 value) {
+    return __atomic_fetch_add(ptr, value, __ATOMIC_ACQ_REL);
+}
+
+static inline void
+tb_fence_acquire() {
+    __atomic_thread_fence(__ATOMIC_ACQUIRE);
+}
+
+static inline void
+tb_fence_release() {
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+}
+
+static inline void
+tb_fence_full() {
+    __atomic_thread_fence(__ATOMIC_SEQ_CST);
+}
+
+#endif
+
+#endif
@@ -115,6 +115,37 @@ next(circular_iterator* iter) {
     return 0;
 }
 
+/**
+ * @brief advance an iterator by n positions
+ *
+ * Equivalent to calling next n times, stops early once the iterator is
+ * exhausted.
+ *
+ * @param[in] iter pointer to circular_iterator struct
+ * @param[in] n number of positions to advance by
+ * @return usize position reached
+ */
+static inline usize
+iterator_advance(circular_iterator* iter, usize n) {
+    usize position = 0;
+    usize step = n < iter->lower.count ? n : iter->lower.count;
+    if (step > 0) {
+        iter->count -= step;
+        iter->lower.count -= step;
+        iter->lower.index += step;
+        position = iter->lower.index;
+        n -= step;
+    }
+    step = n < iter->upper.count ? n : iter->upper.count;
+    if (step > 0) {
+        iter->count -= step;
+        iter->upper.count -= step;
+        iter->upper.index += step;
+        position = iter->upper.index - 1;
+    }
+    return position;
+}
+
 /**
  * @brief Initialise a new iterator for a ring buffer
  *
@@ -190,6 +221,9 @@ typedef struct {
     u64* index;
     u64* limit;
     circular_iterator* iters;
+    u64* entry;      // next channel index entry, CHANNEL_INDEX_MISS to scan
+    u64* entry_stop; // channel index entries published at initialisation
+    u64 stop;        // record count at initialisation
 } pattern_iterator;
 
 typedef struct cc_measurement cc_measurement;
@@ -0,0 +1,215 @@
+#ifndef __BLOCK_SUMMARY__
+#define __BLOCK_SUMMARY__
+
+#include "atomics.h"
+#include "base.h"
+
+/**
+ * @file block_summary.h
+ * @brief Summary of every block of records kept alongside a buffer
+ *
+ * Records are grouped into blocks of block_size consecutive absolute
+ * positions, block b holds positions [b * block_size, (b + 1) * block_size).
+ * For each block the writer keeps the arrival time of its first and last
+ * record, the number of records per channel and a bitmask of the channels
+ * present. Analysis uses complete blocks in place of their records: singles
+ * adds the per-channel counts, lower_bound searches the first arrival times
+ * before searching records and scans for a channel skip blocks without it.
+ *
+ * The summaries form a ring of slots in shared memory, each slot is
+ * {block + 1, records, first, last, mask[4], counts[channel_count]}. A slot
+ * can only be used for block b if it holds b and is complete.
+ */
+
+// words of a slot before the per-channel counts
+#define BLOCK_SUMMARY_HEADER 8
+// words of the channel presence mask, one bit for every possible u8 channel
+#define BLOCK_SUMMARY_MASK_WORDS 4
+
+typedef struct block_summary block_summary;
+struct block_summary {
+    u64 block_size;    /**< records per block, a power of two, 0 if disabled */
+    u64 shift;         /**< log2(block_size) */
+    u64 slots;         /**< number of blocks that are summarised at once */
+    u64 channel_count; /**< number of channels counted */
+    u64* table;        /**< slots * (BLOCK_SUMMARY_HEADER + channel_count) */
+};
+
+///
+/// @brief smallest power of two not less than block_size
+///
+static inline u64
+block_summary_size(u64 block_size) {
+    if (block_size == 0) {
+        return 0;
+    }
+    u64 size = 1;
+    while (size < block_size) {
+        size <<= 1;
+    }
+    return size;
+}
+
+static inline u64
+block_summary_slots(u64 capacity, u64 block_size) {
+    // every block overlapping the buffer plus the block being written
+    return (capacity / block_size) + 2;
+}
+
+static inline u64
+block_summary_words(u64 channel_count) {
+    return BLOCK_SUMMARY_HEADER + channel_count;
+}
+
+static inline u64
+block_summary_map_size(u64 channel_count, u64 capacity, u64 block_size) {
+    block_size = block_summary_size(block_size);
+    if (block_size == 0) {
+        return 0;
+    }
+    return block_summary_slots(capacity, block_size) *
+           block_summary_words(channel_count) * sizeof(u64);
+}
+
+static inline block_summary
+block_summary_init(char* ptr, u64 channel_count, u64 capacity, u64 block_size) {
+    block_summary summary = { 0 };
+    block_size = block_summary_size(block_size);
+    if (block_size == 0) {
+        return summary;
+    }
+    summary.block_size = block_size;
+    while ((1ULL << summary.shift) < block_size) {
+        summary.shift += 1;
+    }
+    summary.slots = block_summary_slots(capacity, block_size);
+    summary.channel_count = channel_count;
+    summary.table = (u64*)ptr;
+    return summary;
+}
+
+static inline u64*
+block_summary_slot(const block_summary* summary, u64 block) {
+    return summary->table + ((block % summary->slots) *
+                             block_summary_words(summary->channel_count));
+}
+
+static inline void
+block_summary_clear(const block_summary* summary) {
+    if (summary->block_size == 0) {
+        return;
+    }
+    for (u64 s = 0; s < summary->slots; s++) {
+        tb_store_release(block_summary_slot(summary, s), 0);
+    }
+}
+
+///
+/// @brief slot of block if the block is fully written, otherwise NULL
+///
+static inline const u64*
+block_summary_complete(const block_summary* summary, u64 block) {
+    const u64* slot = block_summary_slot(summary, block);
+    if ((tb_load_acquire((u64*)&slot[0]) != block + 1) ||
+        (tb_load_acquire((u64*)&slot[1]) != summary->block_size)) {
+        return NULL;
+    }
+    return slot;
+}
+
+///
+/// @brief slot of block if its first record has been written, otherwise NULL
+///
+static inline const u64*
+block_summary_started(const block_summary* summary, u64 block) {
+    const u64* slot = block_summary_slot(summary, block);
+    if ((tb_load_acquire((u64*)&slot[0]) != block + 1) ||
+        (tb_load_acquire((u64*)&slot[1]) == 0)) {
+        return NULL;
+    }
+    return slot;
+}
+
+static inline u64
+block_summary_first(const u64* slot) {
+    return slot[2];
+}
+
+static inline u64
+block_summary_last(const u64* slot) {
+    return slot[3];
+}
+
+static inline bool
+block_summary_has_channel(const u64* slot, u8 channel) {
+    return (slot[4 + (channel >> 6)] >> (channel & 63)) & 1;
+}
+
+static inline const u64*
+block_summary_counts(const u64* slot) {
+    return slot + BLOCK_SUMMARY_HEADER;
+}
+
+///
+/// @brief copy the summaries of the blocks overlapping [start, stop)
+///
+/// Both summaries must use the same block size and channel count, the number
+/// of slots may differ.
+///
+static inline void
+block_summary_copy(const block_summary* from,
+                   const block_summary* to,
+                   u64 start,
+                   u64 stop) {
+    if ((from->block_size == 0) || (from->block_size != to->block_size) ||
+        (from->channel_count != to->channel_count) || (start >= stop)) {
+        return;
+    }
+    u64 words = block_summary_words(from->channel_count);
+    for (u64 block = start >> from->shift; block <= (stop - 1) >> from->shift;
+         block++) {
+        const u64* slot = block_summary_slot(from, block);
+        if (tb_load_acquire((u64*)&slot[0]) != block + 1) {
+            continue;
+        }
+        u64* copy = block_summary_slot(to, block);
+        tb_store_release(&copy[0], 0);
+        memcpy(&copy[1], &slot[1], (words - 1) * sizeof(u64));
+        tb_store_release(&copy[0], block + 1);
+    }
+}
+
+///
+/// @brief add the record at position to the summary of its block
+///
+/// Records must be added in order of position, only the writer adds.
+///
+static inline void
+block_summary_add(const block_summary* summary,
+                  u64 position,
+                  u8 channel,
+                  u64 arrival_time) {
+    u64 block = position >> summary->shift;
+    u64* slot = block_summary_slot(summary, block);
+
+    if ((position & (summary->block_size - 1)) == 0) {
+        // first record of the block, the slot is invalid until it is reset
+        tb_store_release(&slot[0], 0);
+        memset(&slot[1], 0, (block_summary_words(summary->channel_count) - 1) *
+                              sizeof(u64));
+        slot[2] = arrival_time;
+        tb_store_release(&slot[0], block + 1);
+    } else if (tb_load_relaxed(&slot[0]) != block + 1) {
+        // the buffer was started or cleared part way through this block
+        return;
+    }
+
+    if (channel < summary->channel_count) {
+        slot[BLOCK_SUMMARY_HEADER + channel] += 1;
+    }
+    slot[4 + (channel >> 6)] |= 1ULL << (channel & 63);
+    slot[3] = arrival_time;
+    tb_store_release(&slot[1], tb_load_relaxed(&slot[1]) + 1);
+}
+
+#endif
@@ -0,0 +1,300 @@
+#ifndef __BUFFER_REGISTRY__
+#define __BUFFER_REGISTRY__
+
+#include "atomics.h"
+#include "base.h"
+#include "notify.h"
+#include "shared_memory.h"
+
+/**
+ * @file buffer_registry.h
+ * @brief Table of the buffers on a machine kept in a well known segment
+ *
+ * Every buffer created in shared memory is entered in the registry under the
+ * name it was created with, together with its format, capacity and the process
+ * that created it. Connecting to a buffer then looks up its format instead of
+ * trying every name prefix, and listing the buffers reads a single segment.
+ *
+ * The registry is an open addressing hash table of REGISTRY_ENTRIES entries,
+ * each {state, format, capacity, owner, name[REGISTRY_NAME_LENGTH]}. An entry
+ * is claimed with a compare and exchange and published with a release store
+ * of its state, removed entries are left as tombstones so lookups keep
+ * probing past them and are reused by the next entry that probes them. The
+ * segment is never removed, an all zero table is a valid empty registry.
+ */
+
+#define REGISTRY_NAME "tangy_registry"
+// number of entries, a power of two
+#define REGISTRY_ENTRIES 256
+// maximum length of a buffer name including the terminating null
+#define REGISTRY_NAME_LENGTH 64
+#define REGISTRY_ENTRY_WORDS (4 + REGISTRY_NAME_LENGTH / 8)
+// attempts to map a registry another process is still creating
+#define REGISTRY_OPEN_ATTEMPTS 100
+
+typedef enum {
+    REGISTRY_FREE = 0,
+    REGISTRY_CLAIMED = 1,
+    REGISTRY_ACTIVE = 2,
+    REGISTRY_REMOVED = 3,
+} registry_state;
+
+typedef struct registry_entry registry_entry;
+struct registry_entry {
+    u64 format;
+    u64 capacity;
+    u64 owner;
+    char name[REGISTRY_NAME_LENGTH];
+};
+
+typedef struct buffer_registry buffer_registry;
+struct buffer_registry {
+    shared_mapping map;
+    u64* entries;
+};
+
+static inline u64
+registry_map_size() {
+    return REGISTRY_ENTRIES * REGISTRY_ENTRY_WORDS * sizeof(u64);
+}
+
+static inline u64*
+registry_slot(const buffer_registry* registry, u64 index) {
+    return registry->entries + index * REGISTRY_ENTRY_WORDS;
+}
+
+// FNV-1a of the name, the first entry probed for it
+static inline u64
+registry_home(const char* name) {
+    u64 hash = 0xcbf29ce484222325ULL;
+    for (u64 i = 0; (i < REGISTRY_NAME_LENGTH) && (name[i] != '\0'); i++) {
+        hash ^= (u8)name[i];
+        hash *= 0x100000001b3ULL;
+    }
+    return hash & (REGISTRY_ENTRIES - 1);
+}
+
+///
+/// @brief map the registry, creating it if no process has done so yet
+///
+static inline shmem_result
+registry_open(buffer_registry* registry) {
+    shmem_result result = { 0 };
+    shmem_map_result map_result = { 0 };
+
+    for (u64 attempt = 0; attempt < REGISTRY_OPEN_ATTEMPTS; attempt++) {
+        map_result = shmem_connect(REGISTRY_NAME);
+        if (map_result.Ok == false) {
+            // the segment is zeroed when it is sized, nothing to initialise
+            map_result = shmem_create(registry_map_size(), REGISTRY_NAME, 0);
+        }
+        if (map_result.Ok == true) {
+            break;
+        }
+        // lost the race to create it and it has not been sized yet
+        tb_sleep(1e-4);
+    }
+
+    if (map_result.Ok == false) {
+        result.Error = map_result.Error;
+        result.Std_Error = map_result.Std_Error;
+        return result;
+    }
+
+    registry->map = map_result.map;
+    registry->entries = (u64*)map_result.map.data;
+    result.Ok = true;
+    return result;
+}
+
+// position of index in the probe sequence that starts at home
+static inline u64
+registry_distance(u64 home, u64 index) {
+    return (index - home) & (REGISTRY_ENTRIES - 1);
+}
+
+static inline bool
+registry_holds(u64* slot, const char* name) {
+    return 0 == strncmp((char*)(slot + 4), name, REGISTRY_NAME_LENGTH - 1);
+}
+
+///
+/// @brief probe the entries of a name from its home entry
+///
+/// Stops at the first free entry, past which the name can not be.
+///
+/// @param[out] vacant first tombstone or free entry probed, -1 if there is
+/// none
+/// @return index of the active entry of name or -1 if there is none
+///
+static inline i64
+registry_probe(const buffer_registry* registry, const char* name, i64* vacant) {
+    *vacant = -1;
+    u64 home = registry_home(name);
+    for (u64 i = 0; i < REGISTRY_ENTRIES; i++) {
+        u64 index = (home + i) & (REGISTRY_ENTRIES - 1);
+        u64* slot = registry_slot(registry, index);
+        u64 state = tb_load_acquire(slot);
+        if ((state == REGISTRY_FREE) || (state == REGISTRY_REMOVED)) {
+            if (*vacant < 0) {
+                *vacant = (i64)index;
+            }
+            if (state == REGISTRY_FREE) {
+                return -1;
+            }
+        }
+        if ((state == REGISTRY_ACTIVE) && registry_holds(slot, name)) {
+            return (i64)index;
+        }
+    }
+    return -1;
+}
+
+///
+/// @brief find the entry of a buffer
+///
+/// @return index of the entry or -1 if the buffer is not registered
+///
+static inline i64
+registry_find(const buffer_registry* registry, const char* name) {
+    i64 vacant = -1;
+    return registry_probe(registry, name, &vacant);
+}
+
+///
+/// @brief copy out the entry at index
+///
+/// @return true if the entry holds a buffer
+///
+static inline bool
+registry_read(const buffer_registry* registry,
+              u64 index,
+              registry_entry* entry) {
+    u64* slot = registry_slot(registry, index);
+    if (tb_load_acquire(slot) != REGISTRY_ACTIVE) {
+        return false;
+    }
+    entry->format = tb_load_relaxed(slot + 1);
+    entry->capacity = tb_load_relaxed(slot + 2);
+    entry->owner = tb_load_relaxed(slot + 3);
+    memcpy(entry->name, slot + 4, REGISTRY_NAME_LENGTH);
+    entry->name[REGISTRY_NAME_LENGTH - 1] = '\0';
+    // the entry was removed and possibly reused while it was copied
+    return tb_load_acquire(slot) == REGISTRY_ACTIVE;
+}
+
+///
+/// @brief whether an entry claimed for name has to give way to another
+///
+/// Two processes adding the same name at once can both miss the other in
+/// registry_probe and claim an entry each. Both write the name before
+/// checking, so at least one of them sees the other. The claim that sees an
+/// active entry of the name, or a claim earlier in the probe sequence, gives
+/// way. A claim later in the probe sequence is waited on until it has given
+/// way or been published.
+///
+static inline bool
+registry_give_way(const buffer_registry* registry,
+                  const char* name,
+                  u64 claimed) {
+    u64 home = registry_home(name);
+    u64 own = registry_distance(home, claimed);
+    for (u64 i = 0; i < REGISTRY_ENTRIES; i++) {
+        if (i == own) {
+            continue;
+        }
+        u64 index = (home + i) & (REGISTRY_ENTRIES - 1);
+        u64* slot = registry_slot(registry, index);
+        u64 state = tb_load_acquire(slot);
+        for (u64 attempt = 0; (attempt < REGISTRY_OPEN_ATTEMPTS) &&
+                              (state == REGISTRY_CLAIMED) && (i > own) &&
+                              registry_holds(slot, name);
+             attempt++) {
+            tb_sleep(1e-4);
+            state = tb_load_acquire(slot);
+        }
+        if (state == REGISTRY_FREE) {
+            return false;
+        }
+        if (registry_holds(slot, name) &&
+            ((state == REGISTRY_ACTIVE) ||
+             ((state == REGISTRY_CLAIMED) && (i < own)))) {
+            return true;
+        }
+    }
+    return false;
+}
+
+///
+/// @brief enter a buffer in the registry, or update its entry
+///
+/// A new entry takes the first tombstone probed, so removed buffers do not
+/// leave ever longer probe sequences behind.
+///
+/// @return index of the entry or -1 if the name is too long or the registry
+/// is full
+///
+static inline i64
+registry_add(buffer_registry* registry,
+             const char* name,
+             u64 format,
+             u64 capacity,
+             u64 owner) {
+    if (strlen(name) >= REGISTRY_NAME_LENGTH) {
+        return -1;
+    }
+
+    for (u64 attempt = 0; attempt < REGISTRY_OPEN_ATTEMPTS; attempt++) {
+        i64 vacant = -1;
+        i64 found = registry_probe(registry, name, &vacant);
+        if (found >= 0) {
+            u64* slot = registry_slot(registry, (u64)found);
+            tb_store_relaxed(slot + 1, format);
+            tb_store_relaxed(slot + 2, capacity);
+            tb_store_release(slot + 3, owner);
+            return found;
+        }
+        if (vacant < 0) {
+            return -1;
+        }
+
+        u64* slot = registry_slot(registry, (u64)vacant);
+        u64 expected = tb_load_acquire(slot);
+        if (((expected != REGISTRY_FREE) && (expected != REGISTRY_REMOVED)) ||
+            (false == tb_compare_exchange(slot, &expected, REGISTRY_CLAIMED))) {
+            // another process took the entry, probe again
+            continue;
+        }
+
+        char* entry_name = (char*)(slot + 4);
+        memset(entry_name, 0, REGISTRY_NAME_LENGTH);
+        strncpy(entry_name, name, REGISTRY_NAME_LENGTH - 1);
+        tb_store_relaxed(slot + 1, format);
+        tb_store_relaxed(slot + 2, capacity);
+        tb_store_relaxed(slot + 3, owner);
+        tb_fence_full();
+
+        if (registry_give_way(registry, name, (u64)vacant)) {
+            // left as a tombstone, a probe may already have passed the entry
+            tb_store_release(slot, REGISTRY_REMOVED);
+            tb_sleep(1e-4);
+            continue;
+        }
+        tb_store_release(slot, REGISTRY_ACTIVE);
+        return vacant;
+    }
+    return -1;
+}
+
+static inline void
+registry_remove(buffer_registry* registry, const char* name) {
+    i64 index = registry_find(registry, name);
+    if (index < 0) {
+        return;
+    }
+    u64 expected = REGISTRY_ACTIVE;
+    tb_compare_exchange(
+      registry_slot(registry, (u64)index), &expected, REGISTRY_REMOVED);
+}
+
+#endif
@@ -0,0 +1,147 @@
+#ifndef __CHANNEL_INDEX__
+#define __CHANNEL_INDEX__
+
+#include "atomics.h"
+#include "base.h"
+
+/**
+ * @file channel_index.h
+ * @brief Per-channel rings of record positions kept alongside a buffer
+ *
+ * For every channel the writer appends the absolute position (count based
+ * index) of each record it publishes on that channel. Kernels that only look
+ * at a few channels step through these positions rather than testing the
+ * channel of every record in the buffer.
+ *
+ * Each channel keeps the positions of its most recent `capacity` records. A
+ * channel that has dropped positions newer than the start of a scan does not
+ * cover that scan and the kernel falls back to walking the records.
+ *
+ * Layout in shared memory: u64 counts[channel_count] followed by
+ * u64 positions[channel_count][capacity].
+ */
+
+typedef struct channel_index channel_index;
+struct channel_index {
+    u64 capacity;      /**< positions kept per channel, 0 if disabled */
+    u64 channel_count; /**< number of channels indexed */
+    u64* counts;       /**< positions appended to each channel so far */
+    u64* positions;    /**< one ring of positions per channel */
+};
+
+// returned by channel_index_lower_bound if the index can not be used
+#define CHANNEL_INDEX_MISS UINT64_MAX
+
+static inline u64
+channel_index_map_size(u64 channel_count, u64 capacity) {
+    if (capacity == 0) {
+        return 0;
+    }
+    return channel_count * (capacity + 1) * sizeof(u64);
+}
+
+static inline channel_index
+channel_index_init(char* ptr, u64 channel_count, u64 capacity) {
+    channel_index index = { 0 };
+    if (capacity == 0) {
+        return index;
+    }
+    index.capacity = capacity;
+    index.channel_count = channel_count;
+    index.counts = (u64*)ptr;
+    index.positions = index.counts + channel_count;
+    return index;
+}
+
+static inline void
+channel_index_clear(const channel_index* index) {
+    if (index->capacity == 0) {
+        return;
+    }
+    for (u64 c = 0; c < index->channel_count; c++) {
+        tb_store_release(&index->counts[c], 0);
+    }
+}
+
+static inline u64
+channel_index_count(const channel_index* index, u8 channel) {
+    return tb_load_acquire(&index->counts[channel]);
+}
+
+static inline u64
+channel_index_position(const channel_index* index, u8 channel, u64 entry) {
+    return index->positions[(channel * index->capacity) +
+                            (entry % index->capacity)];
+}
+
+///
+/// @brief copy every channel's positions to an index of the same size
+///
+/// Positions are absolute so they stay valid in a buffer of another capacity.
+///
+static inline void
+channel_index_copy(const channel_index* from, const channel_index* to) {
+    if ((from->capacity == 0) || (from->capacity != to->capacity) ||
+        (from->channel_count != to->channel_count)) {
+        return;
+    }
+    memcpy(to->positions,
+           from->positions,
+           from->channel_count * from->capacity * sizeof(u64));
+    for (u64 c = 0; c < from->channel_count; c++) {
+        tb_store_release(&to->counts[c], channel_index_count(from, (u8)c));
+    }
+}
+
+///
+/// @brief record that the record at position is on channel
+///
+/// Positions must be appended in increasing order, only the writer appends.
+///
+static inline void
+channel_index_append(const channel_index* index, u8 channel, u64 position) {
+    if (channel >= index->channel_count) {
+        return;
+    }
+    u64 entry = tb_load_relaxed(&index->counts[channel]);
+    index->positions[(channel * index->capacity) + (entry % index->capacity)] =
+      position;
+    tb_store_release(&index->counts[channel], entry + 1);
+}
+
+///
+/// @brief first entry of channel at or after position
+///
+/// @return entry number or CHANNEL_INDEX_MISS if channel is not indexed or
+/// has dropped positions at or after position
+///
+static inline u64
+channel_index_lower_bound(const channel_index* index,
+                          u8 channel,
+                          u64 position) {
+    if ((index->capacity == 0) || (channel >= index->channel_count)) {
+        return CHANNEL_INDEX_MISS;
+    }
+
+    u64 count = channel_index_count(index, channel);
+    u64 left = count > index->capacity ? count - index->capacity : 0;
+    u64 right = count;
+
+    // the oldest kept position must precede the scan, otherwise positions
+    // the scan needs may already have been dropped
+    if ((left > 0) && (channel_index_position(index, channel, left) > position)) {
+        return CHANNEL_INDEX_MISS;
+    }
+
+    while (left < right) {
+        u64 mid = left + (right - left) / 2;
+        if (channel_index_position(index, channel, mid) < position) {
+            left = mid + 1;
+        } else {
+            right = mid;
+        }
+    }
+    return left;
+}
+
+#endif
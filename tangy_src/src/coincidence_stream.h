@@ -0,0 +1,167 @@
+#ifndef __COINCIDENCE_STREAM__
+#define __COINCIDENCE_STREAM__
+
+#include "base.h"
+
+/**
+ * @file coincidence_stream.h
+ * @brief State of a coincidence counter that consumes records as they arrive
+ *
+ * A record on a channel of the pattern is an anchor, it is in coincidence if
+ * the next record on every other channel of the pattern falls within the
+ * diameter after it, as for coincidence_window. An anchor waits in the
+ * pending list until every other channel has had its next record, or until
+ * the records have moved on by the horizon (diameter plus the largest delay)
+ * beyond which no record can still be in coincidence with it.
+ *
+ * Each pending anchor is {delayed arrival, arrival, channels seen}, the
+ * channels seen holding one bit per pattern channel that had its next record
+ * within the diameter. Anchors are pushed in the order of the records so the
+ * oldest anchor is always at the head.
+ */
+
+// bit of the channels seen marking an anchor that can no longer complete
+#define STREAM_FAILED ((u64)1 << 63)
+// most channels in a pattern, one bit of the channels seen is STREAM_FAILED
+#define STREAM_CHANNELS_MAX 63
+
+typedef struct coincidence_stream coincidence_stream;
+struct coincidence_stream {
+    u64 n_channels;       /**< channels in the pattern */
+    u8 position_of[256];  /**< position of each channel in the pattern,
+                               n_channels if not in it */
+    u64* delay_bins;      /**< delay of each pattern channel */
+    u64 diameter;         /**< coincidence diameter in bins */
+    u64 horizon;          /**< bins after which an anchor can not complete */
+    u64 pattern_mask;     /**< channels seen by a complete anchor */
+    u64 position;         /**< next record to consume */
+    u64 last_time;        /**< arrival time of the last record consumed */
+    u64 coincidences;     /**< coincidences completed by the last update */
+    u64 lost;             /**< records overwritten before being consumed */
+    u64* pending;         /**< anchors, three words each */
+    u64 pending_head;     /**< first live anchor */
+    u64 pending_length;   /**< anchors pushed, including the dead before
+                               pending_head */
+    u64 pending_capacity; /**< anchors pending can hold */
+};
+
+static inline void
+stream_init(coincidence_stream* stream,
+            const u64 n_channels,
+            const u8* channels,
+            const u64* delay_bins,
+            const u64 diameter,
+            const u64 position) {
+    stream->n_channels = n_channels;
+    memset(stream->position_of, (int)n_channels, sizeof(stream->position_of));
+
+    stream->delay_bins = (u64*)malloc(sizeof(u64) * n_channels);
+    u64 delay_max = 0;
+    for (u64 i = 0; i < n_channels; i++) {
+        stream->position_of[channels[i]] = (u8)i;
+        stream->delay_bins[i] = delay_bins[i];
+        delay_max = delay_bins[i] > delay_max ? delay_bins[i] : delay_max;
+    }
+
+    stream->diameter = diameter;
+    stream->horizon = diameter + delay_max;
+    stream->pattern_mask = ((u64)1 << n_channels) - 1;
+    stream->position = position;
+    stream->last_time = 0;
+    stream->coincidences = 0;
+    stream->lost = 0;
+
+    stream->pending_capacity = 64;
+    stream->pending = (u64*)malloc(sizeof(u64) * 3 * stream->pending_capacity);
+    stream->pending_head = 0;
+    stream->pending_length = 0;
+}
+
+static inline void
+stream_deinit(coincidence_stream* stream) {
+    free(stream->delay_bins);
+    free(stream->pending);
+    stream->delay_bins = NULL;
+    stream->pending = NULL;
+}
+
+///
+/// @brief forget the pending anchors and continue from position
+///
+static inline void
+stream_reset(coincidence_stream* stream, u64 position) {
+    stream->pending_head = 0;
+    stream->pending_length = 0;
+    stream->position = position;
+}
+
+static inline void
+stream_push(coincidence_stream* stream, u64 delayed, u64 arrival, u64 seen) {
+    if (stream->pending_length == stream->pending_capacity) {
+        u64 live = stream->pending_length - stream->pending_head;
+        if (live > stream->pending_capacity / 2) {
+            stream->pending_capacity *= 2;
+            stream->pending = (u64*)realloc(
+              stream->pending, sizeof(u64) * 3 * stream->pending_capacity);
+        }
+        // drop the dead anchors at the front
+        memmove(stream->pending,
+                stream->pending + 3 * stream->pending_head,
+                sizeof(u64) * 3 * live);
+        stream->pending_head = 0;
+        stream->pending_length = live;
+    }
+    u64* anchor = stream->pending + 3 * stream->pending_length;
+    anchor[0] = delayed;
+    anchor[1] = arrival;
+    anchor[2] = seen;
+    stream->pending_length += 1;
+}
+
+///
+/// @brief consume a record on pattern channel i
+///
+/// Every pending anchor still waiting for channel i sees its next record on
+/// that channel, then the record becomes an anchor itself.
+///
+static inline void
+stream_record(coincidence_stream* stream, u64 i, u64 arrival) {
+    u64 delayed = arrival + stream->delay_bins[i];
+    u64 bit = (u64)1 << i;
+
+    // anchors that are complete, failed or past the horizon leave the head
+    while (stream->pending_head < stream->pending_length) {
+        u64* anchor = stream->pending + 3 * stream->pending_head;
+        if (((anchor[2] & STREAM_FAILED) == 0) &&
+            (anchor[2] != stream->pattern_mask) &&
+            (arrival - anchor[1] < stream->horizon)) {
+            break;
+        }
+        stream->pending_head += 1;
+    }
+
+    for (u64 k = stream->pending_head; k < stream->pending_length; k++) {
+        u64* anchor = stream->pending + 3 * k;
+        if ((anchor[2] & (bit | STREAM_FAILED)) ||
+            (anchor[2] == stream->pattern_mask)) {
+            continue;
+        }
+        if ((delayed - anchor[0]) < stream->diameter) {
+            anchor[2] |= bit;
+            if (anchor[2] == stream->pattern_mask) {
+                stream->coincidences += 1;
+            }
+        } else {
+            anchor[2] |= STREAM_FAILED;
+        }
+    }
+
+    if (bit == stream->pattern_mask) {
+        // a pattern of a single channel
+        stream->coincidences += 1;
+        return;
+    }
+    stream_push(stream, delayed, arrival, bit);
+}
+
+#endif
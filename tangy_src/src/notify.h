@@ -0,0 +1,225 @@
+#ifndef __NOTIFY__
+#define __NOTIFY__
+
+#include "base.h"
+
+/**
+ * @file notify.h
+ * @brief Cross-process sleep/wake primitives used to signal new timetags
+ *
+ * On Linux waiters sleep on a futex placed in the shared header, the futex is
+ * not created with FUTEX_PRIVATE_FLAG so that it can be woken from any
+ * process mapping the buffer. Other platforms have no equivalent that works
+ * across processes on a plain mapping, waiters there fall back to sleeping for
+ * a short interval and checking again.
+ *
+ * Readers that need a file descriptor (for select/poll based event loops)
+ * register a named FIFO that the writer sends a single byte to when it
+ * publishes new records, the FIFO then stays readable until it is drained.
+ */
+
+#if defined(__linux__)
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <linux/futex.h>
+#include <stdio.h>
+#include <sys/stat.h>
+#include <sys/syscall.h>
+#include <time.h>
+#include <unistd.h>
+#elif defined(_WIN32)
+#include <Windows.h>
+#else
+#include <errno.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <sys/stat.h>
+#include <time.h>
+#include <unistd.h>
+#endif
+
+// interval between checks on platforms without a cross-process futex
+#define TB_POLL_INTERVAL 1e-3
+
+// directory holding the FIFOs of subscribed readers
+#define TB_FIFO_DIRECTORY "/tmp"
+
+static inline f64
+tb_monotonic_time() {
+#if defined(_WIN32)
+    LARGE_INTEGER frequency;
+    LARGE_INTEGER counter;
+    QueryPerformanceFrequency(&frequency);
+    QueryPerformanceCounter(&counter);
+    return (f64)counter.QuadPart / (f64)frequency.QuadPart;
+#else
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (f64)now.tv_sec + (f64)now.tv_nsec * 1e-9;
+#endif
+}
+
+static inline void
+tb_sleep(f64 seconds) {
+#if defined(_WIN32)
+    Sleep((DWORD)(seconds * 1e3));
+#else
+    struct timespec duration;
+    duration.tv_sec = (time_t)seconds;
+    duration.tv_nsec = (long)((seconds - (f64)duration.tv_sec) * 1e9);
+    nanosleep(&duration, NULL);
+#endif
+}
+
+///
+/// @brief sleep while *address == expected
+///
+/// May return early, spuriously or because another process changed the value,
+/// callers must re-check their condition.
+///
+/// @param[in] address word in shared memory
+/// @param[in] expected value last observed at address
+/// @param[in] timeout maximum time to sleep in seconds, negative for no limit
+///
+static inline void
+tb_wait_on_address(u32* address, u32 expected, f64 timeout) {
+#if defined(__linux__)
+    struct timespec duration;
+    struct timespec* duration_ptr = NULL;
+    if (timeout >= 0) {
+        duration.tv_sec = (time_t)timeout;
+        duration.tv_nsec = (long)((timeout - (f64)duration.tv_sec) * 1e9);
+        duration_ptr = &duration;
+    }
+    syscall(SYS_futex, address, FUTEX_WAIT, expected, duration_ptr, NULL, 0);
+#else
+    (void)address;
+    (void)expected;
+    if ((timeout < 0) || (timeout > TB_POLL_INTERVAL)) {
+        timeout = TB_POLL_INTERVAL;
+    }
+    tb_sleep(timeout);
+#endif
+}
+
+///
+/// @brief wake every process sleeping in tb_wait_on_address on address
+///
+static inline void
+tb_wake_address(u32* address) {
+#if defined(__linux__)
+    syscall(SYS_futex, address, FUTEX_WAKE, INT_MAX, NULL, NULL, 0);
+#else
+    (void)address;
+#endif
+}
+
+///
+/// @brief path of the FIFO used by subscriber slot of the buffer named name
+///
+static inline void
+tb_fifo_path(const char* name, u32 slot, char* path, u64 length) {
+    snprintf(path, length, "%s/tangy_%s_%u.fifo", TB_FIFO_DIRECTORY, name, slot);
+}
+
+///
+/// @brief create and open the read end of a FIFO
+///
+/// The FIFO is created under a temporary name, opened and only then moved to
+/// path. A writer therefore either fails to find the FIFO or finds it with a
+/// reader attached, a FIFO without a reader always belongs to a reader that
+/// has gone away.
+///
+/// @return non-blocking descriptor or -1 with errno set
+///
+static inline int
+tb_fifo_open(const char* path) {
+#if defined(_WIN32)
+    (void)path;
+    return -1;
+#else
+    char path_tmp[544];
+    snprintf(path_tmp, sizeof(path_tmp), "%s.%d", path, (int)getpid());
+    unlink(path_tmp);
+    if (-1 == mkfifo(path_tmp, 0666)) {
+        return -1;
+    }
+
+    // opened for reading and writing so that the FIFO always has a writer,
+    // otherwise it reports end-of-file (readable) once a writer closes it
+    int fd = open(path_tmp, O_RDWR | O_NONBLOCK);
+    if (-1 == fd) {
+        unlink(path_tmp);
+        return -1;
+    }
+
+    if (-1 == rename(path_tmp, path)) {
+        close(fd);
+        unlink(path_tmp);
+        return -1;
+    }
+    return fd;
+#endif
+}
+
+static inline void
+tb_fifo_remove(const char* path) {
+#if !defined(_WIN32)
+    unlink(path);
+#else
+    (void)path;
+#endif
+}
+
+static inline void
+tb_fifo_close(const char* path, int fd) {
+#if !defined(_WIN32)
+    close(fd);
+    unlink(path);
+#else
+    (void)path;
+    (void)fd;
+#endif
+}
+
+///
+/// @brief write a single byte to the FIFO at path without blocking
+///
+/// @return false if the FIFO exists but nothing is reading from it
+///
+static inline bool
+tb_fifo_signal(const char* path) {
+#if defined(_WIN32)
+    (void)path;
+    return true;
+#else
+    int fd = open(path, O_WRONLY | O_NONBLOCK);
+    if (-1 == fd) {
+        // ENOENT: subscriber has not finished registering
+        return errno != ENXIO;
+    }
+    // a full FIFO (EAGAIN) already holds an unread notification
+    char byte = 1;
+    ssize_t written = write(fd, &byte, 1);
+    (void)written;
+    close(fd);
+    return true;
+#endif
+}
+
+///
+/// @brief read and discard every pending byte of a FIFO
+///
+static inline void
+tb_fifo_drain(int fd) {
+#if !defined(_WIN32)
+    char bytes[256];
+    while (read(fd, bytes, sizeof(bytes)) > 0) {
+    }
+#else
+    (void)fd;
+#endif
+}
+
+#endif
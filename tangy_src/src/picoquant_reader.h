@@ -610,6 +610,8 @@ srb_read_next_PH_T2(shared_ring_buffer* buf,
         count_tags = status->total_records - count_buffer;
     }
 
+    srb_write_begin(buf, count_tags + 1);
+
     u64 capacity = srb_get_capacity(buf);
     u64 index = count_buffer % capacity;
 
@@ -635,7 +637,9 @@ srb_read_next_PH_T2(shared_ring_buffer* buf,
     status->photon_count += status->current_count;
     status->overflow = out.overflow;
 
-    srb_set_count(buf, count_buffer + status->current_count);
+    std_index_records(
+      buf, data, count_buffer, count_buffer + status->current_count);
+    srb_write_end(buf, count_buffer + status->current_count);
 
     return 1;
 }
@@ -664,6 +668,8 @@ srb_read_next_PH_T3(shared_ring_buffer* buf,
         count_tags = status->total_records - count_buffer;
     }
 
+    srb_write_begin(buf, count_tags + 1);
+
     u64 capacity = srb_get_capacity(buf);
     u64 index = count_buffer % capacity;
 
@@ -680,8 +686,7 @@ srb_read_next_PH_T3(shared_ring_buffer* buf,
 
         if (photon == 1) {
             data->channel[index] = record.channel;
-            data->timestamp[index] =
-              (clk_timetag){ .clock = record.sync, .delta = record.delta_t };
+            clk_timestamp_set(data, index, record.sync, record.delta_t);
             ++status->current_count;
             index = (index + 1) % capacity;
         }
@@ -690,7 +695,9 @@ srb_read_next_PH_T3(shared_ring_buffer* buf,
     status->photon_count += status->current_count;
     status->overflow = out.overflow;
 
-    srb_set_count(buf, count_buffer + status->current_count);
+    clk_index_records(
+      buf, data, count_buffer, count_buffer + status->current_count);
+    srb_write_end(buf, count_buffer + status->current_count);
 
     return 1;
 }
@@ -719,6 +726,8 @@ srb_read_next_HH2_T2(shared_ring_buffer* buf,
         count_tags = status->total_records - count_buffer;
     }
 
+    srb_write_begin(buf, count_tags + 1);
+
     u64 capacity = srb_get_capacity(buf);
     u64 index = count_buffer % capacity;
 
@@ -744,7 +753,9 @@ srb_read_next_HH2_T2(shared_ring_buffer* buf,
     status->photon_count += status->current_count;
     status->overflow = out.overflow;
 
-    srb_set_count(buf, count_buffer + status->current_count);
+    std_index_records(
+      buf, data, count_buffer, count_buffer + status->current_count);
+    srb_write_end(buf, count_buffer + status->current_count);
 
     return 1;
 }
@@ -773,6 +784,8 @@ srb_read_next_HH2_T3(shared_ring_buffer* buf,
         count_tags = status->total_records - count_buffer;
     }
 
+    srb_write_begin(buf, count_tags + 1);
+
     u64 capacity = srb_get_capacity(buf);
     u64 index = count_buffer % capacity;
 
@@ -789,8 +802,7 @@ srb_read_next_HH2_T3(shared_ring_buffer* buf,
 
         if (photon == 1) {
             data->channel[index] = record.channel;
-            data->timestamp[index] =
-              (clk_timetag){ .clock = record.sync, .delta = record.delta_t };
+            clk_timestamp_set(data, index, record.sync, record.delta_t);
             status->current_count++;
             index = (index + 1) % capacity;
         }
@@ -799,7 +811,9 @@ srb_read_next_HH2_T3(shared_ring_buffer* buf,
     status->photon_count += status->current_count;
     status->overflow = out.overflow;
 
-    srb_set_count(buf, count_buffer + status->current_count);
+    clk_index_records(
+      buf, data, count_buffer, count_buffer + status->current_count);
+    srb_write_end(buf, count_buffer + status->current_count);
 
     return 1;
 }
@@ -32,6 +32,8 @@ srb_read_next_qutools(shared_ring_buffer* buf,
     u64 capacity = srb_get_capacity(buf);
     u64 index = count_buffer % capacity;
 
+    srb_write_begin(buf, count_tags);
+
     u8* bytes[10];
     u64 read_tags = 0;
     for (u64 i = 0; i < count_tags; i++) {
@@ -47,7 +49,8 @@ srb_read_next_qutools(shared_ring_buffer* buf,
         index = (index + 1) % capacity;
     }
 
-    srb_set_count(buf, count_buffer + read_tags);
+    std_index_records(buf, data, count_buffer, count_buffer + read_tags);
+    srb_write_end(buf, count_buffer + read_tags);
 
     return 1;
 }
@@ -2,11 +2,81 @@
 #include <errno.h>
 #include <stdio.h>
 
+static void
+shmem_prefault(char* data, u64 size) {
+#if defined(MADV_POPULATE_WRITE)
+    if (0 == madvise(data, size, MADV_POPULATE_WRITE)) {
+        return;
+    }
+#endif
+
+#if defined(_WIN32)
+    SYSTEM_INFO info;
+    GetSystemInfo(&info);
+    u64 page_size = info.dwPageSize;
+#else
+    u64 page_size = (u64)sysconf(_SC_PAGESIZE);
+#endif
+
+    // the mapping is new so it only contains zeros
+    volatile char* pages = data;
+    for (u64 i = 0; i < size; i += page_size) {
+        pages[i] = 0;
+    }
+}
+
+static u64
+shmem_apply_flags(char* data, u64 size, u64 flags) {
+    u64 applied = SM_DEFAULT;
+
+#if defined(MADV_HUGEPAGE)
+    if ((flags & SM_HUGE_PAGES) && (0 == madvise(data, size, MADV_HUGEPAGE))) {
+        applied |= SM_HUGE_PAGES;
+    }
+#endif
+
+    if (flags & SM_PREFAULT) {
+        shmem_prefault(data, size);
+        applied |= SM_PREFAULT;
+    }
+
+#if defined(_WIN32)
+    if ((flags & SM_LOCKED) && VirtualLock(data, size)) {
+        applied |= SM_LOCKED;
+    }
+#else
+    if ((flags & SM_LOCKED) && (0 == mlock(data, size))) {
+        applied |= SM_LOCKED;
+    }
+#endif
+
+    return applied;
+}
+
+void
+shmem_advise(shared_mapping* map, u64 flags) {
+#if defined(MADV_HUGEPAGE)
+    if ((flags & SM_HUGE_PAGES) && (map->size > 0)) {
+        madvise(map->data, map->size, MADV_HUGEPAGE);
+    }
+#else
+    (void)map;
+    (void)flags;
+#endif
+}
+
 shmem_map_result
-shmem_create(u64 map_size, char* name) {
+shmem_create(u64 map_size, char* name, u64 flags) {
 
     shmem_map_result result = { 0 };
 
+#if defined(MADV_HUGEPAGE)
+    if (flags & SM_HUGE_PAGES) {
+        map_size = ((map_size + SM_HUGE_PAGE_SIZE - 1) / SM_HUGE_PAGE_SIZE) *
+                   SM_HUGE_PAGE_SIZE;
+    }
+#endif
+
 #if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
 
     fd_t fd = shm_open(name, O_RDWR | O_CREAT | O_EXCL, 0777);
@@ -26,7 +96,7 @@ shmem_create(u64 map_size, char* name) {
 
     char* ptr = mmap(NULL, map_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
 
-    if (-1 == *ptr) {
+    if (MAP_FAILED == ptr) {
         result.Error = SM_MAP;
         result.Std_Error = errno;
         return result;
@@ -71,6 +141,180 @@ shmem_create(u64 map_size, char* name) {
     result.map.file_descriptor = fd;
     result.map.data = ptr;
     result.map.name = name;
+    result.map.size = map_size;
+    result.map.flags = shmem_apply_flags(ptr, map_size, flags);
+    result.Ok = true;
+
+    return result;
+}
+
+shmem_map_result
+shmem_create_file(u64 map_size, char* path, u64 flags) {
+
+    shmem_map_result result = { 0 };
+
+#if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
+
+    fd_t fd = open(path, O_RDWR | O_CREAT | O_EXCL, 0666);
+
+    if (-1 == fd) {
+        result.Error = SM_MAP_CREATE;
+        result.Std_Error = errno;
+        return result;
+    }
+
+    if (-1 == ftruncate(fd, map_size)) {
+        result.Error = SM_FTRUNCATE;
+        result.Std_Error = errno;
+        close(fd);
+        return result;
+    }
+
+    char* ptr = mmap(NULL, map_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+
+    if (MAP_FAILED == ptr) {
+        result.Error = SM_MAP;
+        result.Std_Error = errno;
+        close(fd);
+        return result;
+    }
+
+#elif defined(_WIN32)
+
+    HANDLE file = CreateFileA(path,
+                              GENERIC_READ | GENERIC_WRITE,
+                              FILE_SHARE_READ | FILE_SHARE_WRITE,
+                              NULL,
+                              CREATE_NEW,
+                              FILE_ATTRIBUTE_NORMAL,
+                              NULL);
+    if (INVALID_HANDLE_VALUE == file) {
+        result.Error = SM_MAP_CREATE;
+        return result;
+    }
+
+    LARGE_INTEGER win_int64;
+    win_int64.QuadPart = map_size;
+
+    HANDLE handle = CreateFileMapping(
+      file, NULL, PAGE_READWRITE, win_int64.HighPart, win_int64.LowPart, NULL);
+    CloseHandle(file);
+    if (NULL == handle) {
+        result.Error = SM_MAP_CREATE;
+        return result;
+    }
+
+    int fd = _open_osfhandle((intptr_t)handle, 0);
+    if (-1 == fd) {
+        result.Error = SM_HANDLE_TO_FD;
+        return result;
+    }
+
+    char* ptr =
+      MapViewOfFile(handle, FILE_MAP_ALL_ACCESS, 0, 0, win_int64.QuadPart);
+
+    if (NULL == ptr) {
+        result.Error = SM_MEMORY_MAPPING;
+        return result;
+    }
+
+#else
+#error "Unknown platform"
+
+#endif
+
+    result.map.file_descriptor = fd;
+    result.map.data = ptr;
+    result.map.name = path;
+    result.map.size = map_size;
+    result.map.flags = shmem_apply_flags(ptr, map_size, flags) | SM_FILE;
+    result.Ok = true;
+
+    return result;
+}
+
+shmem_map_result
+shmem_connect_file(char* path) {
+
+    shmem_map_result result = { 0 };
+
+#if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
+
+    fd_t fd = open(path, O_RDWR);
+
+    if (-1 == fd) {
+        result.Error = SM_MAP_CREATE;
+        result.Std_Error = errno;
+        return result;
+    }
+
+    struct stat file_status;
+
+    if (-1 == fstat(fd, &file_status)) {
+        result.Error = SM_STAT;
+        result.Std_Error = errno;
+        close(fd);
+        return result;
+    }
+
+    u64 map_size = file_status.st_size;
+    char* ptr =
+      mmap(NULL, map_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+
+    if (MAP_FAILED == ptr) {
+        result.Error = SM_MAP;
+        result.Std_Error = errno;
+        close(fd);
+        return result;
+    }
+
+#elif defined(_WIN32)
+
+    HANDLE file = CreateFileA(path,
+                              GENERIC_READ | GENERIC_WRITE,
+                              FILE_SHARE_READ | FILE_SHARE_WRITE,
+                              NULL,
+                              OPEN_EXISTING,
+                              FILE_ATTRIBUTE_NORMAL,
+                              NULL);
+    if (INVALID_HANDLE_VALUE == file) {
+        result.Error = SM_MAP_CREATE;
+        return result;
+    }
+
+    LARGE_INTEGER file_size;
+    GetFileSizeEx(file, &file_size);
+    u64 map_size = file_size.QuadPart;
+
+    HANDLE handle = CreateFileMapping(file, NULL, PAGE_READWRITE, 0, 0, NULL);
+    CloseHandle(file);
+    if (NULL == handle) {
+        result.Error = SM_MAP_CREATE;
+        return result;
+    }
+
+    int fd = _open_osfhandle((intptr_t)handle, 0);
+    if (-1 == fd) {
+        result.Error = SM_HANDLE_TO_FD;
+        return result;
+    }
+
+    char* ptr = MapViewOfFile(handle, FILE_MAP_WRITE, 0, 0, 0);
+
+    if (NULL == ptr) {
+        result.Error = SM_MEMORY_MAPPING;
+        return result;
+    }
+
+#else
+#error "Unknown platform"
+
+#endif
+
+    result.map.file_descriptor = fd;
+    result.map.data = ptr;
+    result.map.name = path;
+    result.map.size = map_size;
     result.Ok = true;
 
     return result;
@@ -102,10 +346,13 @@ shmem_connect(char* name) {
 
     char* ptr = mmap(
       NULL, file_status.st_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    u64 map_size = file_status.st_size;
 
-    if (-1 == *ptr) {
+    // a segment that is still being created has no size yet
+    if (MAP_FAILED == ptr) {
         result.Error = SM_MAP;
         result.Std_Error = errno;
+        close(fd);
         return result;
     }
 
@@ -125,6 +372,7 @@ shmem_connect(char* name) {
     }
 
     char* ptr = MapViewOfFile(handle, FILE_MAP_WRITE, 0, 0, 0);
+    u64 map_size = 0;
 
     if (-1 == *ptr) {
         result.Error = SM_MEMORY_MAPPING;
@@ -139,14 +387,14 @@ shmem_connect(char* name) {
     result.map.file_descriptor = fd;
     result.map.data = ptr;
     result.map.name = name;
+    result.map.size = map_size;
     result.Ok = true;
 
     return result;
 }
 
-// TODO: add error cases
 shmem_result
-shmem_close(shared_mapping* map) {
+shmem_release(shared_mapping* map) {
 
     shmem_result result = { 0 };
 
@@ -170,12 +418,6 @@ shmem_close(shared_mapping* map) {
         return result;
     }
 
-    if (-1 == shm_unlink(map->name)) {
-        result.Error = SM_UNLINK;
-        result.Std_Error = errno;
-        return result;
-    }
-
 #elif defined(_WIN32)
     UnmapViewOfFile(map->data);
     // CloseHandle(map->file_descriptor);
@@ -199,6 +441,81 @@ shmem_close(shared_mapping* map) {
     return result;
 }
 
+// TODO: add error cases
+shmem_result
+shmem_close(shared_mapping* map) {
+
+    shmem_result result = shmem_release(map);
+    if (result.Ok == false) {
+        return result;
+    }
+
+#if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
+    if (-1 == shm_unlink(map->name)) {
+        result.Ok = false;
+        result.Error = SM_UNLINK;
+        result.Std_Error = errno;
+        return result;
+    }
+#endif
+
+    return result;
+}
+
+shmem_result
+shmem_unlink(char* name) {
+    shmem_result result = { 0 };
+
+#if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
+    if (-1 == shm_unlink(name)) {
+        result.Error = SM_UNLINK;
+        result.Std_Error = errno;
+        return result;
+    }
+#elif defined(_WIN32)
+    (void)name;
+    result.Error = SM_UNLINK;
+    return result;
+#else
+#error "Unknown platform"
+#endif
+
+    result.Ok = true;
+    return result;
+}
+
+u64
+shmem_process_id() {
+#if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
+    return (u64)getpid();
+#elif defined(_WIN32)
+    return (u64)GetCurrentProcessId();
+#else
+#error "Unknown platform"
+#endif
+}
+
+bool
+shmem_process_alive(u64 pid) {
+#if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
+    if (0 == kill((pid_t)pid, 0)) {
+        return true;
+    }
+    // EPERM: the process exists but belongs to another user
+    return errno != ESRCH;
+#elif defined(_WIN32)
+    HANDLE process = OpenProcess(SYNCHRONIZE, FALSE, (DWORD)pid);
+    if (NULL == process) {
+        return GetLastError() == ERROR_ACCESS_DENIED;
+    }
+    bool alive = WaitForSingleObject(process, 0) == WAIT_TIMEOUT;
+    CloseHandle(process);
+    return alive;
+#else
+#error "Unknown platform"
+#endif
+}
+
 // TODO: shm_open and close can set errno, handle it!
 // tbResult shmem_exists(char *const map_name, bool *exists) {
 shmem_result
@@ -208,9 +525,11 @@ shmem_exists(char* const map_name, u8* exists) {
 #if defined(__linux__) || defined(__unix__) || defined(__APPLE__)
     fd_t shm_descriptor = shm_open(map_name, O_RDONLY, 0777);
 
-    if (0 <= shm_descriptor) {
-        *exists = 1;
+    if (0 > shm_descriptor) {
+        result.Ok = true;
+        return result;
     }
+    *exists = 1;
 
     if (-1 == close(shm_descriptor)) {
         result.Error = SM_FD_CLOSE;
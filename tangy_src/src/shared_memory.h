@@ -9,6 +9,7 @@
 // typedef HANDLE fd_t;
 #else
 #include <fcntl.h>
+#include <signal.h>
 #include <sys/mman.h>
 #include <sys/stat.h>
 #include <sys/types.h>
@@ -23,8 +24,22 @@ struct shared_mapping {
     fd_t file_descriptor;
     char* name;
     char* data;
+    u64 size;
+    u64 flags;
 };
 
+/// Options for the memory backing a mapping, combined as a bit mask
+typedef enum {
+    SM_DEFAULT = 0,
+    SM_HUGE_PAGES = 1 << 0, ///< back the mapping with transparent huge pages
+    SM_PREFAULT = 1 << 1,   ///< fault in every page when the mapping is made
+    SM_LOCKED = 1 << 2,     ///< lock the mapping in physical memory
+    SM_FILE = 1 << 3,       ///< backed by a regular file that is kept on close
+} shmem_flags;
+
+// size of a huge page, mappings using huge pages are rounded up to a multiple
+#define SM_HUGE_PAGE_SIZE (2 * 1024 * 1024)
+
 
 typedef enum {
     SM_OK,
@@ -39,6 +54,7 @@ typedef enum {
     SM_UNMAP,
     SM_FD_CLOSE,
     SM_UNLINK,
+    SM_HEADER,
 } shmem_error;
 
 
@@ -61,12 +77,47 @@ struct shmem_result {
  * @brief Creates a new shared memory mapping.
  *
  * @param map_size Size of the mapping.
- * @param map Pointer to a shared_mapping structure for storing mapping
- * information.
+ * @param name Name of the mapping.
+ * @param flags Bit mask of shmem_flags, options that can not be applied on
+ * the current platform are ignored. The options that were applied are
+ * returned in map.flags.
+ * @return shmemResult Indicating success or failure.
+ */
+shmem_map_result
+shmem_create(u64 map_size, char* name, u64 flags);
+
+/**
+ * @brief Creates a new mapping of a regular file.
+ *
+ * The contents of the mapping are written back to the file, which persists
+ * after the mapping is closed, and can be larger than physical memory.
+ *
+ * @param map_size Size of the mapping, the file is extended to this size.
+ * @param path Path of the file, which must not exist.
+ * @param flags Bit mask of shmem_flags as for shmem_create, SM_FILE is
+ * always set in map.flags.
  * @return shmemResult Indicating success or failure.
  */
 shmem_map_result
-shmem_create(u64 map_size, char* name);
+shmem_create_file(u64 map_size, char* path, u64 flags);
+
+/**
+ * @brief Maps an existing regular file.
+ *
+ * @param path Path of the file.
+ * @return shmemResult Indicating success or failure.
+ */
+shmem_map_result
+shmem_connect_file(char* path);
+
+/**
+ * @brief Applies the per-process options of a mapping made by another process.
+ *
+ * @param map Mapping returned by shmem_connect.
+ * @param flags Bit mask of shmem_flags applied when the mapping was created.
+ */
+void
+shmem_advise(shared_mapping* map, u64 flags);
 
 /**
  * @brief Creates a new shared memory mapping.
@@ -89,6 +140,46 @@ shmem_connect(char* name);
 shmem_result
 shmem_close(shared_mapping* map);
 
+/**
+ * @brief Unmaps a shared memory mapping without removing it.
+ *
+ * Other processes can continue to use and connect to the mapping.
+ *
+ * @param map Pointer to a shared_mapping structure containing mapping
+ * information.
+ * @return tbResult Indicating success or failure.
+ */
+shmem_result
+shmem_release(shared_mapping* map);
+
+/**
+ * @brief Removes the name of a shared memory mapping.
+ *
+ * Processes that have the mapping open keep using it, a new mapping can then
+ * be created with the same name. Not supported on Windows where a name is
+ * only released once every handle to the mapping is closed.
+ *
+ * @param name Name of the mapping.
+ * @return tbResult Indicating success or failure.
+ */
+shmem_result
+shmem_unlink(char* name);
+
+/**
+ * @brief Identifier of the calling process.
+ */
+u64
+shmem_process_id();
+
+/**
+ * @brief Checks if a process is still running.
+ *
+ * @param pid Process identifier as returned by shmem_process_id.
+ * @return true unless the process is known to have exited.
+ */
+bool
+shmem_process_alive(u64 pid);
+
 /**
  * @brief Checks if a shared memory mapping with a given name exists.
  *
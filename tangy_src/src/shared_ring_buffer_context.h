@@ -1,9 +1,73 @@
 #ifndef __SHARED_RINGBUFFER__
 #define __SHARED_RINGBUFFER__
 
+#include "atomics.h"
 #include "base.h"
+#include "notify.h"
 #include "shared_memory.h"
 
+// maximum number of readers that can hold a pollable file descriptor
+#define SRB_MAX_SUBSCRIBERS 64
+
+// number of processes tracked in the attachment table of the header
+#define SRB_MAX_ATTACHMENTS 16
+// first header slot of the attachment table, each entry is a pair of words
+// {pid, attachments}
+#define SRB_ATTACHMENT_TABLE 13
+// header slot holding the shmem_flags the mapping was created with
+#define SRB_MEMORY_FLAGS (SRB_ATTACHMENT_TABLE + 2 * SRB_MAX_ATTACHMENTS)
+
+// number of named reader cursors that can be registered with a buffer
+#define SRB_MAX_READERS 16
+// maximum length of a reader name including the terminating null
+#define SRB_READER_NAME_LENGTH 24
+// each reader entry is {state, name[3], position, lost}
+#define SRB_READER_WORDS 6
+#define SRB_READER_TABLE (SRB_MEMORY_FLAGS + 1)
+// header slot holding the srb_layout_flags describing the record columns
+#define SRB_LAYOUT (SRB_READER_TABLE + SRB_READER_WORDS * SRB_MAX_READERS)
+// header slot holding the number of positions kept per channel by the channel
+// index, zero if the buffer has no channel index
+#define SRB_CHANNEL_INDEX (SRB_LAYOUT + 1)
+// header slot holding the number of records per block summary, zero if the
+// buffer keeps no block summaries
+#define SRB_BLOCK_SIZE (SRB_CHANNEL_INDEX + 1)
+// header slot holding the capacity of the segment that replaced this one when
+// the buffer was resized, zero while the segment is in use
+#define SRB_RESIZED (SRB_BLOCK_SIZE + 1)
+// header slot holding the absolute index of the oldest record a segment holds
+// before it wraps, non zero when a resize carried over only recent records
+#define SRB_ORIGIN (SRB_RESIZED + 1)
+// header slots identifying a buffer, checked when a buffer file is reopened:
+// magic value, size of the header, buffer format and size of the mapping
+#define SRB_MAGIC (SRB_ORIGIN + 1)
+#define SRB_HEADER_SIZE (SRB_MAGIC + 1)
+#define SRB_FORMAT (SRB_HEADER_SIZE + 1)
+#define SRB_MAP_SIZE (SRB_FORMAT + 1)
+// header slot holding the number of low bits of a packed clocked record that
+// hold the delta, fixed when the buffer is created, see clk_packed_delta_bits
+#define SRB_DELTA_BITS (SRB_MAP_SIZE + 1)
+// header slot holding the bit mask of subscriber slots signalled since they
+// last acknowledged, see srb_signal_subscribers
+#define SRB_SIGNALLED (SRB_DELTA_BITS + 1)
+
+// "TANGYSRB", written once the header of a buffer is complete
+#define SRB_MAGIC_VALUE 0x42525359474e4154ULL
+
+typedef enum {
+    SRB_READER_FREE = 0,
+    SRB_READER_CLAIMED = 1,
+    SRB_READER_ACTIVE = 2,
+} srb_reader_state;
+
+typedef enum {
+    SRB_LAYOUT_DEFAULT = 0,
+    // clocked buffers keep a precomputed arrival time column
+    SRB_LAYOUT_ARRIVAL = 1,
+    // clocked buffers pack clock and delta into a single word per record
+    SRB_LAYOUT_PACKED = 2,
+} srb_layout_flags;
+
 typedef struct shared_ring_buffer shared_ring_buffer;
 struct shared_ring_buffer {
     char* map_ptr;
@@ -23,11 +87,17 @@ struct shared_ring_buffer_context {
     u64 count;
     u64 reference_count;
     u64 channel_count;
+    u64 sequence;
 };
 
 static inline u64
 srb_context_size() {
-    return 9 * sizeof(u64);
+    return (SRB_SIGNALLED + 1) * sizeof(u64);
+}
+
+static inline u64*
+srb_slot(shared_ring_buffer* buffer, u64 index) {
+    return &((u64*)buffer->map_ptr)[index];
 }
 
 static inline u64
@@ -96,24 +166,101 @@ srb_set_capacity(shared_ring_buffer* buffer, u64 capacity) {
     ((u64*)buffer->map_ptr)[5] = capacity;
 }
 
+// count is the publication point of the buffer, every record below count is
+// fully written. It is loaded with acquire and stored with release semantics
+// so that a reader observing a count also observes the records behind it.
 static inline u64
 srb_get_count(shared_ring_buffer* buffer) {
-    return ((u64*)buffer->map_ptr)[6];
+    return tb_load_acquire(srb_slot(buffer, 6));
 }
 
 static inline void
 srb_set_count(shared_ring_buffer* buffer, u64 count) {
-    ((u64*)buffer->map_ptr)[6] = count;
+    tb_store_release(srb_slot(buffer, 6), count);
 }
 
+// reference_count is the total number of attachments from all processes, it
+// is only ever modified atomically
 static inline u64
 srb_get_reference_count(shared_ring_buffer* buffer) {
-    return ((u64*)buffer->map_ptr)[7];
+    return tb_load_acquire(srb_slot(buffer, 7));
 }
 
 static inline void
 srb_set_reference_count(shared_ring_buffer* buffer, u64 reference_count) {
-    ((u64*)buffer->map_ptr)[7] = reference_count;
+    tb_store_release(srb_slot(buffer, 7), reference_count);
+}
+
+static inline u64
+srb_get_memory_flags(shared_ring_buffer* buffer) {
+    return ((u64*)buffer->map_ptr)[SRB_MEMORY_FLAGS];
+}
+
+static inline void
+srb_set_memory_flags(shared_ring_buffer* buffer, u64 flags) {
+    ((u64*)buffer->map_ptr)[SRB_MEMORY_FLAGS] = flags;
+}
+
+static inline u64
+srb_get_layout(shared_ring_buffer* buffer) {
+    return ((u64*)buffer->map_ptr)[SRB_LAYOUT];
+}
+
+static inline void
+srb_set_layout(shared_ring_buffer* buffer, u64 layout) {
+    ((u64*)buffer->map_ptr)[SRB_LAYOUT] = layout;
+}
+
+static inline u64
+srb_get_delta_bits(shared_ring_buffer* buffer) {
+    return *srb_slot(buffer, SRB_DELTA_BITS);
+}
+
+static inline void
+srb_set_delta_bits(shared_ring_buffer* buffer, u64 delta_bits) {
+    *srb_slot(buffer, SRB_DELTA_BITS) = delta_bits;
+}
+
+static inline u64
+srb_get_channel_index(shared_ring_buffer* buffer) {
+    return ((u64*)buffer->map_ptr)[SRB_CHANNEL_INDEX];
+}
+
+static inline void
+srb_set_channel_index(shared_ring_buffer* buffer, u64 positions) {
+    ((u64*)buffer->map_ptr)[SRB_CHANNEL_INDEX] = positions;
+}
+
+static inline u64
+srb_get_block_size(shared_ring_buffer* buffer) {
+    return ((u64*)buffer->map_ptr)[SRB_BLOCK_SIZE];
+}
+
+static inline void
+srb_set_block_size(shared_ring_buffer* buffer, u64 block_size) {
+    ((u64*)buffer->map_ptr)[SRB_BLOCK_SIZE] = block_size;
+}
+
+// non zero once the buffer has moved to a new segment of the same name, the
+// new segment is fully written before this is set
+static inline u64
+srb_get_resized(shared_ring_buffer* buffer) {
+    return tb_load_acquire(srb_slot(buffer, SRB_RESIZED));
+}
+
+static inline void
+srb_set_resized(shared_ring_buffer* buffer, u64 capacity) {
+    tb_store_release(srb_slot(buffer, SRB_RESIZED), capacity);
+}
+
+static inline u64
+srb_get_origin(shared_ring_buffer* buffer) {
+    return tb_load_relaxed(srb_slot(buffer, SRB_ORIGIN));
+}
+
+static inline void
+srb_set_origin(shared_ring_buffer* buffer, u64 origin) {
+    tb_store_relaxed(srb_slot(buffer, SRB_ORIGIN), origin);
 }
 
 static inline u64
@@ -126,18 +273,625 @@ srb_set_channel_count(shared_ring_buffer* buffer, u64 channel_count) {
     ((u64*)buffer->map_ptr)[8] = channel_count;
 }
 
+static inline u64
+srb_get_format(shared_ring_buffer* buffer) {
+    return *srb_slot(buffer, SRB_FORMAT);
+}
+
 static inline void
-srb_reference_count_increment(shared_ring_buffer* buffer) {
-    u64 rc = srb_get_reference_count(buffer);
-    srb_set_reference_count(buffer, rc + 1);
+srb_set_format(shared_ring_buffer* buffer, u64 format) {
+    *srb_slot(buffer, SRB_FORMAT) = format;
+}
+
+///
+/// @brief mark the header as complete, must be called once every other field
+/// of the header has been set
+///
+static inline void
+srb_seal(shared_ring_buffer* buffer) {
+    *srb_slot(buffer, SRB_HEADER_SIZE) = srb_context_size();
+    *srb_slot(buffer, SRB_MAP_SIZE) = buffer->length_bytes;
+    tb_store_release(srb_slot(buffer, SRB_MAGIC), SRB_MAGIC_VALUE);
+}
+
+///
+/// @brief check the header of a mapping of map_size bytes describes a buffer
+/// that fits in the mapping
+///
+static inline bool
+srb_header_valid(shared_ring_buffer* buffer, u64 map_size) {
+    if (map_size < srb_context_size()) {
+        return false;
+    }
+    return (tb_load_acquire(srb_slot(buffer, SRB_MAGIC)) == SRB_MAGIC_VALUE) &&
+           (*srb_slot(buffer, SRB_HEADER_SIZE) == srb_context_size()) &&
+           (*srb_slot(buffer, SRB_MAP_SIZE) <= map_size) &&
+           (srb_get_capacity(buffer) > 0) &&
+           (srb_get_channel_count(buffer) <= 256);
+}
+
+// sequence is the number of records the writer has claimed, it is always
+// greater than or equal to count. Records with an index below
+// (sequence - capacity) may be in the process of being overwritten.
+static inline u64
+srb_get_sequence(shared_ring_buffer* buffer) {
+    return tb_load_acquire(srb_slot(buffer, 9));
+}
+
+static inline void
+srb_set_sequence(shared_ring_buffer* buffer, u64 sequence) {
+    tb_store_relaxed(srb_slot(buffer, 9), sequence);
+}
+
+///
+/// @brief announce that records [count, count + n) are about to be written
+///
+/// Must be called by the writer before it stores any record. The release fence
+/// orders the claim before the record stores, a reader that sees any of the new
+/// records will therefore also see the claim when it validates its range with
+/// srb_valid_from.
+///
+/// @param[in] buffer
+/// @param[in] n maximum number of records that will be written
+/// @return current count, the absolute index of the first record to write
+///
+static inline u64
+srb_write_begin(shared_ring_buffer* buffer, u64 n) {
+    u64 count = srb_get_count(buffer);
+    u64 claimed = count + n;
+    if (claimed > srb_get_sequence(buffer)) {
+        srb_set_sequence(buffer, claimed);
+    }
+    tb_fence_release();
+    return count;
+}
+
+// notify is a 32 bit word (futexes are 32 bits wide) incremented every time
+// new records are published, waiters sleep until it changes
+static inline u32*
+srb_notify_word(shared_ring_buffer* buffer) {
+    return (u32*)srb_slot(buffer, 10);
+}
+
+static inline u64
+srb_get_waiters(shared_ring_buffer* buffer) {
+    return tb_load_relaxed(srb_slot(buffer, 11));
+}
+
+// bit mask of subscriber slots with a FIFO registered, see srb_subscribe
+static inline u64
+srb_get_subscribers(shared_ring_buffer* buffer) {
+    return tb_load_relaxed(srb_slot(buffer, 12));
+}
+
+static inline void
+srb_subscriber_path(shared_ring_buffer* buffer,
+                    u32 slot,
+                    char* path,
+                    u64 length) {
+    tb_fifo_path(buffer->name, slot, path, length);
+}
+
+///
+/// @brief signal the FIFO of every subscriber that has acknowledged
+///
+/// A FIFO that was signalled and not acknowledged since still holds a byte
+/// and stays readable, so only the first publish after an acknowledgement
+/// opens it and writes. Busy writers then do not open every FIFO on every
+/// publish.
+///
+static inline void
+srb_signal_subscribers(shared_ring_buffer* buffer, u64 subscribers) {
+    subscribers &= ~tb_fetch_or(srb_slot(buffer, SRB_SIGNALLED), subscribers);
+    if (subscribers == 0) {
+        return;
+    }
+
+    char path[512];
+    for (u32 slot = 0; slot < SRB_MAX_SUBSCRIBERS; slot++) {
+        u64 bit = (u64)1 << slot;
+        if ((subscribers & bit) == 0) {
+            continue;
+        }
+        srb_subscriber_path(buffer, slot, path, sizeof(path));
+        if (false == tb_fifo_signal(path)) {
+            // the subscriber exited without unsubscribing, remove the FIFO
+            // before releasing the slot so a new subscriber's FIFO is kept
+            tb_fifo_remove(path);
+            tb_fetch_and(srb_slot(buffer, 12), ~bit);
+            tb_fetch_and(srb_slot(buffer, SRB_SIGNALLED), ~bit);
+        }
+    }
 }
 
+///
+/// @brief wake every reader waiting for new records
+///
 static inline void
+srb_notify(shared_ring_buffer* buffer) {
+    u32* word = srb_notify_word(buffer);
+    tb_fetch_add_u32(word, 1);
+    // orders the count and notify updates before the load of waiters, pairs
+    // with the fence in srb_wait_for so that either the waiter sees the new
+    // count or the writer sees the waiter
+    tb_fence_full();
+    if (srb_get_waiters(buffer) > 0) {
+        tb_wake_address(word);
+    }
+
+    u64 subscribers = srb_get_subscribers(buffer);
+    if (subscribers != 0) {
+        srb_signal_subscribers(buffer, subscribers);
+    }
+}
+
+///
+/// @brief publish records written since srb_write_begin
+///
+/// @param[in] buffer
+/// @param[in] count new total number of records written to the buffer
+///
+static inline void
+srb_write_end(shared_ring_buffer* buffer, u64 count) {
+    // slots claimed by srb_write_begin but not written were never modified, so
+    // the claim can be lowered to the number of records actually written
+    srb_set_sequence(buffer, count);
+    srb_set_count(buffer, count);
+    srb_notify(buffer);
+}
+
+///
+/// @brief block until the buffer holds at least target records
+///
+/// @param[in] buffer
+/// @param[in] target count to wait for
+/// @param[in] timeout maximum time to wait in seconds, negative for no limit
+/// @return count when returning, less than target if the wait timed out or
+/// the buffer was resized
+///
+static inline u64
+srb_wait_for(shared_ring_buffer* buffer, u64 target, f64 timeout) {
+    f64 deadline = -1;
+    if (timeout >= 0) {
+        deadline = tb_monotonic_time() + timeout;
+    }
+
+    u32* word = srb_notify_word(buffer);
+    u64* waiters = srb_slot(buffer, 11);
+
+    while (true) {
+        u32 epoch = tb_load_acquire_u32(word);
+        u64 count = srb_get_count(buffer);
+        if ((count >= target) || (srb_get_resized(buffer) != 0)) {
+            // records are no longer published to a resized segment
+            return count;
+        }
+
+        f64 remaining = -1;
+        if (deadline >= 0) {
+            remaining = deadline - tb_monotonic_time();
+            if (remaining <= 0) {
+                return count;
+            }
+        }
+
+        tb_fetch_add(waiters, 1);
+        tb_fence_full();
+        if (srb_get_count(buffer) < target) {
+            tb_wait_on_address(word, epoch, remaining);
+        }
+        tb_fetch_sub(waiters, 1);
+    }
+}
+
+///
+/// @brief register a FIFO that is signalled whenever records are published
+///
+/// @param[in] buffer
+/// @param[out] slot subscriber slot to pass to srb_unsubscribe
+/// @return read end of the FIFO or -1 if no slot is free or the FIFO could
+/// not be created
+///
+static inline int
+srb_subscribe(shared_ring_buffer* buffer, u32* slot) {
+    u64* subscribers = srb_slot(buffer, 12);
+    u64 mask = tb_load_relaxed(subscribers);
+
+    u32 free_slot = SRB_MAX_SUBSCRIBERS;
+    while (true) {
+        for (free_slot = 0; free_slot < SRB_MAX_SUBSCRIBERS; free_slot++) {
+            if ((mask & ((u64)1 << free_slot)) == 0) {
+                break;
+            }
+        }
+        if (free_slot == SRB_MAX_SUBSCRIBERS) {
+            return -1;
+        }
+        if (tb_compare_exchange(
+              subscribers, &mask, mask | ((u64)1 << free_slot))) {
+            break;
+        }
+    }
+
+    char path[512];
+    srb_subscriber_path(buffer, free_slot, path, sizeof(path));
+    int fd = tb_fifo_open(path);
+    if (fd == -1) {
+        tb_fetch_and(subscribers, ~((u64)1 << free_slot));
+        return -1;
+    }
+    // a previous subscriber of the slot may have left it signalled
+    tb_fetch_and(srb_slot(buffer, SRB_SIGNALLED), ~((u64)1 << free_slot));
+
+    *slot = free_slot;
+    return fd;
+}
+
+static inline void
+srb_unsubscribe(shared_ring_buffer* buffer, u32 slot, int fd) {
+    char path[512];
+    srb_subscriber_path(buffer, slot, path, sizeof(path));
+    tb_fetch_and(srb_slot(buffer, 12), ~((u64)1 << slot));
+    tb_fetch_and(srb_slot(buffer, SRB_SIGNALLED), ~((u64)1 << slot));
+    tb_fifo_close(path, fd);
+}
+
+///
+/// @brief clear the FIFO of a subscriber and have the next publish signal it
+///
+/// The slot is marked as acknowledged before the FIFO is drained, records
+/// published in between either leave a byte in the FIFO or are published
+/// before the subscriber reads the count.
+///
+static inline void
+srb_acknowledge(shared_ring_buffer* buffer, u32 slot, int fd) {
+    tb_fetch_and(srb_slot(buffer, SRB_SIGNALLED), ~((u64)1 << slot));
+    tb_fifo_drain(fd);
+}
+
+///
+/// @brief first absolute index that has not been (and is not being) overwritten
+///
+/// Readers call this after they have finished reading records, any record with
+/// an index below the returned value may have been modified during the read.
+///
+/// @param[in] buffer
+/// @return absolute index of the oldest intact record
+///
+static inline u64
+srb_valid_from(shared_ring_buffer* buffer) {
+    tb_fence_acquire();
+    u64 sequence = srb_get_sequence(buffer);
+    u64 capacity = srb_get_capacity(buffer);
+    u64 origin = srb_get_origin(buffer);
+    u64 oldest = sequence > capacity ? sequence - capacity : 0;
+    return oldest > origin ? oldest : origin;
+}
+
+///
+/// @brief check a range starting at start was not overwritten while reading
+///
+static inline bool
+srb_range_intact(shared_ring_buffer* buffer, u64 start) {
+    return start >= srb_valid_from(buffer);
+}
+
+static inline void
+srb_reference_count_increment(shared_ring_buffer* buffer) {
+    tb_fetch_add(srb_slot(buffer, 7), 1);
+}
+
+///
+/// @brief atomically subtract n from a counter without going below zero
+///
+/// @return value of the counter after the subtraction
+///
+static inline u64
+srb_counter_sub(u64* counter, u64 n) {
+    u64 current = tb_load_relaxed(counter);
+    u64 next = 0;
+    do {
+        next = current > n ? current - n : 0;
+    } while (false == tb_compare_exchange(counter, &current, next));
+    return next;
+}
+
+static inline u64
 srb_reference_count_decrement(shared_ring_buffer* buffer) {
-    u64 rc = srb_get_reference_count(buffer);
-    if (rc > 0) {
-        srb_set_reference_count(buffer, rc - 1);
+    return srb_counter_sub(srb_slot(buffer, 7), 1);
+}
+
+static inline u64*
+srb_attachment_pid(shared_ring_buffer* buffer, u64 index) {
+    return srb_slot(buffer, SRB_ATTACHMENT_TABLE + (2 * index));
+}
+
+static inline u64*
+srb_attachment_count(shared_ring_buffer* buffer, u64 index) {
+    return srb_slot(buffer, SRB_ATTACHMENT_TABLE + (2 * index) + 1);
+}
+
+///
+/// @brief remove the attachments of processes that exited without detaching
+///
+/// @param[in] buffer
+/// @return number of attachments removed
+///
+static inline u64
+srb_reap(shared_ring_buffer* buffer) {
+    u64 self = shmem_process_id();
+    u64 reaped = 0;
+
+    for (u64 i = 0; i < SRB_MAX_ATTACHMENTS; i++) {
+        u64 pid = tb_load_acquire(srb_attachment_pid(buffer, i));
+        if ((pid == 0) || (pid == self) || shmem_process_alive(pid)) {
+            continue;
+        }
+
+        // only one reaper can take the count of a dead process
+        u64 attachments = tb_fetch_and(srb_attachment_count(buffer, i), 0);
+        tb_compare_exchange(srb_attachment_pid(buffer, i), &pid, 0);
+
+        srb_counter_sub(srb_slot(buffer, 7), attachments);
+        reaped += attachments;
+    }
+    return reaped;
+}
+
+///
+/// @brief record an attachment of the calling process to the buffer
+///
+/// If the attachment table is full the attachment is still counted but can
+/// not be reaped if the process exits without calling srb_detach.
+///
+static inline void
+srb_attach(shared_ring_buffer* buffer) {
+    u64 self = shmem_process_id();
+
+    srb_reap(buffer);
+    srb_reference_count_increment(buffer);
+
+    for (u64 i = 0; i < SRB_MAX_ATTACHMENTS; i++) {
+        if (tb_load_acquire(srb_attachment_pid(buffer, i)) == self) {
+            tb_fetch_add(srb_attachment_count(buffer, i), 1);
+            return;
+        }
+    }
+
+    for (u64 i = 0; i < SRB_MAX_ATTACHMENTS; i++) {
+        u64 expected = 0;
+        if (tb_compare_exchange(srb_attachment_pid(buffer, i), &expected, self)) {
+            tb_fetch_add(srb_attachment_count(buffer, i), 1);
+            return;
+        }
+    }
+}
+
+///
+/// @brief remove an attachment of the calling process from the buffer
+///
+/// @return number of attachments remaining from all processes
+///
+static inline u64
+srb_detach(shared_ring_buffer* buffer) {
+    u64 self = shmem_process_id();
+
+    for (u64 i = 0; i < SRB_MAX_ATTACHMENTS; i++) {
+        if ((tb_load_acquire(srb_attachment_pid(buffer, i)) == self) &&
+            (tb_load_acquire(srb_attachment_count(buffer, i)) > 0)) {
+            srb_counter_sub(srb_attachment_count(buffer, i), 1);
+            break;
+        }
+    }
+
+    return srb_reference_count_decrement(buffer);
+}
+
+static inline u64*
+srb_reader_entry(shared_ring_buffer* buffer, u64 index) {
+    return srb_slot(buffer, SRB_READER_TABLE + (SRB_READER_WORDS * index));
+}
+
+static inline char*
+srb_reader_name(shared_ring_buffer* buffer, u64 index) {
+    return (char*)(srb_reader_entry(buffer, index) + 1);
+}
+
+// next record the reader will consume
+static inline u64
+srb_reader_position(shared_ring_buffer* buffer, u64 index) {
+    return tb_load_acquire(srb_reader_entry(buffer, index) + 4);
+}
+
+// number of records overwritten before the reader consumed them
+static inline u64
+srb_reader_lost(shared_ring_buffer* buffer, u64 index) {
+    return tb_load_acquire(srb_reader_entry(buffer, index) + 5);
+}
+
+static inline bool
+srb_reader_active(shared_ring_buffer* buffer, u64 index) {
+    return tb_load_acquire(srb_reader_entry(buffer, index)) ==
+           SRB_READER_ACTIVE;
+}
+
+///
+/// @brief find a registered reader by name
+///
+/// @return index of the reader or -1 if no reader has that name
+///
+static inline i64
+srb_reader_find(shared_ring_buffer* buffer, const char* name) {
+    for (u64 i = 0; i < SRB_MAX_READERS; i++) {
+        if (srb_reader_active(buffer, i) &&
+            (0 == strncmp(srb_reader_name(buffer, i),
+                          name,
+                          SRB_READER_NAME_LENGTH - 1))) {
+            return (i64)i;
+        }
+    }
+    return -1;
+}
+
+///
+/// @brief register a named reader, or find it if it already exists
+///
+/// A reader keeps its position after the process using it exits, registering
+/// the same name again resumes from where the previous reader stopped.
+///
+/// @param[in] buffer
+/// @param[in] name identifier of the reader, truncated to
+/// SRB_READER_NAME_LENGTH - 1 characters
+/// @param[in] position first record to consume for a new reader
+/// @return index of the reader or -1 if the table is full
+///
+static inline i64
+srb_reader_register(shared_ring_buffer* buffer,
+                    const char* name,
+                    u64 position) {
+    i64 index = srb_reader_find(buffer, name);
+    if (index >= 0) {
+        return index;
+    }
+
+    for (u64 i = 0; i < SRB_MAX_READERS; i++) {
+        u64* entry = srb_reader_entry(buffer, i);
+        u64 expected = SRB_READER_FREE;
+        if (false == tb_compare_exchange(entry, &expected, SRB_READER_CLAIMED)) {
+            continue;
+        }
+
+        char* entry_name = srb_reader_name(buffer, i);
+        memset(entry_name, 0, SRB_READER_NAME_LENGTH);
+        strncpy(entry_name, name, SRB_READER_NAME_LENGTH - 1);
+        tb_store_relaxed(entry + 4, position);
+        tb_store_relaxed(entry + 5, 0);
+        tb_store_release(entry, SRB_READER_ACTIVE);
+        return (i64)i;
+    }
+    return -1;
+}
+
+static inline void
+srb_reader_unregister(shared_ring_buffer* buffer, u64 index) {
+    tb_store_release(srb_reader_entry(buffer, index), SRB_READER_FREE);
+}
+
+///
+/// @brief find the next contiguous batch of records for a reader
+///
+/// Records that were overwritten before the reader got to them are skipped and
+/// added to the reader's lost count. The batch never wraps around the end of
+/// the ring so it can be accessed in place. The reader's position is not
+/// advanced, see srb_reader_commit.
+///
+/// @param[in] buffer
+/// @param[in] index reader index
+/// @param[in] max_n maximum number of records in the batch
+/// @param[out] start absolute index of the first record of the batch
+/// @return number of records in the batch
+///
+static inline u64
+srb_reader_next(shared_ring_buffer* buffer, u64 index, u64 max_n, u64* start) {
+    u64* entry = srb_reader_entry(buffer, index);
+    u64 position = srb_reader_position(buffer, index);
+    u64 count = srb_get_count(buffer);
+    u64 valid_from = srb_valid_from(buffer);
+
+    if (position < valid_from) {
+        tb_fetch_add(entry + 5, valid_from - position);
+        tb_store_release(entry + 4, valid_from);
+        position = valid_from;
+    }
+
+    *start = position;
+    if (position >= count) {
+        return 0;
+    }
+
+    u64 capacity = srb_get_capacity(buffer);
+    u64 n = count - position;
+    u64 until_wrap = capacity - (position % capacity);
+    if (n > until_wrap) {
+        n = until_wrap;
+    }
+    if (n > max_n) {
+        n = max_n;
+    }
+    return n;
+}
+
+///
+/// @brief mark a batch returned by srb_reader_next as consumed
+///
+/// Batches are accessed in place, if the writer overwrote part of the batch
+/// while it was in use the overwritten records are added to the lost count.
+///
+/// @param[in] buffer
+/// @param[in] index reader index
+/// @param[in] start absolute index of the first record of the batch
+/// @param[in] stop absolute index one past the last record of the batch
+/// @return true if the whole batch was intact when it was committed
+///
+static inline bool
+srb_reader_commit(shared_ring_buffer* buffer, u64 index, u64 start, u64 stop) {
+    u64* entry = srb_reader_entry(buffer, index);
+    u64 valid_from = srb_valid_from(buffer);
+
+    bool intact = start >= valid_from;
+    if (false == intact) {
+        u64 end = valid_from < stop ? valid_from : stop;
+        tb_fetch_add(entry + 5, end - start);
+    }
+
+    if (stop > tb_load_relaxed(entry + 4)) {
+        tb_store_release(entry + 4, stop);
+    }
+    return intact;
+}
+
+///
+/// @brief reader that has consumed the fewest records
+///
+/// @return index of the reader or -1 if no readers are registered
+///
+static inline i64
+srb_reader_slowest(shared_ring_buffer* buffer) {
+    i64 slowest = -1;
+    u64 slowest_position = 0;
+    for (u64 i = 0; i < SRB_MAX_READERS; i++) {
+        if (false == srb_reader_active(buffer, i)) {
+            continue;
+        }
+        u64 position = srb_reader_position(buffer, i);
+        if ((slowest < 0) || (position < slowest_position)) {
+            slowest = (i64)i;
+            slowest_position = position;
+        }
     }
+    return slowest;
+}
+
+///
+/// @brief copy the readers and subscribers of a buffer to its replacement
+///
+/// @param[in] from segment being replaced
+/// @param[in] to new segment of the buffer
+///
+static inline void
+srb_copy_clients(shared_ring_buffer* from, shared_ring_buffer* to) {
+    for (u64 i = 0; i < SRB_MAX_READERS; i++) {
+        if (false == srb_reader_active(from, i)) {
+            continue;
+        }
+        u64* entry = srb_reader_entry(to, i);
+        memcpy(entry,
+               srb_reader_entry(from, i),
+               SRB_READER_WORDS * sizeof(u64));
+        tb_store_release(entry, SRB_READER_ACTIVE);
+    }
+    // subscriber FIFOs are named after the buffer, so keep being signalled
+    tb_store_relaxed(srb_slot(to, 12), srb_get_subscribers(from));
 }
 
 static inline shmem_result
@@ -149,10 +903,16 @@ srb_init(const u64 length_bytes,
          u64 capacity,
          u64 count,
          u64 channel_count,
+         u64 memory_flags,
          shared_ring_buffer* buffer) {
 
     shmem_result result = { 0 };
-    shmem_map_result map_result = shmem_create(length_bytes, name);
+    shmem_map_result map_result;
+    if (memory_flags & SM_FILE) {
+        map_result = shmem_create_file(length_bytes, name, memory_flags);
+    } else {
+        map_result = shmem_create(length_bytes, name, memory_flags);
+    }
 
     if (false == map_result.Ok) {
         result.Ok = map_result.Ok;
@@ -175,8 +935,11 @@ srb_init(const u64 length_bytes,
     srb_set_conversion_factor(buffer, conversion_factor);
     srb_set_capacity(buffer, capacity);
     srb_set_count(buffer, count);
-    srb_set_reference_count(buffer, 1);
+    srb_set_sequence(buffer, count);
+    srb_set_reference_count(buffer, 0);
     srb_set_channel_count(buffer, channel_count);
+    srb_set_memory_flags(buffer, map.flags);
+    srb_attach(buffer);
 
     result.Ok = true;
 
@@ -190,20 +953,33 @@ srb_deinit(shared_ring_buffer* buffer) {
                            .data = buffer->map_ptr };
     u8 exists = 0;
     shmem_result result = { 0 };
+
+    // buffer files are kept for the next process to open them
+    if (srb_get_memory_flags(buffer) & SM_FILE) {
+        srb_detach(buffer);
+        result = shmem_release(&map);
+        if (result.Ok == true) {
+            free((char*)map.name);
+        }
+        return result;
+    }
+
     result = shmem_exists(buffer->name, &exists);
 
     if (result.Ok == false) {
         return result;
     }
 
-    srb_reference_count_decrement(buffer);
-
-    u64 reference_count = srb_get_reference_count(buffer);
-    if ((exists == 1) & (reference_count <= 0)) {
+    // the name of a resized segment belongs to its replacement
+    bool resized = srb_get_resized(buffer) != 0;
+    u64 reference_count = srb_detach(buffer);
+    if ((exists == 1) & (reference_count <= 0) & (resized == false)) {
         result = shmem_close(&map);
-        if (result.Ok == false) {
-            return result;
-        }
+    } else {
+        result = shmem_release(&map);
+    }
+    if (result.Ok == false) {
+        return result;
     }
     free((char*)map.name);
     result.Ok = true;
@@ -235,14 +1011,112 @@ srb_connect(char* name,
     shared_mapping map = map_result.map;
 
     buffer->map_ptr = map.data;
+    buffer->length_bytes = map.size;
     buffer->file_descriptor = map.file_descriptor;
     buffer->name = map.name;
 
+    shmem_advise(&map, srb_get_memory_flags(buffer));
+
     result.Ok = true;
-    srb_reference_count_increment(buffer);
+    srb_attach(buffer);
+    return result;
+}
+
+///
+/// @brief stop using a segment that has been replaced by a resize
+///
+/// The segment stays mapped, arrays viewing its records remain readable,
+/// until srb_release_retired is called.
+///
+static inline void
+srb_retire(shared_ring_buffer* buffer) {
+    srb_detach(buffer);
+}
+
+static inline shmem_result
+srb_release_retired(shared_ring_buffer* buffer) {
+    shared_mapping map = { .file_descriptor = buffer->file_descriptor,
+                           .name = buffer->name,
+                           .data = buffer->map_ptr };
+    shmem_result result = shmem_release(&map);
+    if (result.Ok == false) {
+        return result;
+    }
+    free((char*)map.name);
     return result;
 }
 
+///
+/// @brief map an existing buffer file
+///
+/// @param[in] path of the file, owned by buffer once mapped
+/// @param[out] buffer
+/// @return ok or error, SM_HEADER if the file does not hold a buffer
+///
+static inline shmem_result
+srb_open_file(char* path, shared_ring_buffer* buffer) {
+    shmem_result result = { 0 };
+
+    shmem_map_result map_result = shmem_connect_file(path);
+    if (map_result.Ok == false) {
+        result.Error = map_result.Error;
+        result.Std_Error = map_result.Std_Error;
+        return result;
+    }
+
+    shared_mapping map = map_result.map;
+    buffer->map_ptr = map.data;
+    buffer->length_bytes = map.size;
+    buffer->file_descriptor = map.file_descriptor;
+    buffer->name = map.name;
+
+    if (false == srb_header_valid(buffer, map.size)) {
+        shmem_release(&map);
+        buffer->map_ptr = NULL;
+        buffer->name = NULL;
+        result.Error = SM_HEADER;
+        return result;
+    }
+
+    shmem_advise(&map, srb_get_memory_flags(buffer));
+    srb_attach(buffer);
+    result.Ok = true;
+    return result;
+}
+
+///
+/// @brief reap dead attachments of a buffer and remove it if it is orphaned
+///
+/// @param[in] name full name of the shared memory segment
+/// @param[out] remaining attachments left after reaping, the segment has been
+/// removed if this is zero
+///
+static inline shmem_result
+srb_reap_segment(char* name, u64* remaining) {
+    shmem_result result = { 0 };
+
+    shmem_map_result map_result = shmem_connect(name);
+    if (map_result.Ok == false) {
+        result.Error = map_result.Error;
+        result.Std_Error = map_result.Std_Error;
+        return result;
+    }
+
+    shared_mapping map = map_result.map;
+    shared_ring_buffer buffer = { 0 };
+    buffer.map_ptr = map.data;
+    buffer.file_descriptor = map.file_descriptor;
+    buffer.name = map.name;
+
+    srb_reap(&buffer);
+    *remaining = srb_get_reference_count(&buffer);
+
+    if (*remaining == 0) {
+        return shmem_close(&map);
+    }
+    return shmem_release(&map);
+}
+
 static inline void
 srb_set_context(shared_ring_buffer* buffer,
                 f64 resolution,
@@ -273,6 +1147,7 @@ srb_get_context(shared_ring_buffer* buffer,
     context->count = srb_get_count(buffer);
     context->reference_count = srb_get_reference_count(buffer);
     context->channel_count = srb_get_channel_count(buffer);
+    context->sequence = srb_get_sequence(buffer);
 }
 
 #endif
@@ -0,0 +1,161 @@
+#ifndef __SPARSE_HISTOGRAM__
+#define __SPARSE_HISTOGRAM__
+
+#include "base.h"
+
+/**
+ * @file sparse_histogram.h
+ * @brief Histogram that only holds the bins it has counted into
+ *
+ * An open addressing hash map from bin to count with linear probing. Bins are
+ * stored plus one so that zero marks an empty slot, the table doubles when
+ * it is half full. Memory scales with the occupied bins rather than with the
+ * number of bins, for histograms far wider than the events they hold such as
+ * a joint delay histogram at fine resolution.
+ */
+
+// slots of a new histogram, 2^SPARSE_HISTOGRAM_BITS
+#define SPARSE_HISTOGRAM_BITS 10
+
+typedef struct sparse_histogram sparse_histogram;
+struct sparse_histogram {
+    u64 length;   /**< occupied bins */
+    u64 capacity; /**< slots, a power of two */
+    u64 bits;     /**< log2 of capacity */
+    u64* keys;    /**< bin plus one of each slot, 0 if empty */
+    u64* counts;  /**< count of each slot */
+};
+
+static inline u64
+sparse_histogram_slot(u64 key, u64 bits) {
+    // Fibonacci hashing spreads runs of neighbouring bins over the table
+    return (key * 0x9E3779B97F4A7C15ull) >> (64 - bits);
+}
+
+static inline void
+sparse_histogram_init(sparse_histogram* histogram, u64 capacity) {
+    u64 bits = SPARSE_HISTOGRAM_BITS;
+    while (((u64)1 << bits) < capacity) {
+        bits += 1;
+    }
+    u64 slots = (u64)1 << bits;
+    histogram->length = 0;
+    histogram->capacity = slots;
+    histogram->bits = bits;
+    histogram->keys = (u64*)calloc(slots, sizeof(u64));
+    histogram->counts = (u64*)calloc(slots, sizeof(u64));
+}
+
+static inline void
+sparse_histogram_deinit(sparse_histogram* histogram) {
+    free(histogram->keys);
+    free(histogram->counts);
+    histogram->keys = NULL;
+    histogram->counts = NULL;
+    histogram->length = 0;
+    histogram->capacity = 0;
+    histogram->bits = 0;
+}
+
+static inline void
+sparse_histogram_clear(sparse_histogram* histogram) {
+    memset(histogram->keys, 0, histogram->capacity * sizeof(u64));
+    memset(histogram->counts, 0, histogram->capacity * sizeof(u64));
+    histogram->length = 0;
+}
+
+static inline void
+sparse_histogram_insert(sparse_histogram* histogram, u64 key, u64 count) {
+    u64 mask = histogram->capacity - 1;
+    u64 slot = sparse_histogram_slot(key, histogram->bits);
+    while ((histogram->keys[slot] != 0) && (histogram->keys[slot] != key)) {
+        slot = (slot + 1) & mask;
+    }
+    if (histogram->keys[slot] == 0) {
+        histogram->keys[slot] = key;
+        histogram->length += 1;
+    }
+    histogram->counts[slot] += count;
+}
+
+static inline void
+sparse_histogram_grow(sparse_histogram* histogram) {
+    u64 capacity = histogram->capacity;
+    u64* keys = histogram->keys;
+    u64* counts = histogram->counts;
+
+    histogram->length = 0;
+    histogram->capacity = capacity * 2;
+    histogram->bits += 1;
+    histogram->keys = (u64*)calloc(histogram->capacity, sizeof(u64));
+    histogram->counts = (u64*)calloc(histogram->capacity, sizeof(u64));
+    for (u64 i = 0; i < capacity; i++) {
+        if (keys[i] != 0) {
+            sparse_histogram_insert(histogram, keys[i], counts[i]);
+        }
+    }
+    free(keys);
+    free(counts);
+}
+
+///
+/// @brief count one event into a bin
+///
+static inline void
+sparse_histogram_add(sparse_histogram* histogram, u64 bin) {
+    if (2 * (histogram->length + 1) > histogram->capacity) {
+        sparse_histogram_grow(histogram);
+    }
+    sparse_histogram_insert(histogram, bin + 1, 1);
+}
+
+///
+/// @brief add the counts of every bin of from into histogram
+///
+static inline void
+sparse_histogram_merge(sparse_histogram* histogram,
+                       const sparse_histogram* from) {
+    for (u64 i = 0; i < from->capacity; i++) {
+        if (from->keys[i] == 0) {
+            continue;
+        }
+        if (2 * (histogram->length + 1) > histogram->capacity) {
+            sparse_histogram_grow(histogram);
+        }
+        sparse_histogram_insert(histogram, from->keys[i], from->counts[i]);
+    }
+}
+
+///
+/// @brief add the counts of every bin of histogram into a dense histogram
+///
+static inline void
+sparse_histogram_add_to(const sparse_histogram* histogram, u64* dense) {
+    for (u64 i = 0; i < histogram->capacity; i++) {
+        if (histogram->keys[i] != 0) {
+            dense[histogram->keys[i] - 1] += histogram->counts[i];
+        }
+    }
+}
+
+///
+/// @brief copy the occupied bins and their counts out, in no particular order
+///
+/// @param[out] bins of length histogram->length
+/// @param[out] counts of length histogram->length
+///
+static inline void
+sparse_histogram_export(const sparse_histogram* histogram,
+                        u64* bins,
+                        u64* counts) {
+    u64 n = 0;
+    for (u64 i = 0; i < histogram->capacity; i++) {
+        if (histogram->keys[i] != 0) {
+            bins[n] = histogram->keys[i] - 1;
+            counts[n] = histogram->counts[i];
+            n += 1;
+        }
+    }
+}
+
+#endif
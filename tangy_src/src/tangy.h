@@ -2,6 +2,7 @@
 #define __TANGY__
 
 #include "base.h"
+#include "buffer_registry.h"
 #include "shared_memory.h"
 #include "shared_ring_buffer_context.h"
 
@@ -11,6 +12,12 @@
 
 typedef enum { STANDARD, CLOCKED } buffer_format;
 
+/// Kernel used to find coincidences, both give the same result
+typedef enum {
+    ENGINE_PATTERN, ///< step an iterator per channel, see coincidence_count
+    ENGINE_WINDOW,  ///< single pass over the records, see coincidence_window
+} coincidence_engine;
+
 typedef union tangy_slice tangy_slice;
 union tangy_slice {
     std_slice standard;
@@ -36,17 +43,85 @@ struct tangy_buffer {
     tangy_slice slice;
     tangy_record_vec records;
     buffer_format format;
+    shared_ring_buffer* retired; /**< segments replaced by resizes, kept mapped
+                                    until the buffer is closed */
+    u64 retired_count;
 };
 
+// registry of this process, mapped on first use
+static buffer_registry tangy_registry = { 0 };
+
+///
+/// @brief the registry of buffers, see buffer_registry.h
+///
+/// @return the registry or NULL if it could not be mapped, buffers then work
+/// without it
+///
+static inline buffer_registry*
+tangy_registry_get() {
+    if (tangy_registry.entries == NULL) {
+        if (registry_open(&tangy_registry).Ok == false) {
+            return NULL;
+        }
+    }
+    return &tangy_registry;
+}
+
+///
+/// @brief copy out an entry of the registry
+///
+/// @param[in] index entry to read, less than REGISTRY_ENTRIES
+/// @param[out] entry
+/// @return true if the entry holds a buffer
+///
+static inline bool
+tangy_registry_read(u64 index, registry_entry* entry) {
+    buffer_registry* registry = tangy_registry_get();
+    if (registry == NULL) {
+        return false;
+    }
+    return registry_read(registry, index, entry);
+}
+
+static inline void
+tangy_registry_remove(char* name) {
+    buffer_registry* registry = tangy_registry_get();
+    if (registry != NULL) {
+        registry_remove(registry, name);
+    }
+}
+
+///
+/// @brief enter a buffer in the registry so others can connect to it by name
+///
+static inline void
+tangy_buffer_register(char* name, tangy_buffer* t_buf) {
+    buffer_registry* registry = tangy_registry_get();
+    if (registry != NULL) {
+        registry_add(registry,
+                     name,
+                     t_buf->format,
+                     srb_get_capacity(&t_buf->buffer),
+                     shmem_process_id());
+    }
+}
+
 ///
 /// @brief initialise a buffer
 ///
 /// @param[in] format buffer layout to use
-/// @param[in] name user friendly identifier
+/// @param[in] name user friendly identifier, or the path of the file to
+/// create if memory_flags includes SM_FILE
 /// @param[in] capacity
 /// @param[in] resolution
 /// @param[in] clock_period
 /// @param[in] channel_count number of channels supported for this instance
+/// @param[in] memory_flags shmem_flags for the backing memory
+/// @param[in] layout srb_layout_flags, optional columns of clocked buffers
+/// @param[in] channel_index positions kept per channel by the channel index,
+/// zero for no index
+/// @param[in] block_size records per block summary, rounded up to a power of
+/// two, zero for no block summaries
 /// @param[in/out] t_buffer buffer variable to initialise
 /// @return ok or error
 ///
@@ -57,6 +132,10 @@ tangy_buffer_init(buffer_format format,
                   f64 resolution,
                   f64 clock_period,
                   u64 channel_count,
+                  u64 memory_flags,
+                  u64 layout,
+                  u64 channel_index,
+                  u64 block_size,
                   tangy_buffer* t_buffer) {
 
     t_buffer->format = format;
@@ -69,10 +148,19 @@ tangy_buffer_init(buffer_format format,
             name_full = std_buffer_name_full(name);
             break;
         case CLOCKED:
-            num_bytes = clk_buffer_map_size(capacity);
+            num_bytes = clk_layout_map_size(capacity, layout);
             name_full = clk_buffer_name_full(name);
             break;
     }
+    if (memory_flags & SM_FILE) {
+        // files are identified by their path alone
+        free(name_full);
+        name_full = strdup(name);
+    }
+    // padding to align the indexes following the records
+    num_bytes += channel_index_map_size(channel_count, channel_index) +
+                 block_summary_map_size(channel_count, capacity, block_size) +
+                 sizeof(u64);
 
     u64 factor = 1;
     if (clock_period > 0) {
@@ -87,29 +175,66 @@ tangy_buffer_init(buffer_format format,
                                    capacity,
                                    0,
                                    channel_count,
+                                   memory_flags,
                                    &t_buffer->buffer);
     if (result.Ok == false) {
         return result;
     }
 
     shared_ring_buffer* buf = &t_buffer->buffer;
+    srb_set_format(buf, format);
+    srb_set_channel_index(buf, channel_index);
+    srb_set_block_size(buf, block_summary_size(block_size));
     switch (format) {
         case STANDARD:
+            srb_set_layout(buf, SRB_LAYOUT_DEFAULT);
             t_buffer->slice.standard = std_init_base_ptrs(buf);
             t_buffer->records.standard = std_vec_init(512);
             break;
         case CLOCKED:
+            srb_set_layout(buf, layout);
+            if (layout & SRB_LAYOUT_PACKED) {
+                srb_set_delta_bits(buf, clk_packed_delta_bits(factor));
+            }
             t_buffer->slice.clocked = clk_init_base_ptrs(buf);
             t_buffer->records.clocked = clk_vec_init(512);
             break;
     }
+    srb_seal(buf);
+    if ((memory_flags & SM_FILE) == 0) {
+        tangy_buffer_register(name, t_buffer);
+    }
 
     return result;
 }
 
 static inline shmem_result
 tangy_buffer_deinit(tangy_buffer* t_buf) {
-    shmem_result result = srb_deinit(&t_buf->buffer);
+    shared_ring_buffer* buf = &t_buf->buffer;
+    // the name of a resized segment belongs to its replacement
+    bool registered = ((srb_get_memory_flags(buf) & SM_FILE) == 0) &&
+                      (srb_get_resized(buf) == 0);
+    char* name_full = registered ? strdup(buf->name) : NULL;
+
+    shmem_result result = srb_deinit(buf);
+
+    // the last process to close the buffer removes it from the registry
+    if (registered && (result.Ok == true)) {
+        u8 exists = 0;
+        shmem_exists(name_full, &exists);
+        if (exists == 0) {
+            // drop the format prefix of the full name
+            tangy_registry_remove(strchr(name_full, '_') + 1);
+        }
+    }
+    free(name_full);
+
+    for (u64 i = 0; i < t_buf->retired_count; i++) {
+        srb_release_retired(&t_buf->retired[i]);
+    }
+    free(t_buf->retired);
+    t_buf->retired = NULL;
+    t_buf->retired_count = 0;
 
     switch (t_buf->format) {
         case STANDARD:
@@ -123,33 +248,309 @@ tangy_buffer_deinit(tangy_buffer* t_buf) {
     return result;
 }
 
+///
+/// @brief connect to the buffer with the given name in the given format
+///
 static inline shmem_result
-tangy_buffer_connect(char* name, tangy_buffer* t_buf) {
-    shmem_result result;
-    char* name_full;
-
+tangy_buffer_connect_format(char* name,
+                            buffer_format format,
+                            tangy_buffer* t_buf) {
+    shmem_result result = { 0 };
     shared_ring_buffer* buf = &t_buf->buffer;
-    name_full = std_buffer_name_full(name);
+    char* name_full = NULL;
+
+    switch (format) {
+        case STANDARD:
+            name_full = std_buffer_name_full(name);
+            break;
+        case CLOCKED:
+            name_full = clk_buffer_name_full(name);
+            break;
+    }
     result = srb_connect(name_full, &t_buf->buffer, &t_buf->context);
-    if (result.Ok == true) {
-        t_buf->slice.standard = std_init_base_ptrs(buf);
-        t_buf->format = STANDARD;
-        t_buf->records.standard = std_vec_init(512);
+    if (result.Ok == false) {
+        free(name_full);
         return result;
     }
 
-    free(name_full);
-    name_full = clk_buffer_name_full(name);
-    result = srb_connect(name_full, &t_buf->buffer, &t_buf->context);
+    t_buf->format = format;
+    switch (format) {
+        case STANDARD:
+            t_buf->slice.standard = std_init_base_ptrs(buf);
+            t_buf->records.standard = std_vec_init(512);
+            break;
+        case CLOCKED:
+            t_buf->slice.clocked = clk_init_base_ptrs(buf);
+            t_buf->records.clocked = clk_vec_init(512);
+            break;
+    }
+    return result;
+}
+
+///
+/// @brief connect to an existing buffer
+///
+/// The format is looked up in the registry, buffers missing from it are
+/// tried in every format.
+///
+static inline shmem_result
+tangy_buffer_connect(char* name, tangy_buffer* t_buf) {
+    shmem_result result = { 0 };
+
+    buffer_registry* registry = tangy_registry_get();
+    if (registry != NULL) {
+        i64 index = registry_find(registry, name);
+        registry_entry entry = { 0 };
+        if ((index >= 0) && registry_read(registry, (u64)index, &entry)) {
+            result = tangy_buffer_connect_format(
+              name, (buffer_format)entry.format, t_buf);
+            if (result.Ok == true) {
+                return result;
+            }
+        }
+    }
+
+    result = tangy_buffer_connect_format(name, STANDARD, t_buf);
     if (result.Ok == true) {
-        t_buf->slice.clocked = clk_init_base_ptrs(buf);
-        t_buf->format = CLOCKED;
-        t_buf->records.clocked = clk_vec_init(512);
         return result;
     }
+    return tangy_buffer_connect_format(name, CLOCKED, t_buf);
+}
+
+///
+/// @brief switch t_buf to the segment of replacement and retire its own
+///
+static inline void
+tangy_buffer_replace(tangy_buffer* t_buf, tangy_buffer* replacement) {
+    srb_retire(&t_buf->buffer);
+    t_buf->retired = realloc(t_buf->retired,
+                             (t_buf->retired_count + 1) * sizeof(shared_ring_buffer));
+    t_buf->retired[t_buf->retired_count] = t_buf->buffer;
+    t_buf->retired_count += 1;
+
+    t_buf->buffer = replacement->buffer;
+    t_buf->slice = replacement->slice;
+    switch (replacement->format) {
+        case STANDARD:
+            std_vec_deinit(replacement->records.standard);
+            break;
+        case CLOCKED:
+            clk_vec_deinit(replacement->records.clocked);
+            break;
+    }
+}
+
+///
+/// @brief move a buffer to a new segment of a different capacity
+///
+/// A new segment is created under the same name, the records it can hold are
+/// copied across starting from the most recent and the old segment is marked
+/// as resized. Other processes keep using the old segment until they call
+/// tangy_buffer_refresh. Records must not be written to the buffer while it
+/// is resized. Processes connecting while the buffer is resized may fail to
+/// find it.
+///
+/// @param[in] name user friendly identifier the buffer was created with
+/// @param[in] capacity of the new segment
+/// @param[in/out] t_buf buffer to resize
+/// @return ok or error, the buffer is unchanged if the new segment could not
+/// be named, otherwise it can no longer be connected to on failure
+///
+static inline shmem_result
+tangy_buffer_resize(char* name, const u64 capacity, tangy_buffer* t_buf) {
+    shared_ring_buffer* buf = &t_buf->buffer;
+    tangy_buffer resized = { 0 };
+
+    // processes keep the old segment mapped after its name is removed
+    shmem_result result = shmem_unlink(buf->name);
+    if (result.Ok == false) {
+        return result;
+    }
+
+    result = tangy_buffer_init(t_buf->format,
+                               name,
+                               capacity,
+                               srb_get_resolution(buf),
+                               srb_get_clock_period(buf),
+                               srb_get_channel_count(buf),
+                               srb_get_memory_flags(buf),
+                               srb_get_layout(buf),
+                               srb_get_channel_index(buf),
+                               srb_get_block_size(buf),
+                               &resized);
+    if (result.Ok == false) {
+        return result;
+    }
+
+    switch (t_buf->format) {
+        case STANDARD:
+            std_copy_window(buf,
+                            &t_buf->slice.standard,
+                            &resized.buffer,
+                            &resized.slice.standard);
+            break;
+        case CLOCKED:
+            clk_copy_window(buf,
+                            &t_buf->slice.clocked,
+                            &resized.buffer,
+                            &resized.slice.clocked);
+            break;
+    }
+    srb_copy_clients(buf, &resized.buffer);
+
+    // redirect other processes and wake any waiting on the old segment
+    srb_set_resized(buf, capacity);
+    srb_notify(buf);
+
+    tangy_buffer_replace(t_buf, &resized);
+    return result;
+}
+
+///
+/// @brief follow resizes of a buffer made by another process
+///
+/// Connects to the current segment of the buffer if the one in use has been
+/// resized. The previous segment stays mapped until the buffer is closed.
+///
+/// @param[in] name user friendly identifier of the buffer
+/// @param[in/out] t_buf buffer to refresh
+/// @return ok or error, t_buf is unchanged on error
+///
+static inline shmem_result
+tangy_buffer_refresh(char* name, tangy_buffer* t_buf) {
+    shmem_result result = { 0 };
+    result.Ok = true;
+
+    while (srb_get_resized(&t_buf->buffer) != 0) {
+        tangy_buffer current = { 0 };
+        result = tangy_buffer_connect(name, &current);
+        if (result.Ok == false) {
+            return result;
+        }
+        tangy_buffer_replace(t_buf, &current);
+    }
+    return result;
+}
+
+///
+/// @brief open a buffer file created with SM_FILE
+///
+/// @param[in] path of the file
+/// @param[in/out] t_buf buffer variable to initialise
+/// @return ok or error, SM_HEADER if the file does not hold a buffer
+///
+static inline shmem_result
+tangy_buffer_open_file(char* path, tangy_buffer* t_buf) {
+    char* path_copy = strdup(path);
+    shared_ring_buffer* buf = &t_buf->buffer;
+    shmem_result result = srb_open_file(path_copy, buf);
+    if (result.Ok == false) {
+        free(path_copy);
+        return result;
+    }
+
+    t_buf->format = (buffer_format)srb_get_format(buf);
+    switch (t_buf->format) {
+        case STANDARD:
+            t_buf->slice.standard = std_init_base_ptrs(buf);
+            t_buf->records.standard = std_vec_init(512);
+            break;
+        case CLOCKED:
+            t_buf->slice.clocked = clk_init_base_ptrs(buf);
+            t_buf->records.clocked = clk_vec_init(512);
+            break;
+    }
+    return result;
+}
+
+///
+/// @brief make a buffer consistent after its writer stopped unexpectedly
+///
+/// Only call when no other process is using the buffer.
+///
+/// @return number of records in the buffer after recovery
+///
+static inline u64
+tangy_buffer_recover(tangy_buffer* t_buf) {
+    u64 count = 0;
+    switch (t_buf->format) {
+        case STANDARD:
+            count = std_recover(&t_buf->buffer, &t_buf->slice.standard);
+            break;
+        case CLOCKED:
+            count = clk_recover(&t_buf->buffer, &t_buf->slice.clocked);
+            break;
+    }
+    return count;
+}
 
-    result.Ok = false;
+///
+/// @brief copy the records [start, stop) of a buffer into a private buffer
+///
+/// The snapshot has the configuration of t_buf, room for exactly the range and
+/// keeps the absolute positions of the records, so the range starts at
+/// oldest_index and ends at count. Its name is removed once it is created,
+/// no other process can connect to it and it is freed when deinitialised.
+///
+/// @param[in] t_buf buffer to copy from
+/// @param[in] name unique name for the snapshot
+/// @param[in] start first record to copy
+/// @param[in] stop one past the last record to copy
+/// @param[out] snapshot buffer variable to initialise
+/// @return ok or error, records the writer overwrote while they were copied
+/// are not part of the snapshot, see tangy_oldest_index
+///
+static inline shmem_result
+tangy_buffer_snapshot(tangy_buffer* t_buf,
+                      char* name,
+                      u64 start,
+                      u64 stop,
+                      tangy_buffer* snapshot) {
+    shared_ring_buffer* buf = &t_buf->buffer;
+    u64 capacity = stop > start ? stop - start : 1;
+
+    shmem_result result =
+      tangy_buffer_init(t_buf->format,
+                        name,
+                        capacity,
+                        srb_get_resolution(buf),
+                        srb_get_clock_period(buf),
+                        srb_get_channel_count(buf),
+                        srb_get_memory_flags(buf) & SM_HUGE_PAGES,
+                        srb_get_layout(buf),
+                        srb_get_channel_index(buf),
+                        srb_get_block_size(buf),
+                        snapshot);
+    if (result.Ok == false) {
+        return result;
+    }
+    // without a name the mapping is private, on Windows the name stays until
+    // the snapshot is closed but nothing else knows it
+    shmem_unlink(snapshot->buffer.name);
+    tangy_registry_remove(name);
 
+    u64 intact = start;
+    switch (t_buf->format) {
+        case STANDARD:
+            intact = std_copy_range(buf,
+                                    &t_buf->slice.standard,
+                                    &snapshot->buffer,
+                                    &snapshot->slice.standard,
+                                    start,
+                                    stop);
+            break;
+        case CLOCKED:
+            intact = clk_copy_range(buf,
+                                    &t_buf->slice.clocked,
+                                    &snapshot->buffer,
+                                    &snapshot->slice.clocked,
+                                    start,
+                                    stop);
+            break;
+    }
+    if (intact > start) {
+        srb_set_origin(&snapshot->buffer, intact < stop ? intact : stop);
+    }
     return result;
 }
 
@@ -240,8 +641,128 @@ tangy_buffer_push(tangy_buffer* t_buf,
     return count;
 }
 
+///
+/// @brief merge records from several buffers into t_buf in arrival time order
+///
+/// All buffers must share the format and conversion factor of t_buf, see
+/// std_merge for details of the merge.
+///
+/// @return number of records merged
+///
+static inline u64
+tangy_merge(tangy_buffer* t_buf,
+            const u64 n_sources,
+            tangy_buffer** sources,
+            u64* positions,
+            const u64* stops,
+            u64* waiting_since,
+            const u8* channel_offsets,
+            const u64 latency_bins,
+            const u64 max_n,
+            u64* late) {
+
+    u64 count = 0;
+    shared_ring_buffer** buffers =
+      (shared_ring_buffer**)malloc(n_sources * sizeof(shared_ring_buffer*));
+    if (buffers == NULL) {
+        return 0;
+    }
+    for (u64 k = 0; k < n_sources; k++) {
+        buffers[k] = &sources[k]->buffer;
+    }
+
+    switch (t_buf->format) {
+        case STANDARD: {
+            std_slice* data =
+              (std_slice*)malloc(n_sources * sizeof(std_slice));
+            if (data == NULL) {
+                break;
+            }
+            for (u64 k = 0; k < n_sources; k++) {
+                data[k] = sources[k]->slice.standard;
+            }
+            count = std_merge(&t_buf->buffer,
+                              &t_buf->slice.standard,
+                              n_sources,
+                              buffers,
+                              data,
+                              positions,
+                              stops,
+                              waiting_since,
+                              channel_offsets,
+                              latency_bins,
+                              max_n,
+                              late);
+            free(data);
+            break;
+        }
+        case CLOCKED: {
+            clk_slice* data =
+              (clk_slice*)malloc(n_sources * sizeof(clk_slice));
+            if (data == NULL) {
+                break;
+            }
+            for (u64 k = 0; k < n_sources; k++) {
+                data[k] = sources[k]->slice.clocked;
+            }
+            count = clk_merge(&t_buf->buffer,
+                              &t_buf->slice.clocked,
+                              n_sources,
+                              buffers,
+                              data,
+                              positions,
+                              stops,
+                              waiting_since,
+                              channel_offsets,
+                              latency_bins,
+                              max_n,
+                              late);
+            free(data);
+            break;
+        }
+    }
+
+    free(buffers);
+    return count;
+}
+
 // analysis
 
+// Number of times an analysis is run when the writer overwrites part of the
+// region being read while the analysis is in progress, see srb_write_begin
+#define TANGY_READ_ATTEMPTS 4
+
+static inline u64
+tangy_valid_from(tangy_buffer* t_buf) {
+    return srb_valid_from(&t_buf->buffer);
+}
+
+static inline u64
+tangy_pattern_first_index(tangy_buffer* t_buf,
+                          const u64 n_channels,
+                          const f64* delays,
+                          const f64 read_time) {
+    u64 index = 0;
+
+    switch (t_buf->format) {
+        case STANDARD:
+            index = std_pattern_first_index(&t_buf->buffer,
+                                            &t_buf->slice.standard,
+                                            n_channels,
+                                            delays,
+                                            read_time);
+            break;
+        case CLOCKED:
+            index = clk_pattern_first_index(&t_buf->buffer,
+                                            &t_buf->slice.clocked,
+                                            n_channels,
+                                            delays,
+                                            read_time);
+            break;
+    }
+    return index;
+}
+
 static inline u64
 tangy_oldest_index(tangy_buffer* t_buf) {
     u64 index;
@@ -336,18 +857,41 @@ tangy_lower_bound(tangy_buffer* t_buf, u64 key) {
 }
 
 static inline u64
-tangy_singles(tangy_buffer* t_buf, u64 start, u64 stop, u64* counters) {
+tangy_singles(tangy_buffer* t_buf,
+              u64 start,
+              u64 stop,
+              u64* counters,
+              u64 n_threads) {
     u64 count = 0;
-
-    switch (t_buf->format) {
-        case STANDARD:
-            count = std_singles(
-              &t_buf->buffer, &t_buf->slice.standard, start, stop, counters);
-            break;
-        case CLOCKED:
-            count = clk_singles(
-              &t_buf->buffer, &t_buf->slice.clocked, start, stop, counters);
+    u64 n_channels = srb_get_channel_count(&t_buf->buffer);
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        switch (t_buf->format) {
+            case STANDARD:
+                count = std_singles_parallel(&t_buf->buffer,
+                                             &t_buf->slice.standard,
+                                             start,
+                                             stop,
+                                             counters,
+                                             n_threads);
+                break;
+            case CLOCKED:
+                count = clk_singles_parallel(&t_buf->buffer,
+                                             &t_buf->slice.clocked,
+                                             start,
+                                             stop,
+                                             counters,
+                                             n_threads);
+                break;
+        }
+
+        u64 valid_from = tangy_valid_from(t_buf);
+        if ((start >= valid_from) || (valid_from >= stop)) {
             break;
+        }
+        // the oldest part of the range was overwritten, drop it and recount
+        start = valid_from;
+        memset(counters, 0, n_channels * sizeof(u64));
     }
     return count;
 }
@@ -358,28 +902,91 @@ tangy_coincidence_count(tangy_buffer* t_buf,
                         u8* channels,
                         f64* delays,
                         f64 time_coincidence_radius,
-                        f64 time_read) {
+                        f64 time_read,
+                        coincidence_engine engine,
+                        u64 n_threads) {
     u64 count = 0;
 
-    switch (t_buf->format) {
-        case STANDARD:
-            count = std_coincidence_count(&t_buf->buffer,
-                                          &t_buf->slice.standard,
-                                          channel_count,
-                                          channels,
-                                          delays,
-                                          time_coincidence_radius,
-                                          time_read);
-            break;
-        case CLOCKED:
-            count = clk_coincidence_count(&t_buf->buffer,
-                                          &t_buf->slice.clocked,
-                                          channel_count,
-                                          channels,
-                                          delays,
-                                          time_coincidence_radius,
-                                          time_read);
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        u64 first = tangy_pattern_first_index(
+          t_buf, channel_count, delays, time_read);
+
+        if (n_threads > 1) {
+            // both engines count the same coincidences, only the window
+            // engine splits into chunks
+            switch (t_buf->format) {
+                case STANDARD:
+                    count = std_coincidence_window_parallel(
+                      &t_buf->buffer,
+                      &t_buf->slice.standard,
+                      channel_count,
+                      channels,
+                      delays,
+                      time_coincidence_radius,
+                      time_read,
+                      n_threads);
+                    break;
+                case CLOCKED:
+                    count = clk_coincidence_window_parallel(
+                      &t_buf->buffer,
+                      &t_buf->slice.clocked,
+                      channel_count,
+                      channels,
+                      delays,
+                      time_coincidence_radius,
+                      time_read,
+                      n_threads);
+                    break;
+            }
+        } else if (engine == ENGINE_WINDOW) {
+            switch (t_buf->format) {
+                case STANDARD:
+                    count = std_coincidence_window(&t_buf->buffer,
+                                                   &t_buf->slice.standard,
+                                                   channel_count,
+                                                   channels,
+                                                   delays,
+                                                   time_coincidence_radius,
+                                                   time_read,
+                                                   NULL);
+                    break;
+                case CLOCKED:
+                    count = clk_coincidence_window(&t_buf->buffer,
+                                                   &t_buf->slice.clocked,
+                                                   channel_count,
+                                                   channels,
+                                                   delays,
+                                                   time_coincidence_radius,
+                                                   time_read,
+                                                   NULL);
+                    break;
+            }
+        } else {
+            switch (t_buf->format) {
+                case STANDARD:
+                    count = std_coincidence_count(&t_buf->buffer,
+                                                  &t_buf->slice.standard,
+                                                  channel_count,
+                                                  channels,
+                                                  delays,
+                                                  time_coincidence_radius,
+                                                  time_read);
+                    break;
+                case CLOCKED:
+                    count = clk_coincidence_count(&t_buf->buffer,
+                                                  &t_buf->slice.clocked,
+                                                  channel_count,
+                                                  channels,
+                                                  delays,
+                                                  time_coincidence_radius,
+                                                  time_read);
+                    break;
+            }
+        }
+
+        if (first >= tangy_valid_from(t_buf)) {
             break;
+        }
     }
     return count;
 }
@@ -391,32 +998,236 @@ tangy_coincidence_collect(tangy_buffer* t_buf,
                           f64* delays,
                           f64 time_coincidence_radius,
                           f64 time_read,
-                          tangy_record_vec* records) {
+                          tangy_record_vec* records,
+                          coincidence_engine engine) {
+    u64 count = 0;
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        u64 first = tangy_pattern_first_index(
+          t_buf, channel_count, delays, time_read);
+
+        // records are reset at the start of each collection
+        if (engine == ENGINE_WINDOW) {
+            switch (t_buf->format) {
+                case STANDARD:
+                    count = std_coincidence_window(&t_buf->buffer,
+                                                   &t_buf->slice.standard,
+                                                   channel_count,
+                                                   channels,
+                                                   delays,
+                                                   time_coincidence_radius,
+                                                   time_read,
+                                                   records->standard);
+                    break;
+                case CLOCKED:
+                    count = clk_coincidence_window(&t_buf->buffer,
+                                                   &t_buf->slice.clocked,
+                                                   channel_count,
+                                                   channels,
+                                                   delays,
+                                                   time_coincidence_radius,
+                                                   time_read,
+                                                   records->clocked);
+                    break;
+            }
+        } else {
+            switch (t_buf->format) {
+                case STANDARD:
+                    count = std_coincidence_collect(&t_buf->buffer,
+                                                    &t_buf->slice.standard,
+                                                    channel_count,
+                                                    channels,
+                                                    delays,
+                                                    time_coincidence_radius,
+                                                    time_read,
+                                                    records->standard);
+                    break;
+                case CLOCKED:
+                    count = clk_coincidence_collect(&t_buf->buffer,
+                                                    &t_buf->slice.clocked,
+                                                    channel_count,
+                                                    channels,
+                                                    delays,
+                                                    time_coincidence_radius,
+                                                    time_read,
+                                                    records->clocked);
+                    break;
+            }
+        }
+
+        if (first >= tangy_valid_from(t_buf)) {
+            break;
+        }
+    }
+    return count;
+}
+
+///
+/// @brief count the coincidences of many patterns in a single pass, see
+/// coincidence_counts
+///
+static inline u64
+tangy_coincidence_counts(tangy_buffer* t_buf,
+                         u64 channel_count,
+                         u8* channels,
+                         f64* delays,
+                         f64 time_coincidence_radius,
+                         f64 time_read,
+                         u64 n_patterns,
+                         u64* patterns,
+                         u64* counts) {
     u64 count = 0;
 
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        u64 first = tangy_pattern_first_index(
+          t_buf, channel_count, delays, time_read);
+
+        switch (t_buf->format) {
+            case STANDARD:
+                count = std_coincidence_counts(&t_buf->buffer,
+                                               &t_buf->slice.standard,
+                                               channel_count,
+                                               channels,
+                                               delays,
+                                               time_coincidence_radius,
+                                               time_read,
+                                               n_patterns,
+                                               patterns,
+                                               counts);
+                break;
+            case CLOCKED:
+                count = clk_coincidence_counts(&t_buf->buffer,
+                                               &t_buf->slice.clocked,
+                                               channel_count,
+                                               channels,
+                                               delays,
+                                               time_coincidence_radius,
+                                               time_read,
+                                               n_patterns,
+                                               patterns,
+                                               counts);
+                break;
+        }
+
+        if (first >= tangy_valid_from(t_buf)) {
+            break;
+        }
+    }
+    return count;
+}
+
+///
+/// @brief start a coincidence stream for a pattern, see coincidence_stream.h
+///
+/// @param[in] position first record the stream consumes
+///
+static inline void
+tangy_coincidence_stream_init(tangy_buffer* t_buf,
+                              coincidence_stream* stream,
+                              u64 channel_count,
+                              u8* channels,
+                              f64* delays,
+                              f64 time_coincidence_radius,
+                              u64 position) {
     switch (t_buf->format) {
         case STANDARD:
-            count = std_coincidence_collect(&t_buf->buffer,
-                                            &t_buf->slice.standard,
-                                            channel_count,
-                                            channels,
-                                            delays,
-                                            time_coincidence_radius,
-                                            time_read,
-                                            records->standard);
+            std_coincidence_stream_init(&t_buf->buffer,
+                                        stream,
+                                        channel_count,
+                                        channels,
+                                        delays,
+                                        time_coincidence_radius,
+                                        position);
             break;
         case CLOCKED:
-            count = clk_coincidence_collect(&t_buf->buffer,
-                                            &t_buf->slice.clocked,
-                                            channel_count,
-                                            channels,
-                                            delays,
-                                            time_coincidence_radius,
-                                            time_read,
-                                            records->clocked);
+            clk_coincidence_stream_init(&t_buf->buffer,
+                                        stream,
+                                        channel_count,
+                                        channels,
+                                        delays,
+                                        time_coincidence_radius,
+                                        position);
             break;
     }
-    return count;
+}
+
+///
+/// @brief consume the records written since the last update of a stream
+///
+/// If the writer overwrote records before the stream got to them the stream
+/// restarts from the oldest record still held. If it overwrote records while
+/// they were read the update is discarded and the stream restarts after them.
+/// Either way the records are added to stream->lost.
+///
+/// @param[out] counters records of each channel consumed, zeroed first
+/// @return number of records consumed
+///
+static inline u64
+tangy_coincidence_stream_update(tangy_buffer* t_buf,
+                                coincidence_stream* stream,
+                                u64* counters) {
+    shared_ring_buffer* buf = &t_buf->buffer;
+    memset(counters, 0, srb_get_channel_count(buf) * sizeof(u64));
+    stream->coincidences = 0;
+
+    u64 valid_from = tangy_valid_from(t_buf);
+    if (stream->position < valid_from) {
+        stream->lost += valid_from - stream->position;
+        stream_reset(stream, valid_from);
+    }
+
+    u64 start = stream->position;
+    u64 stop = srb_get_count(buf);
+    u64 consumed = 0;
+    switch (t_buf->format) {
+        case STANDARD:
+            consumed = std_coincidence_stream_update(
+              buf, &t_buf->slice.standard, stream, stop, counters);
+            break;
+        case CLOCKED:
+            consumed = clk_coincidence_stream_update(
+              buf, &t_buf->slice.clocked, stream, stop, counters);
+            break;
+    }
+
+    if (start < tangy_valid_from(t_buf)) {
+        stream->lost += consumed;
+        stream->coincidences = 0;
+        memset(counters, 0, srb_get_channel_count(buf) * sizeof(u64));
+        stream_reset(stream, stop);
+        return 0;
+    }
+    return consumed;
+}
+
+///
+/// @brief allocate a vector for tangy_coincidence_collect to fill
+///
+/// A vector per call, rather than the one held by the buffer, lets several
+/// threads collect from the same buffer at once.
+///
+static inline void
+tangy_records_init(buffer_format format, tangy_record_vec* records) {
+    switch (format) {
+        case STANDARD:
+            records->standard = std_vec_init(512);
+            return;
+        case CLOCKED:
+            records->clocked = clk_vec_init(512);
+            return;
+    }
+}
+
+static inline void
+tangy_records_deinit(buffer_format format, tangy_record_vec* records) {
+    switch (format) {
+        case STANDARD:
+            std_vec_deinit(records->standard);
+            return;
+        case CLOCKED:
+            clk_vec_deinit(records->clocked);
+            return;
+    }
 }
 
 static inline void
@@ -435,86 +1246,232 @@ tangy_records_copy(buffer_format format,
     }
 }
 
-static inline u64
-tangy_timetrace(tangy_buffer* t_buf,
-                const u64 start,
-                const u64 stop,
-                const u64 bin_width,
-                const u8* channels,
-                const u64 n_channels,
-                const u64 length,
-                u64* intensities) {
+static inline void
+tangy_relative_delay(tangy_buffer* t_buf,
+                     const u64 start,
+                     const u64 stop,
+                     const u64 correlation_window,
+                     const u64 resolution,
+                     const u8 channels_a,
+                     const u8 channels_b,
+                     const u64 length,
+                     u64* intensities,
+                     const u64 n_threads) {
 
-    u64 count = 0;
+    u64 first = start;
 
-    switch (t_buf->format) {
-        case STANDARD:
-            count = std_timetrace(&t_buf->buffer,
-                                  &t_buf->slice.standard,
-                                  start,
-                                  stop,
-                                  bin_width,
-                                  channels,
-                                  n_channels,
-                                  length,
-                                  intensities);
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        switch (t_buf->format) {
+            case STANDARD:
+                std_relative_delay_parallel(&t_buf->buffer,
+                                            &t_buf->slice.standard,
+                                            first,
+                                            stop,
+                                            correlation_window,
+                                            resolution,
+                                            channels_a,
+                                            channels_b,
+                                            length,
+                                            intensities,
+                                            n_threads);
+                break;
+            case CLOCKED:
+                clk_relative_delay_parallel(&t_buf->buffer,
+                                            &t_buf->slice.clocked,
+                                            first,
+                                            stop,
+                                            correlation_window,
+                                            resolution,
+                                            channels_a,
+                                            channels_b,
+                                            length,
+                                            intensities,
+                                            n_threads);
+                break;
+        }
+
+        u64 valid_from = tangy_valid_from(t_buf);
+        if ((first >= valid_from) || (valid_from >= stop)) {
             break;
+        }
+        first = valid_from;
+        memset(intensities, 0, length * sizeof(u64));
+    }
+}
 
-        case CLOCKED:
-            count = clk_timetrace(&t_buf->buffer,
-                                  &t_buf->slice.clocked,
-                                  start,
-                                  stop,
-                                  bin_width,
-                                  channels,
-                                  n_channels,
-                                  length,
-                                  intensities);
+static inline void
+tangy_cross_correlation(tangy_buffer* t_buf,
+                        const u64 start,
+                        const u64 stop,
+                        const u64 correlation_window,
+                        const u64 resolution,
+                        const i64 delay,
+                        const u8 channel_a,
+                        const u8 channel_b,
+                        const u64 length,
+                        u64* intensities,
+                        const u64 n_threads) {
+
+    u64 first = start;
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        switch (t_buf->format) {
+            case STANDARD:
+                std_cross_correlation_parallel(&t_buf->buffer,
+                                               &t_buf->slice.standard,
+                                               first,
+                                               stop,
+                                               correlation_window,
+                                               resolution,
+                                               delay,
+                                               channel_a,
+                                               channel_b,
+                                               length,
+                                               intensities,
+                                               n_threads);
+                break;
+            case CLOCKED:
+                clk_cross_correlation_parallel(&t_buf->buffer,
+                                               &t_buf->slice.clocked,
+                                               first,
+                                               stop,
+                                               correlation_window,
+                                               resolution,
+                                               delay,
+                                               channel_a,
+                                               channel_b,
+                                               length,
+                                               intensities,
+                                               n_threads);
+                break;
+        }
+
+        u64 valid_from = tangy_valid_from(t_buf);
+        if ((first >= valid_from) || (valid_from >= stop)) {
             break;
+        }
+        first = valid_from;
+        memset(intensities, 0, length * sizeof(u64));
     }
-
-    return count;
 }
 
 static inline void
-tangy_relative_delay(tangy_buffer* t_buf,
+tangy_delay_histograms(tangy_buffer* t_buf,
+                       const u64 start,
+                       const u64 stop,
+                       const u64 correlation_window,
+                       const u64 resolution,
+                       const u64 n_channels,
+                       const u8* channels,
+                       const u64 length,
+                       u64* intensities,
+                       const u64 n_threads) {
+
+    u64 first = start;
+    u64 n_pairs = n_channels * (n_channels - 1) / 2;
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        switch (t_buf->format) {
+            case STANDARD:
+                std_delay_histograms_parallel(&t_buf->buffer,
+                                              &t_buf->slice.standard,
+                                              first,
+                                              stop,
+                                              correlation_window,
+                                              resolution,
+                                              n_channels,
+                                              channels,
+                                              length,
+                                              intensities,
+                                              n_threads);
+                break;
+            case CLOCKED:
+                clk_delay_histograms_parallel(&t_buf->buffer,
+                                              &t_buf->slice.clocked,
+                                              first,
+                                              stop,
+                                              correlation_window,
+                                              resolution,
+                                              n_channels,
+                                              channels,
+                                              length,
+                                              intensities,
+                                              n_threads);
+                break;
+        }
+
+        u64 valid_from = tangy_valid_from(t_buf);
+        if ((first >= valid_from) || (valid_from >= stop)) {
+            break;
+        }
+        first = valid_from;
+        memset(intensities, 0, n_pairs * length * sizeof(u64));
+    }
+}
+
+static inline u64
+tangy_channel_traces(tangy_buffer* t_buf,
                      const u64 start,
                      const u64 stop,
-                     const u64 correlation_window,
-                     const u64 resolution,
-                     const u8 channels_a,
-                     const u8 channels_b,
+                     const u64 origin,
+                     const u64 bin_width,
+                     const u64 n_channels,
+                     const u8* channels,
                      const u64 length,
-                     u64* intensities) {
+                     u64* intensities,
+                     const u64 n_threads) {
 
-    switch (t_buf->format) {
-        case STANDARD:
-            std_relative_delay(&t_buf->buffer,
-                               &t_buf->slice.standard,
-                               start,
-                               stop,
-                               correlation_window,
-                               resolution,
-                               channels_a,
-                               channels_b,
-                               length,
-                               intensities);
-            break;
-        case CLOCKED:
-            clk_relative_delay(&t_buf->buffer,
-                               &t_buf->slice.clocked,
-                               start,
-                               stop,
-                               correlation_window,
-                               resolution,
-                               channels_a,
-                               channels_b,
-                               length,
-                               intensities);
+    u64 first = start;
+    u64 count = 0;
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        switch (t_buf->format) {
+            case STANDARD:
+                count = std_channel_traces_parallel(&t_buf->buffer,
+                                                    &t_buf->slice.standard,
+                                                    first,
+                                                    stop,
+                                                    origin,
+                                                    bin_width,
+                                                    n_channels,
+                                                    channels,
+                                                    length,
+                                                    intensities,
+                                                    n_threads);
+                break;
+            case CLOCKED:
+                count = clk_channel_traces_parallel(&t_buf->buffer,
+                                                    &t_buf->slice.clocked,
+                                                    first,
+                                                    stop,
+                                                    origin,
+                                                    bin_width,
+                                                    n_channels,
+                                                    channels,
+                                                    length,
+                                                    intensities,
+                                                    n_threads);
+                break;
+        }
+
+        u64 valid_from = tangy_valid_from(t_buf);
+        if ((first >= valid_from) || (valid_from >= stop)) {
             break;
+        }
+        first = valid_from;
+        memset(intensities, 0, n_channels * length * sizeof(u64));
     }
+
+    return count;
 }
 
+///
+/// @brief joint histogram of the delays of signal and idler, binned
+/// bin_width at a time
+///
+/// Counts into sparse if it is not NULL, otherwise into intensities holding
+/// ((2 * radius in bins) / bin_width)^2 bins, see joint_delay_histogram.
+///
 static inline u64
 tangy_joint_delay_histogram(tangy_buffer* t_buf,
                             const u8 clock,
@@ -525,36 +1482,62 @@ tangy_joint_delay_histogram(tangy_buffer* t_buf,
                             const f64* delays,
                             const f64 radius,
                             const f64 read_time,
-                            u64* intensities) {
+                            const u64 bin_width,
+                            u64* intensities,
+                            sparse_histogram* sparse,
+                            const u64 n_threads) {
     u64 count = 0;
 
-    switch (t_buf->format) {
-        case STANDARD:
-            count = std_joint_delay_histogram(&t_buf->buffer,
-                                              &t_buf->slice.standard,
-                                              clock,
-                                              signal,
-                                              idler,
-                                              n_channels,
-                                              channels,
-                                              delays,
-                                              radius,
-                                              read_time,
-                                              intensities);
-            break;
-        case CLOCKED:
-            count = clk_joint_delay_histogram(&t_buf->buffer,
-                                              &t_buf->slice.clocked,
-                                              clock,
-                                              signal,
-                                              idler,
-                                              n_channels,
-                                              channels,
-                                              delays,
-                                              radius,
-                                              read_time,
-                                              intensities);
+    u64 n_axis = (2 * tangy_bins_from_time(t_buf, radius)) / bin_width;
+    u64 n_bins = n_axis * n_axis;
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        u64 first =
+          tangy_pattern_first_index(t_buf, n_channels, delays, read_time);
+
+        switch (t_buf->format) {
+            case STANDARD:
+                count = std_joint_delay_histogram(&t_buf->buffer,
+                                                  &t_buf->slice.standard,
+                                                  clock,
+                                                  signal,
+                                                  idler,
+                                                  n_channels,
+                                                  channels,
+                                                  delays,
+                                                  radius,
+                                                  read_time,
+                                                  bin_width,
+                                                  intensities,
+                                                  sparse,
+                                                  n_threads);
+                break;
+            case CLOCKED:
+                count = clk_joint_delay_histogram(&t_buf->buffer,
+                                                  &t_buf->slice.clocked,
+                                                  clock,
+                                                  signal,
+                                                  idler,
+                                                  n_channels,
+                                                  channels,
+                                                  delays,
+                                                  radius,
+                                                  read_time,
+                                                  bin_width,
+                                                  intensities,
+                                                  sparse,
+                                                  n_threads);
+                break;
+        }
+
+        if (first >= tangy_valid_from(t_buf)) {
             break;
+        }
+        if (sparse != NULL) {
+            sparse_histogram_clear(sparse);
+        } else {
+            memset(intensities, 0, n_bins * sizeof(u64));
+        }
     }
 
     return count;
@@ -571,32 +1554,43 @@ tangy_second_order_coherence(tangy_buffer* t_buf,
                              const u64 length,
                              u64* intensities) {
 
-    switch (t_buf->format) {
-        case STANDARD:
-            std_second_order_coherence(&t_buf->buffer,
-                                       &t_buf->slice.standard,
-                                       start,
-                                       stop,
-                                       correlation_window,
-                                       resolution,
-                                       signal,
-                                       idler,
-                                       length,
-                                       intensities);
-
-            break;
-        case CLOCKED:
-            clk_second_order_coherence(&t_buf->buffer,
-                                       &t_buf->slice.clocked,
-                                       start,
-                                       stop,
-                                       correlation_window,
-                                       resolution,
-                                       signal,
-                                       idler,
-                                       length,
-                                       intensities);
+    u64 first = start;
+
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        switch (t_buf->format) {
+            case STANDARD:
+                std_second_order_coherence(&t_buf->buffer,
+                                           &t_buf->slice.standard,
+                                           first,
+                                           stop,
+                                           correlation_window,
+                                           resolution,
+                                           signal,
+                                           idler,
+                                           length,
+                                           intensities);
+
+                break;
+            case CLOCKED:
+                clk_second_order_coherence(&t_buf->buffer,
+                                           &t_buf->slice.clocked,
+                                           first,
+                                           stop,
+                                           correlation_window,
+                                           resolution,
+                                           signal,
+                                           idler,
+                                           length,
+                                           intensities);
+                break;
+        }
+
+        u64 valid_from = tangy_valid_from(t_buf);
+        if ((first >= valid_from) || (valid_from >= stop)) {
             break;
+        }
+        first = valid_from;
+        memset(intensities, 0, length * sizeof(u64));
     }
 }
 
@@ -611,32 +1605,41 @@ tangy_second_order_coherence_delays(tangy_buffer* t_buf,
                                     const u64 length,
                                     u64* intensities) {
 
-    switch (t_buf->format) {
-        case STANDARD:
-            std_second_order_coherence_delays(&t_buf->buffer,
-                                              &t_buf->slice.standard,
-                                              read_time,
-                                              correlation_window,
-                                              resolution,
-                                              signal,
-                                              idler,
-                                              delays,
-                                              length,
-                                              intensities);
-
-            break;
-        case CLOCKED:
-            clk_second_order_coherence_delays(&t_buf->buffer,
-                                              &t_buf->slice.clocked,
-                                              read_time,
-                                              correlation_window,
-                                              resolution,
-                                              signal,
-                                              idler,
-                                              delays,
-                                              length,
-                                              intensities);
+    for (u32 attempt = 0; attempt < TANGY_READ_ATTEMPTS; attempt++) {
+        u64 first = tangy_pattern_first_index(t_buf, 2, delays, read_time);
+
+        switch (t_buf->format) {
+            case STANDARD:
+                std_second_order_coherence_delays(&t_buf->buffer,
+                                                  &t_buf->slice.standard,
+                                                  read_time,
+                                                  correlation_window,
+                                                  resolution,
+                                                  signal,
+                                                  idler,
+                                                  delays,
+                                                  length,
+                                                  intensities);
+
+                break;
+            case CLOCKED:
+                clk_second_order_coherence_delays(&t_buf->buffer,
+                                                  &t_buf->slice.clocked,
+                                                  read_time,
+                                                  correlation_window,
+                                                  resolution,
+                                                  signal,
+                                                  idler,
+                                                  delays,
+                                                  length,
+                                                  intensities);
+                break;
+        }
+
+        if (first >= tangy_valid_from(t_buf)) {
             break;
+        }
+        memset(intensities, 0, length * sizeof(u64));
     }
 }
 
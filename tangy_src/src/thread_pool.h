@@ -0,0 +1,155 @@
+#ifndef __THREAD_POOL__
+#define __THREAD_POOL__
+
+#include "atomics.h"
+#include "base.h"
+
+/**
+ * @file thread_pool.h
+ * @brief Run the chunks of an analysis on several native threads
+ *
+ * tb_parallel_for starts a pool of workers, the calling thread being one of
+ * them, that take task numbers from a shared counter until every task has
+ * been run, then joins them. Tasks should be much longer than starting a
+ * thread, an analysis is split into a few chunks per thread so that uneven
+ * chunks still keep every thread busy.
+ *
+ * Workers never call into Python, the calling thread keeps whatever it holds
+ * (the GIL included) while it waits for them.
+ */
+
+#if defined(_WIN32)
+#include <Windows.h>
+#else
+#include <pthread.h>
+#include <unistd.h>
+#endif
+
+// most threads a single call will start
+#define TB_THREADS_MAX 256
+// chunks an analysis is split into per thread
+#define TB_CHUNKS_PER_THREAD 4
+
+typedef void (*tb_task)(void* context, u64 task);
+
+typedef struct tb_pool tb_pool;
+struct tb_pool {
+    tb_task task;
+    void* context;
+    u64 n_tasks;
+    u64 next; /**< next task to be taken */
+};
+
+static inline u64
+tb_hardware_threads() {
+#if defined(_WIN32)
+    SYSTEM_INFO info;
+    GetSystemInfo(&info);
+    return (u64)info.dwNumberOfProcessors;
+#else
+    long n = sysconf(_SC_NPROCESSORS_ONLN);
+    return n > 0 ? (u64)n : 1;
+#endif
+}
+
+static inline void
+tb_pool_work(tb_pool* pool) {
+    for (;;) {
+        u64 task = tb_fetch_add(&pool->next, 1);
+        if (task >= pool->n_tasks) {
+            return;
+        }
+        pool->task(pool->context, task);
+    }
+}
+
+#if defined(_WIN32)
+static DWORD WINAPI
+tb_pool_worker(LPVOID pool) {
+    tb_pool_work((tb_pool*)pool);
+    return 0;
+}
+#else
+static void*
+tb_pool_worker(void* pool) {
+    tb_pool_work((tb_pool*)pool);
+    return NULL;
+}
+#endif
+
+///
+/// @brief run task(context, i) for every i in [0, n_tasks) on n_threads
+///
+/// Falls back to fewer threads, down to only the calling thread, if threads
+/// can not be started.
+///
+static inline void
+tb_parallel_for(u64 n_tasks, u64 n_threads, tb_task task, void* context) {
+    tb_pool pool = { task, context, n_tasks, 0 };
+
+    if (n_threads > n_tasks) {
+        n_threads = n_tasks;
+    }
+    if (n_threads > TB_THREADS_MAX) {
+        n_threads = TB_THREADS_MAX;
+    }
+
+    u64 started = 0;
+#if defined(_WIN32)
+    HANDLE workers[TB_THREADS_MAX];
+    for (u64 i = 1; i < n_threads; i++) {
+        workers[started] =
+          CreateThread(NULL, 0, tb_pool_worker, &pool, 0, NULL);
+        if (workers[started] == NULL) {
+            break;
+        }
+        started += 1;
+    }
+#else
+    pthread_t workers[TB_THREADS_MAX];
+    for (u64 i = 1; i < n_threads; i++) {
+        if (pthread_create(&workers[started], NULL, tb_pool_worker, &pool) !=
+            0) {
+            break;
+        }
+        started += 1;
+    }
+#endif
+
+    tb_pool_work(&pool);
+
+    for (u64 i = 0; i < started; i++) {
+#if defined(_WIN32)
+        WaitForSingleObject(workers[i], INFINITE);
+        CloseHandle(workers[i]);
+#else
+        pthread_join(workers[i], NULL);
+#endif
+    }
+}
+
+///
+/// @brief bounds of chunk k of [start, stop) split into n_chunks
+///
+static inline void
+tb_chunk_bounds(u64 start,
+                u64 stop,
+                u64 n_chunks,
+                u64 k,
+                u64* chunk_start,
+                u64* chunk_stop) {
+    u64 length = stop - start;
+    *chunk_start = start + (length * k) / n_chunks;
+    *chunk_stop = start + (length * (k + 1)) / n_chunks;
+}
+
+static inline u64
+tb_chunk_count(u64 n_threads, u64 n_records) {
+    u64 n_chunks = n_threads <= 1 ? 1 : n_threads * TB_CHUNKS_PER_THREAD;
+    if (n_chunks > n_records) {
+        n_chunks = n_records > 0 ? n_records : 1;
+    }
+    return n_chunks;
+}
+
+#endif
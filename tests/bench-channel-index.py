@@ -0,0 +1,72 @@
+"""Compare coincidence counting with and without a channel index
+
+Fills two buffers with the same timetags on 16 channels, one created with a
+channel index and one without, and times coincidence counting between two
+channels. In the sparse mix the two channels carry 1% of the timetags, in the
+dense mix they carry half of them.
+
+Usage:
+    python bench-channel-index.py [capacity]
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+CHANNELS = 16
+CHUNK = 1_000_000
+REPEATS = 5
+
+MIXES = {
+    "sparse (1%)": 0.01,
+    "dense (50%)": 0.5,
+}
+
+
+def timetags(capacity, fraction):
+    rng = np.random.default_rng(0)
+    timestamps = np.cumsum(rng.integers(1, 200, capacity)).astype(np.uint64)
+    others = (1 - fraction) / (CHANNELS - 2)
+    p = [fraction / 2, fraction / 2] + [others] * (CHANNELS - 2)
+    channels = rng.choice(CHANNELS, capacity, p=p).astype(np.uint8)
+    return channels, timestamps
+
+
+def fill(buffer, channels, timestamps):
+    for start in range(0, len(channels), CHUNK):
+        buffer.push(channels[start:start + CHUNK],
+                    timestamps[start:start + CHUNK])
+
+
+def best_of(function):
+    times = []
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        result = function()
+        times.append(perf_counter() - t0)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    capacity = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000_000
+
+    for label, fraction in MIXES.items():
+        channels, timestamps = timetags(capacity, fraction)
+        print(label)
+        for channel_index in (0, capacity):
+            name = f"bench_channel_index_{channel_index}"
+            buffer = tangy.TangyBuffer(name, 1e-12, 1.0, CHANNELS, capacity,
+                                       channel_index=channel_index)
+            t0 = perf_counter()
+            fill(buffer, channels, timestamps)
+            t_fill = perf_counter() - t0
+
+            read_time = buffer.time_in_buffer() * 0.99
+            t_count, count = best_of(
+                lambda: buffer.coincidence_count(read_time, 1e-9, [0, 1])
+            )
+            mode = "index" if channel_index else "scan"
+            print(f"\t{mode}:\tfill: {t_fill:.3f}s\t"
+                  f"coincidence_count: {t_count:.4f}s ({count})")
+            buffer.close()
@@ -0,0 +1,102 @@
+"""Compare the two coincidence engines for 2, 3 and 4 fold patterns
+
+Fills a buffer with timetags spread evenly over 4 channels and times
+coincidence counting with the ``Pattern`` engine, which steps an iterator per
+channel, and the ``Window`` engine, which reads every timetag once. Both must
+find the same number of coincidences. Then times counting the 2 and 3 fold
+patterns of a tomography run, 36 in all on 8 channels, one pattern at a time
+and with a single call to ``coincidence_counts``.
+
+Usage:
+    python bench-coincidence-engine.py [capacity]
+"""
+import sys
+from itertools import combinations
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+CHANNELS = 4
+TOMOGRAPHY_CHANNELS = 8
+CHUNK = 1_000_000
+REPEATS = 5
+WINDOW = 1e-9
+
+PATTERNS = {
+    "2-fold": [0, 1],
+    "3-fold": [0, 1, 2],
+    "4-fold": [0, 1, 2, 3],
+}
+
+
+def timetags(capacity, channel_count):
+    rng = np.random.default_rng(0)
+    timestamps = np.cumsum(rng.integers(1, 200, capacity)).astype(np.uint64)
+    channels = rng.integers(0, channel_count, capacity).astype(np.uint8)
+    return channels, timestamps
+
+
+def fill(buffer, channels, timestamps):
+    for start in range(0, len(channels), CHUNK):
+        buffer.push(channels[start:start + CHUNK],
+                    timestamps[start:start + CHUNK])
+
+
+def best_of(function):
+    times = []
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        result = function()
+        times.append(perf_counter() - t0)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    capacity = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000_000
+
+    channels, timestamps = timetags(capacity, CHANNELS)
+    buffer = tangy.TangyBuffer("bench_coincidence_engine", 1e-12, 1.0,
+                               CHANNELS, capacity)
+    fill(buffer, channels, timestamps)
+    read_time = buffer.time_in_buffer() * 0.99
+
+    for label, pattern in PATTERNS.items():
+        print(label)
+        results = {}
+        for engine in tangy.CoincidenceEngine:
+            t_count, count = best_of(
+                lambda: buffer.coincidence_count(read_time, WINDOW, pattern,
+                                                 engine=engine)
+            )
+            results[engine] = count
+            print(f"\t{engine.name}:\tcoincidence_count: {t_count:.4f}s "
+                  f"({count}, {capacity / t_count / 1e6:.0f} Mtags/s)")
+        assert len(set(results.values())) == 1, "Engines disagree"
+
+    buffer.close()
+
+    channels, timestamps = timetags(capacity, TOMOGRAPHY_CHANNELS)
+    buffer = tangy.TangyBuffer("bench_coincidence_counts", 1e-12, 1.0,
+                               TOMOGRAPHY_CHANNELS, capacity)
+    fill(buffer, channels, timestamps)
+    read_time = buffer.time_in_buffer() * 0.99
+    patterns = [list(p) for p in combinations(range(TOMOGRAPHY_CHANNELS), 2)]
+    patterns += [list(p) for p in combinations(range(4), 3)]
+    patterns += [list(p) for p in combinations(range(4, 8), 3)]
+
+    print(f"{len(patterns)} patterns")
+    for engine in tangy.CoincidenceEngine:
+        t_each, each = best_of(
+            lambda: [buffer.coincidence_count(read_time, WINDOW, pattern,
+                                              engine=engine)
+                     for pattern in patterns]
+        )
+        print(f"\t{engine.name}, one at a time:\t{t_each:.4f}s")
+    t_all, counts = best_of(
+        lambda: buffer.coincidence_counts(read_time, WINDOW, patterns)
+    )
+    print(f"\tcoincidence_counts:\t{t_all:.4f}s")
+    assert list(counts) == each, "coincidence_counts disagrees"
+
+    buffer.close()
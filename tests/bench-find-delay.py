@@ -0,0 +1,66 @@
+"""Find a large delay between two channels with ``find_delay``
+
+Fills a buffer with 10 s of correlated pairs on channels 0 and 1, channel 1
+delayed by 10 us with 50 ps of jitter, on top of uncorrelated timetags on
+both channels, then times ``find_delay`` and checks the delay it finds at
+100 ps resolution.
+
+Usage:
+    python bench-find-delay.py [pair rate] [background rate]
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+DURATION = 10.0
+DELAY = 10e-6
+JITTER = 50e-12
+RESOLUTION = 1e-12
+CHUNK = 1_000_000
+
+
+def timetags(pair_rate, background_rate):
+    rng = np.random.default_rng(0)
+    n_pairs = int(pair_rate * DURATION)
+    n_background = int(background_rate * DURATION)
+    pairs = rng.uniform(0, DURATION, n_pairs)
+    delayed = pairs + DELAY + rng.normal(0, JITTER, n_pairs)
+    times = np.concatenate([
+        pairs,
+        delayed,
+        rng.uniform(0, DURATION, n_background),
+        rng.uniform(0, DURATION, n_background),
+    ])
+    channels = np.concatenate([
+        np.zeros(n_pairs), np.ones(n_pairs),
+        np.zeros(n_background), np.ones(n_background),
+    ]).astype(np.uint8)
+    order = np.argsort(times)
+    return channels[order], (times[order] / RESOLUTION).astype(np.uint64)
+
+
+if __name__ == "__main__":
+    pair_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 1e5
+    background_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 5e5
+
+    channels, timestamps = timetags(pair_rate, background_rate)
+    buffer = tangy.TangyBuffer("bench_find_delay", RESOLUTION, 1.0, 2,
+                               len(channels))
+    for start in range(0, len(channels), CHUNK):
+        buffer.push(channels[start:start + CHUNK],
+                    timestamps[start:start + CHUNK])
+    read_time = buffer.time_in_buffer() * 0.99
+
+    t0 = perf_counter()
+    result = buffer.find_delay(0, 1, read_time, max_delay=20e-6,
+                               resolution=100e-12)
+    elapsed = perf_counter() - t0
+
+    print(f"{len(channels)} timetags, find_delay: {elapsed:.3f}s")
+    print(f"\tdelay found: {result.central_delay * 1e9:.3f} ns "
+          f"(expected {DELAY * 1e9:.3f} ns)")
+    assert abs(result.central_delay - DELAY) < 200e-12, "Delay not found"
+
+    buffer.close()
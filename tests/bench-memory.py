@@ -0,0 +1,77 @@
+"""Compare buffer creation, fill and scan times for the memory options
+
+Creates one buffer per memory configuration, fills it with timetags and then
+times full-buffer scans (singles and timetrace) which are dominated by memory
+access for large buffers.
+
+Usage:
+    python bench-memory.py [capacity]
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+CONFIGURATIONS = {
+    "default": {},
+    "prefault": {"prefault": True},
+    "huge pages": {"huge_pages": True},
+    "huge pages + prefault": {"huge_pages": True, "prefault": True},
+}
+
+CHUNK = 1_000_000
+REPEATS = 5
+
+
+def fill(buffer, capacity):
+    start = 0
+    while start < capacity:
+        n = min(CHUNK, capacity - start)
+        timestamps = np.arange(start, start + n, dtype=np.uint64) * 100
+        channels = (np.arange(start, start + n) % 4).astype(np.uint8)
+        buffer.push(channels, timestamps)
+        start += n
+
+
+def best_of(function):
+    times = []
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        function()
+        times.append(perf_counter() - t0)
+    return min(times)
+
+
+if __name__ == "__main__":
+    capacity = int(float(sys.argv[1])) if len(sys.argv) > 1 else 50_000_000
+
+    for label, options in CONFIGURATIONS.items():
+        name = "bench_memory_" + label.replace(" ", "").replace("+", "_")
+
+        t0 = perf_counter()
+        buffer = tangy.TangyBuffer(name, 1e-12, 1.0, 4, capacity, **options)
+        t_create = perf_counter() - t0
+
+        t0 = perf_counter()
+        fill(buffer, capacity)
+        t_fill = perf_counter() - t0
+
+        t_singles = best_of(
+            lambda: buffer.singles(start=buffer.begin, stop=buffer.end)
+        )
+        read_time = buffer.time_in_buffer()
+        t_trace = best_of(
+            lambda: buffer.timetrace([0, 1], read_time, read_time / 100)
+        )
+
+        memory = buffer.memory
+        rate = capacity / t_singles / 1e6
+        print(f"{label}")
+        print(f"\tapplied: {buffer.configuration()['memory']}, "
+              f"huge page bytes: {memory['huge_page_bytes']}")
+        print(f"\tcreate: {t_create:.3f}s\tfill: {t_fill:.3f}s")
+        print(f"\tsingles: {t_singles:.4f}s ({rate:.1f} Mtags/s)\t"
+              f"timetrace: {t_trace:.4f}s")
+
+        buffer.close()
@@ -0,0 +1,60 @@
+"""Measure the cost of resizing a full buffer
+
+Fills a buffer with timetags and times ``resize`` to twice its capacity, the
+time to ``pull`` the same number of timetags is shown for comparison. Resizing
+creates and faults in the new buffer and copies every timetag held, the
+channel index and the block summaries.
+
+Usage:
+    python bench-resize.py [capacity ...]
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+CHANNELS = 8
+CHUNK = 1_000_000
+
+FORMATS = {
+    "standard": {"format": tangy.TangyBufferType.Standard},
+    "clocked": {"format": tangy.TangyBufferType.Clocked},
+    "clocked packed": {"format": tangy.TangyBufferType.Clocked, "packed": True},
+}
+
+
+def fill(buffer, capacity, clocked):
+    rng = np.random.default_rng(0)
+    for start in range(0, capacity, CHUNK):
+        n = min(CHUNK, capacity - start)
+        channels = rng.integers(0, CHANNELS, n).astype(np.uint8)
+        timestamps = np.arange(start, start + n, dtype=np.uint64) * 100
+        if clocked:
+            buffer.push(channels, (timestamps // 1000, timestamps % 1000))
+        else:
+            buffer.push(channels, timestamps)
+
+
+if __name__ == "__main__":
+    capacities = [int(float(c)) for c in sys.argv[1:]] or [1_000_000, 10_000_000]
+
+    for capacity in capacities:
+        print(f"capacity {capacity:,}")
+        for label, options in FORMATS.items():
+            buffer = tangy.TangyBuffer("bench_resize", 1e-12, 1e-9, CHANNELS,
+                                       capacity, **options)
+            fill(buffer, capacity,
+                 options["format"] == tangy.TangyBufferType.Clocked)
+
+            t0 = perf_counter()
+            buffer.pull(buffer.begin, buffer.count)
+            t_pull = perf_counter() - t0
+
+            t0 = perf_counter()
+            buffer.resize(2 * capacity)
+            t_resize = perf_counter() - t0
+
+            print(f"\t{label}:\tresize: {t_resize * 1e3:.1f} ms\t"
+                  f"pull: {t_pull * 1e3:.1f} ms")
+            buffer.close()
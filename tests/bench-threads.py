@@ -0,0 +1,96 @@
+"""Scaling of the analyses with the number of native threads
+
+Fills a buffer with timetags spread over 4 channels, then times ``singles``,
+``timetrace``, ``coincidence_count``, ``relative_delay`` (nearest and all
+pairs), ``delay_matrix`` and ``joint_delay_histogram`` on 1, 2, 4, ... up to
+the number of cores. Every thread count must give the same result as a single
+thread.
+
+Usage:
+    python bench-threads.py [capacity] [max threads]
+"""
+import os
+import sys
+import warnings
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+CHANNELS = 4
+CHUNK = 1_000_000
+REPEATS = 3
+WINDOW = 1e-9
+
+
+def timetags(capacity):
+    rng = np.random.default_rng(0)
+    timestamps = np.cumsum(rng.integers(1, 200, capacity)).astype(np.uint64)
+    channels = rng.integers(0, CHANNELS, capacity).astype(np.uint8)
+    return channels, timestamps
+
+
+def best_of(function):
+    times = []
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        result = function()
+        times.append(perf_counter() - t0)
+    return min(times), result
+
+
+def same(a, b):
+    if isinstance(a, tuple):
+        return all(same(x, y) for (x, y) in zip(a, b))
+    return np.array_equal(a, b)
+
+
+if __name__ == "__main__":
+    capacity = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000_000
+    max_threads = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    warnings.simplefilter("ignore")
+
+    channels, timestamps = timetags(capacity)
+    buffer = tangy.TangyBuffer("bench_threads", 1e-12, 1.0, CHANNELS, capacity)
+    for start in range(0, capacity, CHUNK):
+        buffer.push(channels[start:start + CHUNK],
+                    timestamps[start:start + CHUNK])
+    read_time = buffer.time_in_buffer() * 0.99
+
+    analyses = {
+        "singles": lambda threads: buffer.singles(
+            read_time, threads=threads),
+        "timetrace": lambda threads: buffer.timetrace(
+            [0, 1], read_time, read_time / 100, threads=threads),
+        "coincidence_count": lambda threads: buffer.coincidence_count(
+            read_time, WINDOW, [0, 1, 2],
+            engine=tangy.CoincidenceEngine.Window, threads=threads),
+        "relative_delay": lambda threads: buffer.relative_delay(
+            0, 1, read_time, resolution=1e-10, window=1e-8,
+            threads=threads).intensities,
+        "relative_delay, all pairs": lambda threads: buffer.relative_delay(
+            0, 1, read_time, resolution=1e-10, window=1e-8, all_pairs=True,
+            threads=threads).intensities,
+        "delay_matrix": lambda threads: buffer.delay_matrix(
+            list(range(CHANNELS)), read_time, 1e-10, 1e-8, histograms=True,
+            threads=threads)[2],
+        "joint_delay_histogram": lambda threads: buffer.joint_delay_histogram(
+            0, 1, [0, 1, 2], read_time, 1e-10, clock=2,
+            threads=threads).data,
+    }
+
+    counts = [1]
+    while counts[-1] * 2 <= max_threads:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_threads:
+        counts.append(max_threads)
+
+    for label, analysis in analyses.items():
+        print(label)
+        t_single, expected = best_of(lambda: analysis(1))
+        for threads in counts:
+            t, result = best_of(lambda: analysis(threads))
+            assert same(result, expected), f"{threads} threads disagree"
+            print(f"\t{threads} threads:\t{t:.4f}s\t(x{t_single / t:.2f})")
+
+    buffer.close()
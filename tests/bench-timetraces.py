@@ -0,0 +1,57 @@
+"""Per-channel time traces with ``timetraces`` against one ``timetrace`` each
+
+Fills a buffer with timetags spread over 8 channels, then times the traces
+of every channel taken with a ``timetrace`` call per channel and with a
+single ``timetraces`` call, for narrow bins (every timetag read once) and
+for wide bins (counted from the block summaries). Both must agree.
+
+Usage:
+    python bench-timetraces.py [capacity] [threads]
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+import tangy
+
+CHANNELS = 8
+CHUNK = 1_000_000
+REPEATS = 3
+
+
+def best_of(function):
+    times = []
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        result = function()
+        times.append(perf_counter() - t0)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    capacity = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000_000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    rng = np.random.default_rng(0)
+    timestamps = np.cumsum(rng.integers(1, 200, capacity)).astype(np.uint64)
+    channels = rng.integers(0, CHANNELS, capacity).astype(np.uint8)
+
+    buffer = tangy.TangyBuffer("bench_timetraces", 1e-12, 1.0, CHANNELS, capacity)
+    for start in range(0, capacity, CHUNK):
+        buffer.push(channels[start:start + CHUNK],
+                    timestamps[start:start + CHUNK])
+    read_time = buffer.time_in_buffer() * 0.99
+    everything = list(range(CHANNELS))
+
+    for label, bins in (("narrow bins", 10_000), ("wide bins", 100)):
+        bin_width = read_time / bins
+        t_each, each = best_of(lambda: np.array(
+            [buffer.timetrace(c, read_time, bin_width) for c in everything]))
+        t_once, once = best_of(lambda: buffer.timetraces(
+            everything, read_time, bin_width, threads=threads))
+        assert np.array_equal(each, once), "Traces disagree"
+        print(f"{label} ({once.shape[1]} bins)")
+        print(f"\ttimetrace per channel:\t{t_each:.4f}s")
+        print(f"\ttimetraces:\t\t{t_once:.4f}s\t(x{t_each / t_once:.1f})")
+
+    buffer.close()
@@ -0,0 +1,93 @@
+"""Stress the publication protocol of the shared ring buffer
+
+One writer process pushes records into a small buffer as fast as it can while
+several reader processes repeatedly copy ranges that sit right at the oldest
+end of the buffer, i.e. the region the writer is about to overwrite. Every
+record is written with channel = (timestamp / step) % 4 so any torn or
+overwritten record returned to a reader shows up as a mismatch.
+
+Usage:
+    python stress-publication.py [readers] [seconds]
+"""
+import sys
+import warnings
+from multiprocessing import Event, Process, Queue
+from time import sleep
+
+import numpy as np
+import tangy
+
+NAME = "stress_publication"
+CAPACITY = 4096
+CHUNK = 512
+STEP = 7
+
+
+def writer(ready, done):
+    buffer = tangy.TangyBuffer(NAME, 1e-12, 1.0, 4, CAPACITY)
+    ready.set()
+    start = 0
+    while not done.is_set():
+        timestamps = np.arange(start, start + CHUNK, dtype=np.uint64) * STEP
+        channels = ((timestamps // STEP) % 4).astype(np.uint8)
+        buffer.push(channels, timestamps)
+        start += CHUNK
+
+
+def reader(done, results):
+    warnings.simplefilter("ignore")
+    buffer = tangy.TangyBuffer(NAME)
+    reads = 0
+    truncated = 0
+    overwritten = 0
+    errors = 0
+    while not done.is_set():
+        begin = buffer.begin
+        stop = begin + CAPACITY // 2
+        if buffer.count < stop:
+            continue
+        try:
+            channels, timestamps = buffer.pull(begin, stop)
+        except IndexError:
+            overwritten += 1
+            continue
+        if len(channels) < (stop - begin):
+            truncated += 1
+        expected = ((timestamps // STEP) % 4).astype(np.uint8)
+        errors += int(np.count_nonzero(channels != expected))
+        reads += 1
+    results.put((reads, truncated, overwritten, errors))
+
+
+if __name__ == "__main__":
+    n_readers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+
+    ready = Event()
+    done = Event()
+    results = Queue()
+
+    w = Process(target=writer, args=(ready, done))
+    w.start()
+    ready.wait()
+
+    readers = [Process(target=reader, args=(done, results))
+               for _ in range(n_readers)]
+    for r in readers:
+        r.start()
+
+    sleep(seconds)
+    done.set()
+
+    total_errors = 0
+    for _ in readers:
+        reads, truncated, overwritten, errors = results.get()
+        total_errors += errors
+        print(f"reads: {reads}\ttruncated: {truncated}\t"
+              f"overwritten: {overwritten}\tbad records: {errors}")
+
+    for r in readers:
+        r.join()
+    w.join()
+
+    print("PASS" if total_errors == 0 else "FAIL")
@@ -0,0 +1,54 @@
+"""Count coincidences through a channel index the writer is replacing
+
+Fills a buffer with a channel index and counts coincidences between its two
+channels while a second thread keeps appending timetags on one of them, far
+enough apart to never add a coincidence. Once the writer has appended a full
+index worth of timetags during a count, the index entries that count still
+needs are replaced, it must then carry on through the records and every count
+must match the one taken before the writer started.
+
+Usage:
+    python test-channel-index.py
+"""
+import threading
+
+import numpy as np
+import tangy
+
+CAPACITY = 20_000_000
+INDEX = 200_000
+CHUNK = 100_000
+
+
+def replaced_during_count():
+    rng = np.random.default_rng(1)
+    timestamps = np.cumsum(rng.integers(1, 200, 300_000)).astype(np.uint64)
+    channels = rng.integers(0, 2, 300_000).astype(np.uint8)
+    buffer = tangy.TangyBuffer("test_channel_index", 1e-12, 1.0, 2, CAPACITY,
+                               channel_index=INDEX)
+    buffer.push(channels, timestamps)
+    expected = buffer.coincidence_count(1e6, 1e-10, [0, 1])
+
+    def writer():
+        last = int(timestamps[-1])
+        while buffer.count < CAPACITY - CHUNK:
+            appended = last + 10**7 * np.arange(1, CHUNK + 1, dtype=np.uint64)
+            last = int(appended[-1])
+            buffer.push(np.zeros(CHUNK, dtype=np.uint8), appended)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    counts = []
+    while thread.is_alive():
+        counts.append(buffer.coincidence_count(1e6, 1e-10, [0, 1]))
+    thread.join()
+    buffer.close()
+
+    wrong = sum(count != expected for count in counts)
+    print(f"replaced during count:\t{len(counts)} counts of {expected}\t"
+          f"wrong: {wrong}")
+    return wrong == 0
+
+
+if __name__ == "__main__":
+    print("PASS" if replaced_during_count() else "FAIL")
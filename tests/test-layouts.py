@@ -0,0 +1,58 @@
+"""Clocked buffer layouts agree with the default layout
+
+Fills a default, an ``arrival`` and a ``packed`` Clocked buffer with the same
+timetags and checks that ``lower_bound`` and ``coincidence_count`` agree
+across them, and that the ``resolution`` and ``clock_period`` of the arrival
+and packed buffers can not be changed, as their records were written with the
+conversion factor the buffer was created with.
+
+Usage:
+    python test-layouts.py
+"""
+import numpy as np
+import tangy
+
+N = 4000
+
+
+def make(name, **layout):
+    buffer = tangy.TangyBuffer(name, 1e-12, 1e-9, 2, N,
+                               tangy.TangyBufferType.Clocked, **layout)
+    clocks = np.arange(N, dtype=np.uint64)
+    deltas = (np.arange(N, dtype=np.uint64) * 37) % 1000
+    channels = (np.arange(N) % 2).astype(np.uint8)
+    buffer.push(channels, (clocks, deltas))
+    return buffer
+
+
+if __name__ == "__main__":
+    default = make("test_layouts_default")
+    layouts = {
+        "arrival": make("test_layouts_arrival", arrival=True),
+        "packed": make("test_layouts_packed", packed=True),
+    }
+
+    ok = True
+    read_time = default.time_in_buffer() / 2
+    expected = (default.lower_bound(read_time),
+                default.coincidence_count(read_time, 1e-9, [0, 1]))
+    for name, buffer in layouts.items():
+        found = (buffer.lower_bound(read_time),
+                 buffer.coincidence_count(read_time, 1e-9, [0, 1]))
+        rejected = []
+        for attribute, value in (("resolution", 1e-11), ("clock_period", 1e-6)):
+            try:
+                setattr(buffer, attribute, value)
+            except ValueError:
+                rejected.append(attribute)
+        unchanged = (buffer.resolution == 1e-12) and (buffer.clock_period == 1e-9)
+        print(f"{name}:\tlower_bound, coincidences {found}, expected {expected}"
+              f"\tsetters rejected: {rejected}")
+        ok = ok and (found == expected) and (len(rejected) == 2) and unchanged
+
+    default.clock_period = 2e-9
+    ok = ok and (default.clock_period == 2e-9)
+
+    for buffer in [default, *layouts.values()]:
+        buffer.close()
+    print("PASS" if ok else "FAIL")
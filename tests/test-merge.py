@@ -0,0 +1,60 @@
+"""Merge producers that start at different times
+
+Producer A writes its timetags and is merged before producer B has written
+anything, B then writes timetags interleaved with A's that are well within
+the merge latency. None of B's timetags may be dropped as late and the merged
+buffer must hold every timetag of both in order. Once B has stayed empty for
+longer than the latency, A is merged without waiting for it.
+
+Usage:
+    python test-merge.py
+"""
+import numpy as np
+import tangy
+
+
+def producer_starts_late():
+    a = tangy.TangyBuffer("test_merge_a", 1e-12, 1.0, 1, 1000)
+    b = tangy.TangyBuffer("test_merge_b", 1e-12, 1.0, 1, 1000)
+    target = tangy.TangyBuffer("test_merge_target", 1e-12, 1.0, 2, 1000)
+    merge = tangy.TangyMerge(target, [a, b], latency=1e-6)
+
+    a.push(np.zeros(100, dtype=np.uint8), np.arange(0, 1000, 10, dtype=np.uint64))
+    first = merge.step()
+    b.push(np.zeros(100, dtype=np.uint8), np.arange(5, 1000, 10, dtype=np.uint64))
+    second = merge.step()
+
+    channels, timestamps = target.pull(target.begin, target.count)
+    ok = (first == 0) and (merge.late == 0) and (target.count == first + second)
+    ok = ok and bool(np.all(np.diff(timestamps.astype(np.int64)) >= 0))
+    ok = ok and (set(timestamps[channels == 1] % 10) <= {5})
+    print(f"producer starts late:\tmerged {first} then {second}\t"
+          f"late: {merge.late}")
+
+    for buffer in (a, b, target):
+        buffer.close()
+    return ok
+
+
+def producer_never_starts():
+    a = tangy.TangyBuffer("test_merge_a", 1e-12, 1.0, 1, 1000)
+    b = tangy.TangyBuffer("test_merge_b", 1e-12, 1.0, 1, 1000)
+    target = tangy.TangyBuffer("test_merge_target", 1e-12, 1.0, 2, 1000)
+    merge = tangy.TangyMerge(target, [a, b], latency=1e-9)
+
+    a.push(np.zeros(10, dtype=np.uint8), np.arange(0, 100, 10, dtype=np.uint64))
+    first = merge.step()
+    a.push(np.zeros(10, dtype=np.uint8),
+           np.arange(10_000, 10_100, 10, dtype=np.uint64))
+    second = merge.step()
+
+    print(f"producer never starts:\tmerged {first} then {second}")
+    for buffer in (a, b, target):
+        buffer.close()
+    return (first == 0) and (second == 20)
+
+
+if __name__ == "__main__":
+    ok = producer_starts_late()
+    ok = producer_never_starts() and ok
+    print("PASS" if ok else "FAIL")